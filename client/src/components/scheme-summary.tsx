@@ -24,6 +24,7 @@ import { Alert, AlertDescription, AlertTitle } from "@/components/ui/alert";
 import { Loader2 } from "lucide-react";
 import { RadioGroup, RadioGroupItem } from "@/components/ui/radio-group";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
+import { postEventStream } from "@/lib/sse";
 
 // Backend API base URL
 const API_BASE_URL =
@@ -123,42 +124,45 @@ export default function SchemeUploader() {
       formData.append("scheme_file", data.schemeFile[0]);
       formData.append("language", data.language); // Send language with form data
 
-      const response = await axios.post<UploadResponse>(
-        `${API_BASE_URL}/upload_scheme`,
+      // Stream the summary as it is generated, then replace it with the final result
+      let streamError: string | null = null;
+      let translating = false;
+      await postEventStream(
+        `${API_BASE_URL}/upload_scheme/stream`,
         formData,
-        {
-          headers: {
-            "Content-Type": "multipart/form-data",
-          },
+        ({ event, data: payload }) => {
+          if (event === "token") {
+            setIsLoading(false);
+            // The English summary is shown until its translation starts streaming
+            const restart = payload.field === "summary" && !translating && data.language !== "en";
+            if (restart) translating = true;
+            setSummaryData((prev) => ({
+              ...(prev ?? { success: true }),
+              summary: (restart ? "" : prev?.summary ?? "") + payload.text,
+            }));
+          } else if (event === "result") {
+            console.log("Upload response:", payload);
+            setSummaryData(payload);
+            setSelectedLanguage(payload.language_code);
+            setAudioUrl(payload.audio_url);
+          } else if (event === "error") {
+            streamError = payload.error;
+          }
         }
       );
-
-      console.log("Upload response:", response.data);
-      const responseData = response.data;
-      if (responseData.success) {
-        setSummaryData(responseData);
-        setSelectedLanguage(responseData.language_code); // Update to language_code
-        setAudioUrl(responseData.audio_url); // Use audio_url (recommended)
-      } else {
-        setErrorMessage(
-          responseData.error || "No summary returned from server."
-        );
+      if (streamError) {
+        setErrorMessage(streamError);
       }
     } catch (error) {
       console.error("Upload error:", error);
-      if (axios.isAxiosError(error)) {
-        if (error.code === "ERR_NETWORK") {
-          setErrorMessage(
-            `Cannot connect to the server. Please ensure the backend is running at ${API_BASE_URL}.`
-          );
-        } else {
-          setErrorMessage(
-            (error.response?.data as any)?.error ||
-              "Failed to upload scheme. Please try again."
-          );
-        }
+      if (error instanceof TypeError) {
+        setErrorMessage(
+          `Cannot connect to the server. Please ensure the backend is running at ${API_BASE_URL}.`
+        );
       } else {
-        setErrorMessage("An unexpected error occurred. Please try again.");
+        setErrorMessage(
+          (error as Error).message || "Failed to upload scheme. Please try again."
+        );
       }
     } finally {
       setIsLoading(false);
@@ -245,42 +249,48 @@ export default function SchemeUploader() {
         questions: eligibilityQuestions,
         responses: data.answers,
       });
-      const response = await axios.post<EligibilityResponse>(
-        `${API_BASE_URL}/check_eligibility`,
-        {
+      // Stream the verdict; a translation replaces the English text once it starts
+      let streamError: string | null = null;
+      let translating = false;
+      await postEventStream(
+        `${API_BASE_URL}/check_eligibility/stream`,
+        JSON.stringify({
           questions: eligibilityQuestions,
           responses: data.answers,
           language: selectedLanguage,
+        }),
+        ({ event, data: payload }) => {
+          if (event === "token") {
+            const restart = payload.field === "result" && !translating && selectedLanguage !== "en";
+            if (restart) translating = true;
+            setEligibilityResult((prev) => ({
+              success: true,
+              is_eligible: prev?.is_eligible ?? false,
+              result: (restart ? "" : prev?.result ?? "") + payload.text,
+            }));
+          } else if (event === "stage" && payload.stage === "verdict_ready") {
+            setEligibilityResult((prev) => prev && { ...prev, is_eligible: payload.is_eligible });
+          } else if (event === "result") {
+            console.log("Eligibility response:", payload);
+            setEligibilityResult(payload);
+          } else if (event === "error") {
+            streamError = payload.error;
+          }
         },
-        {
-          headers: {
-            "Content-Type": "application/json",
-          },
-        }
+        { "Content-Type": "application/json" }
       );
-
-      console.log("Eligibility response:", response.data);
-      if (response.data.success) {
-        setEligibilityResult(response.data);
-      } else {
-        setErrorMessage(response.data.error || "Failed to check eligibility.");
+      if (streamError) {
+        setErrorMessage(streamError);
       }
     } catch (error) {
       console.error("Eligibility check error:", error);
-      if (axios.isAxiosError(error)) {
-        if (error.code === "ERR_NETWORK") {
-          setErrorMessage(
-            `Cannot connect to the server. Please ensure the backend is running at ${API_BASE_URL}.`
-          );
-        } else {
-          setErrorMessage(
-            (error.response?.data as any)?.error ||
-              "Failed to check eligibility. Please try again."
-          );
-        }
+      if (error instanceof TypeError) {
+        setErrorMessage(
+          `Cannot connect to the server. Please ensure the backend is running at ${API_BASE_URL}.`
+        );
       } else {
         setErrorMessage(
-          "An unexpected error occurred while checking eligibility."
+          (error as Error).message || "Failed to check eligibility. Please try again."
         );
       }
     } finally {
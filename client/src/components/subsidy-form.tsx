@@ -26,7 +26,7 @@ import { Separator } from "@/components/ui/separator";
 import { CheckCircle2, Loader2, ArrowRight } from "lucide-react";
 // import { useToast } from "@/components/ui/use-toast";
 import { useState } from "react";
-import axios from "axios";
+import { postEventStream } from "@/lib/sse";
 import MDEditor from "@uiw/react-md-editor";
 
 // Zod schema for form validation
@@ -51,6 +51,7 @@ export function AgriculturalSubsidyForm() {
   const [isLoading, setIsLoading] = useState(false);
   const [recommendations, setRecommendations] = useState(null);
   const [visuals, setVisuals] = useState<string[]>([]);
+  const [progress, setProgress] = useState<{ stage: string; text: string } | null>(null);
   const [activeTab, setActiveTab] = useState("form");
 
   const form = useForm<FormValues>({
@@ -92,12 +93,28 @@ export function AgriculturalSubsidyForm() {
         feedback: values.feedback || null,
       };
 
-      const res = await axios.post(
-        "http://localhost:5000/api/recommendations",
-        requestData
+      // Show workflow progress and recommendation text while the workflow runs
+      setProgress({ stage: "Starting", text: "" });
+      await postEventStream(
+        "http://localhost:5000/api/recommendations/stream",
+        JSON.stringify(requestData),
+        ({ event, data }) => {
+          if (event === "stage") {
+            setProgress((prev) => ({ stage: data.node, text: prev?.text ?? "" }));
+          } else if (event === "token" && data.node === "recommendation") {
+            setProgress((prev) => ({
+              stage: "recommendation",
+              text: (prev?.text ?? "") + data.text,
+            }));
+          } else if (event === "result") {
+            setRecommendations(data.data);
+            setVisuals(data.data.visuals);
+          } else if (event === "error") {
+            console.error("ERROR[SUBSIDY]:", data.error);
+          }
+        },
+        { "Content-Type": "application/json" }
       );
-      setRecommendations(res.data.data);
-      setVisuals(res.data.data.visuals);
     } catch (error) {
       console.error("ERROR[SUBSIDY]:", error);
       //   toast({
@@ -107,6 +124,7 @@ export function AgriculturalSubsidyForm() {
       //   });
     } finally {
       setIsLoading(false);
+      setProgress(null);
     }
   }
 
@@ -435,6 +453,15 @@ export function AgriculturalSubsidyForm() {
                     />
                   )}
 
+                  {isLoading && progress && (
+                    <div className="rounded-md border p-4 text-sm text-muted-foreground">
+                      <p className="font-medium">Step: {progress.stage}</p>
+                      {progress.text && (
+                        <p className="mt-2 whitespace-pre-wrap">{progress.text}</p>
+                      )}
+                    </div>
+                  )}
+
                   <div className="flex justify-end">
                     <Button
                       type="submit"
@@ -0,0 +1,51 @@
+// Minimal server-sent events client for POST endpoints (EventSource only supports GET)
+
+export interface StreamEvent {
+  event: string;
+  data: any;
+}
+
+export async function postEventStream(
+  url: string,
+  body: BodyInit,
+  onEvent: (event: StreamEvent) => void,
+  headers?: Record<string, string>
+): Promise<void> {
+  const response = await fetch(url, { method: "POST", body, headers });
+
+  // Validation errors are returned as plain JSON before the stream starts
+  if (!response.ok || !response.body) {
+    let error = `Request failed with status ${response.status}`;
+    try {
+      error = (await response.json()).error || error;
+    } catch {
+      // Not JSON, keep the generic message
+    }
+    throw new Error(error);
+  }
+
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += value;
+
+    // Events are separated by a blank line
+    let boundary = buffer.indexOf("\n\n");
+    while (boundary !== -1) {
+      const raw = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf("\n\n");
+
+      let event = "message";
+      const data: string[] = [];
+      for (const line of raw.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data.push(line.slice(5).trim());
+      }
+      if (data.length) onEvent({ event, data: JSON.parse(data.join("\n")) });
+    }
+  }
+}
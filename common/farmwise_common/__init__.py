@@ -0,0 +1,20 @@
+"""
+Infrastructure shared by the FarmWise services (shivansh's scheme API and sourav's
+recommendation API)
+
+Each service installs this package (pip install -e ../common, listed in its requirements.txt)
+and keeps a thin module of the same name for each of these, passing in what differs between
+the services, so their call sites don't change:
+
+- metrics: Prometheus metrics and the /metrics route (metrics.py)
+- tracing: request-scoped tracing exported as OTLP/JSON spans (tracing.py)
+- import_timing: import time of a module, per top-level import (import_budget.py, startup_report.py)
+- profiling: on-demand profiling of single requests (profiling.py)
+- cassettes: recording external calls and replaying them offline (cassettes.py)
+- llm_gateway: concurrency and rate limits, retries and circuit breaking for Gemini calls (llm_gateway.py)
+- singleflight: coalescing of identical concurrent calls, within and across processes (singleflight.py)
+- llm_cache: exact-match cache of LLM responses per prompt type (llm_cache.py)
+- token_usage: token and cost accounting for LLM calls, with daily budgets (token_usage.py)
+
+db has the SQLite helpers for the modules that store state in a database the service passes in.
+"""
@@ -0,0 +1,530 @@
+"""
+Record a service's external calls into cassette files and replay them offline with their
+original latencies
+
+    CASSETTE_MODE=record python api.py          # serve real traffic, recording every call
+    CASSETTE_MODE=replay python benchmark.py    # the same calls, no network, same latencies
+    CASSETTE_MODE=replay CASSETTE_LATENCY_SCALE=0.5 CASSETTE_MATCH=sequence python benchmark.py --unique
+    python cassettes.py                         # what's recorded, with latency percentiles
+
+Providers use the names from FAKE_PROVIDERS, and CASSETTE_PROVIDERS selects them (default all).
+Each has a wrapper recording the calls of the real (or fake) client it is given, or replaying
+them when given None:
+- llm: Gemini chat calls, streamed ones with each chunk's arrival time (wrap_llm)
+- tts: gTTS audio (tts_class)
+- tavily: Tavily searches, sync and async (wrap_tavily, wrap_async_tavily)
+- embeddings: Cohere embeddings (wrap_embeddings)
+- vectorstore: Pinecone searches, from the LangChain store and the LlamaIndex retriever; recorded
+  searches include the query's embedding call (wrap_vector_store, wrap_retriever)
+- sites: scraped web pages, over requests and httpx (http_adapter, async_http_transport)
+
+Each provider's calls are appended to CASSETTE_DIR/<provider>.jsonl, one JSON object per call:
+the request, the response (or the error raised), and how long it took. Replaying needs no API
+keys or network: a call sleeps for its recorded latency times CASSETTE_LATENCY_SCALE and returns
+the recorded response. Errors are raised again as CassetteError.
+
+CASSETTE_MATCH=exact (default) serves a call only the recordings of an identical request,
+in order and cycling, and raises CassetteMiss for anything unrecorded. CASSETTE_MATCH=sequence
+serves each provider's recordings in order whatever the request, to drive new inputs with the
+recorded payload sizes and latency distribution.
+
+A service passes configure() its default CASSETTE_DIR.
+"""
+import os
+import sys
+import json
+import time
+import math
+import io
+import base64
+import asyncio
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "").lower()  # record, replay, or empty for off
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", os.path.join("fixtures", "cassettes"))  # see configure()
+CASSETTE_PROVIDERS = {p.strip().lower() for p in os.getenv("CASSETTE_PROVIDERS", "all").split(",") if p.strip()}
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1.0"))
+CASSETTE_MATCH = os.getenv("CASSETTE_MATCH", "exact").lower()  # exact or sequence
+
+MODES = ("record", "replay")
+if CASSETTE_MODE and CASSETTE_MODE not in MODES:
+    raise ValueError(f"CASSETTE_MODE must be record or replay, not {CASSETTE_MODE!r}")
+
+logger = logging.getLogger(__name__)
+
+class CassetteMiss(LookupError):
+    """A replayed call has no recording."""
+
+class CassetteError(RuntimeError):
+    """A replayed call whose recording raised an error."""
+
+def mode(provider: str) -> Optional[str]:
+    """CASSETTE_MODE if it applies to a provider, else None."""
+    if CASSETTE_MODE in MODES and ("all" in CASSETTE_PROVIDERS or provider in CASSETTE_PROVIDERS):
+        return CASSETTE_MODE
+    return None
+
+def request_key(request: Any) -> str:
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class Cassette:
+    """One provider's recorded calls, in CASSETTE_DIR/<provider>.jsonl."""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.path = os.path.join(CASSETTE_DIR, f"{provider}.jsonl")
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self._played: Dict[str, int] = {}
+
+    def record(self, request: Any, response: Any, latency_ms: float, error: Optional[str] = None) -> None:
+        entry = {
+            "key": request_key(request),
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "latency_ms": round(latency_ms, 2),
+            "request": request,
+            "response": response,
+            "error": error,
+        }
+        line = json.dumps(entry, default=str)
+        with self._lock:
+            os.makedirs(CASSETTE_DIR, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _load(self) -> Dict[str, List[Dict[str, Any]]]:
+        if self._entries is None:
+            entries: Dict[str, List[Dict[str, Any]]] = {"*": []}
+            if os.path.exists(self.path):
+                with open(self.path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            entries.setdefault(entry["key"], []).append(entry)
+                            entries["*"].append(entry)
+            logger.info(f"Loaded {len(entries['*'])} {self.provider} recordings from {self.path}")
+            self._entries = entries
+        return self._entries
+
+    def play(self, request: Any) -> Dict[str, Any]:
+        """The next recording for a request, cycling through them in recorded order."""
+        key = "*" if CASSETTE_MATCH == "sequence" else request_key(request)
+        with self._lock:
+            recordings = self._load().get(key)
+            if not recordings:
+                raise CassetteMiss(f"No {self.provider} recording for {json.dumps(request, default=str)[:200]} in {self.path}")
+            played = self._played.get(key, 0)
+            self._played[key] = played + 1
+            return recordings[played % len(recordings)]
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+def configure(cassette_dir: str) -> None:
+    """Set the directory cassettes are recorded to and replayed from, unless CASSETTE_DIR is set."""
+    global CASSETTE_DIR
+    with _cassettes_lock:
+        CASSETTE_DIR = os.getenv("CASSETTE_DIR", cassette_dir)
+        _cassettes.clear()
+
+def cassette(provider: str) -> Cassette:
+    with _cassettes_lock:
+        if provider not in _cassettes:
+            _cassettes[provider] = Cassette(provider)
+        return _cassettes[provider]
+
+def _latency(entry: Dict[str, Any]) -> float:
+    return entry["latency_ms"] * CASSETTE_LATENCY_SCALE / 1000
+
+def _replayed(entry: Dict[str, Any]) -> Any:
+    if entry.get("error"):
+        raise CassetteError(entry["error"])
+    return entry["response"]
+
+def call(provider: str, request: Any, func: Optional[Callable[[], Any]], encode: Callable[[Any], Any], decode: Callable[[Any], Any]) -> Any:
+    """Replay a call from the provider's cassette, or make it with func() and record it."""
+    tape = cassette(provider)
+    if func is None:
+        entry = tape.play(request)
+        time.sleep(_latency(entry))
+        return decode(_replayed(entry))
+    start = time.perf_counter()
+    try:
+        result = func()
+    except Exception as e:
+        tape.record(request, None, (time.perf_counter() - start) * 1000, f"{type(e).__name__}: {e}")
+        raise
+    tape.record(request, encode(result), (time.perf_counter() - start) * 1000)
+    return result
+
+async def acall(provider: str, request: Any, func: Optional[Callable[[], Any]], encode: Callable[[Any], Any], decode: Callable[[Any], Any]) -> Any:
+    """Async variant of call(); func returns an awaitable."""
+    tape = cassette(provider)
+    if func is None:
+        entry = tape.play(request)
+        await asyncio.sleep(_latency(entry))
+        return decode(_replayed(entry))
+    start = time.perf_counter()
+    try:
+        result = await func()
+    except Exception as e:
+        tape.record(request, None, (time.perf_counter() - start) * 1000, f"{type(e).__name__}: {e}")
+        raise
+    tape.record(request, encode(result), (time.perf_counter() - start) * 1000)
+    return result
+
+def _identity(value: Any) -> Any:
+    return value
+
+# --- LLM ---
+
+def wrap_llm(model: Any) -> Any:
+    """A chat model recording model's calls, or replaying them if model is None."""
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    def llm_request(messages: List[BaseMessage], stop: Optional[List[str]]) -> Dict[str, Any]:
+        return {"messages": [{"type": m.type, "content": m.content} for m in messages], "stop": stop}
+
+    def encode(result: ChatResult) -> Dict[str, Any]:
+        message = result.generations[0].message
+        return {"content": message.content, "usage_metadata": getattr(message, "usage_metadata", None)}
+
+    def decode(response: Dict[str, Any]) -> ChatResult:
+        message = AIMessage(content=response["content"], usage_metadata=response.get("usage_metadata"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def replay_chunks(entry: Dict[str, Any]) -> Iterator[Tuple[float, ChatGenerationChunk]]:
+        """(seconds since the previous chunk, chunk) for a recording, streamed or not."""
+        response = _replayed(entry)
+        chunks = response.get("chunks") or [[entry["latency_ms"], response["content"]]]
+        previous = 0.0
+        for i, (offset_ms, text) in enumerate(chunks):
+            usage = response.get("usage_metadata") if i == len(chunks) - 1 else None
+            yield (offset_ms - previous) * CASSETTE_LATENCY_SCALE / 1000, ChatGenerationChunk(message=AIMessageChunk(content=text, usage_metadata=usage))
+            previous = offset_ms
+
+    class RecordedChunks:
+        """Collect a streamed reply's chunks, with when each arrived, for recording."""
+
+        def __init__(self, request: Dict[str, Any]):
+            self.request = request
+            self.start = time.perf_counter()
+            self.chunks: List[List[Any]] = []
+            self.message: Any = None
+
+        def add(self, chunk: Any) -> None:
+            self.chunks.append([round((time.perf_counter() - self.start) * 1000, 2), chunk.message.content])
+            self.message = chunk.message if self.message is None else self.message + chunk.message
+
+        def record(self, error: Optional[BaseException] = None) -> None:
+            latency_ms = (time.perf_counter() - self.start) * 1000
+            if error is not None:
+                cassette("llm").record(self.request, None, latency_ms, f"{type(error).__name__}: {error}")
+            else:
+                content = self.message.content if self.message is not None else ""
+                usage = getattr(self.message, "usage_metadata", None)
+                cassette("llm").record(self.request, {"content": content, "usage_metadata": usage, "chunks": self.chunks}, latency_ms)
+
+    class CassetteChatModel(BaseChatModel):
+        """Chat model recording another model's calls into the llm cassette, or replaying them.
+
+        The wrapped model's _generate/_stream are called directly, so callbacks, tracing and
+        token accounting see each call once.
+        """
+
+        model: Optional[BaseChatModel] = None
+
+        @property
+        def _llm_type(self) -> str:
+            return "cassette"
+
+        def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+            func = (lambda: self.model._generate(messages, stop=stop, **kwargs)) if self.model else None
+            return call("llm", llm_request(messages, stop), func, encode, decode)
+
+        async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+            func = (lambda: self.model._agenerate(messages, stop=stop, **kwargs)) if self.model else None
+            return await acall("llm", llm_request(messages, stop), func, encode, decode)
+
+        def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+            request = llm_request(messages, stop)
+            if self.model is None:
+                for wait, chunk in replay_chunks(cassette("llm").play(request)):
+                    time.sleep(wait)
+                    yield chunk
+                return
+            recorded = RecordedChunks(request)
+            try:
+                for chunk in self.model._stream(messages, stop=stop, **kwargs):
+                    recorded.add(chunk)
+                    yield chunk
+            except Exception as e:
+                recorded.record(e)
+                raise
+            recorded.record()
+
+        async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+            request = llm_request(messages, stop)
+            if self.model is None:
+                for wait, chunk in replay_chunks(cassette("llm").play(request)):
+                    await asyncio.sleep(wait)
+                    yield chunk
+                return
+            recorded = RecordedChunks(request)
+            try:
+                async for chunk in self.model._astream(messages, stop=stop, **kwargs):
+                    recorded.add(chunk)
+                    yield chunk
+            except Exception as e:
+                recorded.record(e)
+                raise
+            recorded.record()
+
+    return CassetteChatModel(model=model)
+
+# --- TTS ---
+
+def tts_class(tts: Optional[type] = None) -> type:
+    """A class with gTTS's interface recording the audio tts makes, or replaying it if tts is None."""
+
+    class CassetteTTS:
+        def __init__(self, text: str, lang: str = "en", slow: bool = False, **kwargs: Any):
+            self.text = text
+            self.lang = lang
+            self.slow = slow
+            self.kwargs = kwargs
+
+        def _audio(self) -> bytes:
+            def synthesize() -> bytes:
+                buffer = io.BytesIO()
+                tts(text=self.text, lang=self.lang, slow=self.slow, **self.kwargs).write_to_fp(buffer)
+                return buffer.getvalue()
+
+            request = {"text": self.text, "lang": self.lang, "slow": self.slow}
+            encode = lambda audio: {"audio_b64": base64.b64encode(audio).decode("ascii")}
+            decode = lambda response: base64.b64decode(response["audio_b64"])
+            return call("tts", request, synthesize if tts else None, encode, decode)
+
+        def write_to_fp(self, fp: Any) -> None:
+            fp.write(self._audio())
+
+        def save(self, savefile: str) -> None:
+            with open(savefile, "wb") as f:
+                f.write(self._audio())
+
+    return CassetteTTS
+
+# --- Tavily ---
+
+class CassetteTavilyClient:
+    """TavilyClient recording another client's searches, or replaying them if client is None."""
+
+    def __init__(self, client: Any = None):
+        self.client = client
+
+    def search(self, query: str, **kwargs: Any) -> Dict[str, Any]:
+        func = (lambda: self.client.search(query=query, **kwargs)) if self.client else None
+        return call("tavily", {"method": "search", "query": query, **kwargs}, func, _identity, _identity)
+
+    def get_search_context(self, query: str, **kwargs: Any) -> str:
+        func = (lambda: self.client.get_search_context(query=query, **kwargs)) if self.client else None
+        return call("tavily", {"method": "get_search_context", "query": query, **kwargs}, func, _identity, _identity)
+
+class CassetteAsyncTavilyClient:
+    """AsyncTavilyClient recording another client's searches, or replaying them if client is None."""
+
+    def __init__(self, client: Any = None):
+        self.client = client
+
+    async def search(self, query: str, **kwargs: Any) -> Dict[str, Any]:
+        func = (lambda: self.client.search(query=query, **kwargs)) if self.client else None
+        return await acall("tavily", {"method": "search", "query": query, **kwargs}, func, _identity, _identity)
+
+def wrap_tavily(client: Any) -> CassetteTavilyClient:
+    return CassetteTavilyClient(client)
+
+def wrap_async_tavily(client: Any) -> CassetteAsyncTavilyClient:
+    return CassetteAsyncTavilyClient(client)
+
+# --- Embeddings and vector search ---
+
+def wrap_embeddings(embeddings: Any) -> Any:
+    """Embeddings recording another model's calls, or replaying them if embeddings is None."""
+    from langchain_core.embeddings import Embeddings
+
+    class CassetteEmbeddings(Embeddings):
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            func = (lambda: embeddings.embed_documents(texts)) if embeddings else None
+            return call("embeddings", {"method": "embed_documents", "texts": texts}, func, _identity, _identity)
+
+        def embed_query(self, text: str) -> List[float]:
+            func = (lambda: embeddings.embed_query(text)) if embeddings else None
+            return call("embeddings", {"method": "embed_query", "text": text}, func, _identity, _identity)
+
+    return CassetteEmbeddings()
+
+def _encode_scored_documents(results: List[Tuple[Any, float]]) -> List[Dict[str, Any]]:
+    return [{"page_content": doc.page_content, "metadata": doc.metadata, "score": score} for doc, score in results]
+
+def _decode_scored_documents(response: List[Dict[str, Any]]) -> List[Tuple[Any, float]]:
+    from langchain_core.documents import Document
+    return [(Document(page_content=item["page_content"], metadata=item["metadata"]), item["score"]) for item in response]
+
+class CassetteVectorStore:
+    """The vector store searches the workflows make, recorded from another store or replayed if store is None."""
+
+    def __init__(self, store: Any = None):
+        self.store = store
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Any, float]]:
+        func = (lambda: self.store.similarity_search_with_score(query=query, k=k, **kwargs)) if self.store else None
+        request = {"method": "similarity_search", "query": query, "k": k, **kwargs}
+        return call("vectorstore", request, func, _encode_scored_documents, _decode_scored_documents)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Any]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+def wrap_vector_store(store: Any) -> CassetteVectorStore:
+    return CassetteVectorStore(store)
+
+class CassetteRetriever:
+    """LlamaIndex retriever recording another retriever's results, or replaying them if retriever is None."""
+
+    def __init__(self, retriever: Any = None):
+        self.retriever = retriever
+
+    def retrieve(self, query: str) -> List[Any]:
+        def encode(nodes: List[Any]) -> List[Dict[str, Any]]:
+            return [{"text": node.get_content(), "metadata": node.metadata, "score": node.score} for node in nodes]
+
+        def decode(response: List[Dict[str, Any]]) -> List[Any]:
+            from llama_index.core.schema import NodeWithScore, TextNode
+            return [NodeWithScore(node=TextNode(text=item["text"], metadata=item["metadata"]), score=item["score"]) for item in response]
+
+        func = (lambda: self.retriever.retrieve(query)) if self.retriever else None
+        return call("vectorstore", {"method": "retrieve", "query": query}, func, encode, decode)
+
+def wrap_retriever(retriever: Any) -> CassetteRetriever:
+    return CassetteRetriever(retriever)
+
+# --- Scraped sites ---
+
+def _http_request(method: str, url: str) -> Dict[str, Any]:
+    return {"method": method, "url": url}
+
+def _encode_http(status: int, headers: Any, body: bytes) -> Dict[str, Any]:
+    return {
+        "status": status,
+        "content_type": headers.get("Content-Type", ""),
+        "body_b64": base64.b64encode(body).decode("ascii"),
+    }
+
+def http_adapter(adapter: Any = None) -> Any:
+    """A requests adapter recording another adapter's responses, or replaying them if adapter is None."""
+    from requests.adapters import BaseAdapter
+    from requests.models import Response
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+
+    def encode(response: Any) -> Dict[str, Any]:
+        return _encode_http(response.status_code, response.headers, response.content)
+
+    class CassetteAdapter(BaseAdapter):
+        def send(self, request, **kwargs):
+            func = (lambda: adapter.send(request, **kwargs)) if adapter else None
+            recorded = call("sites", _http_request(request.method, request.url), func, encode, _identity)
+            if adapter:
+                return recorded
+            response = Response()
+            response.status_code = recorded["status"]
+            response._content = base64.b64decode(recorded["body_b64"])
+            response.headers = CaseInsensitiveDict({"Content-Type": recorded["content_type"]})
+            response.encoding = get_encoding_from_headers(response.headers)
+            response.url = request.url
+            response.request = request
+            return response
+
+        def close(self):
+            if adapter:
+                adapter.close()
+
+    return CassetteAdapter()
+
+def async_http_transport(transport: Any = None) -> Any:
+    """An httpx transport recording another transport's responses, or replaying them if transport is None."""
+    import httpx
+
+    class CassetteTransport(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            http_request = _http_request(request.method, str(request.url))
+            if transport is None:
+                recorded = await acall("sites", http_request, None, _identity, _identity)
+                headers = {"Content-Type": recorded["content_type"]} if recorded["content_type"] else {}
+                return httpx.Response(recorded["status"], headers=headers, content=base64.b64decode(recorded["body_b64"]), request=request)
+
+            async def send() -> httpx.Response:
+                response = await transport.handle_async_request(request)
+                await response.aread()
+                return response
+
+            encode = lambda response: _encode_http(response.status_code, response.headers, response.content)
+            return await acall("sites", http_request, send, encode, _identity)
+
+        async def aclose(self) -> None:
+            if transport is not None:
+                await transport.aclose()
+
+    return CassetteTransport()
+
+# --- Report ---
+
+def _percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(p / 100 * len(ordered))) - 1]
+
+def summary(directory: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Calls, errors, latency percentiles and mean response size per recorded provider."""
+    directory = directory or CASSETTE_DIR
+    rows = []
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        if not name.endswith(".jsonl"):
+            continue
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        if not entries:
+            continue
+        latencies = [entry["latency_ms"] for entry in entries]
+        sizes = [len(json.dumps(entry["response"], default=str)) for entry in entries if not entry.get("error")]
+        rows.append({
+            "provider": name[:-len(".jsonl")],
+            "calls": len(entries),
+            "distinct_requests": len({entry["key"] for entry in entries}),
+            "errors": sum(1 for entry in entries if entry.get("error")),
+            "p50_ms": round(_percentile(latencies, 50), 1),
+            "p95_ms": round(_percentile(latencies, 95), 1),
+            "max_ms": round(max(latencies), 1),
+            "mean_response_bytes": round(sum(sizes) / len(sizes)) if sizes else 0,
+        })
+    return rows
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Summarise the recorded cassettes")
+    parser.add_argument("--dir", default=CASSETTE_DIR, help="Cassette directory")
+    args = parser.parse_args()
+    rows = summary(args.dir)
+    if not rows:
+        print(f"No recordings in {args.dir}")
+        sys.exit(1)
+    header = list(rows[0])
+    table = [[str(row[column]) for column in header] for row in rows]
+    widths = [max([len(header[i])] + [len(row[i]) for row in table]) for i in range(len(header))]
+    print("  ".join(h.ljust(w) for h, w in zip(header, widths)).rstrip())
+    for row in table:
+        print("  ".join(c.ljust(w) for c, w in zip(row, widths)).rstrip())
@@ -0,0 +1,55 @@
+"""
+SQLite connections for the shared modules that store state (token_usage, llm_cache, singleflight)
+
+Those modules take a connect() function from configure(): a service with a database of its own
+passes the function opening it, and one without can pass connector(path).
+"""
+import sqlite3
+import threading
+from typing import Callable, Optional
+from farmwise_common import metrics
+
+def connector(path: str) -> Callable[[], sqlite3.Connection]:
+    """A connect() opening path with timed statements, in WAL mode so worker processes can read while one writes."""
+    lock = threading.Lock()
+    wal = False
+
+    def connect() -> sqlite3.Connection:
+        nonlocal wal
+        conn = sqlite3.connect(path, timeout=10, factory=metrics.TimedConnection)
+        if not wal:
+            with lock:
+                if not wal:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    wal = True
+        return conn
+    return connect
+
+class Schema:
+    """Tables a shared module creates, on the first connection after configure()."""
+
+    def __init__(self, owner: str, *statements: str):
+        self.owner = owner
+        self.statements = statements
+        self.connect_db: Optional[Callable[[], sqlite3.Connection]] = None
+        self._lock = threading.Lock()
+        self._created = False
+
+    def configure(self, connect: Callable[[], sqlite3.Connection]) -> None:
+        with self._lock:
+            self.connect_db = connect
+            self._created = False
+
+    def connect(self) -> sqlite3.Connection:
+        """A connection from the configured connect(), with the tables created."""
+        if self.connect_db is None:
+            raise sqlite3.OperationalError(f"{self.owner} has no database, call {self.owner}.configure() first")
+        conn = self.connect_db()
+        if not self._created:
+            with self._lock:
+                if not self._created:
+                    for statement in self.statements:
+                        conn.execute(statement)
+                    conn.commit()
+                    self._created = True
+        return conn
@@ -0,0 +1,31 @@
+"""
+Import time of a module, measured in a fresh interpreter with python -X importtime
+"""
+import subprocess
+import sys
+from typing import List, Optional, Tuple
+
+def parse_importtime(output: str) -> Tuple[float, List[Tuple[float, str]]]:
+    """Total ms and (cumulative ms, package) per top-level import in -X importtime output."""
+    top_level = []
+    for line in output.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <indent><package>"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, package = line[len("import time:"):].split("|", 2)
+        if not package.startswith(" ") or package.startswith("  "):
+            continue  # Nested import, already counted in its parent's cumulative time
+        top_level.append((int(cumulative) / 1000, package.strip()))
+    return sum(ms for ms, _ in top_level), top_level
+
+def measure_imports(module: str, cwd: Optional[str] = None) -> Tuple[float, List[Tuple[float, str]]]:
+    """Import a module in a fresh interpreter run in cwd; return total ms and (cumulative ms, package) per top-level import."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=cwd
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
@@ -0,0 +1,114 @@
+"""
+Exact-match cache of LLM responses for prompt types whose output only depends on their input,
+stored in SQLite so every worker process shares it
+
+A response is keyed by the model, the prompt type, the rendered messages, the stop sequences
+and the temperature, so any change to a template or its inputs is a miss. The LLM gateway
+(farmwise_common.llm_gateway) looks calls up here when their run config names a prompt type
+(llm_gateway.call_config()), so the cache is skipped when LLM_GATEWAY=0.
+
+- LLM_CACHE_TTLS: "prompt=seconds,..." for the prompt types to cache; prompt types not listed,
+  or with a TTL of 0, are never cached
+- LLM_CACHE_BYPASS: prompt types (or "all") whose calls skip the cache, e.g. while a prompt is
+  being tuned
+
+A service passes configure() the database to use and the TTLs of its prompt types, which
+LLM_CACHE_TTLS replaces. Hits are counted in the cache_lookups_total metric as
+cache="llm_<prompt>".
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from typing import Any, Callable, Dict, List, Optional
+from farmwise_common import metrics
+from farmwise_common.db import Schema
+
+LLM_CACHE_TTLS: Dict[str, int] = {}  # See configure()
+LLM_CACHE_BYPASS = {p.strip() for p in os.getenv("LLM_CACHE_BYPASS", "").split(",") if p.strip()}
+
+logger = logging.getLogger(__name__)
+
+_schema = Schema(
+    "llm_cache",
+    """
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        key TEXT PRIMARY KEY,
+        prompt TEXT NOT NULL,
+        model TEXT NOT NULL,
+        response TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    """
+)
+
+def parse_ttls(spec: str) -> Dict[str, int]:
+    """Parse "prompt=seconds,..." into TTLs per prompt type."""
+    return {
+        name.strip(): int(ttl)
+        for name, _, ttl in (item.partition("=") for item in spec.split(","))
+        if name.strip() and ttl.strip()
+    }
+
+def configure(connect: Callable[[], sqlite3.Connection], ttls: Dict[str, int]) -> None:
+    """Set the database responses are cached in and the default TTL (seconds) of each prompt type to cache."""
+    global LLM_CACHE_TTLS
+    _schema.configure(connect)
+    LLM_CACHE_TTLS = parse_ttls(os.environ["LLM_CACHE_TTLS"]) if "LLM_CACHE_TTLS" in os.environ else dict(ttls)
+
+def enabled(prompt: Optional[str]) -> bool:
+    """Whether calls of a prompt type are cached."""
+    return bool(prompt) and LLM_CACHE_TTLS.get(prompt, 0) > 0 and prompt not in LLM_CACHE_BYPASS and "all" not in LLM_CACHE_BYPASS
+
+def cache_key(model: str, prompt: str, messages: List[Any], stop: Optional[List[str]], temperature: Optional[float]) -> str:
+    """Key a call by its model, prompt type, rendered messages, stop sequences and temperature."""
+    payload = json.dumps({
+        "model": model,
+        "prompt": prompt,
+        "messages": [[m.type, m.content] for m in messages],
+        "stop": stop,
+        "temperature": temperature
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _lookup(prompt: str, key: str) -> Optional[str]:
+    """The cached response text for a key, or None if missing or older than the prompt type's TTL."""
+    conn = _schema.connect()
+    row = conn.execute(
+        "SELECT response FROM llm_cache WHERE key = ? AND created_at >= ?",
+        (key, time.time() - LLM_CACHE_TTLS[prompt])
+    ).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def get(prompt: str, key: str) -> Optional[str]:
+    """Return the cached response text for a key, counting the lookup in the metrics"""
+    try:
+        response = _lookup(prompt, key)
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache read failed: {e}")
+        return None
+    metrics.record_cache_lookup(f"llm_{prompt}", response is not None)
+    return response
+
+def peek(prompt: str, key: str) -> Optional[str]:
+    """get() without counting a cache lookup, for polling while another process computes the response."""
+    try:
+        return _lookup(prompt, key)
+    except sqlite3.Error:
+        return None
+
+def put(prompt: str, key: str, model: str, response: str) -> None:
+    """Cache a response text"""
+    try:
+        conn = _schema.connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, prompt, model, response, created_at) VALUES (?, ?, ?, ?, ?)",
+            (key, prompt, model, response, time.time())
+        )
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache write failed: {e}")
@@ -0,0 +1,641 @@
+"""
+Gateway for a service's Gemini chat calls: concurrency limits, rate limiting, retries and
+circuit breaking in one place, so bursts of requests queue (or are refused) here instead of
+failing at Gemini's rate limits
+
+- Concurrency: at most LLM_MAX_CONCURRENCY calls in flight in the process, and at most the
+  model's limit from LLM_MODEL_CONCURRENCY ("gemini-2.0-flash=4,gemini-1.5-pro=1"; models not
+  listed only share the global limit). Slots are granted first come, first served.
+- Rate: a token bucket per model allowing LLM_RATE_PER_MINUTE calls a minute (0 = no limit),
+  in bursts of up to LLM_RATE_BURST. Retries take a token like any other call.
+- Load shedding: a call waits at most LLM_QUEUE_TIMEOUT_S for its token and slots, and is
+  refused at once when LLM_MAX_QUEUED calls are already waiting (0 = no limit). Both raise
+  GatewayBusy.
+- Retries: 429s, 5xx, timeouts and dropped connections are retried up to LLM_RETRY_ATTEMPTS
+  times, after a full-jitter exponential backoff (a random wait of up to LLM_RETRY_BASE_MS,
+  doubling per attempt up to LLM_RETRY_MAX_MS). The slot is given back while backing off. A
+  streamed call is only retried until its first chunk has been passed on.
+- Circuit breaker: LLM_BREAKER_FAILURES failed attempts in a row (of the kinds retried) open a
+  model's circuit, and its calls fail fast with CircuitOpen for LLM_BREAKER_RESET_S. Then one
+  trial call is let through (half-open): success closes the circuit, failure opens it again.
+- Metrics: queue wait, queued and in-flight calls, retries, refusals and circuit state per
+  model.
+- Response cache: calls run with call_config(prompt_type) are answered from llm_cache when
+  that prompt type is cached, without taking a slot.
+- Coalescing: identical concurrent (non-streamed) calls run with call_config() share one
+  answer through singleflight.
+
+Limits are per process, so under gunicorn each worker has its own; a WSGI app's threads and an
+ASGI app's event loop in the same process share them. A service wraps its chat model with
+wrap_llm() unless LLM_GATEWAY=0, having configured llm_cache and singleflight with its storage,
+and answers GatewayUnavailable (GatewayBusy, CircuitOpen) with a 503 and a Retry-After header.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from farmwise_common import metrics
+
+LLM_GATEWAY = os.getenv("LLM_GATEWAY", "1").lower() not in ("0", "false", "no", "off")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MODEL_CONCURRENCY = {
+    name.strip(): int(limit)
+    for name, _, limit in (item.partition("=") for item in os.getenv("LLM_MODEL_CONCURRENCY", "").split(","))
+    if name.strip() and limit.strip()
+}
+LLM_RATE_PER_MINUTE = float(os.getenv("LLM_RATE_PER_MINUTE", "0"))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", "5"))
+LLM_QUEUE_TIMEOUT_S = float(os.getenv("LLM_QUEUE_TIMEOUT_S", "30"))
+LLM_MAX_QUEUED = int(os.getenv("LLM_MAX_QUEUED", "0"))
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+LLM_RETRY_BASE_MS = float(os.getenv("LLM_RETRY_BASE_MS", "500"))
+LLM_RETRY_MAX_MS = float(os.getenv("LLM_RETRY_MAX_MS", "8000"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_S = float(os.getenv("LLM_BREAKER_RESET_S", "30"))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# Google API client exceptions, for errors that don't carry an HTTP status
+_STATUS_BY_NAME = {
+    "ResourceExhausted": 429,
+    "TooManyRequests": 429,
+    "InternalServerError": 500,
+    "BadGateway": 502,
+    "ServiceUnavailable": 503,
+    "DeadlineExceeded": 504,
+    "GatewayTimeout": 504,
+}
+
+PROMPT_TYPE = "prompt_type"  # Run metadata naming a call's prompt type, see call_config()
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_CIRCUIT_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+logger = logging.getLogger(__name__)
+
+class GatewayUnavailable(Exception):
+    """An LLM call refused by the gateway without calling the model."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class GatewayBusy(GatewayUnavailable):
+    """Too many LLM calls are already waiting, or this one waited too long."""
+
+class CircuitOpen(GatewayUnavailable):
+    """The model's circuit is open after repeated failures."""
+
+def error_status(error: BaseException) -> Optional[int]:
+    """The HTTP status behind an LLM client error, if it has one."""
+    for value in (getattr(error, "status_code", None), getattr(error, "code", None),
+                  getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    return _STATUS_BY_NAME.get(type(error).__name__)
+
+def retry_reason(error: BaseException) -> Optional[str]:
+    """Why an error is worth retrying ("429", "503", "timeout", ...), or None if it isn't."""
+    status = error_status(error)
+    if status in RETRYABLE_STATUS:
+        return str(status)
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, ConnectionError) or type(error).__name__ in ("ConnectError", "ReadTimeout", "RemoteProtocolError"):
+        return "connection"
+    return None
+
+def backoff(attempt: int) -> float:
+    """Seconds to wait before retry number attempt (from 1): full jitter over an exponential cap."""
+    return random.uniform(0, min(LLM_RETRY_MAX_MS, LLM_RETRY_BASE_MS * 2 ** (attempt - 1))) / 1000
+
+class _Waiter:
+    """A thread or a coroutine waiting for a Limiter slot."""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self) -> bool:
+        """Hand the waiter its slot; False if it can't be woken (its event loop has closed)."""
+        if self.loop is None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(True))
+            return True
+        except RuntimeError:
+            return False
+
+class Limiter:
+    """Counting semaphore shared by threads and event loops, granting slots in arrival order.
+
+    The WSGI app's worker threads and the ASGI app's event loop can hold slots of the same
+    limiter. A slot released while others wait is handed straight to the first of them.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._lock = threading.Lock()
+        self._waiters: Deque[_Waiter] = deque()
+
+    def _enter(self, waiter: _Waiter) -> bool:
+        """Take a free slot, or queue the waiter (call with the lock held)."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        self._waiters.append(waiter)
+        return False
+
+    def _leave(self, waiter: _Waiter) -> bool:
+        """Stop waiting; True if the slot was granted meanwhile (and so is now held)."""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+                return False
+            except ValueError:
+                return True
+
+    def acquire(self, timeout: Optional[float]) -> bool:
+        waiter = _Waiter()
+        with self._lock:
+            if self._enter(waiter):
+                return True
+        return waiter.event.wait(timeout) or self._leave(waiter)
+
+    async def aacquire(self, timeout: Optional[float]) -> bool:
+        waiter = _Waiter(asyncio.get_running_loop())
+        with self._lock:
+            if self._enter(waiter):
+                return True
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self._leave(waiter)
+        except asyncio.CancelledError:
+            if self._leave(waiter):
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                if self._waiters.popleft().wake():
+                    return
+            self.active -= 1
+
+class TokenBucket:
+    """Rate limit of rate_per_minute calls, in bursts of up to burst calls."""
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, timeout: Optional[float]) -> Optional[float]:
+        """Take a token, returning how long to wait before using it, or None (taking nothing)
+        if that would be longer than timeout. Tokens are taken ahead of time, so waiting calls
+        go in the order they arrived."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                return None
+            self.tokens -= 1
+            return wait
+
+class CircuitBreaker:
+    """Closed, open or half-open state of one model's circuit."""
+
+    def __init__(self, name: str, failures: int, reset_s: float):
+        self.name = name
+        self.threshold = failures
+        self.reset_s = reset_s
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial = False
+        self._lock = threading.Lock()
+        metrics.LLM_CIRCUIT_STATE.labels(name).set(_CIRCUIT_STATE_VALUES[CLOSED])
+
+    def _set(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"LLM gateway: {self.name} circuit {self.state} -> {state}")
+            self.state = state
+            metrics.LLM_CIRCUIT_STATE.labels(self.name).set(_CIRCUIT_STATE_VALUES[state])
+
+    def retry_after(self) -> float:
+        return max(1.0, self.opened_at + self.reset_s - time.monotonic())
+
+    def check(self) -> None:
+        """Fail fast while the circuit is open (without claiming the half-open trial)."""
+        if self.state == OPEN and time.monotonic() - self.opened_at < self.reset_s:
+            raise CircuitOpen(f"{self.name} is failing, not calling it for now", self.retry_after())
+
+    def enter(self) -> None:
+        """Let a call through, or raise CircuitOpen. After the reset time one trial call goes through."""
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_s:
+                    raise CircuitOpen(f"{self.name} is failing, not calling it for now", self.retry_after())
+                self._set(HALF_OPEN)
+                self.trial = False
+            if self.state == HALF_OPEN:
+                if self.trial:
+                    raise CircuitOpen(f"{self.name} is recovering, waiting for a trial call", self.retry_after())
+                self.trial = True
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.trial = False
+            self._set(CLOSED)
+
+    def failed(self) -> None:
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            self.failures += 1
+            self.trial = False
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self._set(OPEN)
+
+    def abandoned(self) -> None:
+        """A call let through ended without an answer either way (e.g. it was cancelled)."""
+        with self._lock:
+            self.trial = False
+
+_global_limiter = Limiter(LLM_MAX_CONCURRENCY)
+_waiting = 0
+_waiting_lock = threading.Lock()
+
+class Gateway:
+    """Concurrency slots, rate limit and circuit breaker of one model."""
+
+    def __init__(self, name: str):
+        self.name = name
+        limit = LLM_MODEL_CONCURRENCY.get(name)
+        self.limiters = ([Limiter(limit)] if limit else []) + [_global_limiter]
+        self.bucket = TokenBucket(LLM_RATE_PER_MINUTE, LLM_RATE_BURST)
+        self.breaker = CircuitBreaker(name, LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_S)
+
+    def _queue(self) -> None:
+        global _waiting
+        try:
+            self.breaker.check()
+        except CircuitOpen:
+            metrics.LLM_GATEWAY_REJECTED.labels(self.name, "circuit_open").inc()
+            raise
+        with _waiting_lock:
+            if LLM_MAX_QUEUED and _waiting >= LLM_MAX_QUEUED:
+                metrics.LLM_GATEWAY_REJECTED.labels(self.name, "queue_full").inc()
+                raise GatewayBusy(f"{_waiting} LLM calls already waiting", LLM_QUEUE_TIMEOUT_S or 1.0)
+            _waiting += 1
+        metrics.LLM_GATEWAY_QUEUED.labels(self.name).inc()
+
+    def _dequeue(self, start: float) -> None:
+        global _waiting
+        with _waiting_lock:
+            _waiting -= 1
+        metrics.LLM_GATEWAY_QUEUED.labels(self.name).dec()
+        metrics.LLM_GATEWAY_QUEUE_WAIT.labels(self.name).observe(time.perf_counter() - start)
+
+    def _timed_out(self, waited: float) -> GatewayBusy:
+        metrics.LLM_GATEWAY_REJECTED.labels(self.name, "queue_timeout").inc()
+        return GatewayBusy(f"Waited {waited:.1f}s for an LLM slot", LLM_QUEUE_TIMEOUT_S)
+
+    def _remaining(self, start: float) -> Optional[float]:
+        return max(0.0, LLM_QUEUE_TIMEOUT_S - (time.perf_counter() - start)) if LLM_QUEUE_TIMEOUT_S > 0 else None
+
+    def _release(self, limiters: List[Limiter]) -> None:
+        for limiter in reversed(limiters):
+            limiter.release()
+
+    def _entered(self, held: List[Limiter]) -> None:
+        """Claim the circuit for a call holding its slots, giving them back if it is open."""
+        try:
+            self.breaker.enter()
+        except CircuitOpen:
+            metrics.LLM_GATEWAY_REJECTED.labels(self.name, "circuit_open").inc()
+            self._release(held)
+            raise
+        metrics.LLM_GATEWAY_IN_FLIGHT.labels(self.name).inc()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold a rate-limit token and the concurrency slots for one attempt."""
+        start = time.perf_counter()
+        self._queue()
+        held: List[Limiter] = []
+        try:
+            wait = self.bucket.reserve(self._remaining(start))
+            if wait is None:
+                raise self._timed_out(time.perf_counter() - start)
+            time.sleep(wait)
+            for limiter in self.limiters:
+                if not limiter.acquire(self._remaining(start)):
+                    raise self._timed_out(time.perf_counter() - start)
+                held.append(limiter)
+        except BaseException:
+            self._release(held)
+            raise
+        finally:
+            self._dequeue(start)
+        self._entered(held)
+        try:
+            yield
+        finally:
+            metrics.LLM_GATEWAY_IN_FLIGHT.labels(self.name).dec()
+            self._release(held)
+
+    @asynccontextmanager
+    async def aslot(self) -> AsyncIterator[None]:
+        """Async slot(): waits without blocking the event loop."""
+        start = time.perf_counter()
+        self._queue()
+        held: List[Limiter] = []
+        try:
+            wait = self.bucket.reserve(self._remaining(start))
+            if wait is None:
+                raise self._timed_out(time.perf_counter() - start)
+            await asyncio.sleep(wait)
+            for limiter in self.limiters:
+                if not await limiter.aacquire(self._remaining(start)):
+                    raise self._timed_out(time.perf_counter() - start)
+                held.append(limiter)
+        except BaseException:
+            self._release(held)
+            raise
+        finally:
+            self._dequeue(start)
+        self._entered(held)
+        try:
+            yield
+        finally:
+            metrics.LLM_GATEWAY_IN_FLIGHT.labels(self.name).dec()
+            self._release(held)
+
+    def outcome(self, error: Optional[Exception]) -> Optional[str]:
+        """Record an attempt's outcome with the circuit breaker, returning the retry reason if
+        the error is one worth retrying."""
+        reason = retry_reason(error) if error is not None else None
+        if reason:
+            self.breaker.failed()
+        elif error is None:
+            self.breaker.succeeded()
+        else:
+            self.breaker.abandoned()  # Errors that aren't outages say nothing about whether it recovered
+        return reason
+
+    def retrying(self, attempt: int, reason: Optional[str], error: Exception) -> float:
+        """Seconds to back off before retrying, or raise error if it shouldn't be retried."""
+        if reason is None or attempt > LLM_RETRY_ATTEMPTS or self.breaker.state == OPEN:
+            raise error
+        metrics.LLM_GATEWAY_RETRIES.labels(self.name, reason).inc()
+        wait = backoff(attempt)
+        logger.warning(f"LLM gateway: {self.name} failed ({reason}: {error}), retry {attempt}/{LLM_RETRY_ATTEMPTS} in {wait:.2f}s")
+        return wait
+
+    def call(self, func: Callable[[], Any]) -> Any:
+        attempt = 0
+        while True:
+            attempt += 1
+            with self.slot():
+                try:
+                    result = func()
+                except Exception as e:
+                    error, reason = e, self.outcome(e)
+                except BaseException:
+                    self.breaker.abandoned()
+                    raise
+                else:
+                    self.outcome(None)
+                    return result
+            time.sleep(self.retrying(attempt, reason, error))
+
+    async def acall(self, func: Callable[[], Any]) -> Any:
+        attempt = 0
+        while True:
+            attempt += 1
+            async with self.aslot():
+                try:
+                    result = await func()
+                except Exception as e:
+                    error, reason = e, self.outcome(e)
+                except BaseException:
+                    self.breaker.abandoned()
+                    raise
+                else:
+                    self.outcome(None)
+                    return result
+            await asyncio.sleep(self.retrying(attempt, reason, error))
+
+    def stream(self, func: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+        """Pass on a stream's chunks, retrying it only if it fails before the first one."""
+        attempt = 0
+        while True:
+            attempt += 1
+            started = False
+            with self.slot():
+                try:
+                    for chunk in func():
+                        started = True
+                        yield chunk
+                except Exception as e:
+                    error, reason = e, self.outcome(e)
+                    if started:
+                        raise
+                except BaseException:
+                    self.breaker.abandoned()
+                    raise
+                else:
+                    self.outcome(None)
+                    return
+            time.sleep(self.retrying(attempt, reason, error))
+
+    async def astream(self, func: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        attempt = 0
+        while True:
+            attempt += 1
+            started = False
+            async with self.aslot():
+                try:
+                    async for chunk in func():
+                        started = True
+                        yield chunk
+                except Exception as e:
+                    error, reason = e, self.outcome(e)
+                    if started:
+                        raise
+                except BaseException:
+                    self.breaker.abandoned()
+                    raise
+                else:
+                    self.outcome(None)
+                    return
+            await asyncio.sleep(self.retrying(attempt, reason, error))
+
+_gateways: Dict[str, Gateway] = {}
+_gateways_lock = threading.Lock()
+
+def gateway(name: str) -> Gateway:
+    """The gateway of a model, created on first use."""
+    with _gateways_lock:
+        if name not in _gateways:
+            _gateways[name] = Gateway(name)
+        return _gateways[name]
+
+def inner_model(model: Any) -> Any:
+    """The chat model doing the work, looking through wrappers like cassettes."""
+    inner = getattr(model, "model", None)
+    return model if inner is None or isinstance(inner, str) else inner_model(inner)
+
+def model_name(model: Any) -> str:
+    """Model name of a chat model ("gemini-1.5-flash"), looking through wrappers like cassettes."""
+    model = inner_model(model)
+    name = getattr(model, "model", None)
+    return name.rsplit("/", 1)[-1] if isinstance(name, str) else model._llm_type
+
+def call_config(prompt_type: str) -> Dict[str, Any]:
+    """Run config naming a call's prompt type, so its response can be cached (see llm_cache)."""
+    return {"metadata": {PROMPT_TYPE: prompt_type}}
+
+def wrap_llm(model: Any) -> Any:
+    """A chat model sending model's calls through the gateway, answering from llm_cache where it can."""
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+    from farmwise_common import llm_cache, singleflight, tracing
+
+    # Cached and coalesced answers cost nothing, and saying so keeps token accounting from estimating them
+    no_usage = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+    class GatewayChatModel(BaseChatModel):
+        """Chat model calling another one through the LLM gateway.
+
+        The wrapped model's _generate/_stream are called directly, so callbacks, tracing and
+        token accounting see each call once, however many attempts it took.
+        """
+
+        model: BaseChatModel
+
+        @property
+        def _llm_type(self) -> str:
+            return f"gateway-{self.model._llm_type}"
+
+        @property
+        def _gateway(self) -> Gateway:
+            return gateway(model_name(self.model))
+
+        def _call_key(self, messages: List[BaseMessage], stop: Optional[List[str]], run_manager: Any) -> Optional[Tuple[str, str]]:
+            """(prompt type, key) for a call run with call_config(), else None."""
+            prompt = (getattr(run_manager, "metadata", None) or {}).get(PROMPT_TYPE)
+            if not prompt:
+                return None
+            temperature = getattr(inner_model(self.model), "temperature", None)
+            return prompt, llm_cache.cache_key(model_name(self.model), prompt, messages, stop, temperature)
+
+        def _cached(self, key: Optional[Tuple[str, str]]) -> Optional[str]:
+            if not key or not llm_cache.enabled(key[0]):
+                return None
+            text = llm_cache.get(*key)
+            span = tracing.current_span()
+            if span is not None:
+                span.set_attribute("llm.cache_hit", text is not None)
+            return text
+
+        def _save(self, key: Optional[Tuple[str, str]], message: Any) -> None:
+            if key and llm_cache.enabled(key[0]) and message is not None and isinstance(message.content, str):
+                llm_cache.put(key[0], key[1], model_name(self.model), message.content)
+
+        def _cached_result(self, text: str) -> ChatResult:
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=no_usage))])
+
+        def _cached_chunk(self, text: str) -> ChatGenerationChunk:
+            return ChatGenerationChunk(message=AIMessageChunk(content=text, usage_metadata=no_usage))
+
+        def _lookup(self, key: Tuple[str, str]) -> Optional[Callable[[], Optional[ChatResult]]]:
+            """Read the response another worker process may be caching, for singleflight."""
+            if not llm_cache.enabled(key[0]):
+                return None
+
+            def lookup() -> Optional[ChatResult]:
+                text = llm_cache.peek(*key)
+                return self._cached_result(text) if text is not None else None
+            return lookup
+
+        def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+            key = self._call_key(messages, stop, run_manager)
+            text = self._cached(key)
+            if text is not None:
+                return self._cached_result(text)
+
+            def generate() -> ChatResult:
+                result = self._gateway.call(lambda: self.model._generate(messages, stop=stop, **kwargs))
+                self._save(key, result.generations[0].message)
+                return result
+
+            if key is None:
+                return generate()
+            # Identical concurrent calls wait for one answer (their tokens are only spent once)
+            result, coalesced = singleflight.do("llm", key[1], generate, self._lookup(key))
+            return self._cached_result(result.generations[0].message.content) if coalesced else result
+
+        async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+            key = self._call_key(messages, stop, run_manager)
+            text = self._cached(key)
+            if text is not None:
+                return self._cached_result(text)
+
+            async def generate() -> ChatResult:
+                result = await self._gateway.acall(lambda: self.model._agenerate(messages, stop=stop, **kwargs))
+                self._save(key, result.generations[0].message)
+                return result
+
+            if key is None:
+                return await generate()
+            result, coalesced = await singleflight.ado("llm", key[1], generate, self._lookup(key))
+            return self._cached_result(result.generations[0].message.content) if coalesced else result
+
+        def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+            key = self._call_key(messages, stop, run_manager)
+            text = self._cached(key)
+            if text is not None:
+                yield self._cached_chunk(text)
+                return
+            message = None
+            for chunk in self._gateway.stream(lambda: self.model._stream(messages, stop=stop, **kwargs)):
+                message = chunk.message if message is None else message + chunk.message
+                yield chunk
+            self._save(key, message)
+
+        async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+            key = self._call_key(messages, stop, run_manager)
+            text = self._cached(key)
+            if text is not None:
+                yield self._cached_chunk(text)
+                return
+            message = None
+            async for chunk in self._gateway.astream(lambda: self.model._astream(messages, stop=stop, **kwargs)):
+                message = chunk.message if message is None else message + chunk.message
+                yield chunk
+            self._save(key, message)
+
+    logger.info(f"LLM gateway: {model_name(model)} limited to {LLM_MODEL_CONCURRENCY.get(model_name(model), LLM_MAX_CONCURRENCY)} concurrent calls")
+    return GatewayChatModel(model=model)
@@ -0,0 +1,188 @@
+"""
+Prometheus metrics shared by the services, served in text format at /metrics
+
+- Request counts, latency and in-flight requests per route, from the hooks installed by init_app()
+- LLM calls, latency and token usage per prompt type (track_llm_call, record_llm_tokens)
+- LLM gateway queue wait, queued and in-flight calls, retries, refusals and circuit state per model, from llm_gateway
+- Cache lookups per cache (record_cache_lookup), including llm_cache's as cache="llm_<prompt>"
+- Calls coalesced by singleflight, per kind
+- SQLite statement timings, from connections made with factory=TimedConnection
+
+Cache hit ratio, for example:
+
+    sum(rate(cache_lookups_total{cache="llm_summary",result="hit"}[5m])) / sum(rate(cache_lookups_total{cache="llm_summary"}[5m]))
+
+Under gunicorn, PROMETHEUS_MULTIPROC_DIR is set (see each service's gunicorn.conf.py) so
+/metrics reports the totals of every worker process rather than the one that served the scrape.
+"""
+import os
+import re
+import time
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Tuple
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from farmwise_common import tracing
+
+REQUEST_LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 180)
+LLM_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+QUEUE_WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SQLITE_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+
+REQUESTS = Counter("http_requests_total", "HTTP requests handled", ["route", "method", "status"])
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ["route", "method"], buckets=REQUEST_LATENCY_BUCKETS)
+IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being handled", ["route"], multiprocess_mode="livesum")
+
+LLM_CALLS = Counter("llm_calls_total", "LLM calls", ["prompt", "status"])
+LLM_LATENCY = Histogram("llm_call_duration_seconds", "LLM call latency (until the last chunk for streamed calls)", ["prompt"], buckets=LLM_LATENCY_BUCKETS)
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens used", ["prompt", "direction"])
+
+LLM_GATEWAY_QUEUE_WAIT = Histogram("llm_gateway_queue_wait_seconds", "Time LLM call attempts waited for a rate-limit token and concurrency slots", ["model"], buckets=QUEUE_WAIT_BUCKETS)
+LLM_GATEWAY_QUEUED = Gauge("llm_gateway_queued", "LLM call attempts waiting in the gateway", ["model"], multiprocess_mode="livesum")
+LLM_GATEWAY_IN_FLIGHT = Gauge("llm_gateway_in_flight", "LLM call attempts in progress", ["model"], multiprocess_mode="livesum")
+LLM_GATEWAY_RETRIES = Counter("llm_gateway_retries_total", "LLM call attempts retried, by what went wrong", ["model", "reason"])
+LLM_GATEWAY_REJECTED = Counter("llm_gateway_rejected_total", "LLM calls refused by the gateway (queue_full, queue_timeout, circuit_open)", ["model", "reason"])
+LLM_CIRCUIT_STATE = Gauge("llm_gateway_circuit_state", "LLM circuit breaker state (0 closed, 1 half-open, 2 open)", ["model"], multiprocess_mode="livemax")
+
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups", ["cache", "result"])
+SINGLEFLIGHT_CALLS = Counter("singleflight_calls_total", "Coalesced calls by role: leader (computed it), follower (waited for a leader), remote (picked up from another process)", ["kind", "role"])
+
+SQLITE_LATENCY = Histogram("sqlite_query_duration_seconds", "SQLite statement latency", ["statement"], buckets=SQLITE_LATENCY_BUCKETS)
+
+_TABLE_PATTERN = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE(?: IF NOT EXISTS)?)\s+(\w+)", re.IGNORECASE)
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    """Count a cache lookup as a hit or a miss"""
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+@contextmanager
+def track_llm_call(prompt: str) -> Iterator[None]:
+    """Time an LLM call for a prompt type, counting it as an error if the block raises"""
+    start = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        LLM_CALLS.labels(prompt, status).inc()
+        LLM_LATENCY.labels(prompt).observe(time.perf_counter() - start)
+
+def record_llm_tokens(prompt: str, message: Any) -> None:
+    """Add the token usage reported on an LLM message (or streamed chunk), if any"""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        LLM_TOKENS.labels(prompt, "input").inc(usage.get("input_tokens", 0))
+        LLM_TOKENS.labels(prompt, "output").inc(usage.get("output_tokens", 0))
+
+def statement_label(sql: str) -> str:
+    """Label a SQL statement by its verb and table, e.g. "select llm_cache" """
+    words = sql.split(None, 1)
+    if not words:
+        return "empty"
+    table = _TABLE_PATTERN.search(sql)
+    return f"{words[0].lower()} {table.group(1)}" if table else words[0].lower()
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records how long each statement takes, as a metric and a trace span"""
+
+    def execute(self, sql, parameters=()):
+        label = statement_label(sql)
+        start = time.perf_counter()
+        try:
+            with tracing.span(f"sqlite {label}", kind=tracing.SPAN_KIND_CLIENT):
+                return super().execute(sql, parameters)
+        finally:
+            SQLITE_LATENCY.labels(label).observe(time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        label = statement_label(sql)
+        start = time.perf_counter()
+        try:
+            with tracing.span(f"sqlite {label}", kind=tracing.SPAN_KIND_CLIENT):
+                return super().executemany(sql, seq_of_parameters)
+        finally:
+            SQLITE_LATENCY.labels(label).observe(time.perf_counter() - start)
+
+class TimedConnection(sqlite3.Connection):
+    """Connection factory for sqlite3.connect() whose cursors (and conn.execute) are timed"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def _route(request: Any) -> str:
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+def _start_request(request: Any, g: Any) -> None:
+    g.metrics_route = _route(request)
+    g.metrics_start = time.perf_counter()
+    IN_FLIGHT.labels(g.metrics_route).inc()
+
+def _finish_request(request: Any, g: Any, exc: Any) -> None:
+    if not hasattr(g, "metrics_start"):
+        return
+    status = 500 if exc is not None else getattr(g, "metrics_status", 500)
+    IN_FLIGHT.labels(g.metrics_route).dec()
+    REQUESTS.labels(g.metrics_route, request.method, str(status)).inc()
+    REQUEST_LATENCY.labels(g.metrics_route, request.method).observe(time.perf_counter() - g.metrics_start)
+
+def metrics_response() -> Tuple[bytes, int, Dict[str, str]]:
+    """Render every metric in Prometheus text format, as a (body, status, headers) response"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), 200, {"Content-Type": CONTENT_TYPE_LATEST}
+
+def init_app(app: Any) -> None:
+    """
+    Install the request hooks and the /metrics route on a Flask or Quart app
+
+    Latency is measured until the request is torn down, which for streamed (SSE)
+    responses is after the last event has been sent.
+    """
+    if hasattr(app, "before_serving"):
+        from quart import request, g
+
+        @app.before_request
+        async def start_request():
+            _start_request(request, g)
+
+        @app.after_request
+        async def record_status(response):
+            g.metrics_status = response.status_code
+            return response
+
+        @app.teardown_request
+        async def finish_request(exc):
+            _finish_request(request, g, exc)
+
+        @app.route("/metrics")
+        async def metrics():
+            return metrics_response()
+    else:
+        from flask import request, g
+
+        @app.before_request
+        def start_request():
+            _start_request(request, g)
+
+        @app.after_request
+        def record_status(response):
+            g.metrics_status = response.status_code
+            return response
+
+        @app.teardown_request
+        def finish_request(exc):
+            _finish_request(request, g, exc)
+
+        @app.route("/metrics")
+        def metrics():
+            return metrics_response()
@@ -0,0 +1,365 @@
+"""
+On-demand profiling of single requests
+
+Off unless PROFILING_ENABLED is set. Then a request sent with an X-Profile header runs under
+a profiler and its profile is written to PROFILE_DIR, keeping the newest PROFILE_MAX_FILES:
+
+    curl -H "X-Profile: cprofile" ...     # deterministic profile of the request's thread
+    curl -H "X-Profile: sampling" ...     # wall-clock stack samples of every thread
+
+- cprofile (or 1/true): deterministic profile of the request's thread, written as .prof
+  (python -m pstats, snakeviz); work handed to other threads (asyncio.to_thread, LangGraph's
+  sync nodes) needs sampling to be seen
+- sampling: stacks of every thread every PROFILE_SAMPLE_INTERVAL_MS, written as collapsed
+  stacks (.collapsed, for flamegraph.pl or speedscope); includes other requests' threads
+
+If PROFILE_TOKEN is set, the request must also send it in X-Profile-Token.
+
+While a request is profiled, allocations() takes tracemalloc snapshots around the blocks a
+service marks and keeps the top allocation sites. JSON responses get the profile's path, the
+slowest functions and those allocation sites under <key>.profile, where a service passes
+configure() the key (and its default PROFILE_DIR); every profiled response carries an
+X-Profile-Id header. Streamed (SSE) responses are only written to the file, profiled until the
+stream ends on the Flask app and until it starts on Quart.
+
+tracemalloc and the sampler are process-wide, so concurrent requests show up in them.
+"""
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")  # see configure()
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "15"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+PROFILERS = {"1": "cprofile", "true": "cprofile", "cprofile": "cprofile", "sampling": "sampling"}
+TRACEMALLOC_FRAMES = 10
+
+logger = logging.getLogger(__name__)
+
+_current: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("request_profile", default=None)
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_started = False
+_rotate_lock = threading.Lock()
+_response_key = "metadata"
+
+def configure(profile_dir: str, response_key: str) -> None:
+    """Set where profiles are written (unless PROFILE_DIR is set) and the JSON key responses carry the profile under."""
+    global PROFILE_DIR, _response_key
+    PROFILE_DIR = os.getenv("PROFILE_DIR", profile_dir)
+    _response_key = response_key
+
+class SamplingProfiler:
+    """Samples the stacks of every other thread at a fixed interval, counting collapsed stacks."""
+
+    def __init__(self, interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names: Dict[int, str] = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def top_functions(self, n: int) -> List[Dict[str, Any]]:
+        """The functions most often on top of a stack, with their share of the samples."""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [{"function": name, "samples": count, "share": round(count / total, 3)} for name, count in leaves.most_common(n)]
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+class RequestProfile:
+    """A profiled request: its profiler, and the allocation sites recorded while it ran."""
+
+    def __init__(self, route: str, profiler: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.route = route
+        self.profiler_name = profiler
+        self.profiler: Any = None
+        self.allocations: List[Dict[str, Any]] = []
+        self.started_at = time.time()
+        self.duration_ms: Optional[float] = None
+        self.path: Optional[str] = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        if self.profiler_name == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                self.profiler = profiler
+                return
+            except ValueError:
+                # Only one cProfile can run at a time on Python 3.12+
+                logger.warning(f"Profile {self.id}: another profile is running, sampling instead")
+                self.profiler_name = "sampling"
+        self.profiler = SamplingProfiler()
+        self.profiler.start()
+
+    def stop(self) -> None:
+        if self.profiler_name == "cprofile":
+            self.profiler.disable()
+        else:
+            self.profiler.stop()
+        self.duration_ms = round((time.perf_counter() - self._start) * 1000, 1)
+
+    def add_allocations(self, label: str, sites: List[Dict[str, Any]], peak_kib: float) -> None:
+        with self._lock:
+            self.allocations.append({"label": label, "peak_kib": peak_kib, "top_sites": sites})
+
+    def top_functions(self, n: int = PROFILE_TOP_N) -> List[Dict[str, Any]]:
+        """The functions with the most cumulative time (cprofile) or samples (sampling)."""
+        if self.profiler_name != "cprofile":
+            return self.profiler.top_functions(n)
+        stats = pstats.Stats(self.profiler).stats
+        ranked = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:n]
+        return [
+            {
+                "function": f"{name} ({os.path.basename(filename)}:{line})",
+                "calls": calls,
+                "own_ms": round(own * 1000, 1),
+                "cumulative_ms": round(cumulative * 1000, 1),
+            }
+            for (filename, line, name), (_, calls, own, cumulative, _) in ranked
+        ]
+
+    def write(self) -> None:
+        """Write the profile to PROFILE_DIR, removing the oldest beyond PROFILE_MAX_FILES."""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        route = re.sub(r"[^A-Za-z0-9]+", "_", self.route).strip("_") or "root"
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+        extension = "prof" if self.profiler_name == "cprofile" else "collapsed"
+        self.path = os.path.join(PROFILE_DIR, f"{stamp}-{route}-{self.id}.{extension}")
+        if self.profiler_name == "cprofile":
+            self.profiler.dump_stats(self.path)
+        else:
+            self.profiler.write(self.path)
+        with open(self.path + ".json", "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        _rotate()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "route": self.route,
+            "profiler": self.profiler_name,
+            "path": self.path,
+            "duration_ms": self.duration_ms,
+            "top_functions": self.top_functions(),
+            "allocations": self.allocations,
+        }
+
+def _rotate() -> None:
+    with _rotate_lock:
+        profiles = sorted(
+            (os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR) if not name.endswith(".json")),
+            key=os.path.getmtime
+        )
+        for path in profiles[:max(0, len(profiles) - PROFILE_MAX_FILES)]:
+            for stale in (path, path + ".json"):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+def _start_tracemalloc() -> None:
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _tracemalloc_started = True
+        _tracemalloc_users += 1
+
+def _stop_tracemalloc() -> None:
+    """Stop tracemalloc after the last profiled block, unless something else started it."""
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_started:
+            tracemalloc.stop()
+            _tracemalloc_started = False
+
+@contextmanager
+def allocations(label: str) -> Iterator[None]:
+    """Record the top allocation sites of a block in the current request's profile (if it is profiled)."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    _start_tracemalloc()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        before = tracemalloc.take_snapshot()
+        yield
+    finally:
+        after = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        _stop_tracemalloc()
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+        sites = [
+            {
+                "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_kib": round(stat.size_diff / 1024, 1),
+                "count": stat.count_diff,
+            }
+            for stat in sorted(stats, key=lambda stat: stat.size_diff, reverse=True)[:PROFILE_TOP_N]
+            if stat.size_diff > 0
+        ]
+        profile.add_allocations(label, sites, round(peak / 1024, 1))
+
+def _requested_profiler(headers: Any) -> Optional[str]:
+    profiler = PROFILERS.get(headers.get(PROFILE_HEADER, "").strip().lower())
+    if profiler and PROFILE_TOKEN and not hmac.compare_digest(headers.get(PROFILE_TOKEN_HEADER, ""), PROFILE_TOKEN):
+        logger.warning(f"Ignoring {PROFILE_HEADER} without a valid {PROFILE_TOKEN_HEADER}")
+        return None
+    return profiler
+
+def _start_request(request: Any, g: Any) -> None:
+    profiler = _requested_profiler(request.headers)
+    if profiler is None:
+        return
+    profile = RequestProfile(request.path, profiler)
+    g.profile = profile
+    g.profile_token = _current.set(profile)
+    profile.start()
+
+def _finish_profile(profile: RequestProfile) -> None:
+    """Stop and write a request's profile."""
+    profile.stop()
+    try:
+        profile.write()
+        logger.info(f"Profile {profile.id} of {profile.route} ({profile.duration_ms:.0f} ms) written to {profile.path}")
+    except OSError as e:
+        logger.warning(f"Could not write profile {profile.id}: {e}")
+
+def _is_streamed(response: Any) -> bool:
+    streamed = getattr(response, "is_streamed", None)  # Flask
+    if streamed is None:  # Quart: anything but a plain body is streamed
+        streamed = type(response.response).__name__ != "DataBody"
+    return streamed
+
+def _with_profile(response: Any, g: Any, data: Any) -> Any:
+    """Stop a non-streamed request's profile and add it to the response."""
+    if not getattr(g, "profile", None):
+        return response
+    response.headers["X-Profile-Id"] = g.profile.id
+    if _is_streamed(response):
+        if hasattr(response, "call_on_close"):
+            # Flask tears the request down before streaming, so finish once the stream is sent
+            profile = g.pop("profile")
+            g.pop("profile_token", None)
+
+            def finish_streamed() -> None:
+                _finish_profile(profile)
+                _current.set(None)
+
+            response.call_on_close(finish_streamed)
+        return response  # Otherwise (Quart) finished in teardown
+    profile = g.pop("profile")
+    _finish_profile(profile)
+    if isinstance(data, dict):
+        data.setdefault(_response_key, {})["profile"] = profile.summary()
+        response.set_data(json.dumps(data))
+    return response
+
+def _teardown(g: Any) -> None:
+    profile = g.pop("profile", None)
+    if profile is not None:
+        _finish_profile(profile)
+    token = g.pop("profile_token", None)
+    if token is not None:
+        try:
+            _current.reset(token)
+        except ValueError:
+            _current.set(None)  # A streamed response finished in a different context
+
+def init_app(app: Any) -> None:
+    """Profile requests sent with the X-Profile header to a Flask or Quart app (nothing is installed unless PROFILING_ENABLED)."""
+    if not PROFILING_ENABLED:
+        return
+    logger.info(f"Request profiling enabled: send {PROFILE_HEADER}: cprofile or sampling, profiles go to {PROFILE_DIR}")
+    if hasattr(app, "before_serving"):
+        from quart import request, g
+
+        @app.before_request
+        async def start_profile():
+            _start_request(request, g)
+
+        @app.after_request
+        async def add_profile(response):
+            data = None
+            if getattr(g, "profile", None) and response.is_json and not _is_streamed(response):
+                data = await response.get_json()
+            return _with_profile(response, g, data)
+
+        @app.teardown_request
+        async def finish_profile(exc):
+            _teardown(g)
+    else:
+        from flask import request, g
+
+        @app.before_request
+        def start_profile():
+            _start_request(request, g)
+
+        @app.after_request
+        def add_profile(response):
+            data = None
+            if getattr(g, "profile", None) and response.is_json and not _is_streamed(response):
+                data = response.get_json()
+            return _with_profile(response, g, data)
+
+        @app.teardown_request
+        def finish_profile(exc):
+            _teardown(g)
@@ -0,0 +1,234 @@
+"""
+Single-flight coalescing of identical concurrent calls
+
+When many requests need the same thing at once, the first call for a key (an LLM prompt, a
+translation, a search) runs and the others wait for it and share its result, or its error,
+instead of each paying for the same answer. Threads (WSGI routes, background workers) and
+event loops (the ASGI apps) share the same flights.
+
+    response, coalesced = singleflight.do("search", key, compute)
+
+That covers one worker process. With SINGLEFLIGHT_LEASES=true, calls that pass a lookup
+(reading the result from a cache every worker shares, like llm_cache) are also coalesced
+across worker processes: the process computing a key holds a lease on it in the flight_leases
+table of the database the service passes configure(), and the others poll lookup every
+SINGLEFLIGHT_POLL_MS until the result is there. A lease not released after
+SINGLEFLIGHT_LEASE_TTL_S (its holder died or hung) is taken over.
+
+- SINGLEFLIGHT_ENABLED: coalesce at all (default true)
+- SINGLEFLIGHT_LEASES: also across processes (default false)
+- SINGLEFLIGHT_LEASE_TTL_S: lease lifetime (default 120)
+- SINGLEFLIGHT_POLL_MS: how often other processes check for the result (default 200)
+
+The singleflight_calls_total metric counts leaders, followers and results picked up from other
+processes.
+"""
+import os
+import time
+import uuid
+import asyncio
+import sqlite3
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from farmwise_common import metrics, tracing
+from farmwise_common.db import Schema
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+SINGLEFLIGHT_LEASES = os.getenv("SINGLEFLIGHT_LEASES", "false").lower() == "true"
+SINGLEFLIGHT_LEASE_TTL_S = float(os.getenv("SINGLEFLIGHT_LEASE_TTL_S", "120"))
+SINGLEFLIGHT_POLL_MS = float(os.getenv("SINGLEFLIGHT_POLL_MS", "200"))
+
+logger = logging.getLogger(__name__)
+
+_schema = Schema(
+    "singleflight",
+    """
+    CREATE TABLE IF NOT EXISTS flight_leases (
+        key TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    """
+)
+
+def configure(connect: Callable[[], sqlite3.Connection]) -> None:
+    """Set the database holding the leases that coalesce calls across worker processes."""
+    _schema.configure(connect)
+
+class _Abandoned(Exception):
+    """The leader stopped without a result (it was cancelled), so a follower takes over."""
+
+class _Flight:
+    """One in-progress call that others can wait for."""
+
+    def __init__(self) -> None:
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._lock = threading.Lock()
+
+    def finish(self, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self.result, self.error = result, error
+            self.done.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+            except RuntimeError:
+                pass  # That event loop has closed
+
+    def wait(self) -> Any:
+        self.done.wait()
+        return self.outcome()
+
+    async def await_(self) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            future = None if self.done.is_set() else loop.create_future()
+            if future is not None:
+                self._waiters.append((loop, future))
+        if future is not None:
+            await future
+        return self.outcome()
+
+    def outcome(self) -> Any:
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+_flights: Dict[Tuple[str, str], _Flight] = {}
+_flights_lock = threading.Lock()
+
+def _join(kind: str, key: str) -> Tuple[_Flight, bool]:
+    """(flight, True) for the first call of a key, or (its flight, False) for the others."""
+    with _flights_lock:
+        flight = _flights.get((kind, key))
+        if flight is not None:
+            return flight, False
+        flight = _flights[(kind, key)] = _Flight()
+        return flight, True
+
+def _land(kind: str, key: str, flight: _Flight, result: Any = None, error: Optional[BaseException] = None) -> None:
+    with _flights_lock:
+        _flights.pop((kind, key), None)
+    flight.finish(result, error)
+
+def _acquire_lease(kind: str, key: str, owner: str) -> bool:
+    now = time.time()
+    try:
+        conn = _schema.connect()
+        cursor = conn.execute(
+            """INSERT INTO flight_leases (key, owner, expires_at) VALUES (?, ?, ?)
+               ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+               WHERE flight_leases.expires_at < ?""",
+            (f"{kind}:{key}", owner, now + SINGLEFLIGHT_LEASE_TTL_S, now)
+        )
+        acquired = cursor.rowcount == 1
+        conn.commit()
+        conn.close()
+        return acquired
+    except sqlite3.Error as e:
+        logger.warning(f"Single-flight lease failed, computing anyway: {e}")
+        return True
+
+def _release_lease(kind: str, key: str, owner: str) -> None:
+    try:
+        conn = _schema.connect()
+        conn.execute("DELETE FROM flight_leases WHERE key = ? AND owner = ?", (f"{kind}:{key}", owner))
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Single-flight lease release failed: {e}")
+
+def _lead(kind: str, key: str, func: Callable[[], Any], lookup: Optional[Callable[[], Any]]) -> Tuple[Any, bool]:
+    """Make the call for this process, waiting instead if another process holds the key's lease."""
+    if not (SINGLEFLIGHT_LEASES and lookup):
+        return func(), False
+    owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+    while not _acquire_lease(kind, key, owner):
+        result = lookup()
+        if result is not None:
+            return result, True
+        time.sleep(SINGLEFLIGHT_POLL_MS / 1000)
+    try:
+        # The previous holder may have finished between our lookup and taking the lease
+        result = lookup()
+        return (result, True) if result is not None else (func(), False)
+    finally:
+        _release_lease(kind, key, owner)
+
+async def _alead(kind: str, key: str, func: Callable[[], Awaitable[Any]], lookup: Optional[Callable[[], Any]]) -> Tuple[Any, bool]:
+    """Async _lead()."""
+    if not (SINGLEFLIGHT_LEASES and lookup):
+        return await func(), False
+    owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+    while not _acquire_lease(kind, key, owner):
+        result = lookup()
+        if result is not None:
+            return result, True
+        await asyncio.sleep(SINGLEFLIGHT_POLL_MS / 1000)
+    try:
+        result = lookup()
+        return (result, True) if result is not None else (await func(), False)
+    finally:
+        _release_lease(kind, key, owner)
+
+def do(kind: str, key: str, func: Callable[[], Any], lookup: Optional[Callable[[], Any]] = None) -> Tuple[Any, bool]:
+    """Call func once for all concurrent callers with the same key, returning (result, coalesced).
+
+    coalesced is True when another call computed the result; func's exception is raised in
+    every caller waiting on it. lookup, if given, reads the result from a cache shared by all
+    worker processes (None if it isn't there) and is needed to coalesce across processes.
+    """
+    if not SINGLEFLIGHT_ENABLED:
+        return func(), False
+    while True:
+        flight, leader = _join(kind, key)
+        if leader:
+            break
+        metrics.SINGLEFLIGHT_CALLS.labels(kind, "follower").inc()
+        try:
+            with tracing.span(f"singleflight wait {kind}"):
+                return flight.wait(), True
+        except _Abandoned:
+            continue
+    try:
+        result, coalesced = _lead(kind, key, func, lookup)
+    except Exception as e:
+        _land(kind, key, flight, error=e)
+        raise
+    except BaseException:
+        _land(kind, key, flight, error=_Abandoned())
+        raise
+    metrics.SINGLEFLIGHT_CALLS.labels(kind, "remote" if coalesced else "leader").inc()
+    _land(kind, key, flight, result=result)
+    return result, coalesced
+
+async def ado(kind: str, key: str, func: Callable[[], Awaitable[Any]], lookup: Optional[Callable[[], Any]] = None) -> Tuple[Any, bool]:
+    """Async do(); waiting doesn't block the event loop."""
+    if not SINGLEFLIGHT_ENABLED:
+        return await func(), False
+    while True:
+        flight, leader = _join(kind, key)
+        if leader:
+            break
+        metrics.SINGLEFLIGHT_CALLS.labels(kind, "follower").inc()
+        try:
+            with tracing.span(f"singleflight wait {kind}"):
+                return await flight.await_(), True
+        except _Abandoned:
+            continue
+    try:
+        result, coalesced = await _alead(kind, key, func, lookup)
+    except Exception as e:
+        _land(kind, key, flight, error=e)
+        raise
+    except BaseException:
+        _land(kind, key, flight, error=_Abandoned())
+        raise
+    metrics.SINGLEFLIGHT_CALLS.labels(kind, "remote" if coalesced else "leader").inc()
+    _land(kind, key, flight, result=result)
+    return result, coalesced
@@ -0,0 +1,273 @@
+"""
+Token and cost accounting for LLM calls, with daily budgets
+
+Every call a service records with record_call() goes to the llm_usage table with the route
+and user it was made for (set per request by init_app, or with usage_context() for background
+work and scripts) and its prompt type. Tokens come from the usage Gemini reports, or are
+estimated from the text length when it doesn't.
+
+Budgets are daily token limits (0 = unlimited) for all calls, per user and per route:
+
+    LLM_DAILY_TOKEN_BUDGET=2000000
+    LLM_USER_DAILY_TOKEN_BUDGET=100000
+    LLM_ROUTE_TOKEN_BUDGETS=/translate_scheme_summary=300000,prewarm=500000
+
+A service passes configure() the database to record to, its model's prices (overridden by
+LLM_INPUT_COST_PER_MTOK and LLM_OUTPUT_COST_PER_MTOK) and how to tell a request's user, and
+decides which of its calls degrade with within_budget() and which raise BudgetExceeded with
+require_budget(). main() prints a report of the recorded usage.
+
+Budget checks run before every LLM call, so the day's totals they read are kept for
+LLM_BUDGET_CHECK_SECONDS (default 5, 0 to always query) and the calls this process records are
+added to them as it goes; calls from other workers count once the totals are read again.
+"""
+import os
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from farmwise_common.db import Schema
+
+LLM_INPUT_COST_PER_MTOK = float(os.getenv("LLM_INPUT_COST_PER_MTOK", "0"))  # USD per million input tokens, see configure()
+LLM_OUTPUT_COST_PER_MTOK = float(os.getenv("LLM_OUTPUT_COST_PER_MTOK", "0"))  # USD per million output tokens
+LLM_DAILY_TOKEN_BUDGET = int(os.getenv("LLM_DAILY_TOKEN_BUDGET", "0"))
+LLM_USER_DAILY_TOKEN_BUDGET = int(os.getenv("LLM_USER_DAILY_TOKEN_BUDGET", "0"))
+LLM_ROUTE_TOKEN_BUDGETS = {
+    route.strip(): int(limit)
+    for route, _, limit in (entry.rpartition("=") for entry in os.getenv("LLM_ROUTE_TOKEN_BUDGETS", "").split(",") if "=" in entry)
+}
+
+LLM_BUDGET_CHECK_SECONDS = float(os.getenv("LLM_BUDGET_CHECK_SECONDS", "5"))
+
+CHARS_PER_TOKEN = 4  # Rough estimate, used when the LLM doesn't report usage
+
+logger = logging.getLogger(__name__)
+
+_schema = Schema(
+    "token_usage",
+    """
+    CREATE TABLE IF NOT EXISTS llm_usage (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        day TEXT NOT NULL,
+        route TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        prompt TEXT NOT NULL,
+        input_tokens INTEGER NOT NULL,
+        output_tokens INTEGER NOT NULL,
+        cost REAL NOT NULL,
+        estimated BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_llm_usage_day ON llm_usage (day, route, user_id)"
+)
+
+_context: contextvars.ContextVar[Tuple[str, str]] = contextvars.ContextVar("llm_usage_context", default=("other", "anonymous"))
+_request_user: Callable[[Any, Any], Optional[str]] = lambda request, session: None
+# (day, route, user_id) -> (monotonic expiry, tokens) of the totals budget checks last read
+_totals: Dict[Tuple[str, Optional[str], Optional[str]], Tuple[float, int]] = {}
+_totals_lock = threading.Lock()
+
+class BudgetExceeded(Exception):
+    """Raised when an LLM call that can't be skipped would exceed a daily token budget"""
+
+def configure(connect: Callable[[], sqlite3.Connection], input_cost_per_mtok: float, output_cost_per_mtok: float,
+              request_user: Callable[[Any, Any], Optional[str]]) -> None:
+    """Set where usage is recorded, a service's default prices (USD per million tokens) and how init_app() identifies a request's user.
+
+    request_user is called with the framework's request and session and returns the user's id,
+    or None for an anonymous request.
+    """
+    global LLM_INPUT_COST_PER_MTOK, LLM_OUTPUT_COST_PER_MTOK, _request_user
+    _schema.configure(connect)
+    with _totals_lock:
+        _totals.clear()
+    LLM_INPUT_COST_PER_MTOK = float(os.getenv("LLM_INPUT_COST_PER_MTOK", str(input_cost_per_mtok)))
+    LLM_OUTPUT_COST_PER_MTOK = float(os.getenv("LLM_OUTPUT_COST_PER_MTOK", str(output_cost_per_mtok)))
+    _request_user = request_user
+
+@contextmanager
+def usage_context(route: str, user_id: Optional[Any] = None) -> Iterator[None]:
+    """Attribute LLM calls made in this block to a route (or background task or script) and user"""
+    token = _context.set((route, str(user_id) if user_id is not None else "anonymous"))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+def current_context() -> Tuple[str, str]:
+    """Return the (route, user_id) LLM calls are currently attributed to"""
+    return _context.get()
+
+def init_app(app: Any) -> None:
+    """Attribute LLM calls to the route and user of the request being handled"""
+    def request_context(request: Any, session: Any) -> Tuple[str, str]:
+        route = request.url_rule.rule if request.url_rule else request.path
+        user_id = _request_user(request, session)
+        return route, str(user_id) if user_id is not None else "anonymous"
+
+    if hasattr(app, "before_serving"):
+        from quart import request, session
+
+        @app.before_request
+        async def set_usage_context():
+            _context.set(request_context(request, session))
+    else:
+        from flask import request, session
+
+        @app.before_request
+        def set_usage_context():
+            _context.set(request_context(request, session))
+
+def _tokens_used(day: str, route: Optional[str] = None, user_id: Optional[str] = None) -> int:
+    key = (day, route, user_id)
+    with _totals_lock:
+        expires, tokens = _totals.get(key, (0.0, 0))
+    if time.monotonic() < expires:
+        return tokens
+    conditions = ["day = ?"]
+    params: List[Any] = [day]
+    if route is not None:
+        conditions.append("route = ?")
+        params.append(route)
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+    conn = _schema.connect()
+    tokens = conn.execute(
+        f"SELECT COALESCE(SUM(input_tokens + output_tokens), 0) FROM llm_usage WHERE {' AND '.join(conditions)}",
+        params
+    ).fetchone()[0]
+    conn.close()
+    now = time.monotonic()
+    with _totals_lock:
+        for stale in [k for k, (expires, _) in _totals.items() if expires <= now]:
+            del _totals[stale]
+        _totals[key] = (now + LLM_BUDGET_CHECK_SECONDS, tokens)
+    return tokens
+
+def _count(day: str, route: str, user_id: str, tokens: int) -> None:
+    """Add a recorded call to the cached totals it counts towards"""
+    with _totals_lock:
+        for key in ((day, None, None), (day, route, None), (day, None, user_id)):
+            if key in _totals:
+                expires, used = _totals[key]
+                _totals[key] = (expires, used + tokens)
+
+def exceeded_budget() -> Optional[str]:
+    """Describe the daily budget for the current route or user that is used up, or None"""
+    route, user_id = _context.get()
+    today = date.today().isoformat()
+    try:
+        if LLM_DAILY_TOKEN_BUDGET and _tokens_used(today) >= LLM_DAILY_TOKEN_BUDGET:
+            return f"daily LLM budget of {LLM_DAILY_TOKEN_BUDGET} tokens"
+        route_budget = LLM_ROUTE_TOKEN_BUDGETS.get(route)
+        if route_budget and _tokens_used(today, route=route) >= route_budget:
+            return f"daily LLM budget of {route_budget} tokens for {route}"
+        if LLM_USER_DAILY_TOKEN_BUDGET and user_id != "anonymous" and _tokens_used(today, user_id=user_id) >= LLM_USER_DAILY_TOKEN_BUDGET:
+            return f"daily LLM budget of {LLM_USER_DAILY_TOKEN_BUDGET} tokens per user"
+    except sqlite3.Error as e:
+        logger.warning(f"LLM budget check failed: {e}")
+    return None
+
+def within_budget() -> bool:
+    """Check whether optional LLM work should still run"""
+    return exceeded_budget() is None
+
+def require_budget() -> None:
+    """Raise BudgetExceeded if a budget for the current route or user is used up"""
+    exceeded = exceeded_budget()
+    if exceeded:
+        raise BudgetExceeded(f"The {exceeded} has been used up, please try again tomorrow")
+
+def add_usage(total: Optional[Dict[str, int]], message: Any) -> Optional[Dict[str, int]]:
+    """Add the usage reported on an LLM message or streamed chunk to a running total (or None)"""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return total
+    total = total or {"input_tokens": 0, "output_tokens": 0}
+    return {
+        "input_tokens": total["input_tokens"] + usage.get("input_tokens", 0),
+        "output_tokens": total["output_tokens"] + usage.get("output_tokens", 0)
+    }
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
+
+def record_call(name: str, usage: Optional[Dict[str, int]], prompt: Any, inputs: Optional[Dict[str, Any]], output_text: str) -> None:
+    """Record an LLM call of a prompt type against the current route and user.
+
+    usage is the reported input_tokens/output_tokens (see add_usage()), or None to estimate
+    them from the prompt filled in with inputs and from the response text.
+    """
+    estimated = usage is None
+    if estimated:
+        try:
+            prompt_text = prompt.format(**(inputs or {}))
+        except Exception:
+            prompt_text = " ".join(str(v) for v in (inputs or {}).values())
+        usage = {"input_tokens": estimate_tokens(prompt_text), "output_tokens": estimate_tokens(output_text)}
+
+    input_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    cost = (input_tokens * LLM_INPUT_COST_PER_MTOK + output_tokens * LLM_OUTPUT_COST_PER_MTOK) / 1_000_000
+    route, user_id = _context.get()
+    today = date.today().isoformat()
+    try:
+        conn = _schema.connect()
+        try:
+            conn.execute(
+                "INSERT INTO llm_usage (day, route, user_id, prompt, input_tokens, output_tokens, cost, estimated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (today, route, user_id, name, input_tokens, output_tokens, cost, estimated)
+            )
+            conn.commit()
+        finally:
+            conn.close()  # A failed insert would otherwise hold the write lock until collected
+    except sqlite3.Error as e:
+        logger.warning(f"Recording LLM usage failed: {e}")
+        return
+    _count(today, route, user_id, input_tokens + output_tokens)
+
+def usage_report(since_day: str, group_by: List[str]) -> List[Dict[str, Any]]:
+    """Calls, tokens and cost per day and group since a day, most expensive first"""
+    columns = ", ".join(column for column in group_by if column in ("route", "user_id", "prompt"))
+    conn = _schema.connect()
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(f"""
+        SELECT day, {columns}, COUNT(*) AS calls, SUM(input_tokens) AS input_tokens,
+               SUM(output_tokens) AS output_tokens, SUM(cost) AS cost, SUM(estimated) AS estimated
+        FROM llm_usage
+        WHERE day >= ?
+        GROUP BY day, {columns}
+        ORDER BY day DESC, cost DESC
+    """, (since_day,)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Report LLM token usage and cost")
+    parser.add_argument("--days", type=int, default=7, help="Number of days to report, including today")
+    parser.add_argument("--by", nargs="+", choices=["route", "user_id", "prompt"], default=["route", "prompt"], help="Columns to group by")
+    args = parser.parse_args()
+
+    since = (date.today() - timedelta(days=args.days - 1)).isoformat()
+    rows = usage_report(since, args.by)
+    if not rows:
+        print(f"No LLM usage recorded since {since}")
+        return
+
+    header = ["day", *args.by, "calls", "input_tokens", "output_tokens", "cost_usd"]
+    table = [[row["day"], *(str(row[column]) for column in args.by), str(row["calls"]), str(row["input_tokens"]),
+              str(row["output_tokens"]), f"{row['cost']:.6f}" + ("*" if row["estimated"] else "")] for row in rows]
+    widths = [max(len(header[i]), *(len(r[i]) for r in table)) for i in range(len(header))]
+    print("  ".join(h.ljust(w) for h, w in zip(header, widths)).rstrip())
+    for r in table:
+        print("  ".join(c.ljust(w) for c, w in zip(r, widths)).rstrip())
+
+    total_cost = sum(row["cost"] for row in rows)
+    total_tokens = sum(row["input_tokens"] + row["output_tokens"] for row in rows)
+    print(f"\nTotal: {total_tokens} tokens, ${total_cost:.6f}" + (" (* includes estimated token counts)" if any(row["estimated"] for row in rows) else ""))
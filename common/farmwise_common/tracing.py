@@ -0,0 +1,357 @@
+"""
+Request-scoped tracing, exported as OpenTelemetry (OTLP/JSON) spans
+
+Each request gets a trace (see init_app), continuing the caller's trace if it sends a
+W3C traceparent header. Every span() opened while handling it becomes a child of the
+current span. The current span is kept in a contextvar, so it follows the request into
+asyncio tasks, asyncio.to_thread() and copied contexts. Work outside a request starts its
+own trace with span(..., root=True); spans opened outside any trace are not recorded.
+
+Finished traces are appended to TRACE_EXPORT_PATH, one OTLP/JSON export request per line,
+so they can be loaded by OpenTelemetry tooling, and the slowest can be shown as text
+waterfalls with main(). A service names itself and its export path with configure().
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import threading
+import time
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "farmwise")
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", os.path.join("traces", "traces.jsonl"))
+TRACE_EXPORT_MAX_BYTES = int(os.getenv("TRACE_EXPORT_MAX_BYTES", str(20 * 1024 * 1024)))
+TRACE_EXPORT_BACKUP_COUNT = int(os.getenv("TRACE_EXPORT_BACKUP_COUNT", "5"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))  # Fraction of traces exported, 0 disables tracing
+
+# OpenTelemetry span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_export_lock = threading.Lock()
+_exporter = None
+
+
+def configure(service_name, export_path):
+    """
+    Set a service's defaults, before its first trace is exported
+
+    TRACE_SERVICE_NAME and TRACE_EXPORT_PATH, when set, still take precedence.
+
+    Args:
+        service_name (str): service.name of the exported spans, e.g. "farmwise-api"
+        export_path (str): Default file to append finished traces to
+    """
+    global SERVICE_NAME, TRACE_EXPORT_PATH
+    SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", service_name)
+    TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", export_path)
+
+
+class Trace:
+    """Spans collected for one trace, exported when its local root span ends"""
+
+    def __init__(self, trace_id, sampled):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    def __init__(self, trace, name, parent_id=None, kind=SPAN_KIND_INTERNAL, attributes=None):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self):
+        """W3C traceparent header value pointing at this span"""
+        return f"00-{self.trace.trace_id}-{self.span_id}-{'01' if self.trace.sampled else '00'}"
+
+    def to_otlp(self):
+        """This span in the OTLP/JSON span format"""
+        otlp = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1}
+        }
+        if self.parent_id:
+            otlp["parentSpanId"] = self.parent_id
+        return otlp
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def current_span():
+    """Return the active span, or None outside a trace"""
+    return _current_span.get()
+
+
+def _new_trace(traceparent=None):
+    """Start a trace, continuing the remote one in a traceparent header if valid"""
+    match = _TRACEPARENT.match((traceparent or "").strip().lower())
+    if match:
+        return Trace(match.group(1), sampled=match.group(3) != "00" and TRACE_SAMPLE_RATE > 0), match.group(2)
+    return Trace(secrets.token_hex(16), sampled=random.random() < TRACE_SAMPLE_RATE), None
+
+
+@contextmanager
+def span(name, kind=SPAN_KIND_INTERNAL, root=False, traceparent=None, **attributes):
+    """
+    Record a span as a child of the current one
+
+    Args:
+        name (str): Span name, e.g. "llm summary" or "sqlite select"
+        kind (int): SPAN_KIND_INTERNAL, SPAN_KIND_SERVER or SPAN_KIND_CLIENT
+        root (bool): Start a new trace if there is no current span (otherwise nothing is recorded)
+        traceparent (str): Remote parent for a new trace, from a traceparent header
+        **attributes: Span attributes
+
+    Yields:
+        Span: The span (or None when not recorded), so attributes can be added
+    """
+    parent = _current_span.get()
+    if parent is not None:
+        trace, parent_id = parent.trace, parent.span_id
+    elif root:
+        trace, parent_id = _new_trace(traceparent)
+    else:
+        yield None
+        return
+
+    if not trace.sampled:
+        # Keep the trace in context so nested spans aren't recorded either
+        current = Span(trace, name, parent_id, kind)
+        token = _current_span.set(current)
+        try:
+            yield current
+        finally:
+            _reset(token)
+        return
+
+    current = Span(trace, name, parent_id, kind, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _reset(token)
+        trace.add(current)
+        if parent is None:
+            export(trace)
+
+
+def _reset(token):
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        _current_span.set(None)  # Ended in a different context (e.g. a finished streaming response)
+
+
+def _get_exporter():
+    """Rotating JSONL writer for finished traces, set up on first use"""
+    global _exporter
+    with _export_lock:
+        if _exporter is None:
+            os.makedirs(os.path.dirname(TRACE_EXPORT_PATH), exist_ok=True)
+            handler = RotatingFileHandler(TRACE_EXPORT_PATH, maxBytes=TRACE_EXPORT_MAX_BYTES, backupCount=TRACE_EXPORT_BACKUP_COUNT, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            exporter = logging.getLogger("trace_export")
+            exporter.setLevel(logging.INFO)
+            exporter.propagate = False
+            exporter.addHandler(handler)
+            _exporter = exporter
+        return _exporter
+
+
+def export(trace):
+    """Append a finished trace to TRACE_EXPORT_PATH as an OTLP/JSON export request"""
+    payload = {
+        "resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{
+                "scope": {"name": "farmwise.tracing"},
+                "spans": [s.to_otlp() for s in trace.spans]
+            }]
+        }]
+    }
+    try:
+        _get_exporter().info(json.dumps(payload))
+    except Exception as e:
+        logger.warning(f"Could not export trace {trace.trace_id}: {e}")
+
+
+def _start_request(request, g):
+    route = request.url_rule.rule if request.url_rule else request.path
+    g.trace_span = span(f"{request.method} {route}", kind=SPAN_KIND_SERVER, root=True,
+                        traceparent=request.headers.get("traceparent"),
+                        **{"http.method": request.method, "http.route": route, "http.target": request.path})
+    g.trace_span.__enter__()
+
+
+def _tag_response(response):
+    current = _current_span.get()
+    if current is not None:
+        current.set_attribute("http.status_code", response.status_code)
+        response.headers["traceparent"] = current.traceparent
+    return response
+
+
+def _finish_request(g, exc):
+    trace_span = g.pop("trace_span", None)
+    if trace_span is not None:
+        if exc is not None:
+            trace_span.__exit__(type(exc), exc, exc.__traceback__)
+        else:
+            trace_span.__exit__(None, None, None)
+
+
+def init_app(app):
+    """
+    Trace every request handled by a Flask or Quart app
+
+    The root span ends when the request is torn down, so for streamed (SSE) responses it
+    covers every event. Responses carry a traceparent header naming the request's trace.
+    """
+    if hasattr(app, "before_serving"):
+        from quart import request, g
+
+        @app.before_request
+        async def start_trace():
+            _start_request(request, g)
+
+        @app.after_request
+        async def tag_response(response):
+            return _tag_response(response)
+
+        @app.teardown_request
+        async def finish_trace(exc):
+            _finish_request(g, exc)
+    else:
+        from flask import request, g
+
+        @app.before_request
+        def start_trace():
+            _start_request(request, g)
+
+        @app.after_request
+        def tag_response(response):
+            return _tag_response(response)
+
+        @app.teardown_request
+        def finish_trace(exc):
+            _finish_request(g, exc)
+
+
+def load_traces(path):
+    """Read exported traces, returning {trace_id: [otlp span, ...]}"""
+    traces = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for resource_spans in json.loads(line).get("resourceSpans", []):
+                for scope_spans in resource_spans.get("scopeSpans", []):
+                    for s in scope_spans.get("spans", []):
+                        traces.setdefault(s["traceId"], []).append(s)
+    return traces
+
+
+def render_waterfall(spans, width=40):
+    """
+    Render one trace's spans as a text waterfall, children indented under their parents
+
+    Returns:
+        str: One line per span with its offset, duration and a bar on the trace's timeline
+    """
+    start = min(int(s["startTimeUnixNano"]) for s in spans)
+    end = max(int(s["endTimeUnixNano"]) for s in spans)
+    total = max(end - start, 1)
+    ids = {s["spanId"] for s in spans}
+    children = {}
+    for s in spans:
+        parent = s.get("parentSpanId") if s.get("parentSpanId") in ids else None
+        children.setdefault(parent, []).append(s)
+
+    lines = []
+
+    def walk(parent, depth):
+        for s in sorted(children.get(parent, []), key=lambda s: int(s["startTimeUnixNano"])):
+            offset = int(s["startTimeUnixNano"]) - start
+            duration = int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])
+            bar_start = int(offset / total * width)
+            bar_len = max(1, int(duration / total * width))
+            bar = " " * bar_start + "#" * min(bar_len, width - bar_start)
+            failed = " !" if s.get("status", {}).get("code") == 2 else ""
+            lines.append(f"{offset / 1e6:9.1f} ms {duration / 1e6:9.1f} ms |{bar:<{width}}| {'  ' * depth}{s['name']}{failed}")
+            walk(s["spanId"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the slowest exported traces as text waterfalls")
+    parser.add_argument("path", nargs="?", default=TRACE_EXPORT_PATH, help="Exported traces file (default: TRACE_EXPORT_PATH)")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest traces to show")
+    parser.add_argument("--name", help="Only traces whose root span has this name, e.g. \"POST /upload_scheme\"")
+    args = parser.parse_args()
+
+    summaries = []
+    for trace_id, spans in load_traces(args.path).items():
+        roots = [s for s in spans if not s.get("parentSpanId") or s["parentSpanId"] not in {x["spanId"] for x in spans}]
+        root = min(roots or spans, key=lambda s: int(s["startTimeUnixNano"]))
+        if args.name and root["name"] != args.name:
+            continue
+        duration = max(int(s["endTimeUnixNano"]) for s in spans) - min(int(s["startTimeUnixNano"]) for s in spans)
+        summaries.append((duration, trace_id, root["name"], spans))
+
+    for duration, trace_id, name, spans in sorted(summaries, key=lambda t: t[0], reverse=True)[:args.top]:
+        print(f"Trace {trace_id}  {name}  {duration / 1e6:.1f} ms, {len(spans)} spans")
+        print(render_waterfall(spans))
+        print()
+
@@ -0,0 +1,69 @@
+import io
+import pytest
+from farmwise_common import cassettes
+
+@pytest.fixture
+def tapes(tmp_path, monkeypatch):
+    monkeypatch.delenv("CASSETTE_DIR", raising=False)
+    monkeypatch.setattr(cassettes, "CASSETTE_LATENCY_SCALE", 0.0)
+    cassettes.configure(str(tmp_path))
+    return cassettes
+
+def replay_fresh(tapes, directory):
+    """Forget what was loaded, as a new process replaying the recordings would."""
+    tapes.configure(directory)
+
+def test_record_then_replay_exact(tapes, tmp_path):
+    assert tapes.call("search", {"q": "wheat"}, lambda: {"hits": 1}, dict, dict) == {"hits": 1}
+    tapes.call("search", {"q": "wheat"}, lambda: {"hits": 2}, dict, dict)
+    replay_fresh(tapes, str(tmp_path))
+    assert [tapes.call("search", {"q": "wheat"}, None, dict, dict)["hits"] for _ in range(3)] == [1, 2, 1]
+    with pytest.raises(tapes.CassetteMiss):
+        tapes.call("search", {"q": "rice"}, None, dict, dict)
+
+def test_sequence_match_ignores_the_request(tapes, tmp_path, monkeypatch):
+    tapes.call("search", {"q": "wheat"}, lambda: "first", str, str)
+    replay_fresh(tapes, str(tmp_path))
+    monkeypatch.setattr(tapes, "CASSETTE_MATCH", "sequence")
+    assert tapes.call("search", {"q": "anything"}, None, str, str) == "first"
+
+def test_recorded_errors_are_raised_again(tapes, tmp_path):
+    def fail():
+        raise TimeoutError("upstream timed out")
+
+    with pytest.raises(TimeoutError):
+        tapes.call("search", {"q": "wheat"}, fail, str, str)
+    replay_fresh(tapes, str(tmp_path))
+    with pytest.raises(tapes.CassetteError, match="TimeoutError: upstream timed out"):
+        tapes.call("search", {"q": "wheat"}, None, str, str)
+    assert tapes.summary()[0]["errors"] == 1
+
+def test_tts_round_trip(tapes, tmp_path):
+    class ToneTTS:
+        def __init__(self, text, lang="en", slow=False):
+            self.audio = f"{lang}:{text}".encode()
+
+        def write_to_fp(self, fp):
+            fp.write(self.audio)
+
+    recorded = io.BytesIO()
+    tapes.tts_class(ToneTTS)("namaste", lang="hi").write_to_fp(recorded)
+    replay_fresh(tapes, str(tmp_path))
+    replayed = io.BytesIO()
+    tapes.tts_class()("namaste", lang="hi").write_to_fp(replayed)
+    assert replayed.getvalue() == recorded.getvalue() == b"hi:namaste"
+
+def test_llm_round_trip(tapes, tmp_path):
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    recording = tapes.wrap_llm(FakeListChatModel(responses=["A scheme for wheat farmers"]))
+    assert recording.invoke("Title?").content == "A scheme for wheat farmers"
+    replay_fresh(tapes, str(tmp_path))
+    replaying = tapes.wrap_llm(None)
+    assert replaying.invoke("Title?").content == "A scheme for wheat farmers"
+    assert "".join(chunk.content for chunk in replaying.stream("Title?")) == "A scheme for wheat farmers"
+
+def test_env_dir_overrides_service_default(tmp_path, monkeypatch):
+    monkeypatch.setenv("CASSETTE_DIR", str(tmp_path / "from_env"))
+    cassettes.configure(str(tmp_path / "default"))
+    assert cassettes.cassette("llm").path == str(tmp_path / "from_env" / "llm.jsonl")
@@ -0,0 +1,24 @@
+import pytest
+from farmwise_common import import_timing
+
+OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:       300 |       1500 | json
+import time:       900 |       1200 |   json.decoder
+import time:      2500 |       2500 | sqlite3
+"""
+
+def test_parse_counts_only_top_level_imports():
+    total_ms, top_level = import_timing.parse_importtime(OUTPUT)
+    assert top_level == [(1.5, "json"), (2.5, "sqlite3")]
+    assert total_ms == 4.0
+
+def test_measure_imports_runs_in_a_fresh_interpreter(tmp_path):
+    (tmp_path / "local_module.py").write_text("import json\n")
+    total_ms, top_level = import_timing.measure_imports("local_module", cwd=str(tmp_path))
+    assert "local_module" in [package for _, package in top_level]
+    assert total_ms > 0
+
+def test_failed_import_raises(tmp_path):
+    with pytest.raises(RuntimeError, match="no_such_module_here"):
+        import_timing.measure_imports("no_such_module_here", cwd=str(tmp_path))
@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+import pytest
+from farmwise_common import db, llm_cache, metrics
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.delenv("LLM_CACHE_TTLS", raising=False)
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_BYPASS", set())
+    llm_cache.configure(db.connector(str(tmp_path / "cache.db")), {"title": 60, "draft": 0})
+    return llm_cache
+
+def lookups(prompt, result):
+    return metrics.REGISTRY.get_sample_value("cache_lookups_total", {"cache": f"llm_{prompt}", "result": result}) or 0.0
+
+def message(type, content):
+    return SimpleNamespace(type=type, content=content)
+
+def test_key_covers_everything_the_response_depends_on():
+    messages = [message("system", "Write a title"), message("human", "wheat")]
+    key = llm_cache.cache_key("gemini", "title", messages, None, 0.0)
+    assert key == llm_cache.cache_key("gemini", "title", list(messages), None, 0.0)
+    assert key != llm_cache.cache_key("gemini", "title", [message("human", "rice")], None, 0.0)
+    assert key != llm_cache.cache_key("gemini", "title", messages, ["\n"], 0.0)
+    assert key != llm_cache.cache_key("gemini", "title", messages, None, 0.7)
+    assert key != llm_cache.cache_key("other", "title", messages, None, 0.0)
+
+def test_enabled_per_prompt_type(cache, monkeypatch):
+    assert cache.enabled("title")
+    assert not cache.enabled("draft")
+    assert not cache.enabled("unlisted")
+    assert not cache.enabled(None)
+    monkeypatch.setattr(cache, "LLM_CACHE_BYPASS", {"all"})
+    assert not cache.enabled("title")
+
+def test_get_put_and_peek(cache):
+    hits, misses = lookups("title", "hit"), lookups("title", "miss")
+    assert cache.get("title", "k") is None
+    cache.put("title", "k", "gemini", "Wheat subsidy")
+    assert cache.get("title", "k") == "Wheat subsidy"
+    assert cache.peek("title", "k") == "Wheat subsidy"
+    assert (lookups("title", "hit"), lookups("title", "miss")) == (hits + 1, misses + 1)
+
+def test_expired_responses_are_misses(cache, monkeypatch):
+    cache.put("title", "k", "gemini", "Wheat subsidy")
+    monkeypatch.setitem(cache.LLM_CACHE_TTLS, "title", -1)
+    assert cache.get("title", "k") is None
+
+def test_env_ttls_replace_service_defaults(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_CACHE_TTLS", "summary=10, title=0")
+    llm_cache.configure(db.connector(str(tmp_path / "cache.db")), {"title": 60})
+    assert llm_cache.LLM_CACHE_TTLS == {"summary": 10, "title": 0}
+
+def test_database_errors_are_misses(monkeypatch):
+    monkeypatch.setattr(llm_cache, "_schema", db.Schema("llm_cache"))
+    llm_cache.put("title", "k", "gemini", "Wheat subsidy")
+    assert llm_cache.get("title", "k") is None
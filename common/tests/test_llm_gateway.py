@@ -0,0 +1,282 @@
+import asyncio
+import threading
+import time
+import pytest
+from farmwise_common import llm_gateway
+from farmwise_common.llm_gateway import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, GatewayBusy, Limiter, TokenBucket
+
+class Unavailable(Exception):
+    status_code = 503
+
+class BadRequest(Exception):
+    status_code = 400
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "backoff", lambda attempt: 0.0)
+
+# --- Limiter ---
+
+def test_limiter_grants_up_to_its_limit():
+    limiter = Limiter(2)
+    assert limiter.acquire(0) and limiter.acquire(0)
+    assert not limiter.acquire(0.01)
+    limiter.release()
+    assert limiter.acquire(0)
+    assert limiter.active == 2
+
+def test_limiter_hands_released_slots_over_in_arrival_order():
+    limiter = Limiter(1)
+    assert limiter.acquire(None)
+    order = []
+
+    def wait(name):
+        assert limiter.acquire(5)
+        order.append(name)
+        limiter.release()
+
+    threads = []
+    for name in ("first", "second", "third"):
+        threads.append(threading.Thread(target=wait, args=(name,)))
+        threads[-1].start()
+        time.sleep(0.02)
+    limiter.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ["first", "second", "third"]
+    assert limiter.active == 0
+
+def test_limiter_is_shared_by_threads_and_event_loops():
+    limiter = Limiter(1)
+    assert limiter.acquire(None)
+    threading.Timer(0.05, limiter.release).start()
+
+    async def wait():
+        return await limiter.aacquire(5)
+
+    assert asyncio.run(wait())
+    assert limiter.active == 1
+
+def test_limiter_async_timeout_and_cancel_give_nothing_back():
+    limiter = Limiter(1)
+    assert limiter.acquire(None)
+
+    async def main():
+        assert not await limiter.aacquire(0.01)
+        task = asyncio.create_task(limiter.aacquire(None))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    limiter.release()
+    assert limiter.active == 0
+
+# --- TokenBucket ---
+
+def test_token_bucket_allows_a_burst_then_spaces_calls():
+    bucket = TokenBucket(rate_per_minute=60, burst=2)
+    assert bucket.reserve(None) == 0.0
+    assert bucket.reserve(None) == 0.0
+    assert bucket.reserve(None) == pytest.approx(1.0, abs=0.05)
+    assert bucket.reserve(None) == pytest.approx(2.0, abs=0.05)
+
+def test_token_bucket_refuses_waits_past_the_timeout_without_taking_a_token():
+    bucket = TokenBucket(rate_per_minute=60, burst=1)
+    assert bucket.reserve(0) == 0.0
+    assert bucket.reserve(0.5) is None
+    assert bucket.reserve(None) == pytest.approx(1.0, abs=0.05)
+
+def test_token_bucket_without_rate_never_waits():
+    bucket = TokenBucket(rate_per_minute=0, burst=1)
+    assert [bucket.reserve(0) for _ in range(100)] == [0.0] * 100
+
+# --- CircuitBreaker ---
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("breaker-test-open", failures=3, reset_s=30)
+    for _ in range(2):
+        breaker.enter()
+        breaker.failed()
+    assert breaker.state == CLOSED
+    breaker.enter()
+    breaker.succeeded()
+    for _ in range(3):
+        breaker.enter()
+        breaker.failed()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen) as raised:
+        breaker.enter()
+    assert 1.0 <= raised.value.retry_after <= 30
+
+def test_breaker_half_open_trial_closes_on_success():
+    breaker = CircuitBreaker("breaker-test-close", failures=1, reset_s=0.05)
+    breaker.enter()
+    breaker.failed()
+    assert breaker.state == OPEN
+    time.sleep(0.06)
+    breaker.enter()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.enter()  # Only one trial call at a time
+    breaker.succeeded()
+    assert breaker.state == CLOSED
+    breaker.enter()
+
+def test_breaker_half_open_trial_reopens_on_failure():
+    breaker = CircuitBreaker("breaker-test-reopen", failures=5, reset_s=0.05)
+    for _ in range(5):
+        breaker.enter()
+        breaker.failed()
+    time.sleep(0.06)
+    breaker.enter()
+    breaker.failed()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.enter()
+
+def test_breaker_abandoned_trial_lets_another_through():
+    breaker = CircuitBreaker("breaker-test-abandon", failures=1, reset_s=0.05)
+    breaker.enter()
+    breaker.failed()
+    time.sleep(0.06)
+    breaker.enter()
+    breaker.abandoned()
+    breaker.enter()
+    assert breaker.state == HALF_OPEN
+
+# --- Gateway ---
+
+def test_retry_reason():
+    assert llm_gateway.retry_reason(Unavailable()) == "503"
+    assert llm_gateway.retry_reason(TimeoutError()) == "timeout"
+    assert llm_gateway.retry_reason(ConnectionResetError()) == "connection"
+    assert llm_gateway.retry_reason(BadRequest()) is None
+    assert llm_gateway.retry_reason(type("ResourceExhausted", (Exception,), {})()) == "429"
+
+def test_gateway_retries_outages_then_succeeds(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_RETRY_ATTEMPTS", 3)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Unavailable("overloaded")
+        return "answer"
+
+    assert llm_gateway.Gateway("gateway-test-retry").call(flaky) == "answer"
+    assert len(attempts) == 3
+
+def test_gateway_does_not_retry_client_errors():
+    attempts = []
+
+    def bad():
+        attempts.append(1)
+        raise BadRequest("invalid prompt")
+
+    with pytest.raises(BadRequest):
+        llm_gateway.Gateway("gateway-test-bad").call(bad)
+    assert len(attempts) == 1
+
+def test_gateway_fails_fast_once_the_circuit_opens(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_RETRY_ATTEMPTS", 10)
+    monkeypatch.setattr(llm_gateway, "LLM_BREAKER_FAILURES", 2)
+    gateway = llm_gateway.Gateway("gateway-test-circuit")
+    attempts = []
+
+    def down():
+        attempts.append(1)
+        raise Unavailable("down")
+
+    with pytest.raises(Unavailable):
+        gateway.call(down)
+    assert len(attempts) == 2
+    with pytest.raises(CircuitOpen):
+        gateway.call(down)
+    assert len(attempts) == 2
+
+def test_gateway_client_errors_leave_the_circuit_as_it_was(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_BREAKER_FAILURES", 1)
+    monkeypatch.setattr(llm_gateway, "LLM_BREAKER_RESET_S", 0.05)
+    gateway = llm_gateway.Gateway("gateway-test-client-error")
+
+    def down():
+        raise Unavailable("down")
+
+    def bad():
+        raise BadRequest("invalid prompt")
+
+    with pytest.raises(Unavailable):
+        gateway.call(down)
+    time.sleep(0.06)
+    with pytest.raises(BadRequest):
+        gateway.call(bad)  # The half-open trial
+    assert gateway.breaker.state == HALF_OPEN
+    assert gateway.call(lambda: "answer") == "answer"  # The trial slot was given back
+    assert gateway.breaker.state == CLOSED
+
+def test_gateway_sheds_calls_when_the_queue_is_full(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_MAX_QUEUED", 1)
+    monkeypatch.setattr(llm_gateway, "LLM_QUEUE_TIMEOUT_S", 5)
+    monkeypatch.setattr(llm_gateway, "LLM_MODEL_CONCURRENCY", {"gateway-test-queue": 1})
+    gateway = llm_gateway.Gateway("gateway-test-queue")
+    release = threading.Event()
+    results = []
+
+    def hold():
+        release.wait(5)
+        return "done"
+
+    def call():
+        results.append(gateway.call(hold))
+
+    threads = [threading.Thread(target=call) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)  # The first holds the model's slot, the second queues for it
+    with pytest.raises(GatewayBusy):
+        gateway.call(hold)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["done", "done"]
+
+def test_gateway_times_out_waiting_for_a_slot(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_QUEUE_TIMEOUT_S", 0.05)
+    monkeypatch.setattr(llm_gateway, "LLM_MODEL_CONCURRENCY", {"gateway-test-timeout": 1})
+    gateway = llm_gateway.Gateway("gateway-test-timeout")
+    with gateway.slot():
+        with pytest.raises(GatewayBusy):
+            gateway.call(lambda: "never")
+
+def test_stream_is_not_retried_after_its_first_chunk(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_RETRY_ATTEMPTS", 3)
+    attempts = []
+
+    def stream():
+        attempts.append(1)
+        yield "first"
+        raise Unavailable("dropped")
+
+    chunks = []
+    with pytest.raises(Unavailable):
+        for chunk in llm_gateway.Gateway("gateway-test-stream").stream(stream):
+            chunks.append(chunk)
+    assert chunks == ["first"]
+    assert len(attempts) == 1
+
+def test_wrapped_model_answers_cached_prompts_without_calling_the_model(tmp_path, monkeypatch):
+    pytest.importorskip("langchain_core")
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from farmwise_common import db, llm_cache
+    monkeypatch.delenv("LLM_CACHE_TTLS", raising=False)
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_BYPASS", set())
+    llm_cache.configure(db.connector(str(tmp_path / "cache.db")), {"title": 60})
+    model = FakeListChatModel(responses=["Wheat subsidy", "Something else"])
+    llm = llm_gateway.wrap_llm(model)
+    assert llm.invoke("Title?", config=llm_gateway.call_config("title")).content == "Wheat subsidy"
+    cached = llm.invoke("Title?", config=llm_gateway.call_config("title"))
+    assert cached.content == "Wheat subsidy"
+    assert cached.usage_metadata["total_tokens"] == 0
+    assert llm.invoke("Title?").content == "Something else"
@@ -0,0 +1,44 @@
+import sqlite3
+import pytest
+from farmwise_common import metrics
+
+def sample(name, **labels):
+    return metrics.REGISTRY.get_sample_value(name, labels) or 0.0
+
+@pytest.mark.parametrize("sql, label", [
+    ("SELECT response FROM llm_cache WHERE key = ?", "select llm_cache"),
+    ("INSERT OR REPLACE INTO llm_cache (key) VALUES (?)", "insert llm_cache"),
+    ("UPDATE upload_jobs SET status = ?", "update upload_jobs"),
+    ("CREATE TABLE IF NOT EXISTS flight_leases (key TEXT)", "create flight_leases"),
+    ("PRAGMA journal_mode=WAL", "pragma"),
+    ("   ", "empty"),
+])
+def test_statement_label(sql, label):
+    assert metrics.statement_label(sql) == label
+
+def test_timed_connection_records_statements():
+    before = sample("sqlite_query_duration_seconds_count", statement="create timed_test")
+    conn = sqlite3.connect(":memory:", factory=metrics.TimedConnection)
+    conn.execute("CREATE TABLE timed_test (id INTEGER)")
+    conn.cursor().executemany("INSERT INTO timed_test VALUES (?)", [(1,), (2,)])
+    assert conn.execute("SELECT COUNT(*) FROM timed_test").fetchone()[0] == 2
+    conn.close()
+    assert sample("sqlite_query_duration_seconds_count", statement="create timed_test") == before + 1
+    assert sample("sqlite_query_duration_seconds_count", statement="insert timed_test") >= 1
+
+def test_track_llm_call_counts_errors():
+    before = sample("llm_calls_total", prompt="metrics_test", status="error")
+    with pytest.raises(RuntimeError):
+        with metrics.track_llm_call("metrics_test"):
+            raise RuntimeError("model down")
+    with metrics.track_llm_call("metrics_test"):
+        pass
+    assert sample("llm_calls_total", prompt="metrics_test", status="error") == before + 1
+    assert sample("llm_calls_total", prompt="metrics_test", status="ok") >= 1
+
+def test_record_cache_lookup():
+    before = sample("cache_lookups_total", cache="metrics_test", result="hit")
+    metrics.record_cache_lookup("metrics_test", True)
+    metrics.record_cache_lookup("metrics_test", False)
+    assert sample("cache_lookups_total", cache="metrics_test", result="hit") == before + 1
+    assert sample("cache_lookups_total", cache="metrics_test", result="miss") >= 1
@@ -0,0 +1,43 @@
+import os
+import pytest
+from farmwise_common import profiling
+
+flask = pytest.importorskip("flask")
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.delenv("PROFILE_DIR", raising=False)
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "")
+    profiling.configure(str(tmp_path), response_key="debug")
+    app = flask.Flask(__name__)
+    profiling.init_app(app)
+
+    @app.route("/work")
+    def work():
+        with profiling.allocations("build list"):
+            data = [str(i) * 10 for i in range(2000)]
+        return flask.jsonify({"items": len(data)})
+
+    return app.test_client()
+
+def test_unprofiled_request_is_untouched(client, tmp_path):
+    response = client.get("/work")
+    assert response.get_json() == {"items": 2000}
+    assert "X-Profile-Id" not in response.headers
+    assert os.listdir(tmp_path) == []
+
+def test_profiled_request_is_written_and_summarised(client, tmp_path):
+    response = client.get("/work", headers={"X-Profile": "cprofile"})
+    profile = response.get_json()["debug"]["profile"]
+    assert response.headers["X-Profile-Id"] == profile["id"]
+    assert profile["profiler"] == "cprofile"
+    assert os.path.dirname(profile["path"]) == str(tmp_path)
+    assert os.path.exists(profile["path"])
+    assert [site["label"] for site in profile["allocations"]] == ["build list"]
+
+def test_token_is_required_when_set(client, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    assert "debug" not in client.get("/work", headers={"X-Profile": "cprofile"}).get_json()
+    response = client.get("/work", headers={"X-Profile": "cprofile", "X-Profile-Token": "secret"})
+    assert "profile" in response.get_json()["debug"]
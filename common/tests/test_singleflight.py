@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+import pytest
+from farmwise_common import db, singleflight
+
+@pytest.fixture(autouse=True)
+def flights(tmp_path, monkeypatch):
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_ENABLED", True)
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_LEASES", False)
+    singleflight.configure(db.connector(str(tmp_path / "leases.db")))
+
+def run_concurrently(n, target):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+def test_concurrent_calls_share_one_result():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return "translated"
+
+    results, errors = run_concurrently(8, lambda: singleflight.do("translation", "k", compute))
+    assert not errors
+    assert len(calls) == 1
+    assert sorted(coalesced for _, coalesced in results) == [False] + [True] * 7
+    assert {result for result, _ in results} == {"translated"}
+
+def test_error_is_raised_in_every_waiting_caller():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        raise TimeoutError("model timed out")
+
+    results, errors = run_concurrently(5, lambda: singleflight.do("llm", "k", compute))
+    assert results == []
+    assert len(calls) == 1
+    assert len(errors) == 5 and all(isinstance(e, TimeoutError) for e in errors)
+
+def test_later_calls_run_again():
+    assert singleflight.do("llm", "k", lambda: 1) == (1, False)
+    assert singleflight.do("llm", "k", lambda: 2) == (2, False)
+
+def test_different_keys_do_not_coalesce():
+    results, _ = run_concurrently(2, lambda: singleflight.do("llm", threading.current_thread().name, lambda: time.sleep(0.05)))
+    assert [coalesced for _, coalesced in results] == [False, False]
+
+def test_async_callers_share_one_result():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "audio"
+
+    async def main():
+        return await asyncio.gather(*(singleflight.ado("tts", "k", compute) for _ in range(6)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ["audio"] * 6
+    assert sum(coalesced for _, coalesced in results) == 5
+
+def test_async_error_propagates():
+    async def compute():
+        await asyncio.sleep(0.05)
+        raise ValueError("bad reply")
+
+    async def main():
+        return await asyncio.gather(*(singleflight.ado("llm", "k", compute) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(main()))
+
+def test_cancelled_leader_hands_over_to_a_follower():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05 if len(calls) == 1 else 0)
+        return len(calls)
+
+    async def main():
+        leader = asyncio.create_task(singleflight.ado("llm", "k", compute))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(singleflight.ado("llm", "k", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == (2, False)
+
+def test_lease_held_elsewhere_waits_for_the_shared_result(monkeypatch):
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_LEASES", True)
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_POLL_MS", 10)
+    assert singleflight._acquire_lease("llm", "k", "other-process")
+    cache = {}
+    threading.Timer(0.05, lambda: cache.update(k="from the other process")).start()
+
+    def compute():
+        raise AssertionError("the other process is computing this")
+
+    assert singleflight.do("llm", "k", compute, lookup=lambda: cache.get("k")) == ("from the other process", True)
+
+def test_lease_is_released_after_computing(monkeypatch):
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_LEASES", True)
+    assert singleflight.do("llm", "k", lambda: "fresh", lookup=lambda: None) == ("fresh", False)
+    assert singleflight._acquire_lease("llm", "k", "next-process")
@@ -0,0 +1,100 @@
+import sqlite3
+from datetime import date
+import pytest
+from farmwise_common import db, token_usage
+
+@pytest.fixture
+def usage(tmp_path, monkeypatch):
+    monkeypatch.delenv("LLM_INPUT_COST_PER_MTOK", raising=False)
+    monkeypatch.delenv("LLM_OUTPUT_COST_PER_MTOK", raising=False)
+    token_usage.configure(db.connector(str(tmp_path / "usage.db")), 1.0, 2.0, request_user=lambda request, session: None)
+    return token_usage
+
+def test_record_call_uses_reported_usage_and_prices(usage):
+    with usage.usage_context("/summary", 7):
+        usage.record_call("summary", {"input_tokens": 1000, "output_tokens": 500}, None, {}, "")
+    [row] = usage.usage_report(date.today().isoformat(), ["route", "user_id", "prompt"])
+    assert (row["route"], row["user_id"], row["prompt"]) == ("/summary", "7", "summary")
+    assert (row["input_tokens"], row["output_tokens"], row["estimated"]) == (1000, 500, 0)
+    assert row["cost"] == pytest.approx(0.002)
+
+def test_record_call_estimates_missing_usage(usage):
+    usage.record_call("title", None, "Title for {text}", {"text": "a" * 390}, "b" * 40)
+    [row] = usage.usage_report(date.today().isoformat(), ["route", "user_id"])
+    assert (row["route"], row["user_id"]) == ("other", "anonymous")
+    assert (row["input_tokens"], row["output_tokens"], row["estimated"]) == (100, 10, 1)
+
+def test_failed_record_does_not_hold_the_database(usage, tmp_path):
+    with usage.usage_context(None):
+        usage.record_call("title", {"input_tokens": 1, "output_tokens": 1}, None, {}, "")
+    conn = sqlite3.connect(str(tmp_path / "usage.db"), timeout=0)
+    conn.execute("DELETE FROM llm_usage")
+    conn.commit()
+    conn.close()
+
+def test_add_usage_sums_reported_chunks():
+    class Chunk:
+        def __init__(self, usage_metadata):
+            self.usage_metadata = usage_metadata
+
+    total = token_usage.add_usage(None, Chunk(None))
+    assert total is None
+    total = token_usage.add_usage(total, Chunk({"input_tokens": 10, "output_tokens": 1}))
+    total = token_usage.add_usage(total, Chunk({"output_tokens": 4}))
+    assert total == {"input_tokens": 10, "output_tokens": 5}
+
+def test_user_budget(usage, monkeypatch):
+    monkeypatch.setattr(usage, "LLM_USER_DAILY_TOKEN_BUDGET", 100)
+    with usage.usage_context("/chat", "u1"):
+        assert usage.within_budget()
+        usage.record_call("chat", {"input_tokens": 80, "output_tokens": 30}, None, {}, "")
+        assert not usage.within_budget()
+        with pytest.raises(usage.BudgetExceeded, match="per user"):
+            usage.require_budget()
+    with usage.usage_context("/chat", "u2"):
+        usage.require_budget()
+    with usage.usage_context("/chat"):
+        assert usage.within_budget()
+
+def test_route_budget(usage, monkeypatch):
+    monkeypatch.setattr(usage, "LLM_ROUTE_TOKEN_BUDGETS", {"prewarm": 10})
+    with usage.usage_context("prewarm"):
+        usage.record_call("translation", {"input_tokens": 10, "output_tokens": 0}, None, {}, "")
+        assert not usage.within_budget()
+    with usage.usage_context("/translate"):
+        assert usage.within_budget()
+
+def test_env_prices_override_service_defaults(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_INPUT_COST_PER_MTOK", "5")
+    token_usage.configure(db.connector(str(tmp_path / "usage.db")), 1.0, 2.0, request_user=lambda request, session: None)
+    assert (token_usage.LLM_INPUT_COST_PER_MTOK, token_usage.LLM_OUTPUT_COST_PER_MTOK) == (5.0, 2.0)
+
+def test_unconfigured_database_does_not_fail_calls(monkeypatch):
+    monkeypatch.setattr(token_usage, "_schema", db.Schema("token_usage"))
+    monkeypatch.setattr(token_usage, "LLM_DAILY_TOKEN_BUDGET", 1)
+    token_usage.record_call("title", {"input_tokens": 1, "output_tokens": 1}, None, {}, "")
+    assert token_usage.within_budget()
+
+def test_budget_checks_reuse_the_days_totals(usage, monkeypatch, tmp_path):
+    monkeypatch.setattr(usage, "LLM_DAILY_TOKEN_BUDGET", 100)
+    assert usage.within_budget()
+    usage.record_call("chat", {"input_tokens": 60, "output_tokens": 0}, None, {}, "")
+    conn = sqlite3.connect(str(tmp_path / "usage.db"))
+    conn.execute("INSERT INTO llm_usage (day, route, user_id, prompt, input_tokens, output_tokens, cost) VALUES (?, 'other', 'anonymous', 'chat', 60, 0, 0)",
+                 (date.today().isoformat(),))
+    conn.commit()
+    conn.close()
+    assert usage.within_budget()  # Another worker's call isn't read again yet
+    usage.record_call("chat", {"input_tokens": 40, "output_tokens": 0}, None, {}, "")
+    assert not usage.within_budget()  # This process's own calls count straight away
+
+def test_budget_checks_read_other_workers_calls_once_the_totals_expire(usage, monkeypatch, tmp_path):
+    monkeypatch.setattr(usage, "LLM_DAILY_TOKEN_BUDGET", 100)
+    monkeypatch.setattr(usage, "LLM_BUDGET_CHECK_SECONDS", 0)
+    assert usage.within_budget()
+    conn = sqlite3.connect(str(tmp_path / "usage.db"))
+    conn.execute("INSERT INTO llm_usage (day, route, user_id, prompt, input_tokens, output_tokens, cost) VALUES (?, 'other', 'anonymous', 'chat', 100, 0, 0)",
+                 (date.today().isoformat(),))
+    conn.commit()
+    conn.close()
+    assert not usage.within_budget()
@@ -0,0 +1,56 @@
+import json
+import pytest
+from farmwise_common import tracing
+
+@pytest.fixture
+def exported(tmp_path, monkeypatch):
+    """Export traces to a fresh file, returning a function reading its spans."""
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_EXPORT_PATH", str(path))
+    monkeypatch.setattr(tracing, "_exporter", None)
+    yield lambda: [span for spans in tracing.load_traces(str(path)).values() for span in spans]
+    for handler in tracing.logging.getLogger("trace_export").handlers[:]:
+        handler.close()
+        tracing.logging.getLogger("trace_export").removeHandler(handler)
+
+def test_spans_outside_a_trace_are_not_recorded(exported):
+    with tracing.span("orphan") as span:
+        assert span is None
+    assert tracing.current_span() is None
+
+def test_children_share_the_root_trace(exported):
+    with tracing.span("root", root=True) as root:
+        with tracing.span("child", kind=tracing.SPAN_KIND_CLIENT, rows=3) as child:
+            assert tracing.current_span() is child
+    spans = {span["name"]: span for span in exported()}
+    assert spans["child"]["traceId"] == spans["root"]["traceId"] == root.trace.trace_id
+    assert spans["child"]["parentSpanId"] == root.span_id
+    assert {"key": "rows", "value": {"intValue": "3"}} in spans["child"]["attributes"]
+
+def test_remote_traceparent_is_continued(exported):
+    traceparent = "00-" + "a" * 32 + "-" + "b" * 16 + "-01"
+    with tracing.span("request", root=True, traceparent=traceparent):
+        pass
+    (span,) = exported()
+    assert span["traceId"] == "a" * 32
+    assert span["parentSpanId"] == "b" * 16
+
+def test_errors_mark_the_span_failed(exported):
+    with pytest.raises(ValueError):
+        with tracing.span("root", root=True):
+            raise ValueError("boom")
+    (span,) = exported()
+    assert span["status"] == {"code": 2, "message": "ValueError: boom"}
+
+def test_configure_names_the_service(exported, monkeypatch):
+    monkeypatch.delenv("TRACE_SERVICE_NAME", raising=False)
+    monkeypatch.setattr(tracing, "SERVICE_NAME", tracing.SERVICE_NAME)
+    export_path = tracing.TRACE_EXPORT_PATH
+    monkeypatch.setenv("TRACE_EXPORT_PATH", export_path)
+    tracing.configure("farmwise-test", "/nonexistent/traces.jsonl")
+    assert tracing.TRACE_EXPORT_PATH == export_path  # The environment wins
+    with tracing.span("root", root=True):
+        pass
+    with open(export_path, encoding="utf-8") as f:
+        resource = json.loads(f.readline())["resourceSpans"][0]["resource"]
+    assert resource["attributes"] == [{"key": "service.name", "value": {"stringValue": "farmwise-test"}}]
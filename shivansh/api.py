@@ -1,16 +1,28 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, session
+from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, session, Response, stream_with_context
 import os
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from PyPDF2 import PdfReader
 import io
 import base64
+import json
 import re
 import db_utils
 import audio_utils
+import eligibility_cache
+import eligibility_matrix
+import jobs
+import llm_gateway
+import metrics
+import prewarm
+import profiling
+import scheme_pipeline
+import startup
+import token_usage
+import tracing
+import translation_utils
+from llm_utils import stream_prompt
 import sqlite3
 import time
+import uuid
 
 # Load environment variables
 load_dotenv()
@@ -19,36 +31,40 @@ load_dotenv()
 from flask_cors import CORS
 app = Flask(__name__)
 CORS(app)
-app.secret_key = os.urandom(24)  # For session management
-
-# API key validation
-api_key = os.getenv("GOOGLE_API_KEY")
-# if not api_key:
-#     raise ValueError("GOOGLE_API_KEY is not set in the .env file.")
-
-# Initialize LLM
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    api_key=api_key
-)
+# Sessions must be signed with the same key in every worker process, so the app refuses to
+# start without one when served by gunicorn or uvicorn; only `python api.py` makes one up
+app.secret_key = os.getenv("SECRET_KEY")
+if not app.secret_key:
+    if __name__ != '__main__':
+        raise RuntimeError("SECRET_KEY is not set: set it to a long random string shared by all workers (see .env.example)")
+    print("Warning: SECRET_KEY is not set, using a random key. Sessions won't survive restarts.")
+    app.secret_key = os.urandom(24)
+
+# Request metrics and the Prometheus /metrics endpoint
+metrics.init_app(app)
+# Request traces, exported to TRACE_EXPORT_PATH (see tracing.py)
+tracing.init_app(app)
+# LLM token usage is recorded per route and user, within daily budgets (see token_usage.py)
+token_usage.init_app(app)
+# Requests sent with X-Profile are profiled when PROFILING_ENABLED is set (see profiling.py)
+profiling.init_app(app)
 
 # Get supported languages
 supported_langs = audio_utils.get_supported_languages()
 
 # Filter the language dictionary to only include supported languages
-languages = {
-    "English": "en",
-    "Hindi": "hi",
-    "Tamil": "ta",
-    "Telugu": "te",
-    "Bengali": "bn",
-    "Marathi": "mr",
-    "Gujarati": "gu",
-    "Kannada": "kn",
-    "Malayalam": "ml"
-}
+languages = {k: v for k, v in translation_utils.LANGUAGES.items() if audio_utils.is_language_supported(v)}
+
+
+@app.before_request
+def mark_request_started():
+    # Let the background pre-warm worker yield to interactive requests
+    prewarm.request_started()
+
 
-languages = {k: v for k, v in languages.items() if audio_utils.is_language_supported(v)}
+@app.teardown_request
+def mark_request_finished(exc):
+    prewarm.request_finished()
 
 
 @app.route('/set_language', methods=['POST'])
@@ -61,6 +77,42 @@ def set_language():
     return jsonify({'success': True, 'language': language}), 200
 
 
+def upload_response(result, url_for=url_for):
+    """Build the /upload_scheme response payload from a pipeline result"""
+    audio_file = os.path.join(scheme_pipeline.TEMP_AUDIO_DIR, result['audio_file'])
+    with open(audio_file, 'rb') as f:
+        audio_base64 = base64.b64encode(f.read()).decode('utf-8')
+    
+    return {
+        'success': True,
+        'summary': result['summary'],
+        'raw': result['raw'],
+        'summary_title': result['summary_title'],
+        'eligibility_questions': result['eligibility_questions'],  # Translated
+        'language': translation_utils.get_language_name(result['language_code']),
+        'language_code': result['language_code'],
+        'audio_base64': audio_base64,
+        'audio_url': url_for('static', filename=f"temp_audio/{result['audio_file']}", _external=True)
+    }
+
+
+def remember_uploaded_scheme(result, session=session):
+    """Store an uploaded scheme in the session so it can be saved later"""
+    summary = result['summary_original']
+    eligibility_questions = result['eligibility_questions_original']
+    
+    session['document_text'] = result['raw']
+    session['scheme_title'] = result['summary_title']
+    session['scheme_summary'] = summary  # Original English
+    session['scheme_summary_translated'] = result['summary']  # Translated
+    session['scheme_eligibility'] = eligibility_questions  # Original English
+    session['scheme_eligibility_translated'] = result['eligibility_questions']  # Translated
+    session['scheme_criteria'] = result.get('eligibility_criteria', [])  # From the structured extraction only
+    session['original_questions'] = [q.strip() for q in eligibility_questions.strip().split("\n") if q.strip()]
+    session['translated_questions'] = [q.strip() for q in result['eligibility_questions'].strip().split("\n") if q.strip()]
+    session['language'] = result['language_code']  # For other endpoints
+
+
 @app.route('/upload_scheme', methods=['POST'])
 def upload_scheme():
     if 'scheme_file' not in request.files:
@@ -77,126 +129,90 @@ def upload_scheme():
     
     if file and file.filename.endswith('.pdf'):
         try:
-            pdf_reader = PdfReader(file, strict=False)
-            text = ""
-            for page in pdf_reader.pages:
-                try:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text
-                except Exception as e:
-                    return jsonify({'error': f'Warning: Could not extract text from a page: {e}'}), 400
-            
-            if not text.strip():
-                return jsonify({'error': 'Could not extract any text from the uploaded PDF'}), 400
-            
-            # Extract scheme title
-            title_prompt = ChatPromptTemplate.from_messages([
-                ("system", "You are an expert in government agricultural schemes. Extract the exact title of the scheme from the provided document. Return ONLY the title as a single line, without any additional text or explanation."),
-                ("human", f"Extract the title from this document: {text[:5000]}")
-            ])
-            
-            title_chain = title_prompt | llm
-            title_response = title_chain.invoke({})
-            scheme_title = title_response.content if hasattr(title_response, "content") else title_response
-            scheme_title = scheme_title.strip()
-            
-            # Analyze the scheme
-            summary_prompt = ChatPromptTemplate.from_messages([
-                ("system", "You are an expert in government agricultural schemes. Your task is to analyze the provided government scheme document and create a simple, easy-to-understand summary for farmers. Focus on the key benefits, eligibility criteria, and application process. Use simple language that a person with basic education can understand."),
-                ("human", f"Please analyze this government agricultural scheme document and provide a summary in simple language: {text[:15000]}")
-            ])
-            
-            summary_chain = summary_prompt | llm
-            summary_response = summary_chain.invoke({})
-            summary = summary_response.content if hasattr(summary_response, "content") else summary_response
-            
-            # Generate eligibility questions
-            eligibility_prompt = ChatPromptTemplate.from_messages([
-                ("system", "You are an expert in government agricultural schemes. Extract the key eligibility criteria from the provided document. Then generate 5-7 simple yes/no questions that can determine if a farmer is eligible for the scheme. Return ONLY the questions, one per line, without any numbering or additional text."),
-                ("human", f"Extract eligibility criteria questions from this scheme document: {text[:15000]}")
-            ])
-            
-            eligibility_chain = eligibility_prompt | llm
-            eligibility_response = eligibility_chain.invoke({})
-            eligibility_questions = eligibility_response.content if hasattr(eligibility_response, "content") else eligibility_response
-            
-            # Get selected language name
-            selected_language = [k for k, v in languages.items() if v == language_code][0]
+            text = scheme_pipeline.extract_pdf_text(file)
+            result = scheme_pipeline.process_scheme(text, language_code)
             
-            # Translate summary if not English
-            display_summary = summary
-            if language_code != "en":
-                translation_prompt = ChatPromptTemplate.from_messages([
-                    ("system", f"You are a translator. Translate the following text from English to {selected_language} maintaining the meaning and simplicity. Return ONLY the translated text without any additional explanations or notes."),
-                    ("human", summary)
-                ])
-                translation_chain = translation_prompt | llm
-                translation_response = translation_chain.invoke({})
-                display_summary = translation_response.content if hasattr(translation_response, "content") else translation_response
+            # Store in session for /save_scheme
+            remember_uploaded_scheme(result)
             
-            # Translate eligibility questions if not English
-            display_eligibility_questions = eligibility_questions
-            if language_code != "en":
-                translation_prompt = ChatPromptTemplate.from_messages([
-                    ("system", f"You are a translator. Translate the following questions from English to {selected_language} maintaining the meaning and simplicity. Keep the format with one question per line, no numbering or extra text."),
-                    ("human", eligibility_questions)
-                ])
-                translation_chain = translation_prompt | llm
-                translation_response = translation_chain.invoke({})
-                display_eligibility_questions = translation_response.content if hasattr(translation_response, "content") else translation_response
+            # Warm translations and audio for the other languages our users read
+            prewarm.enqueue_upload(result)
             
-            # Generate audio for the summary
-            try:
-                tts_text = display_summary  # Use translated summary for non-English
-                audio_bytes, _ = audio_utils.generate_audio(tts_text, language_code)
-                if not audio_bytes:
-                    return jsonify({'error': 'Failed to generate audio'}), 500
-                
-                # Convert audio to base64 for response
-                audio_bytes.seek(0)
-                audio_base64 = base64.b64encode(audio_bytes.read()).decode('utf-8')
-                
-                # Optionally save audio to temp file for future use
-                timestamp = int(time.time())
-                filename = f"scheme_{scheme_title.lower().replace(' ', '_')}_{timestamp}.mp3"
-                temp_dir = os.path.join(os.getcwd(), 'static', 'temp_audio')
-                os.makedirs(temp_dir, exist_ok=True)
-                temp_file = os.path.join(temp_dir, filename)
-                audio_bytes.seek(0)
-                with open(temp_file, 'wb') as f:
-                    f.write(audio_bytes.read())
-                audio_url = url_for('static', filename=f'temp_audio/{filename}', _external=True)
-            except Exception as e:
-                return jsonify({'error': f'Error generating audio: {e}'}), 500
-            
-            # Store in session
-            session['document_text'] = text
-            session['scheme_title'] = scheme_title
-            session['scheme_summary'] = summary  # Original English
-            session['scheme_summary_translated'] = display_summary  # Translated
-            session['scheme_eligibility'] = eligibility_questions  # Original English
-            session['scheme_eligibility_translated'] = display_eligibility_questions  # Translated
-            session['original_questions'] = [q.strip() for q in eligibility_questions.strip().split("\n") if q.strip()]
-            session['translated_questions'] = [q.strip() for q in display_eligibility_questions.strip().split("\n") if q.strip()]
-            session['language'] = language_code  # For other endpoints
-            
-            return jsonify({
-                'success': True,
-                'summary': display_summary,
-                'raw': text,
-                'summary_title': scheme_title,
-                'eligibility_questions': display_eligibility_questions,  # Translated
-                'language': selected_language,
-                'language_code': language_code,
-                'audio_base64': audio_base64,
-                'audio_url': audio_url
-            })
+            return jsonify(upload_response(result))
         
+        except scheme_pipeline.PipelineError as e:
+            return jsonify({'error': e.message}), e.status
+        except token_usage.BudgetExceeded as e:
+            return jsonify({'error': str(e)}), 429
+        except llm_gateway.GatewayUnavailable as e:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': str(round(e.retry_after))}
         except Exception as e:
             return jsonify({'error': f'Error processing PDF: {e}'}), 500
     
     return jsonify({'error': 'Invalid file type, please upload a PDF'}), 400
+
+
+@app.route('/upload_jobs', methods=['POST'])
+def submit_upload_job():
+    if 'scheme_file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    file = request.files['scheme_file']
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    
+    language_code = request.form.get('language', 'en')
+    if language_code not in languages.values():
+        return jsonify({'error': f'Unsupported language code: {language_code}'}), 400
+    
+    if not file.filename.endswith('.pdf'):
+        return jsonify({'error': 'Invalid file type, please upload a PDF'}), 400
+    
+    try:
+        job_id = jobs.submit_upload(file.read(), language_code)
+    except jobs.JobQueueFull as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': f'Error queuing upload: {e}'}), 500
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('get_upload_job', job_id=job_id, _external=True)
+    }), 202
+
+
+@app.route('/upload_jobs/<job_id>')
+def get_upload_job(job_id):
+    job = jobs.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    result = job['result']
+    response = {
+        'job_id': job_id,
+        'status': job['status'],
+        'stage': job['stage'],
+        'stages': job['stages'],
+        'pending_stages': [stage for stage in scheme_pipeline.STAGES if stage not in job['stages']],
+        'language_code': job['language']
+    }
+    
+    if job['status'] == 'failed':
+        response['error'] = job['error']
+    elif job['status'] == 'completed':
+        # Same payload as /upload_scheme, and remember the scheme for /save_scheme
+        remember_uploaded_scheme(result)
+        response['result'] = upload_response(result)
+    else:
+        # Partial results for the stages that are already done (English until translated)
+        partial_keys = ('summary_title', 'summary_original', 'eligibility_questions_original', 'summary', 'eligibility_questions')
+        response['result'] = {key: result[key] for key in partial_keys if key in result}
+    
+    return jsonify(response)
+
+
 @app.route('/view_scheme/<scheme_id>')
 def view_scheme(scheme_id):
     scheme = db_utils.get_scheme_by_id(scheme_id)
@@ -207,34 +223,12 @@ def view_scheme(scheme_id):
     language_code = session.get('language', 'en')
     selected_language = [k for k, v in languages.items() if v == language_code][0]
     
-    # If not English, translate the summary
-    if language_code != "en":
-        translation_prompt = ChatPromptTemplate.from_messages([
-            ("system", f"You are a translator. Translate the following text from English to {selected_language} maintaining the meaning and simplicity. Return ONLY the translated text without any additional explanations or notes."),
-            ("human", scheme['summary'])
-        ])
-        translation_chain = translation_prompt | llm
-        translation_response = translation_chain.invoke({})
-        translated_summary = translation_response.content if hasattr(translation_response, "content") else translation_response
-        display_summary = translated_summary
-    else:
-        display_summary = scheme['summary']
-    
-    # Translate eligibility questions if not in English
-    if language_code != "en":
-        translation_prompt = ChatPromptTemplate.from_messages([
-            ("system", f"You are a translator. Translate the following questions from English to {selected_language} maintaining the meaning and simplicity. Keep the same format with one question per line."),
-            ("human", scheme['eligibility_criteria'])
-        ])
-        translation_chain = translation_prompt | llm
-        translation_response = translation_chain.invoke({})
-        translated_questions = translation_response.content if hasattr(translation_response, "content") else translation_response
-        
-        # Split translated questions
-        display_questions = [q.strip() for q in translated_questions.strip().split("\n") if q.strip()]
-    else:
-        # Use original questions for display
-        display_questions = [q.strip() for q in scheme['eligibility_criteria'].strip().split("\n") if q.strip()]
+    # If not English, translate the summary and eligibility questions
+    display_summary = translation_utils.translate(scheme['summary'], language_code)
+    translated_questions = translation_utils.translate(scheme['eligibility_criteria'], language_code, kind="questions")
+    
+    # Split questions for display
+    display_questions = [q.strip() for q in translated_questions.strip().split("\n") if q.strip()]
     
     return jsonify({
         'title': scheme['title'],
@@ -262,17 +256,7 @@ def generate_audio():
     
     try:
         # If not English, translate
-        if language_code != "en":
-            selected_language = [k for k, v in languages.items() if v == language_code][0]
-            translation_prompt = ChatPromptTemplate.from_messages([
-                ("system", f"You are a translator. Translate the following text from English to {selected_language} maintaining the meaning and simplicity. Return ONLY the translated text without any additional explanations or notes."),
-                ("human", summary)
-            ])
-            translation_chain = translation_prompt | llm
-            translation_response = translation_chain.invoke({})
-            tts_text = translation_response.content if hasattr(translation_response, "content") else translation_response
-        else:
-            tts_text = summary
+        tts_text = translation_utils.translate(summary, language_code)
         
         # Generate audio
         audio_bytes, _ = audio_utils.generate_audio(tts_text, language_code)
@@ -290,12 +274,10 @@ def generate_audio():
         return jsonify({'error': f'Error generating audio: {e}'}), 500
 
 
-@app.route('/check_eligibility', methods=['POST'])
-def check_eligibility():
-    # Get JSON data from the request
-    data = request.get_json()
+def eligibility_request_error(data):
+    """Return the error message for an invalid eligibility request, or None if it is valid"""
     if not data or 'questions' not in data or 'responses' not in data:
-        return jsonify({'error': 'Questions and responses must be provided'}), 400
+        return 'Questions and responses must be provided'
 
     questions = data['questions']
     responses = data['responses']
@@ -303,50 +285,276 @@ def check_eligibility():
 
     # Validate inputs
     if not isinstance(questions, list) or not isinstance(responses, list):
-        return jsonify({'error': 'Questions and responses must be arrays'}), 400
+        return 'Questions and responses must be arrays'
     if len(questions) != len(responses):
-        return jsonify({'error': 'Number of questions and responses must match'}), 400
+        return 'Number of questions and responses must match'
     if not all(r in ['Yes', 'No'] for r in responses):
-        return jsonify({'error': 'Responses must be "Yes" or "No"'}), 400
+        return 'Responses must be "Yes" or "No"'
     if language_code not in languages.values():
-        return jsonify({'error': f'Unsupported language code: {language_code}'}), 400
+        return f'Unsupported language code: {language_code}'
+    return None
+
+
+@app.route('/check_eligibility', methods=['POST'])
+def check_eligibility():
+    # Get JSON data from the request
+    data = request.get_json()
+    error = eligibility_request_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    questions = data['questions']
+    responses = data['responses']
+    language_code = data.get('language', 'en')
+    scheme_id = data.get('scheme_id')  # A stored scheme is judged by its compiled rules
+    explain = bool(data.get('explain'))  # Have the LLM explain a rule verdict
 
     try:
-        # Prepare responses for analysis
-        formatted_responses = "\n".join(
-            [f"Q: {questions[i]}\nA: {responses[i]}" for i in range(len(questions))]
-        )
+        # Check eligibility (the scheme's rules, or the LLM with the questions as context) and
+        # translate the verdict, LLM verdicts reused from the eligibility cache for answers seen before
+        is_eligible, display_result = scheme_pipeline.judge_eligibility(questions, responses, language_code, scheme_id, explain)
 
-        # Check eligibility (no document_text, using questions as context)
-        eligibility_check_prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are an expert in government agricultural schemes. Based on the eligibility questions and the farmer's responses, determine if they are eligible for the scheme. IMPORTANT: Start your response with exactly 'ELIGIBLE: ' (if they qualify) or 'NOT ELIGIBLE: ' (if they don't qualify) followed by a clear explanation of your decision and any next steps they should take. If they are eligible, provide information on how to apply."),
-            ("human", f"Eligibility questions and responses:\n{formatted_responses}\n\nBased on these responses, is the farmer eligible for the scheme? Start with ELIGIBLE: or NOT ELIGIBLE: followed by your explanation.")
-        ])
+        return jsonify({
+            'success': True,
+            'is_eligible': is_eligible,
+            'result': display_result
+        })
+    except token_usage.BudgetExceeded as e:
+        return jsonify({'error': str(e)}), 429
+    except llm_gateway.GatewayUnavailable as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(round(e.retry_after))}
+    except Exception as e:
+        return jsonify({'error': f'Error checking eligibility: {str(e)}'}), 500
 
-        eligibility_check_chain = eligibility_check_prompt | llm
-        eligibility_check_response = eligibility_check_chain.invoke({})
-        eligibility_result = eligibility_check_response.content if hasattr(eligibility_check_response, "content") else eligibility_check_response
 
-        # Determine if eligible
-        is_eligible = eligibility_result.upper().startswith("ELIGIBLE:") and not eligibility_result.upper().startswith("NOT ELIGIBLE:")
+def sse_event(event, data):
+    """Format a server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        # Translate eligibility result if not in English
-        display_result = eligibility_result
-        if language_code != "en":
-            selected_language = [k for k, v in languages.items() if v == language_code][0]
-            translation_prompt = ChatPromptTemplate.from_messages([
-                ("system", f"You are a translator. Translate the following text from English to {selected_language} maintaining the meaning and simplicity. Return ONLY the translated text without any additional explanations or notes."),
-                ("human", eligibility_result)
-            ])
-            translation_chain = translation_prompt | llm
-            translation_response = translation_chain.invoke({})
-            display_result = translation_response.content if hasattr(translation_response, "content") else translation_response
 
-        return jsonify({
+def sse_response(events):
+    """Stream server-sent events from a generator"""
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/upload_scheme/stream', methods=['POST'])
+def upload_scheme_stream():
+    """
+    Streaming variant of /upload_scheme
+
+    Emits "token" events with summary text as it is generated ("summary_original" is
+    the English summary shown while a translation is pending), "stage" events as each
+    stage completes, then a "result" event with the /upload_scheme payload plus a
+    job_id (fetch /upload_jobs/<job_id> to store the scheme in the session), or an
+    "error" event.
+    """
+    if 'scheme_file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    file = request.files['scheme_file']
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    
+    language_code = request.form.get('language', 'en')
+    if language_code not in languages.values():
+        return jsonify({'error': f'Unsupported language code: {language_code}'}), 400
+    
+    if not file.filename.endswith('.pdf'):
+        return jsonify({'error': 'Invalid file type, please upload a PDF'}), 400
+    
+    try:
+        text = scheme_pipeline.extract_pdf_text(file)
+    except scheme_pipeline.PipelineError as e:
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        return jsonify({'error': f'Error processing PDF: {e}'}), 500
+    
+    # Track the upload as a job so the result can be picked up via /upload_jobs
+    job_id = uuid.uuid4().hex
+    db_utils.create_upload_job(job_id, language_code)
+    
+    def generate():
+        completed = ["text_extracted"]
+        yield sse_event('stage', {'stage': 'text_extracted', 'job_id': job_id})
+        try:
+            for kind, name, payload in scheme_pipeline.stream_scheme(text, language_code):
+                if kind == 'token':
+                    yield sse_event('token', {'field': name, 'text': payload})
+                elif kind == 'stage':
+                    completed.append(name)
+                    db_utils.update_upload_job(job_id, status='running', stage=name, stages=completed)
+                    yield sse_event('stage', {'stage': name})
+                else:
+                    db_utils.update_upload_job(job_id, status='completed', result=payload)
+                    prewarm.enqueue_upload(payload)
+                    yield sse_event('result', {**upload_response(payload), 'job_id': job_id})
+        except scheme_pipeline.PipelineError as e:
+            db_utils.update_upload_job(job_id, status='failed', error=e.message)
+            yield sse_event('error', {'error': e.message})
+        except Exception as e:
+            db_utils.update_upload_job(job_id, status='failed', error=f'Error processing PDF: {e}')
+            yield sse_event('error', {'error': f'Error processing PDF: {e}'})
+    
+    return sse_response(generate())
+
+
+@app.route('/check_eligibility/stream', methods=['POST'])
+def check_eligibility_stream():
+    """
+    Streaming variant of /check_eligibility
+
+    Emits "token" events with the verdict as it is generated (field "result_original"
+    holds the English verdict while a translation is pending, "result" the text to
+    display), a "stage" event once the verdict is known, then a "result" event with
+    the /check_eligibility payload, or an "error" event. A scheme judged by its rules
+    has its "stage" event first, before any explanation is generated.
+    """
+    data = request.get_json()
+    error = eligibility_request_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    questions = data['questions']
+    responses = data['responses']
+    language_code = data.get('language', 'en')
+    scheme_id = data.get('scheme_id')
+    explain = bool(data.get('explain'))
+    result_field = 'result' if language_code == 'en' else 'result_original'
+
+    key = eligibility_cache.verdict_key(questions, responses)
+
+    def generate_from_rules(rules):
+        is_eligible, eligibility_result = scheme_pipeline.rule_verdict(rules, responses)
+        yield sse_event('stage', {'stage': 'verdict_ready', 'is_eligible': is_eligible})
+        if explain:
+            chunks = []
+            for chunk in scheme_pipeline.stream_explanation(rules, responses, is_eligible):
+                chunks.append(chunk)
+                yield sse_event('token', {'field': result_field, 'text': chunk})
+            eligibility_result = "".join(chunks)
+        else:
+            yield sse_event('token', {'field': result_field, 'text': eligibility_result})
+
+        display_result = eligibility_result
+        if language_code != 'en':
+            chunks = []
+            for chunk in translation_utils.stream_translate(eligibility_result, language_code):
+                chunks.append(chunk)
+                yield sse_event('token', {'field': 'result', 'text': chunk})
+            display_result = "".join(chunks)
+
+        yield sse_event('result', {
             'success': True,
             'is_eligible': is_eligible,
             'result': display_result
         })
+
+    def generate():
+        try:
+            rules = scheme_pipeline.applicable_rules(scheme_pipeline.scheme_rules(scheme_id), questions, responses) if scheme_id else None
+            if rules is not None:
+                yield from generate_from_rules(rules)
+                return
+
+            verdict = eligibility_cache.get(key)
+            if verdict is None:
+                chunks = []
+                for chunk in stream_prompt(scheme_pipeline.ELIGIBILITY_CHECK_PROMPT,
+                                           {"responses": scheme_pipeline.format_responses(questions, responses)},
+                                           name="eligibility"):
+                    chunks.append(chunk)
+                    yield sse_event('token', {'field': result_field, 'text': chunk})
+                eligibility_result = "".join(chunks)
+                verdict = eligibility_cache.put(key, scheme_pipeline.is_eligible_result(eligibility_result), eligibility_result)
+            else:
+                yield sse_event('token', {'field': result_field, 'text': verdict['result']})
+
+            is_eligible = verdict['is_eligible']
+            yield sse_event('stage', {'stage': 'verdict_ready', 'is_eligible': is_eligible})
+
+            display_result = scheme_pipeline.cached_verdict_text(verdict, language_code)
+            if display_result is not None:
+                if language_code != 'en':
+                    yield sse_event('token', {'field': 'result', 'text': display_result})
+            else:
+                chunks = []
+                for chunk in translation_utils.stream_translate(verdict['result'], language_code):
+                    chunks.append(chunk)
+                    yield sse_event('token', {'field': 'result', 'text': chunk})
+                display_result = "".join(chunks)
+                scheme_pipeline.save_verdict_translation(key, verdict, language_code, display_result)
+
+            yield sse_event('result', {
+                'success': True,
+                'is_eligible': is_eligible,
+                'result': display_result
+            })
+        except Exception as e:
+            yield sse_event('error', {'error': f'Error checking eligibility: {str(e)}'})
+
+    return sse_response(generate())
+
+
+def matrix_request_error(data):
+    """Return the error message for an invalid /eligibility_matrix request, or None if it is valid"""
+    if not data or not (data.get('answers') or data.get('profile')):
+        return 'Answers or a profile must be provided'
+    answers = data.get('answers') or {}
+    if not isinstance(answers, dict):
+        return 'Answers must map question IDs to "Yes" or "No"'
+    if not all(a in ['Yes', 'No'] for a in answers.values()):
+        return 'Answers must be "Yes" or "No"'
+    if not isinstance(data.get('profile') or {}, (dict, str)):
+        return 'Profile must be an object or text'
+    if data.get('language', 'en') not in languages.values():
+        return f"Unsupported language code: {data.get('language')}"
+    return None
+
+
+@app.route('/eligibility_matrix/questions')
+def eligibility_matrix_questions():
+    """
+    The eligibility questions of every stored scheme, each asked once however many schemes
+    share it, most widely asked first (translated into the ?language= or session language)
+    """
+    language_code = request.args.get('language', session.get('language', 'en'))
+    if language_code not in languages.values():
+        return jsonify({'error': f'Unsupported language code: {language_code}'}), 400
+
+    try:
+        questions = eligibility_matrix.translate_questions(eligibility_matrix.questions(), language_code)
+        return jsonify({'success': True, 'questions': questions})
+    except Exception as e:
+        return jsonify({'error': f'Error listing eligibility questions: {str(e)}'}), 500
+
+
+@app.route('/eligibility_matrix', methods=['POST'])
+def check_eligibility_matrix():
+    """
+    Check one farmer against every stored scheme
+
+    Takes "answers" ({question ID from /eligibility_matrix/questions: "Yes" or "No"}) and/or a
+    "profile" the LLM answers the other questions from. Returns the eligible schemes ranked,
+    the schemes that need more answers with the questions to ask, and those not eligible.
+    """
+    data = request.get_json()
+    error = matrix_request_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    language_code = data.get('language', 'en')
+    try:
+        report = eligibility_matrix.assess(data.get('answers'), data.get('profile'))
+        report['questions'] = eligibility_matrix.translate_questions(report['questions'], language_code)
+        return jsonify({'success': True, **report})
+    except token_usage.BudgetExceeded as e:
+        return jsonify({'error': str(e)}), 429
+    except llm_gateway.GatewayUnavailable as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(round(e.retry_after))}
     except Exception as e:
         return jsonify({'error': f'Error checking eligibility: {str(e)}'}), 500
 
@@ -372,9 +580,17 @@ def save_scheme():
             description="Uploaded scheme",
             eligibility_criteria=eligibility_questions,
             summary=scheme_summary,
-            document_text=document_text
+            document_text=document_text,
+            criteria=session.get('scheme_criteria')
         )
         
+        # Compile the eligibility rules once, so checks of this scheme don't need the LLM
+        # (if this fails they are compiled on the first check instead)
+        try:
+            scheme_pipeline.scheme_rules(scheme_id)
+        except Exception as e:
+            print(f"Error compiling eligibility rules for scheme {scheme_id}: {e}")
+        
         # Save user scheme without eligibility result if not checked
         db_utils.save_user_scheme(
             user_id=session['user_id'],
@@ -383,6 +599,9 @@ def save_scheme():
             eligibility_details=None
         )
         
+        # Warm translations and audio for the languages this scheme's users read
+        prewarm.enqueue_scheme(scheme_id, [session.get('language'), db_utils.get_user_language(session['user_id'])])
+        
         return jsonify({'success': True, 'message': 'Scheme saved to your list!'})
     
     except Exception as e:
@@ -404,7 +623,7 @@ def translate_scheme_summary():
     
     # Get the scheme from the database
     try:
-        conn = sqlite3.connect(db_utils.DB_PATH)
+        conn = db_utils.get_connection()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         cursor.execute("SELECT summary FROM schemes WHERE id = ?", (scheme_id,))
@@ -415,16 +634,9 @@ def translate_scheme_summary():
             return jsonify({'error': 'Scheme not found'}), 404
         
         summary = scheme['summary']
-        selected_language = [k for k, v in languages.items() if v == language_code][0]
         
         # Translate the summary
-        translation_prompt = ChatPromptTemplate.from_messages([
-            ("system", f"You are a translator. Translate the following text from English to {selected_language} maintaining the meaning and simplicity. Return ONLY the translated text without any additional explanations or notes."),
-            ("human", summary)
-        ])
-        translation_chain = translation_prompt | llm
-        translation_response = translation_chain.invoke({})
-        translated_text = translation_response.content if hasattr(translation_response, "content") else translation_response
+        translated_text = translation_utils.translate(summary, language_code)
         
         return jsonify({'translated_text': translated_text})
     except Exception as e:
@@ -446,7 +658,7 @@ def translate_eligibility_details():
     
     # Get the eligibility details from the database
     try:
-        conn = sqlite3.connect(db_utils.DB_PATH)
+        conn = db_utils.get_connection()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         cursor.execute(
@@ -460,16 +672,9 @@ def translate_eligibility_details():
             return jsonify({'error': 'Scheme not found'}), 404
         
         eligibility_details = user_scheme['eligibility_details']
-        selected_language = [k for k, v in languages.items() if v == language_code][0]
         
         # Translate the eligibility details
-        translation_prompt = ChatPromptTemplate.from_messages([
-            ("system", f"You are a translator. Translate the following text from English to {selected_language} maintaining the meaning and simplicity. Return ONLY the translated text without any additional explanations or notes."),
-            ("human", eligibility_details)
-        ])
-        translation_chain = translation_prompt | llm
-        translation_response = translation_chain.invoke({})
-        translated_text = translation_response.content if hasattr(translation_response, "content") else translation_response
+        translated_text = translation_utils.translate(eligibility_details, language_code)
         
         return jsonify({'translated_text': translated_text})
     except Exception as e:
@@ -487,7 +692,7 @@ def generate_scheme_audio():
     
     # Get the scheme from the database
     try:
-        conn = sqlite3.connect(db_utils.DB_PATH)
+        conn = db_utils.get_connection()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         cursor.execute("SELECT summary FROM schemes WHERE id = ?", (scheme_id,))
@@ -500,18 +705,8 @@ def generate_scheme_audio():
         summary = scheme['summary']
         language_code = session.get('language', 'en')
         
-        # If not English, translate
-        if language_code != "en":
-            selected_language = [k for k, v in languages.items() if v == language_code][0]
-            translation_prompt = ChatPromptTemplate.from_messages([
-                ("system", f"You are a translator. Translate the following text from English to {selected_language} maintaining the meaning and simplicity. Return ONLY the translated text without any additional explanations or notes."),
-                ("human", summary)
-            ])
-            translation_chain = translation_prompt | llm
-            translation_response = translation_chain.invoke({})
-            tts_text = translation_response.content if hasattr(translation_response, "content") else translation_response
-        else:
-            tts_text = summary
+        # If not English, translate (usually served from the pre-warmed cache)
+        tts_text = translation_utils.translate(summary, language_code)
         
         # Create a temporary audio file
         audio_bytes, _ = audio_utils.generate_audio(tts_text, language_code)
@@ -537,5 +732,11 @@ def generate_scheme_audio():
         return jsonify({'error': f'Error generating audio: {e}'}), 500
 
 
+@app.route('/prewarm_status')
+def prewarm_status():
+    return jsonify(prewarm.get_status())
+
+
 if __name__ == '__main__':
+    startup.run()
     app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
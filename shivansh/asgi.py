@@ -0,0 +1,407 @@
+"""
+ASGI entry point for the API, for serving many concurrent requests from one process
+
+    uvicorn asgi:app --port 8000
+
+The routes that spend their time waiting on Gemini and gTTS are implemented here as
+async views on top of the async pipeline, so a request that is waiting doesn't hold a
+thread. Every other route is passed through to the Flask app in api.py, so URLs,
+payloads and session cookies are the same as when running api.py directly.
+"""
+import asyncio
+import time
+import uuid
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart, request, jsonify, session, url_for, Response, stream_with_context
+from quart_cors import cors
+from werkzeug.exceptions import HTTPException
+import api
+import audio_utils
+import db_utils
+import eligibility_cache
+import eligibility_matrix
+import llm_gateway
+import metrics
+import prewarm
+import profiling
+import scheme_pipeline
+import startup
+import token_usage
+import tracing
+import translation_utils
+from llm_utils import astream_prompt
+
+async_app = Quart(__name__)
+async_app = cors(async_app, allow_origin="*")
+async_app.secret_key = api.app.secret_key  # Share sessions with the Flask routes
+metrics.init_app(async_app)  # Same metrics (in this process) as the Flask routes
+tracing.init_app(async_app)
+token_usage.init_app(async_app)
+profiling.init_app(async_app)
+
+languages = api.languages
+
+
+@async_app.before_serving
+async def run_startup():
+    startup.run()
+
+
+@async_app.before_request
+async def mark_request_started():
+    # Let the background pre-warm worker yield to interactive requests
+    prewarm.request_started()
+
+
+@async_app.teardown_request
+async def mark_request_finished(exc):
+    prewarm.request_finished()
+
+
+async def read_upload():
+    """Validate an uploaded scheme PDF, returning (file, language_code, error_response)"""
+    files = await request.files
+    form = await request.form
+    if 'scheme_file' not in files:
+        return None, None, (jsonify({'error': 'No file part'}), 400)
+
+    file = files['scheme_file']
+    if file.filename == '':
+        return None, None, (jsonify({'error': 'No selected file'}), 400)
+
+    language_code = form.get('language', 'en')
+    if language_code not in languages.values():
+        return None, None, (jsonify({'error': f'Unsupported language code: {language_code}'}), 400)
+
+    if not file.filename.endswith('.pdf'):
+        return None, None, (jsonify({'error': 'Invalid file type, please upload a PDF'}), 400)
+    return file, language_code, None
+
+
+def sse_response(events):
+    """Stream server-sent events from an async generator"""
+    return Response(
+        events,
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@async_app.route('/upload_scheme', methods=['POST'])
+async def upload_scheme():
+    file, language_code, error = await read_upload()
+    if error:
+        return error
+
+    try:
+        text = await scheme_pipeline.aextract_pdf_text(file)
+        result = await scheme_pipeline.aprocess_scheme(text, language_code)
+
+        # Store in session for /save_scheme
+        api.remember_uploaded_scheme(result, session)
+
+        await asyncio.to_thread(prewarm.enqueue_upload, result)
+
+        return jsonify(api.upload_response(result, url_for))
+
+    except scheme_pipeline.PipelineError as e:
+        return jsonify({'error': e.message}), e.status
+    except token_usage.BudgetExceeded as e:
+        return jsonify({'error': str(e)}), 429
+    except llm_gateway.GatewayUnavailable as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(round(e.retry_after))}
+    except Exception as e:
+        return jsonify({'error': f'Error processing PDF: {e}'}), 500
+
+
+@async_app.route('/upload_scheme/stream', methods=['POST'])
+async def upload_scheme_stream():
+    """Async variant of /upload_scheme/stream in api.py, emitting the same events"""
+    file, language_code, error = await read_upload()
+    if error:
+        return error
+
+    try:
+        text = await scheme_pipeline.aextract_pdf_text(file)
+    except scheme_pipeline.PipelineError as e:
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        return jsonify({'error': f'Error processing PDF: {e}'}), 500
+
+    # SQLite has no async driver, so database calls run in a worker thread
+    job_id = uuid.uuid4().hex
+    await asyncio.to_thread(db_utils.create_upload_job, job_id, language_code)
+
+    @stream_with_context
+    async def generate():
+        completed = ["text_extracted"]
+        yield api.sse_event('stage', {'stage': 'text_extracted', 'job_id': job_id})
+        try:
+            async for kind, name, payload in scheme_pipeline.astream_scheme(text, language_code):
+                if kind == 'token':
+                    yield api.sse_event('token', {'field': name, 'text': payload})
+                elif kind == 'stage':
+                    completed.append(name)
+                    await asyncio.to_thread(db_utils.update_upload_job, job_id, status='running', stage=name, stages=completed)
+                    yield api.sse_event('stage', {'stage': name})
+                else:
+                    await asyncio.to_thread(db_utils.update_upload_job, job_id, status='completed', result=payload)
+                    await asyncio.to_thread(prewarm.enqueue_upload, payload)
+                    yield api.sse_event('result', {**api.upload_response(payload, url_for), 'job_id': job_id})
+        except scheme_pipeline.PipelineError as e:
+            await asyncio.to_thread(db_utils.update_upload_job, job_id, status='failed', error=e.message)
+            yield api.sse_event('error', {'error': e.message})
+        except Exception as e:
+            await asyncio.to_thread(db_utils.update_upload_job, job_id, status='failed', error=f'Error processing PDF: {e}')
+            yield api.sse_event('error', {'error': f'Error processing PDF: {e}'})
+
+    return sse_response(generate())
+
+
+@async_app.route('/view_scheme/<scheme_id>')
+async def view_scheme(scheme_id):
+    scheme = await asyncio.to_thread(db_utils.get_scheme_by_id, scheme_id)
+
+    if not scheme:
+        return jsonify({'error': 'Scheme not found'}), 404
+
+    language_code = session.get('language', 'en')
+    selected_language = [k for k, v in languages.items() if v == language_code][0]
+
+    display_summary, translated_questions = await asyncio.gather(
+        translation_utils.atranslate(scheme['summary'], language_code),
+        translation_utils.atranslate(scheme['eligibility_criteria'], language_code, kind="questions")
+    )
+
+    display_questions = [q.strip() for q in translated_questions.strip().split("\n") if q.strip()]
+
+    return jsonify({
+        'title': scheme['title'],
+        'summary': display_summary,
+        'questions': display_questions,
+        'language': selected_language,
+        'language_code': language_code,
+        'scheme_id': scheme_id
+    })
+
+
+@async_app.route('/generate_audio', methods=['POST'])
+async def generate_audio():
+    data = await request.get_json()
+    if not data or 'summary' not in data:
+        return jsonify({'error': 'No summary provided in the request'}), 400
+
+    summary = data['summary']
+    language_code = data.get('language', 'en')
+
+    if language_code not in languages.values():
+        return jsonify({'error': f'Unsupported language code: {language_code}'}), 400
+
+    try:
+        tts_text = await translation_utils.atranslate(summary, language_code)
+
+        # gTTS has no async client
+        audio_bytes, _ = await asyncio.to_thread(audio_utils.generate_audio, tts_text, language_code)
+        if audio_bytes:
+            audio_bytes.seek(0)
+            return Response(
+                audio_bytes.read(),
+                mimetype='audio/mp3',
+                headers={'Content-Disposition': f'attachment; filename=scheme_summary_{language_code}.mp3'}
+            )
+        else:
+            return jsonify({'error': 'Failed to generate audio'}), 500
+    except Exception as e:
+        return jsonify({'error': f'Error generating audio: {e}'}), 500
+
+
+@async_app.route('/generate_scheme_audio')
+async def generate_scheme_audio():
+    """Async variant of /generate_scheme_audio in api.py"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Please log in to generate audio'}), 401
+
+    scheme_id = request.args.get('scheme_id')
+    if not scheme_id:
+        return jsonify({'error': 'No scheme ID provided'}), 400
+
+    try:
+        scheme = await asyncio.to_thread(db_utils.get_scheme_by_id, scheme_id)
+        if not scheme:
+            return jsonify({'error': 'Scheme not found'}), 404
+
+        language_code = session.get('language', 'en')
+
+        # If not English, translate (usually served from the pre-warmed cache)
+        tts_text = await translation_utils.atranslate(scheme['summary'], language_code)
+
+        # gTTS has no async client
+        audio_bytes, _ = await asyncio.to_thread(audio_utils.generate_audio, tts_text, language_code)
+        if not audio_bytes:
+            return jsonify({'error': 'Failed to generate audio'}), 500
+
+        filename = f"scheme_{scheme_id}_{int(time.time())}.mp3"
+        await asyncio.to_thread(scheme_pipeline.save_audio_file, audio_bytes, filename)
+        return jsonify({'audio_url': url_for('static', filename=f'temp_audio/{filename}')})
+    except Exception as e:
+        return jsonify({'error': f'Error generating audio: {e}'}), 500
+
+
+@async_app.route('/check_eligibility', methods=['POST'])
+async def check_eligibility():
+    data = await request.get_json()
+    error = api.eligibility_request_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    questions = data['questions']
+    responses = data['responses']
+    language_code = data.get('language', 'en')
+
+    try:
+        is_eligible, display_result = await scheme_pipeline.ajudge_eligibility(
+            questions, responses, language_code, data.get('scheme_id'), bool(data.get('explain')))
+
+        return jsonify({
+            'success': True,
+            'is_eligible': is_eligible,
+            'result': display_result
+        })
+    except token_usage.BudgetExceeded as e:
+        return jsonify({'error': str(e)}), 429
+    except llm_gateway.GatewayUnavailable as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(round(e.retry_after))}
+    except Exception as e:
+        return jsonify({'error': f'Error checking eligibility: {str(e)}'}), 500
+
+
+@async_app.route('/check_eligibility/stream', methods=['POST'])
+async def check_eligibility_stream():
+    """Async variant of /check_eligibility/stream in api.py, emitting the same events"""
+    data = await request.get_json()
+    error = api.eligibility_request_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    questions = data['questions']
+    responses = data['responses']
+    language_code = data.get('language', 'en')
+    scheme_id = data.get('scheme_id')
+    explain = bool(data.get('explain'))
+    result_field = 'result' if language_code == 'en' else 'result_original'
+
+    key = eligibility_cache.verdict_key(questions, responses)
+
+    async def generate_from_rules(rules):
+        is_eligible, eligibility_result = await scheme_pipeline.arule_verdict(rules, responses)
+        yield api.sse_event('stage', {'stage': 'verdict_ready', 'is_eligible': is_eligible})
+        if explain:
+            chunks = []
+            async for chunk in scheme_pipeline.astream_explanation(rules, responses, is_eligible):
+                chunks.append(chunk)
+                yield api.sse_event('token', {'field': result_field, 'text': chunk})
+            eligibility_result = "".join(chunks)
+        else:
+            yield api.sse_event('token', {'field': result_field, 'text': eligibility_result})
+
+        display_result = eligibility_result
+        if language_code != 'en':
+            chunks = []
+            async for chunk in translation_utils.astream_translate(eligibility_result, language_code):
+                chunks.append(chunk)
+                yield api.sse_event('token', {'field': 'result', 'text': chunk})
+            display_result = "".join(chunks)
+
+        yield api.sse_event('result', {
+            'success': True,
+            'is_eligible': is_eligible,
+            'result': display_result
+        })
+
+    async def generate():
+        try:
+            rules = scheme_pipeline.applicable_rules(await scheme_pipeline.ascheme_rules(scheme_id), questions, responses) if scheme_id else None
+            if rules is not None:
+                async for event in generate_from_rules(rules):
+                    yield event
+                return
+
+            verdict = await asyncio.to_thread(eligibility_cache.get, key)
+            if verdict is None:
+                chunks = []
+                async for chunk in astream_prompt(scheme_pipeline.ELIGIBILITY_CHECK_PROMPT,
+                                                  {"responses": scheme_pipeline.format_responses(questions, responses)},
+                                                  name="eligibility"):
+                    chunks.append(chunk)
+                    yield api.sse_event('token', {'field': result_field, 'text': chunk})
+                eligibility_result = "".join(chunks)
+                verdict = await asyncio.to_thread(eligibility_cache.put, key, scheme_pipeline.is_eligible_result(eligibility_result), eligibility_result)
+            else:
+                yield api.sse_event('token', {'field': result_field, 'text': verdict['result']})
+
+            is_eligible = verdict['is_eligible']
+            yield api.sse_event('stage', {'stage': 'verdict_ready', 'is_eligible': is_eligible})
+
+            display_result = scheme_pipeline.cached_verdict_text(verdict, language_code)
+            if display_result is not None:
+                if language_code != 'en':
+                    yield api.sse_event('token', {'field': 'result', 'text': display_result})
+            else:
+                chunks = []
+                async for chunk in translation_utils.astream_translate(verdict['result'], language_code):
+                    chunks.append(chunk)
+                    yield api.sse_event('token', {'field': 'result', 'text': chunk})
+                display_result = "".join(chunks)
+                await asyncio.to_thread(scheme_pipeline.save_verdict_translation, key, verdict, language_code, display_result)
+
+            yield api.sse_event('result', {
+                'success': True,
+                'is_eligible': is_eligible,
+                'result': display_result
+            })
+        except Exception as e:
+            yield api.sse_event('error', {'error': f'Error checking eligibility: {str(e)}'})
+
+    return sse_response(generate())
+
+
+@async_app.route('/eligibility_matrix', methods=['POST'])
+async def check_eligibility_matrix():
+    """Async variant of /eligibility_matrix in api.py; its grouped LLM calls run concurrently"""
+    data = await request.get_json()
+    error = api.matrix_request_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    language_code = data.get('language', 'en')
+    try:
+        report = await eligibility_matrix.aassess(data.get('answers'), data.get('profile'))
+        report['questions'] = await eligibility_matrix.atranslate_questions(report['questions'], language_code)
+        return jsonify({'success': True, **report})
+    except token_usage.BudgetExceeded as e:
+        return jsonify({'error': str(e)}), 429
+    except llm_gateway.GatewayUnavailable as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(round(e.retry_after))}
+    except Exception as e:
+        return jsonify({'error': f'Error checking eligibility: {str(e)}'}), 500
+
+
+# Everything not routed above is served by the Flask app (in a worker thread)
+flask_app = WsgiToAsgi(api.app)
+async_routes = async_app.url_map.bind("localhost")
+
+
+def is_async_route(scope):
+    """Check whether a request is handled by one of the async views"""
+    try:
+        async_routes.match(scope["path"], method=scope["method"])
+        return True
+    except HTTPException:
+        return False
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "http" and not is_async_route(scope):
+        await flask_app(scope, receive, send)
+    else:
+        await async_app(scope, receive, send)
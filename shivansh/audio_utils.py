@@ -1,30 +1,53 @@
 import os
 import hashlib
-from gtts import gTTS
-from gtts.lang import tts_langs
 import io
 from pathlib import Path
 from dotenv import load_dotenv
 import re
 import shutil
-import streamlit as st
+import metrics
+import singleflight
+import tracing
 
 load_dotenv()
 
-# Set up audio cache directory
+# Audio cache directory (created on first write, cleaned up by startup.run())
 AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "./audio_cache")
-os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
 
-# Get a dictionary of supported languages by gTTS
-SUPPORTED_LANGUAGES = tts_langs()
+# Dictionary of languages supported by gTTS, loaded on first use
+_supported_languages = None
 
 def get_supported_languages():
     """Return a dictionary of supported languages by gTTS"""
-    return SUPPORTED_LANGUAGES
+    global _supported_languages
+    if _supported_languages is None:
+        from gtts.lang import tts_langs
+        _supported_languages = tts_langs()
+    return _supported_languages
+
+def get_tts_class():
+    """Return gTTS, or the silent stand-in when FAKE_PROVIDERS includes tts (see fakes.py), recorded or replayed with CASSETTE_MODE (see cassettes.py)"""
+    cassette_mode = None
+    if os.getenv("CASSETTE_MODE"):
+        import cassettes
+        cassette_mode = cassettes.mode("tts")
+        if cassette_mode == "replay":
+            return cassettes.tts_class()
+    tts_class = None
+    if os.getenv("FAKE_PROVIDERS"):
+        import fakes
+        if fakes.enabled("tts"):
+            tts_class = fakes.SilentTTS
+    if tts_class is None:
+        from gtts import gTTS
+        tts_class = gTTS
+    if cassette_mode == "record":
+        return cassettes.tts_class(tts_class)
+    return tts_class
 
 def is_language_supported(lang_code):
     """Check if a language is supported by gTTS"""
-    return lang_code in SUPPORTED_LANGUAGES
+    return lang_code in get_supported_languages()
 
 def clear_audio_cache(force=True):
     """Clear all audio files from the cache directory
@@ -41,11 +64,6 @@ def clear_audio_cache(force=True):
             os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
             return True
             
-        # Clear the session states that might be holding references to these files
-        for key in list(st.session_state.keys()):
-            if key.startswith('audio_data_'):
-                del st.session_state[key]
-                
         # Delete each file
         deleted_count = 0
         for file in cache_dir.glob("*.mp3"):
@@ -128,6 +146,39 @@ def get_audio_hash(text, lang_code):
     content = f"{text}_{lang_code}".encode('utf-8')
     return hashlib.md5(content).hexdigest()
 
+def get_audio_cache_path(text, lang_code):
+    """Return the cache path the audio for this text and language is stored under"""
+    text_hash = get_audio_hash(clean_text_for_audio(text), lang_code)
+    return os.path.join(AUDIO_CACHE_DIR, f"{text_hash}.mp3")
+
+def is_audio_cached(text, lang_code):
+    """Check if audio for this text and language has already been generated"""
+    if not text:
+        return False
+    return os.path.exists(get_audio_cache_path(text, lang_code))
+
+def write_cache_file(cache_path, data):
+    """
+    Write a cache file atomically, so other worker processes never read a partial file
+    
+    Args:
+        cache_path (str): Final path of the cache file
+        data (bytes): File contents
+    """
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, cache_path)
+
+def read_cache_file(cache_path):
+    """Return a cache file's contents, or None if it doesn't exist (yet)"""
+    try:
+        with open(cache_path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
 def generate_audio(text, lang_code="en", use_cache=True):
     """
     Generate audio from text using gTTS
@@ -158,25 +209,30 @@ def generate_audio(text, lang_code="en", use_cache=True):
     cache_path = os.path.join(AUDIO_CACHE_DIR, f"{text_hash}.mp3")
     
     # Check if cached version exists
-    if use_cache and os.path.exists(cache_path):
+    cached = use_cache and os.path.exists(cache_path)
+    if use_cache:
+        metrics.record_cache_lookup("audio", cached)
+    if cached:
         with open(cache_path, 'rb') as f:
             audio_data = f.read()
         return io.BytesIO(audio_data), cache_path
     
     # Generate new audio
-    try:
-        tts = gTTS(text=cleaned_text, lang=lang_code, slow=False)
-        
-        # Save to BytesIO for streaming
-        audio_bytes = io.BytesIO()
-        tts.write_to_fp(audio_bytes)
-        audio_bytes.seek(0)
+    def synthesize():
+        with tracing.span("gtts synthesize", kind=tracing.SPAN_KIND_CLIENT, language=lang_code, characters=len(cleaned_text)):
+            tts = get_tts_class()(text=cleaned_text, lang=lang_code, slow=False)
+            audio_bytes = io.BytesIO()
+            tts.write_to_fp(audio_bytes)
         
         # Cache the audio if caching is enabled
         if use_cache:
-            tts.save(cache_path)
-        
-        return audio_bytes, cache_path
+            write_cache_file(cache_path, audio_bytes.getvalue())
+        return audio_bytes.getvalue()
+    
+    try:
+        # Concurrent requests for the same audio wait for one gTTS job, and each gets its own stream
+        audio_data, _ = singleflight.do("tts", text_hash, synthesize, (lambda: read_cache_file(cache_path)) if use_cache else None)
+        return io.BytesIO(audio_data), cache_path
     except Exception as e:
         print(f"Error generating audio: {e}")
         return None, None
@@ -197,6 +253,3 @@ def clean_cache(max_age_days=7):
                 print(f"Removed old cache file: {cache_file}")
             except Exception as e:
                 print(f"Error removing cache file {cache_file}: {e}")
-                
-# Run cache cleanup on import (once per app startup)
-clean_cache() 
\ No newline at end of file
@@ -0,0 +1,386 @@
+"""
+End-to-end benchmarks for the API routes, driven through the Flask test client
+
+    python benchmark.py                                    # every scenario
+    python benchmark.py upload eligibility --clients 8 --requests 40
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json --tolerance 0.15
+
+Runs against the offline stand-ins in fakes.py (FAKE_PROVIDERS=all) unless --live, with the
+database, audio cache and exported traces in a temporary directory. For each scenario it
+reports p50/p95/p99 latency and throughput with --clients concurrent clients, the process's
+peak RSS so far, and (from a separate single-client pass under tracemalloc) the peak bytes
+allocated and the memory blocks retained per request.
+
+Scenario inputs repeat by default, so the translation and audio caches are warm after the
+first request; --unique makes every request's input different to measure the cold path.
+With --baseline the exit status is 1 if p95 latency, throughput, peak RSS or allocations
+regress by more than --tolerance, so it can run in CI.
+"""
+import argparse
+import gc
+import io
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = ["upload", "view", "translate", "eligibility", "audio"]
+
+BENCHMARK_LANGUAGE = "hi"
+BENCHMARK_QUESTIONS = [
+    "Are you a farmer who owns or cultivates agricultural land?",
+    "Is your total land holding 2 hectares or less?",
+    "Do you have an Aadhaar card?",
+    "Do you have a bank account linked to your Aadhaar?",
+    "Are you an Indian citizen?"
+]
+
+# Metric -> True if a higher value is a regression
+COMPARED_METRICS = {"p95_ms": True, "throughput_rps": False, "peak_rss_mib": True, "alloc_peak_kib": True}
+
+
+def make_pdf(text):
+    """
+    Build a minimal single-font PDF of the text (ASCII only), one line per text line
+
+    Args:
+        text (str): Text to lay out, about 60 lines fit on a page
+
+    Returns:
+        bytes: The PDF document
+    """
+    lines = [line.encode("ascii", "replace").decode("ascii") for line in text.splitlines()]
+    pages = [lines[i:i + 60] for i in range(0, len(lines), 60)] or [[""]]
+
+    objects = []
+    page_ids = []
+    font_id = 3
+    objects.append(None)  # 1: catalog, filled in below
+    objects.append(None)  # 2: page tree
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for page in pages:
+        escaped = [line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in page]
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({line}) '" for line in escaped) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode("ascii"))
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {content_id} 0 R "
+                       f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>".encode("ascii"))
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>".encode("ascii")
+
+    pdf = io.BytesIO()
+    pdf.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(pdf.tell())
+        pdf.write(f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n")
+    xref = pdf.tell()
+    pdf.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("ascii"))
+    for offset in offsets:
+        pdf.write(f"{offset:010d} 00000 n \n".encode("ascii"))
+    pdf.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii"))
+    return pdf.getvalue()
+
+
+def setup(db_utils):
+    """
+    Create the user, stored scheme and upload document the scenarios use
+
+    Returns:
+        dict: Scenario context (user_id, scheme_id, summary, document_text, pdf)
+    """
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "example_scheme.txt"), encoding="utf-8") as f:
+        document_text = f.read()
+    summary = document_text[:1500]
+    db_utils.init_db()
+    user_id = db_utils.get_or_create_user("Benchmark Farmer", "9000000000", BENCHMARK_LANGUAGE)
+    scheme_id = db_utils.save_scheme(
+        title="Benchmark Scheme",
+        description="Benchmark scheme",
+        eligibility_criteria="\n".join(BENCHMARK_QUESTIONS),
+        summary=summary,
+        document_text=document_text
+    )
+    return {
+        "user_id": user_id,
+        "scheme_id": scheme_id,
+        "summary": summary,
+        "document_text": document_text,
+        "pdf": make_pdf(document_text)
+    }
+
+
+def new_client(app, ctx):
+    """A test client logged in as the benchmark user, reading BENCHMARK_LANGUAGE"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = ctx["user_id"]
+        session['language'] = BENCHMARK_LANGUAGE
+    return client
+
+
+def run_scenario(name, client, ctx, i, unique):
+    """
+    Make one request of a scenario
+
+    Args:
+        name (str): Scenario name (see SCENARIOS)
+        client: Flask test client
+        ctx (dict): Context from setup()
+        i (int): Request number, used to vary the input when unique is set
+        unique (bool): Whether to make the input unique to this request (defeats caches)
+
+    Returns:
+        Response: The test client response, with its body read
+    """
+    suffix = f" (request {i})" if unique else ""
+    if name == "upload":
+        pdf = make_pdf(ctx["document_text"] + suffix) if unique else ctx["pdf"]
+        response = client.post('/upload_scheme', data={
+            'language': BENCHMARK_LANGUAGE,
+            'scheme_file': (io.BytesIO(pdf), 'scheme.pdf')
+        }, content_type='multipart/form-data')
+    elif name == "view":
+        response = client.get(f'/view_scheme/{ctx["scheme_id"]}')
+    elif name == "translate":
+        response = client.get('/translate_scheme_summary', query_string={'scheme_id': ctx["scheme_id"]})
+    elif name == "eligibility":
+        questions = [q + suffix for q in BENCHMARK_QUESTIONS]
+        # Unique requests also vary the answers, so eligibility verdicts differ
+        responses = ["No" if unique and (i >> n) & 1 else "Yes" for n in range(len(questions))]
+        response = client.post('/check_eligibility', json={
+            'questions': questions, 'responses': responses, 'language': BENCHMARK_LANGUAGE
+        })
+    elif name == "audio":
+        response = client.post('/generate_audio', json={'summary': ctx["summary"][:600] + suffix, 'language': BENCHMARK_LANGUAGE})
+    else:
+        raise ValueError(f"Unknown scenario: {name}")
+    response.get_data()
+    response.close()
+    return response
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def peak_rss_mib():
+    """Peak resident set size of this process so far, in MiB (None where unavailable)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def measure_load(app, name, ctx, clients, requests_per_client, unique, offset):
+    """
+    Run a scenario from concurrent clients
+
+    Returns:
+        dict: Request and error counts, latency percentiles (ms) and throughput
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+
+    def worker(n):
+        client = new_client(app, ctx)
+        barrier.wait()
+        for j in range(requests_per_client):
+            i = offset + n * requests_per_client + j
+            start = time.perf_counter()
+            try:
+                status = run_scenario(name, client, ctx, i, unique).status_code
+            except Exception as e:
+                status = f"{type(e).__name__}: {e}"
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if status != 200:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    if errors:
+        print(f"  {name}: {len(errors)} failed requests, e.g. {errors[0]}")
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None
+    }
+
+
+def measure_allocations(app, name, ctx, count, unique, offset):
+    """
+    Trace allocations of a scenario's requests, one at a time
+
+    Returns:
+        dict: Median peak KiB allocated during a request, and memory blocks retained per request
+    """
+    client = new_client(app, ctx)
+    peaks = []
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        for n in range(count):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            run_scenario(name, client, ctx, offset + n, unique)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    gc.collect()
+    return {
+        "alloc_peak_kib": round(percentile(peaks, 50) / 1024, 1),
+        "retained_blocks_per_request": round((sys.getallocatedblocks() - blocks_before) / count, 1)
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline
+
+    Returns:
+        list: (scenario, metric, baseline value, current value, change, regressed) for each compared metric
+    """
+    rows = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for metric, higher_is_worse in COMPARED_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change > tolerance if higher_is_worse else change < -tolerance
+            rows.append((name, metric, old, new, change, regressed))
+    return rows
+
+
+def print_results(results):
+    header = ["scenario", "requests", "errors", "p50_ms", "p95_ms", "p99_ms", "throughput_rps", "peak_rss_mib", "alloc_peak_kib", "retained_blocks_per_request"]
+    table = [[name, *(str(stats.get(column, "")) for column in header[1:])] for name, stats in results["scenarios"].items()]
+    widths = [max(len(header[i]), *(len(row[i]) for row in table)) for i in range(len(header))]
+    print("  ".join(h.ljust(w) for h, w in zip(header, widths)).rstrip())
+    for row in table:
+        print("  ".join(c.ljust(w) for c, w in zip(row, widths)).rstrip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API routes through the Flask test client")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per client")
+    parser.add_argument("--warmup", type=int, default=2, help="Requests per scenario before measuring")
+    parser.add_argument("--alloc-requests", type=int, default=5, help="Requests per scenario traced for allocations (0 to skip)")
+    parser.add_argument("--unique", action="store_true", help="Make every request's input unique, so caches miss")
+    parser.add_argument("--live", action="store_true", help="Call the real Gemini and gTTS instead of fakes.py")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file as the new baseline")
+    parser.add_argument("--baseline", help="Compare with this baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression against the baseline")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+    scenarios = args.scenarios or SCENARIOS
+
+    # Configure the app before importing it: fakes, and a throwaway database and caches
+    workdir = tempfile.mkdtemp(prefix="farmwise-benchmark-")
+    if not args.live:
+        os.environ.setdefault("FAKE_PROVIDERS", "all")
+    os.environ.setdefault("PREWARM_ENABLED", "false")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ["AUDIO_CACHE_DIR"] = os.path.join(workdir, "audio_cache")
+    os.environ["TRACE_EXPORT_PATH"] = os.path.join(workdir, "traces", "traces.jsonl")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)  # Uploaded scheme audio is written under ./static
+
+    import db_utils
+    db_utils.DB_PATH = os.path.join(workdir, "farmwise.db")
+    from api import app
+
+    ctx = setup(db_utils)
+    print(f"Benchmarking {', '.join(scenarios)} with {args.clients} clients x {args.requests} requests "
+          f"({'live providers' if args.live else 'FAKE_PROVIDERS=' + os.environ['FAKE_PROVIDERS']}, working directory {workdir})")
+
+    results = {
+        "meta": {
+            "service": "api",
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "clients": args.clients,
+            "requests_per_client": args.requests,
+            "unique": args.unique,
+            "fake_providers": os.getenv("FAKE_PROVIDERS", "")
+        },
+        "scenarios": {}
+    }
+    offset = 0
+    for name in scenarios:
+        warmup_client = new_client(app, ctx)
+        for i in range(args.warmup):
+            run_scenario(name, warmup_client, ctx, offset + i, args.unique)
+        offset += args.warmup
+        stats = measure_load(app, name, ctx, args.clients, args.requests, args.unique, offset)
+        offset += args.clients * args.requests
+        stats["peak_rss_mib"] = peak_rss_mib()
+        if args.alloc_requests:
+            stats.update(measure_allocations(app, name, ctx, args.alloc_requests, args.unique, offset))
+            offset += args.alloc_requests
+        results["scenarios"][name] = stats
+
+    print()
+    print_results(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            print(f"\nResults written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.tolerance)
+        print(f"\nCompared with {args.baseline} ({baseline.get('meta', {}).get('date', 'unknown date')}), tolerance {args.tolerance:.0%}:")
+        for name, metric, old, new, change, regressed in rows:
+            print(f"  {name:<12} {metric:<15} {old:>10} -> {new:<10} {change:+.1%}{'  REGRESSION' if regressed else ''}")
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Record the API's Gemini and gTTS calls into cassette files and replay them offline with their
+original latencies
+
+    CASSETTE_MODE=record python api.py          # serve real traffic, recording every call
+    CASSETTE_MODE=replay python benchmark.py    # the same calls, no network, same latencies
+    CASSETTE_MODE=replay CASSETTE_LATENCY_SCALE=0.5 CASSETTE_MATCH=sequence python benchmark.py --unique
+    python cassettes.py                         # what's recorded, with latency percentiles
+
+CASSETTE_PROVIDERS selects llm (Gemini chat calls) and tts (gTTS audio), default all, and
+recordings go to fixtures/cassettes (CASSETTE_DIR). llm_utils.get_llm() and
+audio_utils.get_tts_class() use these when CASSETTE_MODE is set.
+
+The implementation is farmwise_common.cassettes; this module sets where the API's cassettes are.
+"""
+import os
+from farmwise_common import cassettes as _cassettes
+from farmwise_common.cassettes import CassetteError, CassetteMiss, main, mode, summary, tts_class, wrap_llm
+
+_cassettes.configure(os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "cassettes"))
+
+
+if __name__ == "__main__":
+    main()
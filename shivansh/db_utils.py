@@ -1,15 +1,25 @@
 import sqlite3
 import os
 import json
+import hashlib
+import threading
+import time
+import metrics
 from datetime import datetime
 
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'farmwise.db')
 
+_init_lock = threading.Lock()
+_initialized = False
+
 def init_db():
     """Initialize the database with required tables"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, factory=metrics.TimedConnection)
     cursor = conn.cursor()
     
+    # WAL lets several worker processes read while one writes
+    cursor.execute('PRAGMA journal_mode=WAL')
+    
     # Create users table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS users (
@@ -30,10 +40,21 @@ def init_db():
         eligibility_criteria TEXT,
         summary TEXT NOT NULL,
         document_text TEXT,
+        eligibility_rules TEXT,
+        criteria TEXT,
         added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     ''')
     
+    # Add the compiled eligibility rule set (see eligibility_rules.py) and the criteria from the
+    # structured extraction to databases created before them
+    cursor.execute("PRAGMA table_info(schemes)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'eligibility_rules' not in columns:
+        cursor.execute("ALTER TABLE schemes ADD COLUMN eligibility_rules TEXT")
+    if 'criteria' not in columns:
+        cursor.execute("ALTER TABLE schemes ADD COLUMN criteria TEXT")
+    
     # Create user_schemes table for saved schemes
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS user_schemes (
@@ -48,12 +69,62 @@ def init_db():
     )
     ''')
     
+    # Create translations table used as a translation cache
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS translations (
+        source_hash TEXT NOT NULL,
+        language TEXT NOT NULL,
+        kind TEXT NOT NULL DEFAULT 'text',
+        translated_text TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (source_hash, language, kind)
+    )
+    ''')
+    
+    # Create upload_jobs table to track asynchronous scheme uploads
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS upload_jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL DEFAULT 'queued',
+        stage TEXT,
+        stages TEXT,
+        language TEXT,
+        result TEXT,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    # Create eligibility_verdicts table caching verdicts per question set and answers (see eligibility_cache.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS eligibility_verdicts (
+        question_hash TEXT NOT NULL,
+        response_mask INTEGER NOT NULL,
+        is_eligible BOOLEAN NOT NULL,
+        result TEXT NOT NULL,
+        translations TEXT NOT NULL DEFAULT '{}',
+        created_at REAL NOT NULL,
+        PRIMARY KEY (question_hash, response_mask)
+    )
+    ''')
+    
     conn.commit()
     conn.close()
 
+def get_connection():
+    """Open a database connection, creating the tables on first use"""
+    global _initialized
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                init_db()
+                _initialized = True
+    return sqlite3.connect(DB_PATH, factory=metrics.TimedConnection)
+
 def get_or_create_user(name, phone, language='en'):
     """Get existing user or create a new one"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     # Check if user exists
@@ -76,9 +147,9 @@ def get_or_create_user(name, phone, language='en'):
     conn.close()
     return user_id
 
-def save_scheme(title, description, eligibility_criteria, summary, document_text):
-    """Save a scheme to the database"""
-    conn = sqlite3.connect(DB_PATH)
+def save_scheme(title, description, eligibility_criteria, summary, document_text, criteria=None):
+    """Save a scheme to the database, with the eligibility criteria listed by the structured extraction if any"""
+    conn = get_connection()
     cursor = conn.cursor()
     
     # Check if scheme already exists by title
@@ -87,16 +158,19 @@ def save_scheme(title, description, eligibility_criteria, summary, document_text
     
     if scheme:
         scheme_id = scheme[0]
-        # Update scheme
+        # Update scheme, dropping its compiled eligibility rules if the questions changed
         cursor.execute(
-            "UPDATE schemes SET description = ?, eligibility_criteria = ?, summary = ?, document_text = ? WHERE id = ?",
-            (description, json.dumps(eligibility_criteria), summary, document_text, scheme_id)
+            """UPDATE schemes SET description = ?, eligibility_criteria = ?, summary = ?, document_text = ?, criteria = ?,
+                   eligibility_rules = CASE WHEN eligibility_criteria = ? THEN eligibility_rules END
+               WHERE id = ?""",
+            (description, json.dumps(eligibility_criteria), summary, document_text, json.dumps(criteria or []),
+             json.dumps(eligibility_criteria), scheme_id)
         )
     else:
         # Create new scheme
         cursor.execute(
-            "INSERT INTO schemes (title, description, eligibility_criteria, summary, document_text) VALUES (?, ?, ?, ?, ?)",
-            (title, description, json.dumps(eligibility_criteria), summary, document_text)
+            "INSERT INTO schemes (title, description, eligibility_criteria, summary, document_text, criteria) VALUES (?, ?, ?, ?, ?, ?)",
+            (title, description, json.dumps(eligibility_criteria), summary, document_text, json.dumps(criteria or []))
         )
         scheme_id = cursor.lastrowid
     
@@ -106,7 +180,7 @@ def save_scheme(title, description, eligibility_criteria, summary, document_text
 
 def save_user_scheme(user_id, scheme_id, is_eligible, eligibility_details):
     """Save a scheme for a user with eligibility information"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     # Check if user has already saved this scheme
@@ -134,7 +208,7 @@ def save_user_scheme(user_id, scheme_id, is_eligible, eligibility_details):
 
 def get_user_schemes(user_id):
     """Get all schemes saved by a user"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     conn.row_factory = sqlite3.Row  # Return rows as dictionaries
     cursor = conn.cursor()
     
@@ -158,7 +232,7 @@ def get_user_schemes(user_id):
 
 def get_scheme_by_id(scheme_id):
     """Get a scheme by its ID"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -166,7 +240,219 @@ def get_scheme_by_id(scheme_id):
     scheme = cursor.fetchone()
     
     conn.close()
-    return dict(scheme) if scheme else None
+    if not scheme:
+        return None
+    
+    scheme = dict(scheme)
+    scheme['eligibility_criteria'] = decode_eligibility_criteria(scheme['eligibility_criteria'])
+    scheme['criteria'] = json.loads(scheme['criteria']) if scheme['criteria'] else []
+    return scheme
+
+def get_all_schemes():
+    """Get the eligibility questions and compiled rules of every scheme, for eligibility_matrix"""
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT id, title, eligibility_criteria, eligibility_rules FROM schemes ORDER BY id")
+    schemes = [dict(row) for row in cursor.fetchall()]
+    
+    conn.close()
+    for scheme in schemes:
+        scheme['eligibility_criteria'] = decode_eligibility_criteria(scheme['eligibility_criteria'])
+    return schemes
+
+def decode_eligibility_criteria(eligibility_criteria):
+    """Decode eligibility criteria stored as a JSON string by save_scheme"""
+    if not eligibility_criteria:
+        return eligibility_criteria
+    try:
+        decoded = json.loads(eligibility_criteria)
+    except (TypeError, ValueError):
+        return eligibility_criteria
+    return decoded if isinstance(decoded, str) else eligibility_criteria
+
+def save_scheme_rules(scheme_id, eligibility_rules):
+    """Save the compiled eligibility rule set of a scheme (a JSON string, see eligibility_rules.py)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("UPDATE schemes SET eligibility_rules = ? WHERE id = ?", (eligibility_rules, scheme_id))
+    
+    conn.commit()
+    conn.close()
+
+def get_user_language(user_id):
+    """Get the preferred language of a user"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT language FROM users WHERE id = ?", (user_id,))
+    user = cursor.fetchone()
+    
+    conn.close()
+    return user[0] if user else None
+
+def get_scheme_languages(scheme_id):
+    """Get the preferred languages of all users who saved a scheme"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        SELECT DISTINCT u.language
+        FROM user_schemes us
+        JOIN users u ON us.user_id = u.id
+        WHERE us.scheme_id = ? AND u.language IS NOT NULL
+    """, (scheme_id,))
+    
+    languages = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return languages
+
+def get_popular_languages(limit=3):
+    """Get the most used non-English user languages, most popular first"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        SELECT language, COUNT(*) AS user_count
+        FROM users
+        WHERE language IS NOT NULL AND language != 'en'
+        GROUP BY language
+        ORDER BY user_count DESC
+        LIMIT ?
+    """, (limit,))
+    
+    languages = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return languages
+
+def hash_text(text):
+    """Hash source text for use as a cache key"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def get_translation(source_text, language, kind='text'):
+    """Get a cached translation, or None if the text was never translated"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        "SELECT translated_text FROM translations WHERE source_hash = ? AND language = ? AND kind = ?",
+        (hash_text(source_text), language, kind)
+    )
+    translation = cursor.fetchone()
+    
+    conn.close()
+    return translation[0] if translation else None
+
+def save_translation(source_text, language, translated_text, kind='text'):
+    """Save a translation to the translation cache"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        "INSERT OR REPLACE INTO translations (source_hash, language, kind, translated_text) VALUES (?, ?, ?, ?)",
+        (hash_text(source_text), language, kind, translated_text)
+    )
+    
+    conn.commit()
+    conn.close()
+
+def create_upload_job(job_id, language):
+    """Create a queued upload job"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        "INSERT INTO upload_jobs (id, status, language, stages) VALUES (?, 'queued', ?, '[]')",
+        (job_id, language)
+    )
+    
+    conn.commit()
+    conn.close()
+
+def update_upload_job(job_id, status=None, stage=None, stages=None, result=None, error=None):
+    """Update the progress of an upload job, leaving unspecified fields unchanged"""
+    updates = {'updated_at': datetime.now()}
+    if status is not None:
+        updates['status'] = status
+    if stage is not None:
+        updates['stage'] = stage
+    if stages is not None:
+        updates['stages'] = json.dumps(stages)
+    if result is not None:
+        updates['result'] = json.dumps(result)
+    if error is not None:
+        updates['error'] = error
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    assignments = ", ".join(f"{column} = ?" for column in updates)
+    cursor.execute(
+        f"UPDATE upload_jobs SET {assignments} WHERE id = ?",
+        (*updates.values(), job_id)
+    )
+    
+    conn.commit()
+    conn.close()
+
+def get_upload_job(job_id):
+    """Get an upload job by its ID"""
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT * FROM upload_jobs WHERE id = ?", (job_id,))
+    job = cursor.fetchone()
+    
+    conn.close()
+    if not job:
+        return None
+    
+    job = dict(job)
+    job['stages'] = json.loads(job['stages']) if job['stages'] else []
+    job['result'] = json.loads(job['result']) if job['result'] else {}
+    return job
+
+def get_eligibility_verdict(question_hash, response_mask, max_age):
+    """Get a cached eligibility verdict with its translations, or None if there is none newer than max_age seconds"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        "SELECT is_eligible, result, translations FROM eligibility_verdicts WHERE question_hash = ? AND response_mask = ? AND created_at >= ?",
+        (question_hash, response_mask, time.time() - max_age)
+    )
+    verdict = cursor.fetchone()
+    
+    conn.close()
+    if not verdict:
+        return None
+    return {'is_eligible': bool(verdict[0]), 'result': verdict[1], 'translations': json.loads(verdict[2])}
+
+def save_eligibility_verdict(question_hash, response_mask, is_eligible, result):
+    """Save an eligibility verdict, dropping the translations of any verdict it replaces"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        "INSERT OR REPLACE INTO eligibility_verdicts (question_hash, response_mask, is_eligible, result, created_at) VALUES (?, ?, ?, ?, ?)",
+        (question_hash, response_mask, is_eligible, result, time.time())
+    )
+    
+    conn.commit()
+    conn.close()
 
-# Initialize database when module is imported
-init_db() 
\ No newline at end of file
+def save_eligibility_translation(question_hash, response_mask, language, translated_text):
+    """Add the translation of a cached eligibility verdict"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        "UPDATE eligibility_verdicts SET translations = json_set(translations, ?, ?) WHERE question_hash = ? AND response_mask = ?",
+        (f'$."{language}"', translated_text, question_hash, response_mask)
+    )
+    
+    conn.commit()
+    conn.close()
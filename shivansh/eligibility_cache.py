@@ -0,0 +1,92 @@
+"""
+Cache of eligibility verdicts, kept in the eligibility_verdicts table of the SQLite database
+
+A scheme's eligibility questions are fixed and every answer is Yes or No, so a scheme with 7
+questions has at most 2^7 distinct submissions. A verdict is keyed by a hash of the normalised
+question set plus a bitmask of the answers, and stored with the translations of its
+explanation, so a repeated combination skips both the eligibility and the translation call.
+
+Questions are normalised (case, whitespace, numbering and trailing punctuation) and sorted
+before hashing, so the same set sent in another order, or re-generated with cosmetic changes,
+still hits; the bitmask follows the sorted order.
+
+- ELIGIBILITY_CACHE_ENABLED: reuse verdicts (default true)
+- ELIGIBILITY_CACHE_TTL_S: how long a verdict is reused, in seconds (default 30 days)
+
+Lookups are counted in the cache_lookups_total metric as cache="eligibility".
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import db_utils
+import metrics
+
+ELIGIBILITY_CACHE_ENABLED = os.getenv("ELIGIBILITY_CACHE_ENABLED", "true").lower() == "true"
+ELIGIBILITY_CACHE_TTL_S = int(os.getenv("ELIGIBILITY_CACHE_TTL_S", str(30 * 86400)))
+
+_NUMBERING = re.compile(r"^\s*(?:q?\d+[.):]|[-*•])\s*", re.IGNORECASE)
+
+
+def normalize_question(question):
+    """Lower-case a question and strip numbering, bullets, extra whitespace and trailing punctuation"""
+    question = _NUMBERING.sub("", question)
+    return " ".join(question.lower().split()).rstrip(" ?.!")
+
+
+def verdict_key(questions, responses):
+    """
+    Key a submission by its question set and answers
+
+    Args:
+        questions (list): Eligibility questions
+        responses (list): "Yes" or "No" for each question
+
+    Returns:
+        tuple: (hex SHA-256 of the sorted normalised questions, bitmask with bit i set when
+        the i-th sorted question was answered Yes)
+    """
+    pairs = sorted(zip((normalize_question(q) for q in questions), responses))
+    question_hash = hashlib.sha256(json.dumps([q for q, _ in pairs]).encode("utf-8")).hexdigest()
+    mask = sum(1 << i for i, (_, response) in enumerate(pairs) if response == "Yes")
+    return question_hash, mask
+
+
+def get(key):
+    """
+    Return the cached verdict for a key
+
+    Returns:
+        dict: is_eligible, result (the English verdict) and translations ({language code: text}),
+        or None if there is none newer than ELIGIBILITY_CACHE_TTL_S
+    """
+    if not ELIGIBILITY_CACHE_ENABLED:
+        return None
+    try:
+        verdict = db_utils.get_eligibility_verdict(key[0], key[1], ELIGIBILITY_CACHE_TTL_S)
+    except sqlite3.Error as e:
+        print(f"Eligibility cache read failed: {e}")
+        return None
+    metrics.record_cache_lookup("eligibility", verdict is not None)
+    return verdict
+
+
+def put(key, is_eligible, result):
+    """Cache a verdict, returning it in the form get() does"""
+    if ELIGIBILITY_CACHE_ENABLED:
+        try:
+            db_utils.save_eligibility_verdict(key[0], key[1], is_eligible, result)
+        except sqlite3.Error as e:
+            print(f"Eligibility cache write failed: {e}")
+    return {"is_eligible": is_eligible, "result": result, "translations": {}}
+
+
+def put_translation(key, language_code, text):
+    """Store the translation of a cached verdict"""
+    if not ELIGIBILITY_CACHE_ENABLED:
+        return
+    try:
+        db_utils.save_eligibility_translation(key[0], key[1], language_code, text)
+    except sqlite3.Error as e:
+        print(f"Eligibility cache write failed: {e}")
@@ -0,0 +1,335 @@
+"""
+Eligibility of one farmer for every stored scheme, in one request
+
+Schemes share many questions ("Do you own agricultural land?", "Do you have a bank account?"),
+so the questions of all schemes are deduplicated by their normalised text (see
+eligibility_cache.normalize_question) and the farmer answers each one once, or the LLM answers
+them from the farmer's profile. Schemes with a compiled rule set (see eligibility_rules.py)
+are then judged together: their clauses are rows of a clause x question matrix, so every
+scheme is evaluated in a few numpy operations. Schemes without usable rules are judged by the
+LLM, ELIGIBILITY_MATRIX_GROUP_SIZE schemes per call.
+
+- ELIGIBILITY_MATRIX_GROUP_SIZE: schemes per grouped LLM judgement, and questions per LLM call
+  answering them from a profile (default 10)
+
+Served by /eligibility_matrix/questions and /eligibility_matrix in api.py (and asgi.py).
+"""
+import asyncio
+import hashlib
+import os
+import numpy as np
+from langchain_core.prompts import ChatPromptTemplate
+import db_utils
+import eligibility_rules
+import scheme_pipeline
+import tracing
+import translation_utils
+from eligibility_cache import normalize_question
+from llm_utils import json_object, invoke_prompt, ainvoke_prompt
+
+ELIGIBILITY_MATRIX_GROUP_SIZE = int(os.getenv("ELIGIBILITY_MATRIX_GROUP_SIZE", "10"))
+
+GROUP_JUDGEMENT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are an expert in government agricultural schemes. For each numbered scheme you are given its eligibility questions and one farmer's answers (Unknown where the farmer was not asked). Decide for every scheme whether the farmer is eligible. Return ONLY a JSON object mapping each scheme number to \"ELIGIBLE\", \"NOT ELIGIBLE\" or \"UNKNOWN\" (when unanswered questions decide it)."),
+    ("human", "{schemes}")
+])
+
+PROFILE_ANSWERS_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are an expert in government agricultural schemes. Answer each numbered yes/no eligibility question for the farmer described by the profile. Return ONLY a JSON object mapping each question number to \"Yes\", \"No\" or \"Unknown\" when the profile does not say."),
+    ("human", "Farmer profile:\n{profile}\n\nQuestions:\n{questions}")
+])
+
+
+def question_id(question):
+    """Short stable ID of a question, equal for questions that only differ cosmetically"""
+    return hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()[:12]
+
+
+def build(schemes):
+    """
+    Deduplicate the questions of the schemes and lay out their rules as matrices
+
+    Args:
+        schemes (list): Rows from db_utils.get_all_schemes()
+
+    Returns:
+        dict: questions ({question id: English text}), askers ({question id: number of schemes
+        asking it}), schemes (per scheme: scheme_id, title, question_ids, rules), and for the
+        schemes judged by rules the clause x question matrices yes and no (a clause holds if
+        the farmer answered Yes to a question marked in its yes row, or No to one in its no
+        row) with clause_scheme, the row in schemes each clause belongs to
+    """
+    questions = {}
+    askers = {}
+    entries = []
+    for scheme in schemes:
+        rules = eligibility_rules.loads(scheme['eligibility_rules'])
+        texts = rules['questions'] if rules else scheme_pipeline.split_questions(scheme['eligibility_criteria'] or "")
+        ids = []
+        for text in texts:
+            qid = question_id(text)
+            questions.setdefault(qid, text)
+            if qid not in ids:
+                askers[qid] = askers.get(qid, 0) + 1
+            ids.append(qid)
+        entries.append({'scheme_id': scheme['id'], 'title': scheme['title'], 'question_ids': ids, 'rules': rules})
+
+    columns = {qid: i for i, qid in enumerate(questions)}
+    clauses = [(row, clause) for row, entry in enumerate(entries) if entry['rules'] for clause in entry['rules']['clauses']]
+    yes = np.zeros((len(clauses), len(columns)), dtype=bool)
+    no = np.zeros((len(clauses), len(columns)), dtype=bool)
+    for c, (row, clause) in enumerate(clauses):
+        for index, answer in clause:
+            (yes if answer == "Yes" else no)[c, columns[entries[row]['question_ids'][index]]] = True
+
+    return {
+        'questions': questions,
+        'askers': askers,
+        'schemes': entries,
+        'yes': yes,
+        'no': no,
+        'clause_scheme': np.array([row for row, _ in clauses], dtype=np.intp)
+    }
+
+
+def evaluate_rules(matrix, answers):
+    """
+    Judge every scheme with rules at once
+
+    Args:
+        matrix (dict): From build()
+        answers (dict): {question id: "Yes" or "No"}; questions not in it are unanswered
+
+    Returns:
+        dict: {row in matrix['schemes']: (status, clauses met, clauses, missing question ids)},
+        status being "eligible", "not_eligible" or "needs_answers"
+    """
+    answer_list = [answers.get(qid) for qid in matrix['questions']]
+    said_yes = np.array([a == "Yes" for a in answer_list], dtype=bool)
+    said_no = np.array([a == "No" for a in answer_list], dtype=bool)
+    unanswered = ~(said_yes | said_no)
+    yes, no, clause_scheme = matrix['yes'], matrix['no'], matrix['clause_scheme']
+
+    met = (yes & said_yes).any(axis=1) | (no & said_no).any(axis=1)
+    # A clause not met yet could still be by an unanswered question
+    open_ = ~met & ((yes | no) & unanswered).any(axis=1)
+    rows = len(matrix['schemes'])
+    clause_counts = np.bincount(clause_scheme, minlength=rows)
+    met_counts = np.bincount(clause_scheme[met], minlength=rows)
+    failed_counts = np.bincount(clause_scheme[~met & ~open_], minlength=rows)
+
+    question_ids = list(matrix['questions'])
+    results = {}
+    for row in np.flatnonzero(clause_counts):
+        if failed_counts[row]:
+            status, missing = "not_eligible", []
+        elif met_counts[row] == clause_counts[row]:
+            status, missing = "eligible", []
+        else:
+            clause_rows = np.flatnonzero((clause_scheme == row) & open_)
+            columns = np.flatnonzero(((yes[clause_rows] | no[clause_rows]) & unanswered).any(axis=0))
+            status, missing = "needs_answers", [question_ids[c] for c in columns]
+        results[int(row)] = (status, int(met_counts[row]), int(clause_counts[row]), missing)
+    return results
+
+
+def _groups(items):
+    return [items[i:i + ELIGIBILITY_MATRIX_GROUP_SIZE] for i in range(0, len(items), ELIGIBILITY_MATRIX_GROUP_SIZE)]
+
+
+def _judgement_inputs(matrix, rows, answers):
+    blocks = []
+    for n, row in enumerate(rows, 1):
+        entry = matrix['schemes'][row]
+        lines = [f"Scheme {n}: {entry['title']}"]
+        for qid in entry['question_ids']:
+            lines.append(f"Q: {matrix['questions'][qid]}\nA: {answers.get(qid, 'Unknown')}")
+        blocks.append("\n".join(lines))
+    return {"schemes": "\n\n".join(blocks)}
+
+
+def _judgements(output, rows, matrix, answers):
+    """Map a grouped judgement back to {row: (status, met, total, missing)}"""
+    try:
+        verdicts = json_object(output)
+    except ValueError as e:
+        print(f"Could not read grouped eligibility judgement: {e}")
+        verdicts = {}
+    results = {}
+    for n, row in enumerate(rows, 1):
+        verdict = str(verdicts.get(str(n), "UNKNOWN")).upper()
+        missing = [qid for qid in matrix['schemes'][row]['question_ids'] if qid not in answers]
+        if verdict == "ELIGIBLE":
+            results[row] = ("eligible", None, None, [])
+        elif verdict == "NOT ELIGIBLE":
+            results[row] = ("not_eligible", None, None, [])
+        else:
+            results[row] = ("needs_answers", None, None, missing)
+    return results
+
+
+def _profile_inputs(profile, question_ids, matrix):
+    return {
+        "profile": profile if isinstance(profile, str) else "\n".join(f"{k}: {v}" for k, v in profile.items()),
+        "questions": "\n".join(f"{n}. {matrix['questions'][qid]}" for n, qid in enumerate(question_ids, 1))
+    }
+
+
+def _profile_answers(output, question_ids):
+    try:
+        parsed = json_object(output)
+    except ValueError as e:
+        print(f"Could not read profile answers: {e}")
+        return {}
+    answers = {}
+    for n, qid in enumerate(question_ids, 1):
+        answer = str(parsed.get(str(n), "")).strip().capitalize()
+        if answer in ("Yes", "No"):
+            answers[qid] = answer
+    return answers
+
+
+def _llm_rows(matrix, answers):
+    """Rows of the schemes without rules with answered questions for the LLM to judge"""
+    return [row for row, entry in enumerate(matrix['schemes'])
+            if not entry['rules'] and any(qid in answers for qid in entry['question_ids'])]
+
+
+def _unanswered_rows(matrix, answers):
+    """Schemes without rules none of whose questions are answered, which need answers without asking the LLM"""
+    return {
+        row: ("needs_answers", None, None, list(entry['question_ids']))
+        for row, entry in enumerate(matrix['schemes'])
+        if not entry['rules'] and entry['question_ids'] and not any(qid in answers for qid in entry['question_ids'])
+    }
+
+
+def _report(matrix, results, answers):
+    """Rank the results: eligible schemes first, judged by rules before the LLM and by the most criteria met"""
+    eligible, needs_answers, not_eligible = [], [], []
+    for row, (status, met, total, missing) in results.items():
+        entry = matrix['schemes'][row]
+        item = {
+            'scheme_id': entry['scheme_id'],
+            'title': entry['title'],
+            'method': 'rules' if entry['rules'] else 'llm',
+            'criteria_met': met,
+            'criteria': total
+        }
+        if status == "eligible":
+            eligible.append(item)
+        elif status == "needs_answers":
+            needs_answers.append({**item, 'missing_questions': missing})
+        else:
+            not_eligible.append(item)
+
+    eligible.sort(key=lambda s: (s['method'] != 'rules', -(s['criteria'] or 0), -s['scheme_id']))
+    needs_answers.sort(key=lambda s: (len(s['missing_questions']), -s['scheme_id']))
+    not_eligible.sort(key=lambda s: -s['scheme_id'])
+    missing = {qid for s in needs_answers for qid in s['missing_questions']}
+    return {
+        'eligible': eligible,
+        'needs_answers': needs_answers,
+        'not_eligible': not_eligible,
+        'answers': answers,
+        'questions': [{'id': qid, 'question': matrix['questions'][qid]} for qid in matrix['questions'] if qid in missing]
+    }
+
+
+def translate_questions(questions, language_code):
+    """Translate the question texts of a list of question dicts in one call, keeping English if the lines don't line up"""
+    if language_code == "en" or not questions:
+        return questions
+    translated = translation_utils.translate("\n".join(q['question'] for q in questions), language_code, kind="questions")
+    return _with_translations(questions, translated)
+
+
+async def atranslate_questions(questions, language_code):
+    """Async variant of translate_questions()"""
+    if language_code == "en" or not questions:
+        return questions
+    translated = await translation_utils.atranslate("\n".join(q['question'] for q in questions), language_code, kind="questions")
+    return _with_translations(questions, translated)
+
+
+def _with_translations(questions, translated):
+    lines = scheme_pipeline.split_questions(translated)
+    if len(lines) != len(questions):
+        return questions
+    return [{**q, 'question': line} for q, line in zip(questions, lines)]
+
+
+def questions():
+    """
+    Return the deduplicated questions of all stored schemes, most widely asked first
+
+    Returns:
+        list: {'id', 'question' (English), 'schemes' (number of schemes asking it)} per question
+    """
+    matrix = build(db_utils.get_all_schemes())
+    ranked = sorted(matrix['questions'], key=lambda qid: -matrix['askers'][qid])
+    return [{'id': qid, 'question': matrix['questions'][qid], 'schemes': matrix['askers'][qid]} for qid in ranked]
+
+
+def assess(answers=None, profile=None):
+    """
+    Judge one farmer against every stored scheme
+
+    Args:
+        answers (dict): {question id: "Yes" or "No"} for questions from questions() (default: none)
+        profile (dict or str): Farmer profile the LLM answers the remaining questions from (default: none)
+
+    Returns:
+        dict: Ranked eligible schemes, schemes that need more answers (with the missing question
+        IDs, also listed with their text under questions), schemes not eligible, and the answers
+        used (including those taken from the profile)
+    """
+    with tracing.span("eligibility_matrix build"):
+        matrix = build(db_utils.get_all_schemes())
+    answers = dict(answers or {})
+
+    if profile:
+        unanswered = [qid for qid in matrix['questions'] if qid not in answers]
+        for group in _groups(unanswered):
+            output = invoke_prompt(PROFILE_ANSWERS_PROMPT, _profile_inputs(profile, group, matrix), name="eligibility_profile")
+            answers.update(_profile_answers(output, group))
+
+    with tracing.span("eligibility_matrix evaluate", schemes=len(matrix['schemes']), clauses=len(matrix['clause_scheme'])):
+        results = evaluate_rules(matrix, answers)
+    results.update(_unanswered_rows(matrix, answers))
+
+    for rows in _groups(_llm_rows(matrix, answers)):
+        output = invoke_prompt(GROUP_JUDGEMENT_PROMPT, _judgement_inputs(matrix, rows, answers), name="eligibility_group")
+        results.update(_judgements(output, rows, matrix, answers))
+
+    return _report(matrix, results, answers)
+
+
+async def aassess(answers=None, profile=None):
+    """Async variant of assess(); the LLM calls of each step run concurrently"""
+    with tracing.span("eligibility_matrix build"):
+        matrix = build(await asyncio.to_thread(db_utils.get_all_schemes))
+    answers = dict(answers or {})
+
+    if profile:
+        groups = _groups([qid for qid in matrix['questions'] if qid not in answers])
+        outputs = await asyncio.gather(*[
+            ainvoke_prompt(PROFILE_ANSWERS_PROMPT, _profile_inputs(profile, group, matrix), name="eligibility_profile")
+            for group in groups
+        ])
+        for group, output in zip(groups, outputs):
+            answers.update(_profile_answers(output, group))
+
+    with tracing.span("eligibility_matrix evaluate", schemes=len(matrix['schemes']), clauses=len(matrix['clause_scheme'])):
+        results = evaluate_rules(matrix, answers)
+    results.update(_unanswered_rows(matrix, answers))
+
+    groups = _groups(_llm_rows(matrix, answers))
+    outputs = await asyncio.gather(*[
+        ainvoke_prompt(GROUP_JUDGEMENT_PROMPT, _judgement_inputs(matrix, rows, answers), name="eligibility_group")
+        for rows in groups
+    ])
+    for rows, output in zip(groups, outputs):
+        results.update(_judgements(output, rows, matrix, answers))
+
+    return _report(matrix, results, answers)
@@ -0,0 +1,114 @@
+"""
+Eligibility rule sets: a scheme's eligibility criteria compiled once into conditions on the
+answers to its yes/no questions, so a farmer's answers are judged locally instead of by the LLM
+
+A rule set is stored as JSON in the eligibility_rules column of the schemes table:
+
+    {"questions": ["Do you own agricultural land?", ...],
+     "clauses": [[[0, "Yes"]], [[4, "No"]], [[5, "Yes"], [6, "Yes"]]]}
+
+Every clause must hold, and a clause holds when any of its (question index, answer) pairs
+matches the farmer's answer: above, Q1 must be Yes, Q5 must be No and Q6 or Q7 must be Yes.
+Questions no clause mentions don't affect the verdict. Clauses are evaluated as bitmasks over
+the answers, so a check takes microseconds.
+
+scheme_pipeline.compile_eligibility_rules() asks the LLM for the clauses when a scheme is saved
+(or first checked); the LLM is only called again to explain a verdict when the user asks.
+"""
+import json
+from llm_utils import json_object
+
+
+def parse(output, questions):
+    """
+    Build a rule set from the LLM's compiled clauses
+
+    Args:
+        output (str): The LLM output, a JSON object {"clauses": [[{"question": 1, "answer": "Yes"}, ...], ...]}
+            with 1-based question numbers (code fences and surrounding text are ignored)
+        questions (list): The English eligibility questions the clauses refer to
+
+    Returns:
+        dict: The rule set
+
+    Raises:
+        ValueError: If the output is not a valid set of clauses over the questions
+    """
+    compiled = json_object(output)
+
+    clauses = []
+    for clause in compiled.get("clauses", []):
+        terms = []
+        for term in clause if isinstance(clause, list) else [clause]:
+            try:
+                index = int(term["question"]) - 1
+                answer = str(term["answer"]).strip().capitalize()
+            except (TypeError, KeyError, ValueError):
+                raise ValueError(f"invalid condition in the compiled rules: {term}")
+            if not 0 <= index < len(questions) or answer not in ("Yes", "No"):
+                raise ValueError(f"condition out of range in the compiled rules: {term}")
+            terms.append([index, answer])
+        if terms:
+            clauses.append(terms)
+    if not clauses:
+        raise ValueError("the compiled rules have no conditions")
+    return {"questions": list(questions), "clauses": clauses}
+
+
+def clause_masks(rules):
+    """Return (yes_mask, no_mask) per clause, bit i standing for question i"""
+    masks = []
+    for clause in rules["clauses"]:
+        yes_mask = sum(1 << index for index, answer in clause if answer == "Yes")
+        no_mask = sum(1 << index for index, answer in clause if answer == "No")
+        masks.append((yes_mask, no_mask))
+    return masks
+
+
+def answer_mask(responses):
+    """Return the answers as a bitmask, bit i set when question i was answered Yes"""
+    return sum(1 << i for i, response in enumerate(responses) if response == "Yes")
+
+
+def evaluate(rules, responses):
+    """
+    Judge a farmer's answers against a rule set
+
+    Args:
+        rules (dict): A rule set from parse()
+        responses (list): "Yes" or "No" for each of the rule set's questions
+
+    Returns:
+        tuple: (is_eligible, the clauses the answers don't meet)
+    """
+    answers = answer_mask(responses)
+    unmet = [
+        clause for clause, (yes_mask, no_mask) in zip(rules["clauses"], clause_masks(rules))
+        if not (answers & yes_mask or ~answers & no_mask)
+    ]
+    return not unmet, unmet
+
+
+def describe(rules, is_eligible, unmet):
+    """Write the verdict for evaluate()'s result without the LLM, starting with ELIGIBLE: or NOT ELIGIBLE: like the LLM's"""
+    if is_eligible:
+        return "ELIGIBLE: Your answers meet all the eligibility criteria of this scheme."
+    lines = ["NOT ELIGIBLE: Your answers don't meet these eligibility criteria of this scheme:"]
+    for clause in unmet:
+        lines.append("- " + " or ".join(f'"{rules["questions"][index]}" must be {answer}' for index, answer in clause))
+    return "\n".join(lines)
+
+
+def dumps(rules):
+    """Serialize a rule set for the schemes table"""
+    return json.dumps(rules)
+
+
+def loads(stored):
+    """Deserialize a rule set stored by dumps(), or None if there is none"""
+    if not stored:
+        return None
+    try:
+        return json.loads(stored)
+    except (TypeError, ValueError):
+        return None
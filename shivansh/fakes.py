@@ -0,0 +1,223 @@
+"""
+Offline, deterministic stand-ins for Gemini and gTTS
+
+Selected with FAKE_PROVIDERS, a comma separated list of providers (or "all"):
+
+    FAKE_PROVIDERS=all python api.py
+    FAKE_PROVIDERS=llm FAKE_LLM_LATENCY_MS=800 FAKE_LLM_JITTER_MS=200 python api.py
+
+- llm: a chat model returning canned, shape-correct replies for each pipeline prompt (a
+  single-line title, one question per line, structured extractions of the fields asked for,
+  "ELIGIBLE: ..." verdicts, compiled eligibility rules requiring every question to be answered
+  Yes, section notes a quarter of the section, grouped verdicts, profiles answering Yes to
+  everything, translations that keep the line structure) after FAKE_LLM_LATENCY_MS +/-
+  FAKE_LLM_JITTER_MS, streamed in chunks every FAKE_LLM_CHUNK_MS, with usage metadata so token
+  accounting still works
+- tts: silent MP3 audio about as long as gTTS would speak the text, after FAKE_TTS_LATENCY_MS
+
+llm_utils.get_llm() and audio_utils return these, so the API, jobs and pre-warming run
+unchanged against them. Latency jitter comes from FAKE_SEED, so runs are reproducible.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+FAKE_PROVIDERS = {p.strip().lower() for p in os.getenv("FAKE_PROVIDERS", "").split(",") if p.strip()}
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))  # Time to the first token
+FAKE_LLM_JITTER_MS = float(os.getenv("FAKE_LLM_JITTER_MS", "100"))
+FAKE_LLM_CHUNK_MS = float(os.getenv("FAKE_LLM_CHUNK_MS", "20"))  # Between streamed chunks
+FAKE_TTS_LATENCY_MS = float(os.getenv("FAKE_TTS_LATENCY_MS", "500"))
+FAKE_SEED = int(os.getenv("FAKE_SEED", "0"))
+
+CHARS_PER_TOKEN = 4
+WORDS_PER_CHUNK = 4
+SPOKEN_CHARS_PER_SECOND = 15  # Roughly gTTS's speaking rate
+
+# One silent MPEG-1 Layer III frame: 32 kbit/s, 44.1 kHz, mono, no CRC, all-zero side info
+# and main data. 1152 samples, so about 26 ms of silence each.
+SILENT_MP3_FRAME = bytes([0xFF, 0xFB, 0x10, 0xC0]) + bytes(100)
+SILENT_MP3_FRAME_SECONDS = 1152 / 44100
+
+_rng = random.Random(FAKE_SEED)
+_rng_lock = threading.Lock()
+
+
+def enabled(provider):
+    """Check whether FAKE_PROVIDERS selects the fake for a provider ("llm" or "tts")"""
+    return "all" in FAKE_PROVIDERS or provider in FAKE_PROVIDERS
+
+
+def _delay(base_ms, jitter_ms=0.0):
+    """A latency in seconds, jittered reproducibly from FAKE_SEED"""
+    with _rng_lock:
+        jitter = _rng.uniform(-jitter_ms, jitter_ms) if jitter_ms else 0.0
+    return max(0.0, base_ms + jitter) / 1000
+
+
+SUMMARY = """This scheme gives financial support to small and marginal farmers.
+
+Key benefits:
+- Direct payment into your bank account in instalments every year
+- Subsidy on seeds, fertiliser and farm equipment
+- Free crop insurance advice at your district agriculture office
+
+Who can apply:
+- Farmers who own or cultivate up to 2 hectares of land
+- You need an Aadhaar card, a bank account and your land records
+
+How to apply:
+Visit your nearest Common Service Centre or the agriculture office with your documents, or apply on the scheme's website. Keep the acknowledgement slip to track your application."""
+
+QUESTIONS = """Are you a farmer who owns or cultivates agricultural land?
+Is your total land holding 2 hectares or less?
+Do you have an Aadhaar card?
+Do you have a bank account linked to your Aadhaar?
+Are you an Indian citizen?
+Are you free of any income tax liability for the last assessment year?"""
+
+
+def _human_text(messages):
+    return str(messages[-1].content) if messages else ""
+
+
+def canned_reply(messages):
+    """
+    Build a deterministic reply in the shape the calling prompt asks for
+
+    Args:
+        messages (list): The prompt's messages (system instructions, then the human input)
+
+    Returns:
+        str: The reply text
+    """
+    system = str(messages[0].content) if messages else ""
+    human = _human_text(messages)
+    if "You are a translator" in system:
+        # Same lines as the input, so translated questions still line up with the originals
+        return human
+    if "JSON object with these keys" in system:
+        # Only the keys asked for, so a retry for missing fields gets just those
+        document = human.split(":", 1)[-1]
+        first_line = next((line.strip() for line in document.splitlines() if line.strip()), "Agricultural Support Scheme")
+        fields = {"title": first_line[:120], "summary": SUMMARY, "questions": QUESTIONS.splitlines(),
+                  "eligibility_criteria": [q.rstrip("?") for q in QUESTIONS.splitlines()]}
+        return json.dumps({key: value for key, value in fields.items() if f'"{key}"' in system})
+    if "one section of a longer scheme document" in system:
+        # Notes a quarter of the section's length, so condensing converges
+        section = human.split("\n", 1)[-1]
+        return section[:max(200, len(section) // 4)]
+    if "title of the scheme" in system:
+        document = human.split(":", 1)[-1]
+        first_line = next((line.strip() for line in document.splitlines() if line.strip()), "Agricultural Support Scheme")
+        return first_line[:120]
+    if "yes/no questions" in system:
+        return QUESTIONS
+    if '"clauses"' in system:
+        numbers = [int(line.split(".", 1)[0]) for line in human.split("Eligibility questions:", 1)[-1].splitlines()
+                   if line.split(".", 1)[0].strip().isdigit()]
+        return json.dumps({"clauses": [[{"question": n, "answer": "Yes"}] for n in numbers]})
+    if "For each numbered scheme" in system:
+        verdicts = {}
+        for block in human.split("Scheme ")[1:]:
+            answers = [line[2:].strip() for line in block.splitlines() if line.startswith("A:")]
+            verdict = "NOT ELIGIBLE" if "No" in answers else "UNKNOWN" if "Unknown" in answers else "ELIGIBLE"
+            verdicts[block.split(":", 1)[0].strip()] = verdict
+        return json.dumps(verdicts)
+    if "described by the profile" in system:
+        numbers = [line.split(".", 1)[0] for line in human.split("Questions:", 1)[-1].splitlines() if line.split(".", 1)[0].strip().isdigit()]
+        return json.dumps({n: "Yes" for n in numbers})
+    if "verdict has already been decided" in system:
+        return "Your answers to the eligibility questions decided this. Visit your nearest Common Service Centre with your Aadhaar card, bank passbook and land records for next steps."
+    if "ELIGIBLE:" in system:
+        answers = [line[2:].strip().lower() for line in human.splitlines() if line.startswith("A:")]
+        if answers and all(a in ("yes", "y", "true") for a in answers):
+            return "ELIGIBLE: You meet all the eligibility criteria for this scheme. Apply at your nearest Common Service Centre with your Aadhaar card, bank passbook and land records."
+        return "NOT ELIGIBLE: Based on your answers you do not meet every eligibility criterion for this scheme. Check with your district agriculture office for other schemes you may qualify for."
+    return SUMMARY
+
+
+def _usage(messages, reply):
+    input_tokens = max(1, sum(len(str(m.content)) for m in messages) // CHARS_PER_TOKEN)
+    output_tokens = max(1, len(reply) // CHARS_PER_TOKEN)
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+
+def _chunks(text):
+    words = text.split(" ")
+    return [" ".join(words[i:i + WORDS_PER_CHUNK]) + (" " if i + WORDS_PER_CHUNK < len(words) else "")
+            for i in range(0, len(words), WORDS_PER_CHUNK)]
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model with Gemini's interface that answers from canned replies after a simulated delay"""
+
+    latency_ms: float = FAKE_LLM_LATENCY_MS
+    jitter_ms: float = FAKE_LLM_JITTER_MS
+    chunk_ms: float = FAKE_LLM_CHUNK_MS
+
+    @property
+    def _llm_type(self):
+        return "fake-gemini"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = canned_reply(messages)
+        time.sleep(_delay(self.latency_ms, self.jitter_ms) + len(_chunks(reply)) * self.chunk_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply, usage_metadata=_usage(messages, reply)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = canned_reply(messages)
+        await asyncio.sleep(_delay(self.latency_ms, self.jitter_ms) + len(_chunks(reply)) * self.chunk_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply, usage_metadata=_usage(messages, reply)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = canned_reply(messages)
+        chunks = _chunks(reply)
+        time.sleep(_delay(self.latency_ms, self.jitter_ms))
+        for i, text in enumerate(chunks):
+            if i:
+                time.sleep(self.chunk_ms / 1000)
+            # Like Gemini, usage is reported on the last chunk
+            usage = _usage(messages, reply) if i == len(chunks) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text, usage_metadata=usage))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = canned_reply(messages)
+        chunks = _chunks(reply)
+        await asyncio.sleep(_delay(self.latency_ms, self.jitter_ms))
+        for i, text in enumerate(chunks):
+            if i:
+                await asyncio.sleep(self.chunk_ms / 1000)
+            usage = _usage(messages, reply) if i == len(chunks) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text, usage_metadata=usage))
+
+
+def silent_mp3(seconds):
+    """Return a silent MP3 of about the given length (at least one frame)"""
+    return SILENT_MP3_FRAME * max(1, round(seconds / SILENT_MP3_FRAME_SECONDS))
+
+
+class SilentTTS:
+    """Stand-in for gTTS with the same interface, producing silent audio without the network"""
+
+    def __init__(self, text, lang="en", slow=False, **kwargs):
+        self.text = text
+        self.lang = lang
+        self.slow = slow
+
+    def _audio(self):
+        time.sleep(_delay(FAKE_TTS_LATENCY_MS))
+        seconds = len(self.text) / SPOKEN_CHARS_PER_SECOND
+        return silent_mp3(seconds * 2 if self.slow else seconds)
+
+    def write_to_fp(self, fp):
+        fp.write(self._audio())
+
+    def save(self, savefile):
+        with open(savefile, "wb") as f:
+            f.write(self._audio())
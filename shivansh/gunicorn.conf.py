@@ -0,0 +1,47 @@
+"""
+Production server configuration
+
+    gunicorn -c gunicorn.conf.py api:app
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+
+Workers share sessions through SECRET_KEY, and share the translation cache, upload jobs
+and audio cache through farmwise.db and AUDIO_CACHE_DIR. With preload on, the app
+(Gemini client, gTTS language table, database schema) is loaded once in the master
+process before the workers are forked (see on_starting below).
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+
+# The Gemini client uses gRPC, which needs fork support enabled to be loaded before forking
+os.environ.setdefault("GRPC_ENABLE_FORK_SUPPORT", "1")
+os.environ.setdefault("GRPC_POLL_STRATEGY", "poll")
+
+# Workers write their metrics here so /metrics can add up every process. The previous run's
+# metric files (counter_<pid>.db and so on) are cleared on each start; nothing else in the
+# directory is touched, as an operator may point it at a directory holding other data
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "farmwise-api-metrics"))
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+for metric_type in ("counter", "gauge", "histogram", "summary"):
+    for metrics_file in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], f"{metric_type}_*.db")):
+        os.remove(metrics_file)
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))  # Per worker, for the gthread worker class
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))  # An upload runs several LLM calls
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+
+def on_starting(server):
+    """One-off startup work, done once in the master rather than in every worker"""
+    import startup
+    startup.run(warm_clients=preload_app)
+
+
+def child_exit(server, worker):
+    """Drop a finished worker's live gauges (in-flight requests) from /metrics"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,49 @@
+"""
+Check how long importing a service module takes, using python -X importtime
+
+    python import_budget.py              # api, against IMPORT_BUDGET_MS
+    python import_budget.py asgi --budget-ms 1500 --top 15
+
+Exits with status 1 if the import takes longer than the budget, so it can run in CI.
+Heavy clients (Gemini, gTTS, PyPDF2, Streamlit) should stay behind lazy accessors or
+startup.run(); if this fails, the slowest imports listed show what to defer.
+"""
+import argparse
+import os
+import sys
+from farmwise_common import import_timing
+
+IMPORT_BUDGET_MS = int(os.getenv("IMPORT_BUDGET_MS", "1500"))
+
+def measure_imports(module):
+    """
+    Import a module of this service in a fresh interpreter and collect -X importtime timings
+
+    Args:
+        module (str): Module to import
+
+    Returns:
+        tuple: (total_ms, [(cumulative_ms, package), ...] for top-level imports)
+    """
+    return import_timing.measure_imports(module, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of a module against a budget")
+    parser.add_argument("module", nargs="?", default="api", help="Module to import (default: api)")
+    parser.add_argument("--budget-ms", type=int, default=IMPORT_BUDGET_MS, help="Import time budget in milliseconds")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list")
+    args = parser.parse_args()
+
+    total_ms, top_level = measure_imports(args.module)
+
+    print(f"import {args.module}: {total_ms:.0f} ms (budget {args.budget_ms} ms)")
+    print("Slowest top-level imports:")
+    for ms, package in sorted(top_level, reverse=True)[:args.top]:
+        print(f"  {ms:8.1f} ms  {package}")
+
+    if total_ms > args.budget_ms:
+        print(f"Over budget by {total_ms - args.budget_ms:.0f} ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
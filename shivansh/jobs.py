@@ -0,0 +1,97 @@
+import io
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import db_utils
+import prewarm
+import scheme_pipeline
+import token_usage
+import tracing
+
+# Upload jobs run on a bounded worker pool so long uploads don't tie up
+# request threads. Progress is persisted in the upload_jobs table.
+UPLOAD_JOB_WORKERS = int(os.getenv("UPLOAD_JOB_WORKERS", "2"))
+UPLOAD_JOB_QUEUE_LIMIT = int(os.getenv("UPLOAD_JOB_QUEUE_LIMIT", "20"))  # Max queued + running jobs
+
+_lock = threading.Lock()
+_executor = None
+_outstanding = 0
+
+
+class JobQueueFull(Exception):
+    """Raised when too many upload jobs are already queued"""
+
+
+def _get_executor():
+    """Create the worker pool on first use"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=UPLOAD_JOB_WORKERS, thread_name_prefix="upload-job")
+        return _executor
+
+def submit_upload(pdf_bytes, language_code):
+    """
+    Queue an uploaded PDF for processing
+
+    Args:
+        pdf_bytes (bytes): Contents of the uploaded PDF
+        language_code (str): Language to translate the results into
+
+    Returns:
+        str: The job ID
+    """
+    global _outstanding
+    with _lock:
+        if _outstanding >= UPLOAD_JOB_QUEUE_LIMIT:
+            raise JobQueueFull(f"Too many uploads in progress ({_outstanding}), please retry shortly")
+        _outstanding += 1
+
+    job_id = uuid.uuid4().hex
+    try:
+        db_utils.create_upload_job(job_id, language_code)
+        # LLM usage is attributed to the route and user that queued the job
+        _get_executor().submit(_run_job, job_id, pdf_bytes, language_code, token_usage.current_context())
+    except Exception:
+        with _lock:
+            _outstanding -= 1
+        raise
+    return job_id
+
+def get_job(job_id):
+    """Get the status and (partial) result of an upload job"""
+    return db_utils.get_upload_job(job_id)
+
+def _run_job(job_id, pdf_bytes, language_code, usage_context):
+    """Run the upload pipeline for one job, persisting progress after each stage"""
+    global _outstanding
+    completed = []
+
+    def on_stage(stage, result):
+        completed.append(stage)
+        partial = {k: v for k, v in result.items() if k != 'raw'}
+        db_utils.update_upload_job(job_id, stage=stage, stages=completed, result=partial)
+
+    try:
+        # Jobs outlive the request that queued them, so each gets its own trace
+        with tracing.span("upload_job", root=True, **{"job.id": job_id, "language": language_code}), \
+                token_usage.usage_context(*usage_context):
+            db_utils.update_upload_job(job_id, status='running')
+            text = scheme_pipeline.extract_pdf_text(io.BytesIO(pdf_bytes))
+            on_stage("text_extracted", {})
+
+            result = scheme_pipeline.process_scheme(text, language_code, on_stage=on_stage)
+            db_utils.update_upload_job(job_id, status='completed', result=result)
+    except scheme_pipeline.PipelineError as e:
+        db_utils.update_upload_job(job_id, status='failed', error=e.message)
+    except Exception as e:
+        print(f"Error processing upload job {job_id}: {e}")
+        db_utils.update_upload_job(job_id, status='failed', error=f'Error processing PDF: {e}')
+    else:
+        # Warm translations and audio for the other languages our users read; the job has
+        # completed, so a failure here is only logged
+        prewarm.enqueue_upload(result)
+    finally:
+        with _lock:
+            _outstanding -= 1
@@ -0,0 +1,22 @@
+"""
+Exact-match cache of LLM responses for prompt types whose output only depends on their input
+(title, summary, structured extraction, section notes, eligibility questions and rules, explanations, translation), kept in the llm_cache table of the SQLite
+database so every worker process shares it
+
+The LLM gateway looks up calls whose run config names a prompt type, which llm_utils does for
+every prompt it runs. Those prompt types are cached for a week unless LLM_CACHE_TTLS
+("prompt=seconds,...") says otherwise, and LLM_CACHE_BYPASS lists prompt types (or "all") whose
+calls skip the cache.
+
+The implementation is farmwise_common.llm_cache; this module passes it the API's database and
+TTLs.
+"""
+import db_utils
+from farmwise_common import llm_cache as _llm_cache
+from farmwise_common.llm_cache import cache_key, enabled, get, peek, put
+
+_llm_cache.configure(db_utils.get_connection, {
+    prompt: 604800
+    for prompt in ("title", "summary", "scheme_extraction", "section_notes", "eligibility_questions",
+                   "eligibility_rules", "eligibility_explanation", "translation")
+})
@@ -0,0 +1,17 @@
+"""
+Gateway for the API's Gemini chat calls: concurrency limits, rate limiting, retries and circuit
+breaking in one place, so bursts of uploads, translations and pre-warming queue (or are refused)
+here instead of failing at Gemini's rate limits
+
+llm_utils.get_llm() wraps the chat model with wrap_llm() unless LLM_GATEWAY=0, and runs every
+prompt with call_config(prompt type) so its response can be cached (llm_cache.py) and identical
+concurrent calls coalesced (singleflight.py). The ASGI app's event loop and the WSGI app it
+mounts share the limits. The routes answer GatewayUnavailable (GatewayBusy, CircuitOpen) with a
+503 and a Retry-After header.
+
+The implementation, and its LLM_* settings, are in farmwise_common.llm_gateway; importing this
+module sets up the API's response cache and single-flight leases, which the gateway uses.
+"""
+import llm_cache
+import singleflight
+from farmwise_common.llm_gateway import CircuitOpen, GatewayBusy, GatewayUnavailable, LLM_GATEWAY, call_config, wrap_llm
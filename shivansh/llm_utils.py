@@ -0,0 +1,164 @@
+import json
+import os
+import re
+import threading
+from dotenv import load_dotenv
+import llm_gateway
+import metrics
+import profiling
+import token_usage
+import tracing
+
+# Load environment variables
+load_dotenv()
+
+# API key validation
+api_key = os.getenv("GOOGLE_API_KEY")
+
+# LLM shared by the API and the background workers, created on first use
+_llm = None
+_llm_lock = threading.Lock()
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+def json_object(output):
+    """
+    Read the JSON object in an LLM output, ignoring code fences and surrounding text
+
+    Raises:
+        ValueError: If there is no JSON object in the output
+    """
+    match = _JSON_OBJECT.search(output or "")
+    if not match:
+        raise ValueError("no JSON object in the LLM output")
+    try:
+        parsed = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"LLM output is not valid JSON: {e}")
+    if not isinstance(parsed, dict):
+        raise ValueError("LLM output is not a JSON object")
+    return parsed
+
+def get_llm():
+    """
+    Return the shared Gemini client (or the fake one, see fakes.py, or a cassette, see cassettes.py),
+    creating it on first use. Its calls go through the LLM gateway (see llm_gateway.py) unless LLM_GATEWAY=0
+    """
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = _create_llm()
+    return _llm
+
+def _create_llm():
+    """Create the chat model get_llm() shares: Gemini, the fake or a replayed cassette, recorded and gated as configured"""
+    llm = None
+    cassette_mode = None
+    if os.getenv("CASSETTE_MODE"):
+        import cassettes
+        cassette_mode = cassettes.mode("llm")
+        if cassette_mode == "replay":
+            print("Replaying recorded LLM calls (CASSETTE_MODE)")
+            llm = cassettes.wrap_llm(None)
+    if llm is None and os.getenv("FAKE_PROVIDERS"):
+        import fakes
+        if fakes.enabled("llm"):
+            print("Using the fake chat model (FAKE_PROVIDERS)")
+            llm = fakes.FakeChatModel()
+    if llm is None:
+        # Imported here as it pulls in the (slow to import) Google client libraries
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        llm = ChatGoogleGenerativeAI(
+            model="gemini-2.0-flash",
+            api_key=api_key,
+            # The gateway retries failed calls itself, so the client only makes one attempt
+            max_retries=1 if llm_gateway.LLM_GATEWAY else 6
+        )
+    if cassette_mode == "record":
+        print("Recording LLM calls (CASSETTE_MODE)")
+        llm = cassettes.wrap_llm(llm)
+    if llm_gateway.LLM_GATEWAY:
+        llm = llm_gateway.wrap_llm(llm)
+    return llm
+
+def _assemble(prompt, inputs, name):
+    """Fill in a prompt template (its allocations are recorded when the request is profiled)"""
+    with profiling.allocations(f"prompt {name}"):
+        return prompt.format_prompt(**(inputs or {}))
+
+def invoke_prompt(prompt, inputs=None, name="other"):
+    """
+    Run a prompt template through the shared LLM
+
+    Args:
+        prompt (ChatPromptTemplate): The prompt to run
+        inputs (dict): Template variables (default: none)
+        name (str): Prompt type the call is counted under in the metrics and token usage (default: "other")
+
+    Returns:
+        str: The text content of the LLM response
+
+    Raises:
+        token_usage.BudgetExceeded: If a daily token budget is used up
+    """
+    token_usage.require_budget()
+    with metrics.track_llm_call(name), tracing.span(f"llm {name}", kind=tracing.SPAN_KIND_CLIENT):
+        response = get_llm().invoke(_assemble(prompt, inputs, name), config=llm_gateway.call_config(name))
+    metrics.record_llm_tokens(name, response)
+    text = response.content if hasattr(response, "content") else response
+    token_usage.record_call(name, token_usage.add_usage(None, response), prompt, inputs, text)
+    return text
+
+def stream_prompt(prompt, inputs=None, name="other"):
+    """
+    Stream a prompt template through the shared LLM
+
+    Args:
+        prompt (ChatPromptTemplate): The prompt to run
+        inputs (dict): Template variables (default: none)
+        name (str): Prompt type the call is counted under in the metrics and token usage (default: "other")
+
+    Yields:
+        str: Text chunks of the LLM response as they arrive
+
+    Raises:
+        token_usage.BudgetExceeded: If a daily token budget is used up
+    """
+    token_usage.require_budget()
+    usage = None
+    chunks = []
+    with metrics.track_llm_call(name), tracing.span(f"llm {name}", kind=tracing.SPAN_KIND_CLIENT, stream=True):
+        for chunk in get_llm().stream(_assemble(prompt, inputs, name), config=llm_gateway.call_config(name)):
+            metrics.record_llm_tokens(name, chunk)
+            usage = token_usage.add_usage(usage, chunk)
+            text = chunk.content if hasattr(chunk, "content") else chunk
+            if text:
+                chunks.append(text)
+                yield text
+    token_usage.record_call(name, usage, prompt, inputs, "".join(chunks))
+
+async def ainvoke_prompt(prompt, inputs=None, name="other"):
+    """Async variant of invoke_prompt() that awaits the LLM without holding a thread"""
+    token_usage.require_budget()
+    with metrics.track_llm_call(name), tracing.span(f"llm {name}", kind=tracing.SPAN_KIND_CLIENT):
+        response = await get_llm().ainvoke(_assemble(prompt, inputs, name), config=llm_gateway.call_config(name))
+    metrics.record_llm_tokens(name, response)
+    text = response.content if hasattr(response, "content") else response
+    token_usage.record_call(name, token_usage.add_usage(None, response), prompt, inputs, text)
+    return text
+
+async def astream_prompt(prompt, inputs=None, name="other"):
+    """Async variant of stream_prompt(), yielding text chunks as they arrive"""
+    token_usage.require_budget()
+    usage = None
+    chunks = []
+    with metrics.track_llm_call(name), tracing.span(f"llm {name}", kind=tracing.SPAN_KIND_CLIENT, stream=True):
+        async for chunk in get_llm().astream(_assemble(prompt, inputs, name), config=llm_gateway.call_config(name)):
+            metrics.record_llm_tokens(name, chunk)
+            usage = token_usage.add_usage(usage, chunk)
+            text = chunk.content if hasattr(chunk, "content") else chunk
+            if text:
+                chunks.append(text)
+                yield text
+    token_usage.record_call(name, usage, prompt, inputs, "".join(chunks))
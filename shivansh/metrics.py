@@ -0,0 +1,17 @@
+"""
+Prometheus metrics for the API, served in text format at /metrics
+
+- Request counts, latency and in-flight requests per route, from the hooks installed by init_app()
+- LLM calls, latency and token usage per prompt type, from llm_utils
+- LLM gateway queue wait, queued and in-flight calls, retries, refusals and circuit state per model, from farmwise_common.llm_gateway
+- Audio, translation and eligibility verdict cache lookups, from audio_utils, translation_utils and eligibility_cache
+- Calls coalesced by farmwise_common.singleflight, per kind (translation, tts, llm)
+- SQLite statement timings, from the connection factory used by db_utils
+
+Cache hit ratio, for example:
+
+    sum(rate(cache_lookups_total{cache="audio",result="hit"}[5m])) / sum(rate(cache_lookups_total{cache="audio"}[5m]))
+
+The metrics are defined in farmwise_common.metrics, shared with the recommendations API.
+"""
+from farmwise_common.metrics import TimedConnection, init_app, record_cache_lookup, record_llm_tokens, track_llm_call
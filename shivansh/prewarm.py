@@ -0,0 +1,201 @@
+import os
+import queue
+import threading
+import time
+import audio_utils
+import db_utils
+import token_usage
+import tracing
+import translation_utils
+
+# Background pre-warming of translations and audio for stored schemes.
+# Work is done on a single daemon thread that backs off while interactive
+# requests are being served and spaces out its LLM/TTS calls.
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "true").lower() == "true"
+PREWARM_MIN_INTERVAL = float(os.getenv("PREWARM_MIN_INTERVAL", "2"))  # Seconds between LLM/TTS calls
+PREWARM_MAX_LANGUAGES = int(os.getenv("PREWARM_MAX_LANGUAGES", "3"))
+PREWARM_IDLE_TIMEOUT = float(os.getenv("PREWARM_IDLE_TIMEOUT", "30"))  # Max seconds to yield to requests
+
+_tasks = queue.Queue()
+_lock = threading.Lock()
+_idle = threading.Condition(_lock)
+_pending = set()
+_worker = None
+_active_requests = 0
+_last_call = 0.0
+_status = {
+    "completed": 0,
+    "failed": 0,
+    "translations_generated": 0,
+    "audio_generated": 0,
+    "current": None,
+    "last_error": None
+}
+
+def request_started():
+    """Mark an interactive request as in flight so the worker yields to it"""
+    global _active_requests
+    with _lock:
+        _active_requests += 1
+
+def request_finished():
+    """Mark an interactive request as finished"""
+    global _active_requests
+    with _lock:
+        _active_requests = max(0, _active_requests - 1)
+        if _active_requests == 0:
+            _idle.notify_all()
+
+def get_status():
+    """Return a snapshot of the worker's progress"""
+    with _lock:
+        status = dict(_status)
+        status["queued"] = len(_pending)
+        status["running"] = _worker is not None and _worker.is_alive()
+    status["enabled"] = PREWARM_ENABLED
+    return status
+
+def enqueue_texts(label, summary, eligibility_questions, languages):
+    """
+    Queue a summary and its eligibility questions for pre-warming
+
+    Args:
+        label (str): Name used in progress reporting (e.g. scheme title or id)
+        summary (str): English summary to translate and convert to audio
+        eligibility_questions (str): English eligibility questions, one per line
+        languages (list): Language codes to warm
+
+    Returns:
+        int: Number of tasks queued
+    """
+    if not PREWARM_ENABLED or not summary:
+        return 0
+
+    queued = 0
+    for language_code in languages:
+        if not language_code or language_code == "en":
+            continue
+        if not audio_utils.is_language_supported(language_code):
+            continue
+        key = (db_utils.hash_text(summary), language_code)
+        with _lock:
+            if key in _pending:
+                continue
+            _pending.add(key)
+        _tasks.put((key, label, summary, eligibility_questions, language_code))
+        queued += 1
+
+    if queued:
+        _ensure_worker()
+    return queued
+
+def enqueue_upload(result):
+    """
+    Queue an uploaded scheme for pre-warming in the languages our users read
+
+    The upload has succeeded by the time this runs, so failures are only logged.
+
+    Args:
+        result (dict): The upload pipeline's result
+
+    Returns:
+        int: Number of tasks queued
+    """
+    try:
+        return enqueue_texts(result['summary_title'], result['summary_original'], result['eligibility_questions_original'],
+                             db_utils.get_popular_languages(PREWARM_MAX_LANGUAGES))
+    except Exception as e:
+        print(f"Error queueing pre-warming for {result.get('summary_title')}: {e}")
+        return 0
+
+def enqueue_scheme(scheme_id, languages=None):
+    """
+    Queue a stored scheme for pre-warming in the languages its users use
+
+    Args:
+        scheme_id (int): ID of the scheme in the schemes table
+        languages (list): Extra language codes to warm (default: none)
+
+    Returns:
+        int: Number of tasks queued
+    """
+    scheme = db_utils.get_scheme_by_id(scheme_id)
+    if not scheme:
+        return 0
+
+    wanted = list(languages or [])
+    wanted += db_utils.get_scheme_languages(scheme_id)
+    wanted += db_utils.get_popular_languages(PREWARM_MAX_LANGUAGES)
+    # Keep order (explicit languages first) while dropping duplicates
+    wanted = list(dict.fromkeys(wanted))
+
+    return enqueue_texts(f"scheme {scheme_id}", scheme['summary'], scheme['eligibility_criteria'], wanted)
+
+def _ensure_worker():
+    """Start the worker thread on first use"""
+    global _worker
+    with _lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        _worker = threading.Thread(target=_run, name="prewarm-worker", daemon=True)
+        _worker.start()
+
+def _throttle():
+    """Wait for interactive requests to drain and for the rate limit interval to pass"""
+    global _last_call
+    with _lock:
+        _idle.wait_for(lambda: _active_requests == 0, timeout=PREWARM_IDLE_TIMEOUT)
+        delay = _last_call + PREWARM_MIN_INTERVAL - time.time()
+    if delay > 0:
+        time.sleep(delay)
+    with _lock:
+        _last_call = time.time()
+
+def _warm(summary, eligibility_questions, language_code):
+    """Generate any missing translations and audio for one language"""
+    # Pre-warming is optional, so it is the first thing to stop when over the LLM budget
+    if not token_usage.within_budget():
+        raise RuntimeError("LLM budget used up, skipping")
+    translated_summary = translation_utils.get_cached_translation(summary, language_code)
+    if translated_summary is None:
+        _throttle()
+        translated_summary = translation_utils.translate(summary, language_code)
+        with _lock:
+            _status["translations_generated"] += 1
+
+    if eligibility_questions and translation_utils.get_cached_translation(eligibility_questions, language_code, "questions") is None:
+        _throttle()
+        translation_utils.translate(eligibility_questions, language_code, kind="questions")
+        with _lock:
+            _status["translations_generated"] += 1
+
+    if not audio_utils.is_audio_cached(translated_summary, language_code):
+        _throttle()
+        audio_bytes, _ = audio_utils.generate_audio(translated_summary, language_code)
+        if not audio_bytes:
+            raise RuntimeError("Failed to generate audio")
+        with _lock:
+            _status["audio_generated"] += 1
+
+def _run():
+    """Worker loop processing queued pre-warm tasks"""
+    while True:
+        key, label, summary, eligibility_questions, language_code = _tasks.get()
+        with _lock:
+            _status["current"] = f"{label} ({language_code})"
+        try:
+            with tracing.span("prewarm", root=True, label=label, language=language_code), token_usage.usage_context("prewarm"):
+                _warm(summary, eligibility_questions, language_code)
+            with _lock:
+                _status["completed"] += 1
+            print(f"Pre-warmed {label} in {language_code} ({_tasks.qsize()} tasks left)")
+        except Exception as e:
+            with _lock:
+                _status["failed"] += 1
+                _status["last_error"] = f"{label} ({language_code}): {e}"
+            print(f"Error pre-warming {label} in {language_code}: {e}")
+        finally:
+            with _lock:
+                _pending.discard(key)
+                _status["current"] = None
+            _tasks.task_done()
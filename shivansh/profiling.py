@@ -0,0 +1,19 @@
+"""
+On-demand profiling of single requests
+
+Off unless PROFILING_ENABLED is set. Then a request sent with an X-Profile header (cprofile or
+sampling) runs under a profiler and its profile is written to profiles/ (PROFILE_DIR):
+
+    curl -H "X-Profile: cprofile" -F file=@scheme.pdf localhost:8000/upload_scheme
+
+allocations() records the top allocation sites of PDF extraction and prompt assembly, and JSON
+responses get a "debug": {"profile": ...} entry summarising the profile.
+
+The implementation is farmwise_common.profiling; this module sets where the API's profiles go
+and the key they are returned under.
+"""
+import os
+from farmwise_common import profiling as _profiling
+from farmwise_common.profiling import allocations, init_app
+
+_profiling.configure(os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"), response_key="debug")
@@ -0,0 +1,156 @@
+"""
+Map-reduce condensing of long scheme documents for the title, summary, eligibility and rules prompts
+
+A document that fits in SCHEME_PROMPT_TOKENS is passed to those prompts whole. A longer one is
+split on line boundaries into sections of at most SCHEME_SECTION_TOKENS, every section is
+condensed into notes concurrently (SCHEME_DIGEST_CONCURRENCY at a time), and the prompts read
+the notes of all sections instead of the first 15 000 characters, so eligibility annexures at
+the end of a document are no longer lost. Notes that are still too long are condensed again,
+up to SCHEME_DIGEST_MAX_LEVELS times, so latency grows with the number of levels rather than
+with the length of the document.
+
+Section notes are a prompt type of their own ("section_notes") in llm_cache.py, keyed by the
+section's text, so re-uploading a document, or one sharing sections with another, only
+condenses the sections that changed, and the save and rules steps reuse the upload's notes.
+
+- SCHEME_PROMPT_TOKENS: document tokens a prompt reads before the document is condensed (default 3750)
+- SCHEME_SECTION_TOKENS: tokens per condensed section (default 1500)
+- SCHEME_DIGEST_CONCURRENCY: sections condensed at the same time (default 8)
+- SCHEME_DIGEST_MAX_LEVELS: how many times notes are condensed again (default 3)
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.prompts import ChatPromptTemplate
+import token_usage
+import tracing
+from llm_utils import invoke_prompt, ainvoke_prompt
+
+SCHEME_PROMPT_TOKENS = int(os.getenv("SCHEME_PROMPT_TOKENS", "3750"))
+SCHEME_SECTION_TOKENS = int(os.getenv("SCHEME_SECTION_TOKENS", "1500"))
+SCHEME_DIGEST_CONCURRENCY = int(os.getenv("SCHEME_DIGEST_CONCURRENCY", "8"))
+SCHEME_DIGEST_MAX_LEVELS = int(os.getenv("SCHEME_DIGEST_MAX_LEVELS", "3"))
+
+SECTION_NOTES_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are an expert in government agricultural schemes. You are given one section of a longer scheme document. Write concise notes of everything in it that a farmer or an eligibility check needs: the scheme's name, benefits and amounts, every eligibility condition and exclusion, required documents, deadlines and how to apply. Keep numbers, names and conditions exact and leave out boilerplate. Return ONLY the notes."),
+    ("human", "Document section:\n{text}")
+])
+
+_lock = threading.Lock()
+_executor = None
+
+
+def _get_executor():
+    """Create the worker pool on first use"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SCHEME_DIGEST_CONCURRENCY, thread_name_prefix="scheme-digest")
+        return _executor
+
+
+def _chars(tokens):
+    return tokens * token_usage.CHARS_PER_TOKEN
+
+
+def _lines(text, max_chars):
+    """Yield the lines of the text, with lines longer than max_chars broken at whitespace"""
+    for line in text.splitlines(keepends=True):
+        while len(line) > max_chars:
+            cut = line.rfind(" ", 0, max_chars)
+            cut = cut + 1 if cut > 0 else max_chars
+            yield line[:cut]
+            line = line[cut:]
+        yield line
+
+
+def split_sections(text, max_tokens=None):
+    """
+    Split a document into sections on line boundaries
+
+    Args:
+        text (str): Document text
+        max_tokens (int): Tokens per section (default SCHEME_SECTION_TOKENS)
+
+    Returns:
+        list: The non-empty sections, in document order
+    """
+    max_chars = _chars(max_tokens or SCHEME_SECTION_TOKENS)
+    sections, current = [], ""
+    for line in _lines(text or "", max_chars):
+        if current and len(current) + len(line) > max_chars:
+            sections.append(current)
+            current = ""
+        current += line
+    sections.append(current)
+    return [section.strip() for section in sections if section.strip()]
+
+
+def opening(text):
+    """Return the first section of a document, where its title is"""
+    sections = split_sections(text)
+    return sections[0] if sections else ""
+
+
+def fits(text):
+    """Return whether a prompt can read the text without it being condensed"""
+    return token_usage.estimate_tokens(text) <= SCHEME_PROMPT_TOKENS
+
+
+def _join(notes):
+    return "\n\n".join(f"Notes on section {i + 1} of the scheme document:\n{n.strip()}" for i, n in enumerate(notes))
+
+
+def _truncate(text):
+    print(f"Scheme document notes still exceed {SCHEME_PROMPT_TOKENS} tokens after {SCHEME_DIGEST_MAX_LEVELS} levels, truncating")
+    return text[:_chars(SCHEME_PROMPT_TOKENS)]
+
+
+def _condense_section(section):
+    return invoke_prompt(SECTION_NOTES_PROMPT, {"text": section}, name="section_notes")
+
+
+def digest(text):
+    """
+    Return the text the scheme prompts should read for a document
+
+    Args:
+        text (str): Document text
+
+    Returns:
+        str: The document itself if it fits in SCHEME_PROMPT_TOKENS, otherwise the notes of its sections
+    """
+    text = text or ""
+    level = 0
+    while not fits(text):
+        if level == SCHEME_DIGEST_MAX_LEVELS:
+            return _truncate(text)
+        sections = split_sections(text)
+        with tracing.span("scheme digest", level=level, sections=len(sections)):
+            # Each task gets its own copy of the context so usage and traces stay attributed to this request
+            futures = [_get_executor().submit(contextvars.copy_context().run, _condense_section, s) for s in sections]
+            text = _join([future.result() for future in futures])
+        level += 1
+    return text
+
+
+async def adigest(text):
+    """Async variant of digest()"""
+    text = text or ""
+    semaphore = asyncio.Semaphore(SCHEME_DIGEST_CONCURRENCY)
+
+    async def condense(section):
+        async with semaphore:
+            return await ainvoke_prompt(SECTION_NOTES_PROMPT, {"text": section}, name="section_notes")
+
+    level = 0
+    while not fits(text):
+        if level == SCHEME_DIGEST_MAX_LEVELS:
+            return _truncate(text)
+        sections = split_sections(text)
+        with tracing.span("scheme digest", level=level, sections=len(sections)):
+            text = _join(await asyncio.gather(*(condense(s) for s in sections)))
+        level += 1
+    return text
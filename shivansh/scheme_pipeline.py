@@ -0,0 +1,630 @@
+import asyncio
+import os
+import time
+from langchain_core.prompts import ChatPromptTemplate
+import audio_utils
+import db_utils
+import eligibility_cache
+import eligibility_rules
+import profiling
+import scheme_digest
+import tracing
+import translation_utils
+from llm_utils import json_object, invoke_prompt, stream_prompt, ainvoke_prompt, astream_prompt
+
+# Directory uploaded scheme audio is written to (served as static files)
+TEMP_AUDIO_DIR = os.path.join(os.getcwd(), 'static', 'temp_audio')
+
+# Stages of the upload pipeline, in the order they complete
+STAGES = ["text_extracted", "title_ready", "summary_ready", "questions_ready", "translation_ready", "audio_ready"]
+
+# How an upload's title, summary and questions are generated: "separate" sends the document to
+# three prompts, "single" to one structured-output call (EXTRACTION_PROMPT). Compare them with
+# SCHEME_EXTRACTION_MODE=single python benchmark.py upload and python token_usage.py --by prompt
+SCHEME_EXTRACTION_MODE = os.getenv("SCHEME_EXTRACTION_MODE", "separate").lower()
+
+# Fields of the structured extraction and what the LLM is asked to put in them
+EXTRACTION_FIELDS = {
+    "title": "the exact title of the scheme, as a single line",
+    "summary": "a simple, easy-to-understand summary for farmers of the key benefits, eligibility criteria and application process, in language a person with basic education can understand",
+    "eligibility_criteria": "a list of the key eligibility criteria, one string each",
+    "questions": "a list of 5-7 simple yes/no questions, one string each without numbering, that determine whether a farmer is eligible"
+}
+
+TITLE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are an expert in government agricultural schemes. Extract the exact title of the scheme from the provided document. Return ONLY the title as a single line, without any additional text or explanation."),
+    ("human", "Extract the title from this document: {text}")
+])
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are an expert in government agricultural schemes. Your task is to analyze the provided government scheme document and create a simple, easy-to-understand summary for farmers. Focus on the key benefits, eligibility criteria, and application process. Use simple language that a person with basic education can understand."),
+    ("human", "Please analyze this government agricultural scheme document and provide a summary in simple language: {text}")
+])
+
+ELIGIBILITY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are an expert in government agricultural schemes. Extract the key eligibility criteria from the provided document. Then generate 5-7 simple yes/no questions that can determine if a farmer is eligible for the scheme. Return ONLY the questions, one per line, without any numbering or additional text."),
+    ("human", "Extract eligibility criteria questions from this scheme document: {text}")
+])
+
+EXTRACTION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are an expert in government agricultural schemes. Read the provided scheme document and return ONLY a JSON object with these keys:\n{fields}"),
+    ("human", "Scheme document: {text}")
+])
+
+ELIGIBILITY_CHECK_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are an expert in government agricultural schemes. Based on the eligibility questions and the farmer's responses, determine if they are eligible for the scheme. IMPORTANT: Start your response with exactly 'ELIGIBLE: ' (if they qualify) or 'NOT ELIGIBLE: ' (if they don't qualify) followed by a clear explanation of your decision and any next steps they should take. If they are eligible, provide information on how to apply."),
+    ("human", "Eligibility questions and responses:\n{responses}\n\nBased on these responses, is the farmer eligible for the scheme? Start with ELIGIBLE: or NOT ELIGIBLE: followed by your explanation.")
+])
+
+ELIGIBILITY_RULES_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are an expert in government agricultural schemes. Given a scheme document and numbered yes/no eligibility questions, write the conditions on the answers under which a farmer is eligible. Return ONLY a JSON object {{\"clauses\": [...]}} where every clause is a list of conditions {{\"question\": <number>, \"answer\": \"Yes\" or \"No\"}}. A farmer is eligible when every clause has at least one condition matching their answers, so put a condition in a clause of its own when it is required and group conditions in one clause when any of them is enough. Leave out questions that don't decide eligibility."),
+    ("human", "Scheme document: {text}\n\nEligibility questions:\n{questions}")
+])
+
+ELIGIBILITY_EXPLANATION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are an expert in government agricultural schemes. A farmer has answered the scheme's eligibility questions and the verdict has already been decided. Explain the verdict in simple language, citing the answers that decided it, and give the next steps they should take. If they are eligible, provide information on how to apply. Do not repeat the verdict label."),
+    ("human", "Eligibility questions and responses:\n{responses}\n\nVerdict: {verdict}")
+])
+
+
+class PipelineError(Exception):
+    """Error in a pipeline stage, carrying the HTTP status the API should answer with"""
+
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def extract_pdf_text(file):
+    """
+    Extract the text of every page of a PDF
+
+    Args:
+        file: A file-like object containing the PDF
+
+    Returns:
+        str: The extracted text
+    """
+    from PyPDF2 import PdfReader
+    with tracing.span("pdf extract_text") as trace_span, profiling.allocations("pdf extract_text"):
+        pdf_reader = PdfReader(file, strict=False)
+        text = ""
+        for page in pdf_reader.pages:
+            try:
+                page_text = page.extract_text()
+                if page_text:
+                    text += page_text
+            except Exception as e:
+                raise PipelineError(f'Warning: Could not extract text from a page: {e}', 400)
+        if trace_span:
+            trace_span.set_attribute("pages", len(pdf_reader.pages))
+
+    if not text.strip():
+        raise PipelineError('Could not extract any text from the uploaded PDF', 400)
+    return text
+
+def extract_title(text):
+    """Extract the scheme title from the opening section of the document text"""
+    return invoke_prompt(TITLE_PROMPT, {"text": scheme_digest.opening(text)}, name="title").strip()
+
+def summarize_scheme(document):
+    """Summarize the scheme in simple language from the document, or its notes from scheme_digest.digest()"""
+    return invoke_prompt(SUMMARY_PROMPT, {"text": document}, name="summary")
+
+def generate_eligibility_questions(document):
+    """Generate yes/no eligibility questions, one per line, from the document or its notes"""
+    return invoke_prompt(ELIGIBILITY_PROMPT, {"text": document}, name="eligibility_questions")
+
+def parse_extraction(output):
+    """
+    Validate a structured extraction against EXTRACTION_FIELDS
+
+    Args:
+        output (str): The LLM output, a JSON object (code fences and surrounding text are ignored)
+
+    Returns:
+        dict: The fields that are present and well-formed; missing or malformed ones are left out
+    """
+    try:
+        extracted = json_object(output)
+    except ValueError as e:
+        print(f"Could not parse the structured extraction: {e}")
+        return {}
+
+    fields = {}
+    for key in ("title", "summary"):
+        value = extracted.get(key)
+        if isinstance(value, str) and value.strip():
+            fields[key] = value.strip()
+    if "\n" in fields.get("title", ""):
+        del fields["title"]
+    for key in ("eligibility_criteria", "questions"):
+        items = extracted.get(key)
+        if isinstance(items, list) and items and all(isinstance(item, str) and item.strip() for item in items):
+            fields[key] = [item.strip() for item in items]
+    return fields
+
+def _extraction_inputs(document, keys):
+    return {"fields": "\n".join(f'- "{key}": {EXTRACTION_FIELDS[key]}' for key in keys), "text": document}
+
+def _extraction_result(fields):
+    """Shape extracted fields like the separate prompts' results"""
+    return {
+        'summary_title': fields['title'],
+        'summary_original': fields['summary'],
+        'eligibility_questions_original': "\n".join(fields['questions']),
+        'eligibility_criteria': fields.get('eligibility_criteria', [])
+    }
+
+def extract_scheme(document, text):
+    """
+    Generate the title, summary, eligibility criteria and questions in one structured call
+
+    Fields missing from the output, or malformed, are asked for again in one call for just
+    those fields; the title, summary or questions still missing after that come from their
+    own prompts, and criteria still missing are left empty.
+
+    Args:
+        document (str): The document, or its notes from scheme_digest.digest()
+        text (str): The extracted document text, whose opening section a title fallback reads
+
+    Returns:
+        dict: summary_title, summary_original, eligibility_questions_original (one per line)
+        and eligibility_criteria (a list)
+    """
+    fields = parse_extraction(invoke_prompt(EXTRACTION_PROMPT, _extraction_inputs(document, EXTRACTION_FIELDS), name="scheme_extraction"))
+    missing = [key for key in EXTRACTION_FIELDS if key not in fields]
+    if missing:
+        print(f"Structured extraction is missing {', '.join(missing)}, asking for them again")
+        retried = parse_extraction(invoke_prompt(EXTRACTION_PROMPT, _extraction_inputs(document, missing), name="scheme_extraction"))
+        fields.update({key: retried[key] for key in missing if key in retried})
+
+    if 'title' not in fields:
+        fields['title'] = extract_title(text)
+    if 'summary' not in fields:
+        fields['summary'] = summarize_scheme(document)
+    if 'questions' not in fields:
+        fields['questions'] = split_questions(generate_eligibility_questions(document))
+    return _extraction_result(fields)
+
+def save_audio_file(audio_bytes, filename):
+    """Write generated audio into the static temp audio directory and return its path"""
+    os.makedirs(TEMP_AUDIO_DIR, exist_ok=True)
+    temp_file = os.path.join(TEMP_AUDIO_DIR, filename)
+    audio_bytes.seek(0)
+    with open(temp_file, 'wb') as f:
+        f.write(audio_bytes.read())
+    return temp_file
+
+def process_scheme(text, language_code, on_stage=None):
+    """
+    Run the title -> summary -> questions -> translation -> audio chain
+
+    Args:
+        text (str): Extracted document text
+        language_code (str): Language to translate the results into
+        on_stage (callable): Called as on_stage(stage, result) after each stage (default: None)
+
+    Returns:
+        dict: Title, summaries, questions and the generated audio file name
+    """
+    result = {'raw': text, 'language_code': language_code}
+
+    def complete(stage):
+        if on_stage:
+            on_stage(stage, result)
+
+    # Long documents are condensed section by section, once for every prompt
+    document = scheme_digest.digest(text)
+
+    if SCHEME_EXTRACTION_MODE == "single":
+        result.update(extract_scheme(document, text))
+        complete("title_ready")
+        complete("summary_ready")
+        complete("questions_ready")
+    else:
+        result['summary_title'] = extract_title(text)
+        complete("title_ready")
+
+        result['summary_original'] = summarize_scheme(document)
+        complete("summary_ready")
+
+        result['eligibility_questions_original'] = generate_eligibility_questions(document)
+        complete("questions_ready")
+
+    # Translate summary and eligibility questions if not English
+    result['summary'] = translation_utils.translate(result['summary_original'], language_code)
+    result['eligibility_questions'] = translation_utils.translate(result['eligibility_questions_original'], language_code, kind="questions")
+    complete("translation_ready")
+
+    # Generate audio for the (translated) summary
+    result['audio_file'] = _generate_audio_file(result)
+    complete("audio_ready")
+
+    return result
+
+def _generate_audio_file(result):
+    """Generate audio for the displayed summary and save it, returning the file name"""
+    try:
+        audio_bytes, _ = audio_utils.generate_audio(result['summary'], result['language_code'])
+    except Exception as e:
+        raise PipelineError(f'Error generating audio: {e}', 500)
+    if not audio_bytes:
+        raise PipelineError('Failed to generate audio', 500)
+
+    timestamp = int(time.time())
+    filename = f"scheme_{result['summary_title'].lower().replace(' ', '_')}_{timestamp}.mp3"
+    try:
+        save_audio_file(audio_bytes, filename)
+    except Exception as e:
+        raise PipelineError(f'Error generating audio: {e}', 500)
+    return filename
+
+def format_responses(questions, responses):
+    """Format eligibility questions and Yes/No responses for the eligibility prompt"""
+    return "\n".join(
+        [f"Q: {questions[i]}\nA: {responses[i]}" for i in range(len(questions))]
+    )
+
+def is_eligible_result(eligibility_result):
+    """Determine from the LLM verdict whether the farmer is eligible"""
+    return eligibility_result.upper().startswith("ELIGIBLE:") and not eligibility_result.upper().startswith("NOT ELIGIBLE:")
+
+def check_eligibility(questions, responses):
+    """Ask the LLM for an eligibility verdict starting with ELIGIBLE: or NOT ELIGIBLE:"""
+    return invoke_prompt(ELIGIBILITY_CHECK_PROMPT, {"responses": format_responses(questions, responses)}, name="eligibility")
+
+def split_questions(eligibility_questions):
+    """Split newline separated eligibility questions into a list"""
+    return [q.strip() for q in eligibility_questions.strip().split("\n") if q.strip()]
+
+def _numbered(questions):
+    return "\n".join(f"{i + 1}. {q}" for i, q in enumerate(questions))
+
+def compile_eligibility_rules(questions, text):
+    """
+    Compile a scheme's eligibility questions into a rule set (see eligibility_rules.py)
+
+    Args:
+        questions (list): English eligibility questions
+        text (str): Scheme document text the questions were generated from
+
+    Returns:
+        dict: The rule set, or None if the LLM's output is not a valid one
+    """
+    output = invoke_prompt(ELIGIBILITY_RULES_PROMPT, {"text": scheme_digest.digest(text), "questions": _numbered(questions)}, name="eligibility_rules")
+    try:
+        return eligibility_rules.parse(output, questions)
+    except ValueError as e:
+        print(f"Could not compile eligibility rules: {e}")
+        return None
+
+async def acompile_eligibility_rules(questions, text):
+    """Async variant of compile_eligibility_rules()"""
+    output = await ainvoke_prompt(ELIGIBILITY_RULES_PROMPT, {"text": await scheme_digest.adigest(text), "questions": _numbered(questions)}, name="eligibility_rules")
+    try:
+        return eligibility_rules.parse(output, questions)
+    except ValueError as e:
+        print(f"Could not compile eligibility rules: {e}")
+        return None
+
+def _stored_rules(scheme_id):
+    """Return (scheme, its stored rule set or None), or (None, None) for an unknown scheme"""
+    scheme = db_utils.get_scheme_by_id(scheme_id)
+    if not scheme:
+        return None, None
+    return scheme, eligibility_rules.loads(scheme.get('eligibility_rules'))
+
+def scheme_rules(scheme_id):
+    """Return a stored scheme's eligibility rule set, compiling and storing it the first time, or None"""
+    scheme, rules = _stored_rules(scheme_id)
+    if scheme and rules is None and scheme['eligibility_criteria']:
+        rules = compile_eligibility_rules(split_questions(scheme['eligibility_criteria']), scheme['document_text'])
+        if rules is not None:
+            db_utils.save_scheme_rules(scheme['id'], eligibility_rules.dumps(rules))
+    return rules
+
+async def ascheme_rules(scheme_id):
+    """Async variant of scheme_rules(), reading and writing the database in a worker thread"""
+    scheme, rules = await asyncio.to_thread(_stored_rules, scheme_id)
+    if scheme and rules is None and scheme['eligibility_criteria']:
+        rules = await acompile_eligibility_rules(split_questions(scheme['eligibility_criteria']), scheme['document_text'])
+        if rules is not None:
+            await asyncio.to_thread(db_utils.save_scheme_rules, scheme['id'], eligibility_rules.dumps(rules))
+    return rules
+
+def applicable_rules(rules, questions, responses):
+    """
+    Return the rule set if it can judge these answers, else None
+
+    The rules only fit answers to the questions they were compiled from, in the same order
+    (compared normalised, see eligibility_cache.normalize_question), so a scheme whose questions
+    were edited since is judged by the LLM instead of by stale rules.
+    """
+    if rules is None or len(rules['questions']) != len(responses) or len(questions) != len(responses):
+        return None
+    compiled = [eligibility_cache.normalize_question(q) for q in rules['questions']]
+    return rules if compiled == [eligibility_cache.normalize_question(q) for q in questions] else None
+
+def verdict_label(is_eligible):
+    """The prefix eligibility verdicts start with"""
+    return "ELIGIBLE: " if is_eligible else "NOT ELIGIBLE: "
+
+def _explanation_inputs(rules, responses, is_eligible):
+    return {"responses": format_responses(rules['questions'], responses), "verdict": verdict_label(is_eligible).rstrip(": ")}
+
+def rule_verdict(rules, responses, explain=False):
+    """
+    Judge answers against a compiled rule set
+
+    Args:
+        rules (dict): The scheme's rule set
+        responses (list): "Yes" or "No" for each of its questions
+        explain (bool): Have the LLM explain the verdict instead of listing the unmet criteria (default: False)
+
+    Returns:
+        tuple: (is_eligible, English verdict starting with ELIGIBLE: or NOT ELIGIBLE:)
+    """
+    is_eligible, unmet = eligibility_rules.evaluate(rules, responses)
+    if not explain:
+        return is_eligible, eligibility_rules.describe(rules, is_eligible, unmet)
+    explanation = invoke_prompt(ELIGIBILITY_EXPLANATION_PROMPT, _explanation_inputs(rules, responses, is_eligible), name="eligibility_explanation")
+    return is_eligible, verdict_label(is_eligible) + explanation.strip()
+
+async def arule_verdict(rules, responses, explain=False):
+    """Async variant of rule_verdict()"""
+    is_eligible, unmet = eligibility_rules.evaluate(rules, responses)
+    if not explain:
+        return is_eligible, eligibility_rules.describe(rules, is_eligible, unmet)
+    explanation = await ainvoke_prompt(ELIGIBILITY_EXPLANATION_PROMPT, _explanation_inputs(rules, responses, is_eligible), name="eligibility_explanation")
+    return is_eligible, verdict_label(is_eligible) + explanation.strip()
+
+def stream_explanation(rules, responses, is_eligible):
+    """Stream the LLM's explanation of a rule verdict, starting with the verdict label"""
+    yield verdict_label(is_eligible)
+    yield from stream_prompt(ELIGIBILITY_EXPLANATION_PROMPT, _explanation_inputs(rules, responses, is_eligible), name="eligibility_explanation")
+
+async def astream_explanation(rules, responses, is_eligible):
+    """Async variant of stream_explanation()"""
+    yield verdict_label(is_eligible)
+    async for chunk in astream_prompt(ELIGIBILITY_EXPLANATION_PROMPT, _explanation_inputs(rules, responses, is_eligible), name="eligibility_explanation"):
+        yield chunk
+
+def cached_verdict_text(verdict, language_code):
+    """Return a cached verdict's text in a language, or None if it has not been translated into it yet"""
+    return verdict['result'] if language_code == "en" else verdict['translations'].get(language_code)
+
+def save_verdict_translation(key, verdict, language_code, display_result):
+    """Cache the translation of a verdict, unless translating fell back to the English text"""
+    if language_code != "en" and display_result != verdict['result']:
+        eligibility_cache.put_translation(key, language_code, display_result)
+
+def judge_eligibility(questions, responses, language_code, scheme_id=None, explain=False):
+    """
+    Get the eligibility verdict for a set of answers in the user's language
+
+    For a stored scheme the answers are judged by its compiled rule set, the LLM only writing
+    an explanation when asked to. Otherwise (or when the rules don't fit the answers) the LLM
+    judges, and a combination of answers already judged for the same question set is answered
+    from eligibility_cache without calling the LLM, and so is its translation.
+
+    Args:
+        questions (list): Eligibility questions
+        responses (list): "Yes" or "No" for each question
+        language_code (str): Language to give the verdict in
+        scheme_id (int): Stored scheme the questions belong to (default: None)
+        explain (bool): Whether to have the LLM explain a rule verdict (default: False)
+
+    Returns:
+        tuple: (is_eligible, verdict text in the requested language)
+    """
+    rules = applicable_rules(scheme_rules(scheme_id), questions, responses) if scheme_id else None
+    if rules is not None:
+        is_eligible, eligibility_result = rule_verdict(rules, responses, explain)
+        return is_eligible, translation_utils.translate(eligibility_result, language_code)
+
+    key = eligibility_cache.verdict_key(questions, responses)
+    verdict = eligibility_cache.get(key)
+    if verdict is None:
+        eligibility_result = check_eligibility(questions, responses)
+        verdict = eligibility_cache.put(key, is_eligible_result(eligibility_result), eligibility_result)
+
+    display_result = cached_verdict_text(verdict, language_code)
+    if display_result is None:
+        display_result = translation_utils.translate(verdict['result'], language_code)
+        save_verdict_translation(key, verdict, language_code, display_result)
+    return verdict['is_eligible'], display_result
+
+def stream_scheme(text, language_code):
+    """
+    Run the upload chain like process_scheme(), streaming the summary as it is generated
+
+    The summary is generated first so its first tokens reach the user as soon as possible.
+
+    Args:
+        text (str): Extracted document text
+        language_code (str): Language to translate the results into
+
+    Yields:
+        tuple: ("token", field, text) for summary chunks, ("stage", stage, result) after each
+        stage, and finally ("result", None, result)
+    """
+    result = {'raw': text, 'language_code': language_code}
+    document = scheme_digest.digest(text)
+
+    # English summary; for English it is also what the user reads
+    summary_field = 'summary' if language_code == "en" else 'summary_original'
+    if SCHEME_EXTRACTION_MODE == "single":
+        # The structured call can't be streamed, so the summary arrives as one token
+        result.update(extract_scheme(document, text))
+        yield ("token", summary_field, result['summary_original'])
+        yield ("stage", "summary_ready", result)
+        yield ("stage", "title_ready", result)
+        yield ("stage", "questions_ready", result)
+    else:
+        chunks = []
+        for chunk in stream_prompt(SUMMARY_PROMPT, {"text": document}, name="summary"):
+            chunks.append(chunk)
+            yield ("token", summary_field, chunk)
+        result['summary_original'] = "".join(chunks)
+        yield ("stage", "summary_ready", result)
+
+        result['summary_title'] = extract_title(text)
+        yield ("stage", "title_ready", result)
+
+        result['eligibility_questions_original'] = generate_eligibility_questions(document)
+        yield ("stage", "questions_ready", result)
+
+    if language_code == "en":
+        result['summary'] = result['summary_original']
+    else:
+        chunks = []
+        for chunk in translation_utils.stream_translate(result['summary_original'], language_code):
+            chunks.append(chunk)
+            yield ("token", 'summary', chunk)
+        result['summary'] = "".join(chunks)
+    result['eligibility_questions'] = translation_utils.translate(result['eligibility_questions_original'], language_code, kind="questions")
+    yield ("stage", "translation_ready", result)
+
+    result['audio_file'] = _generate_audio_file(result)
+    yield ("stage", "audio_ready", result)
+
+    yield ("result", None, result)
+
+
+# Async variants, used by the ASGI app (asgi.py). LLM calls are awaited instead of
+# holding a thread; PDF parsing and gTTS have no async API and run in worker threads.
+
+async def aextract_pdf_text(file):
+    """Async variant of extract_pdf_text()"""
+    return await asyncio.to_thread(extract_pdf_text, file)
+
+async def aprocess_scheme(text, language_code):
+    """
+    Async variant of process_scheme()
+
+    Title, summary and questions don't depend on each other, so they are generated
+    concurrently, as are the two translations.
+    """
+    result = {'raw': text, 'language_code': language_code}
+    document = await scheme_digest.adigest(text)
+
+    if SCHEME_EXTRACTION_MODE == "single":
+        result.update(await aextract_scheme(document, text))
+    else:
+        result['summary_title'], result['summary_original'], result['eligibility_questions_original'] = await asyncio.gather(
+            ainvoke_prompt(TITLE_PROMPT, {"text": scheme_digest.opening(text)}, name="title"),
+            ainvoke_prompt(SUMMARY_PROMPT, {"text": document}, name="summary"),
+            ainvoke_prompt(ELIGIBILITY_PROMPT, {"text": document}, name="eligibility_questions")
+        )
+        result['summary_title'] = result['summary_title'].strip()
+
+    result['summary'], result['eligibility_questions'] = await asyncio.gather(
+        translation_utils.atranslate(result['summary_original'], language_code),
+        translation_utils.atranslate(result['eligibility_questions_original'], language_code, kind="questions")
+    )
+
+    result['audio_file'] = await asyncio.to_thread(_generate_audio_file, result)
+    return result
+
+async def aextract_scheme(document, text):
+    """Async variant of extract_scheme(); the prompts for fields still missing after the retry run concurrently"""
+    fields = parse_extraction(await ainvoke_prompt(EXTRACTION_PROMPT, _extraction_inputs(document, EXTRACTION_FIELDS), name="scheme_extraction"))
+    missing = [key for key in EXTRACTION_FIELDS if key not in fields]
+    if missing:
+        print(f"Structured extraction is missing {', '.join(missing)}, asking for them again")
+        retried = parse_extraction(await ainvoke_prompt(EXTRACTION_PROMPT, _extraction_inputs(document, missing), name="scheme_extraction"))
+        fields.update({key: retried[key] for key in missing if key in retried})
+
+    fallbacks = {
+        'title': (TITLE_PROMPT, {"text": scheme_digest.opening(text)}, "title"),
+        'summary': (SUMMARY_PROMPT, {"text": document}, "summary"),
+        'questions': (ELIGIBILITY_PROMPT, {"text": document}, "eligibility_questions")
+    }
+    missing = [key for key in fallbacks if key not in fields]
+    outputs = await asyncio.gather(*(ainvoke_prompt(*fallbacks[key][:2], name=fallbacks[key][2]) for key in missing))
+    for key, output in zip(missing, outputs):
+        fields[key] = split_questions(output) if key == 'questions' else output.strip() if key == 'title' else output
+    return _extraction_result(fields)
+
+async def acheck_eligibility(questions, responses):
+    """Async variant of check_eligibility()"""
+    return await ainvoke_prompt(ELIGIBILITY_CHECK_PROMPT, {"responses": format_responses(questions, responses)}, name="eligibility")
+
+async def ajudge_eligibility(questions, responses, language_code, scheme_id=None, explain=False):
+    """Async variant of judge_eligibility(); the verdict cache is read and written in a worker thread"""
+    rules = applicable_rules(await ascheme_rules(scheme_id), questions, responses) if scheme_id else None
+    if rules is not None:
+        is_eligible, eligibility_result = await arule_verdict(rules, responses, explain)
+        return is_eligible, await translation_utils.atranslate(eligibility_result, language_code)
+
+    key = eligibility_cache.verdict_key(questions, responses)
+    verdict = await asyncio.to_thread(eligibility_cache.get, key)
+    if verdict is None:
+        eligibility_result = await acheck_eligibility(questions, responses)
+        verdict = await asyncio.to_thread(eligibility_cache.put, key, is_eligible_result(eligibility_result), eligibility_result)
+
+    display_result = cached_verdict_text(verdict, language_code)
+    if display_result is None:
+        display_result = await translation_utils.atranslate(verdict['result'], language_code)
+        await asyncio.to_thread(save_verdict_translation, key, verdict, language_code, display_result)
+    return verdict['is_eligible'], display_result
+
+async def astream_scheme(text, language_code):
+    """
+    Async variant of stream_scheme(), yielding the same events
+
+    Title and questions are generated concurrently while the summary streams.
+    """
+    result = {'raw': text, 'language_code': language_code}
+    document = await scheme_digest.adigest(text)
+    summary_field = 'summary' if language_code == "en" else 'summary_original'
+    if SCHEME_EXTRACTION_MODE == "single":
+        result.update(await aextract_scheme(document, text))
+        yield ("token", summary_field, result['summary_original'])
+        yield ("stage", "summary_ready", result)
+        yield ("stage", "title_ready", result)
+        yield ("stage", "questions_ready", result)
+    else:
+        title_task = asyncio.create_task(ainvoke_prompt(TITLE_PROMPT, {"text": scheme_digest.opening(text)}, name="title"))
+        questions_task = asyncio.create_task(ainvoke_prompt(ELIGIBILITY_PROMPT, {"text": document}, name="eligibility_questions"))
+
+        try:
+            chunks = []
+            async for chunk in astream_prompt(SUMMARY_PROMPT, {"text": document}, name="summary"):
+                chunks.append(chunk)
+                yield ("token", summary_field, chunk)
+            result['summary_original'] = "".join(chunks)
+            yield ("stage", "summary_ready", result)
+
+            result['summary_title'] = (await title_task).strip()
+            yield ("stage", "title_ready", result)
+
+            result['eligibility_questions_original'] = await questions_task
+            yield ("stage", "questions_ready", result)
+        finally:
+            # Don't leave the side calls running if the client went away
+            title_task.cancel()
+            questions_task.cancel()
+
+    questions_translation = asyncio.create_task(translation_utils.atranslate(
+        result['eligibility_questions_original'], language_code, kind="questions"))
+    try:
+        if language_code == "en":
+            result['summary'] = result['summary_original']
+        else:
+            chunks = []
+            async for chunk in translation_utils.astream_translate(result['summary_original'], language_code):
+                chunks.append(chunk)
+                yield ("token", 'summary', chunk)
+            result['summary'] = "".join(chunks)
+        result['eligibility_questions'] = await questions_translation
+    finally:
+        questions_translation.cancel()
+    yield ("stage", "translation_ready", result)
+
+    result['audio_file'] = await asyncio.to_thread(_generate_audio_file, result)
+    yield ("stage", "audio_ready", result)
+
+    yield ("result", None, result)
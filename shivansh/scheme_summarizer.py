@@ -18,6 +18,7 @@ import base64
 import re
 import db_utils
 import audio_utils
+import scheme_digest
 
 load_dotenv()
 
@@ -166,7 +167,7 @@ with tab1:
         # Extract scheme title
         title_prompt = ChatPromptTemplate.from_messages([
             ("system", "You are an expert in government agricultural schemes. Extract the exact title of the scheme from the provided document. Return ONLY the title as a single line, without any additional text or explanation."),
-            ("human", f"Extract the title from this document: {text[:5000]}")
+            ("human", f"Extract the title from this document: {scheme_digest.opening(text)}")
         ])
         
         title_chain = title_prompt | llm
@@ -179,9 +180,12 @@ with tab1:
         
         # Analyze the scheme
         with st.spinner("Analyzing the scheme..."):
+            # Long documents are condensed section by section instead of cut at 15 000 characters
+            document = scheme_digest.digest(text)
+            
             summary_prompt = ChatPromptTemplate.from_messages([
                 ("system", "You are an expert in government agricultural schemes. Your task is to analyze the provided government scheme document and create a simple, easy-to-understand summary for farmers. Focus on the key benefits, eligibility criteria, and application process. Use simple language that a person with basic education can understand."),
-                ("human", f"Please analyze this government agricultural scheme document and provide a summary in simple language: {text[:15000]}")
+                ("human", f"Please analyze this government agricultural scheme document and provide a summary in simple language: {document}")
             ])
             
             summary_chain = summary_prompt | llm
@@ -233,7 +237,7 @@ with tab1:
         with st.spinner("Analyzing eligibility criteria..."):
             eligibility_prompt = ChatPromptTemplate.from_messages([
                 ("system", "You are an expert in government agricultural schemes. Extract the key eligibility criteria from the provided document. Then generate 5-7 simple yes/no questions that can determine if a farmer is eligible for the scheme. Return ONLY the questions, one per line, without any numbering or additional text."),
-                ("human", f"Extract eligibility criteria questions from this scheme document: {text[:15000]}")
+                ("human", f"Extract eligibility criteria questions from this scheme document: {document}")
             ])
             
             eligibility_chain = eligibility_prompt | llm
@@ -0,0 +1,22 @@
+"""
+Single-flight coalescing of identical concurrent calls
+
+When many requests need the same thing at once (a scheme link shared in a WhatsApp group
+sends dozens of farmers to the same translation and audio within seconds), the first call
+for a key runs and the others wait for it and share its result, or its error, instead of
+each launching its own translation, gTTS job or LLM call.
+
+    text, coalesced = singleflight.do("translation", key, compute, lookup=read_from_cache)
+
+Used by translation_utils (translations), audio_utils (gTTS) and llm_gateway (identical LLM
+calls). With SINGLEFLIGHT_LEASES=true, calls passing a lookup are also coalesced across worker
+processes through leases in the flight_leases table of farmwise.db.
+
+The implementation is farmwise_common.singleflight; this module points its leases at the API's
+database.
+"""
+import db_utils
+from farmwise_common import singleflight as _singleflight
+from farmwise_common.singleflight import ado, do
+
+_singleflight.configure(db_utils.get_connection)
@@ -0,0 +1,21 @@
+"""
+One-off startup work, kept out of module imports so that importing the service
+(and restarting a worker) stays fast. Check the import cost with import_budget.py.
+"""
+import audio_utils
+import db_utils
+
+def run(warm_clients=False):
+    """
+    Prepare the service before it starts handling requests
+
+    Args:
+        warm_clients (bool): Also create the Gemini client now, e.g. in a preloading
+            gunicorn master so forked workers don't each create their own (default: False)
+    """
+    db_utils.init_db()
+    audio_utils.clean_cache()
+
+    if warm_clients:
+        import llm_utils
+        llm_utils.get_llm()
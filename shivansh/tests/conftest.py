@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+# The service's modules import each other by name, as when it runs from its own directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Answer every LLM and TTS call from fakes.py without delays, and keep the tests' database,
+# audio and traces out of the service directory
+_workdir = tempfile.mkdtemp(prefix="farmwise-tests-")
+os.environ.setdefault("FAKE_PROVIDERS", "all")
+for name in ("FAKE_LLM_LATENCY_MS", "FAKE_LLM_JITTER_MS", "FAKE_LLM_CHUNK_MS", "FAKE_TTS_LATENCY_MS"):
+    os.environ.setdefault(name, "0")
+os.environ.setdefault("LLM_CACHE_BYPASS", "all")
+os.environ.setdefault("PREWARM_ENABLED", "false")
+os.environ.setdefault("AUDIO_CACHE_DIR", os.path.join(_workdir, "audio_cache"))
+os.environ.setdefault("TRACE_EXPORT_PATH", os.path.join(_workdir, "traces", "traces.jsonl"))
+
+import db_utils
+
+db_utils.DB_PATH = os.path.join(_workdir, "farmwise.db")
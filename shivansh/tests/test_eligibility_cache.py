@@ -0,0 +1,85 @@
+import asyncio
+import uuid
+import pytest
+import eligibility_cache
+import scheme_pipeline
+from eligibility_cache import verdict_key
+
+@pytest.fixture
+def questions():
+    # A question of its own per test, so verdicts cached by other tests don't hit
+    return [f"Do you grow crop {uuid.uuid4().hex}?", "Do you own agricultural land?", "Do you have an Aadhaar card?"]
+
+def test_normalize_question():
+    assert eligibility_cache.normalize_question("  2. Do you own  Agricultural land? ") == "do you own agricultural land"
+    assert eligibility_cache.normalize_question("Q3) do you own agricultural land.") == "do you own agricultural land"
+    assert eligibility_cache.normalize_question("- Do you own agricultural land") == "do you own agricultural land"
+
+def test_reordered_questions_share_a_key(questions):
+    responses = ["Yes", "No", "Yes"]
+    reordered = [questions[2], questions[0], questions[1]]
+    assert verdict_key(reordered, ["Yes", "Yes", "No"]) == verdict_key(questions, responses)
+
+def test_reformatted_questions_share_a_key(questions):
+    reformatted = [f"{i + 1}. {q.upper().rstrip('?')}  " for i, q in enumerate(questions)]
+    assert verdict_key(reformatted, ["Yes", "No", "Yes"]) == verdict_key(questions, ["Yes", "No", "Yes"])
+
+def test_changed_answers_or_questions_miss(questions):
+    question_hash, mask = verdict_key(questions, ["Yes", "No", "Yes"])
+    changed_hash, changed_mask = verdict_key(questions, ["Yes", "Yes", "Yes"])
+    assert changed_hash == question_hash and changed_mask != mask
+    assert verdict_key(questions, ["No", "No", "No"]) == (question_hash, 0)
+    assert verdict_key(questions[:2] + ["Do you pay income tax?"], ["Yes", "No", "Yes"])[0] != question_hash
+
+def test_stored_verdict_round_trips(questions):
+    key = verdict_key(questions, ["Yes", "No", "Yes"])
+    assert eligibility_cache.get(key) is None
+    stored = eligibility_cache.put(key, False, "NOT ELIGIBLE: You need agricultural land.")
+    assert eligibility_cache.get(key) == stored == {"is_eligible": False, "result": "NOT ELIGIBLE: You need agricultural land.", "translations": {}}
+    eligibility_cache.put_translation(key, "hi", "पात्र नहीं")
+    assert eligibility_cache.get(key)["translations"] == {"hi": "पात्र नहीं"}
+    assert eligibility_cache.get(verdict_key(questions, ["Yes", "Yes", "Yes"])) is None
+
+def test_expired_verdicts_miss(questions, monkeypatch):
+    key = verdict_key(questions, ["Yes", "Yes", "Yes"])
+    eligibility_cache.put(key, True, "ELIGIBLE: You qualify.")
+    monkeypatch.setattr(eligibility_cache, "ELIGIBILITY_CACHE_TTL_S", -1)
+    assert eligibility_cache.get(key) is None
+
+def test_disabled_cache_stores_nothing(questions, monkeypatch):
+    key = verdict_key(questions, ["No", "No", "Yes"])
+    monkeypatch.setattr(eligibility_cache, "ELIGIBILITY_CACHE_ENABLED", False)
+    assert eligibility_cache.put(key, True, "ELIGIBLE: You qualify.")["result"] == "ELIGIBLE: You qualify."
+    monkeypatch.setattr(eligibility_cache, "ELIGIBILITY_CACHE_ENABLED", True)
+    assert eligibility_cache.get(key) is None
+
+def test_repeated_submission_skips_the_llm(questions, monkeypatch):
+    checks = []
+    check_eligibility = scheme_pipeline.check_eligibility
+    monkeypatch.setattr(scheme_pipeline, "check_eligibility", lambda *args: checks.append(args) or check_eligibility(*args))
+
+    first = scheme_pipeline.judge_eligibility(questions, ["Yes", "Yes", "Yes"], "en")
+    reordered = scheme_pipeline.judge_eligibility(list(reversed(questions)), ["Yes", "Yes", "Yes"], "en")
+    assert first == reordered
+    assert first[0] is True and first[1].startswith("ELIGIBLE: ")
+    assert len(checks) == 1
+    scheme_pipeline.judge_eligibility(questions, ["Yes", "No", "Yes"], "en")
+    assert len(checks) == 2
+
+def test_async_repeated_submission_skips_the_llm(questions, monkeypatch):
+    checks = []
+    acheck_eligibility = scheme_pipeline.acheck_eligibility
+
+    async def check(*args):
+        checks.append(args)
+        return await acheck_eligibility(*args)
+
+    monkeypatch.setattr(scheme_pipeline, "acheck_eligibility", check)
+
+    async def judge_twice():
+        first = await scheme_pipeline.ajudge_eligibility(questions, ["Yes", "Yes", "Yes"], "hi")
+        return first, await scheme_pipeline.ajudge_eligibility(list(reversed(questions)), ["Yes", "Yes", "Yes"], "hi")
+
+    first, second = asyncio.run(judge_twice())
+    assert first == second and first[0] is True
+    assert len(checks) == 1
@@ -0,0 +1,127 @@
+import asyncio
+import pytest
+import eligibility_matrix
+import eligibility_rules
+from eligibility_matrix import question_id
+
+LAND = "Do you own agricultural land?"
+SMALL = "Is your land holding 2 hectares or less?"
+AADHAAR = "Do you have an Aadhaar card?"
+TAX = "Do you pay income tax?"
+
+def scheme(scheme_id, questions, clauses=None):
+    """A row as db_utils.get_all_schemes() returns it, with a rule set if clauses are given"""
+    rules = {"questions": questions, "clauses": clauses} if clauses else None
+    return {
+        "id": scheme_id,
+        "title": f"Farmer support {scheme_id}",
+        "eligibility_criteria": "\n".join(questions),
+        "eligibility_rules": eligibility_rules.dumps(rules) if rules else None
+    }
+
+SCHEMES = [
+    # Land and Aadhaar must be Yes
+    scheme(1, [LAND, AADHAAR], [[[0, "Yes"]], [[1, "Yes"]]]),
+    # Land must be Yes and income tax No, or a small holding
+    scheme(2, ["do you own agricultural land", TAX, SMALL], [[[0, "Yes"]], [[1, "No"], [2, "Yes"]]]),
+    # No rules: judged by the LLM
+    scheme(3, [AADHAAR, TAX]),
+    scheme(4, [SMALL])
+]
+
+def names(calls):
+    return [name for name, _ in calls]
+
+def ids(*questions):
+    return [question_id(q) for q in questions]
+
+def answered(**answers):
+    names = {"land": LAND, "small": SMALL, "aadhaar": AADHAAR, "tax": TAX}
+    return {question_id(names[name]): answer for name, answer in answers.items()}
+
+@pytest.fixture
+def matrix():
+    return eligibility_matrix.build(SCHEMES)
+
+@pytest.fixture
+def prompts(monkeypatch):
+    """Answer the LLM from fakes.py, recording the prompt type and inputs of each call"""
+    calls = []
+    invoke_prompt, ainvoke_prompt = eligibility_matrix.invoke_prompt, eligibility_matrix.ainvoke_prompt
+
+    def invoke(prompt, inputs, name=None):
+        calls.append((name, inputs))
+        return invoke_prompt(prompt, inputs, name=name)
+
+    async def ainvoke(prompt, inputs, name=None):
+        calls.append((name, inputs))
+        return await ainvoke_prompt(prompt, inputs, name=name)
+
+    monkeypatch.setattr(eligibility_matrix, "invoke_prompt", invoke)
+    monkeypatch.setattr(eligibility_matrix, "ainvoke_prompt", ainvoke)
+    monkeypatch.setattr(eligibility_matrix.db_utils, "get_all_schemes", lambda: SCHEMES)
+    return calls
+
+def test_build_deduplicates_questions_across_schemes(matrix):
+    assert list(matrix["questions"]) == ids(LAND, AADHAAR, TAX, SMALL)
+    assert matrix["askers"] == dict(zip(ids(LAND, AADHAAR, TAX, SMALL), [2, 2, 2, 2]))
+    assert matrix["schemes"][1]["question_ids"] == ids(LAND, TAX, SMALL)
+    # Four clauses from the two schemes with rules, over the four distinct questions
+    assert matrix["yes"].shape == matrix["no"].shape == (4, 4)
+    assert matrix["clause_scheme"].tolist() == [0, 0, 1, 1]
+    assert matrix["yes"][3].tolist() == [False, False, False, True]
+    assert matrix["no"][3].tolist() == [False, False, True, False]
+
+def test_rules_judge_eligible_and_not_eligible(matrix):
+    results = eligibility_matrix.evaluate_rules(matrix, answered(land="Yes", aadhaar="Yes", tax="Yes", small="No"))
+    assert results == {0: ("eligible", 2, 2, []), 1: ("not_eligible", 1, 2, [])}
+
+def test_either_condition_of_a_clause_meets_it(matrix):
+    results = eligibility_matrix.evaluate_rules(matrix, answered(land="Yes", tax="Yes", small="Yes"))
+    assert results[1] == ("eligible", 2, 2, [])
+
+def test_unknown_answers_leave_schemes_needing_them(matrix):
+    results = eligibility_matrix.evaluate_rules(matrix, answered(land="Yes", tax="Yes"))
+    assert results[0] == ("needs_answers", 1, 2, ids(AADHAAR))
+    assert results[1] == ("needs_answers", 1, 2, ids(SMALL))
+    # A failed clause decides the verdict whatever the unknown answers are
+    assert eligibility_matrix.evaluate_rules(matrix, answered(land="No"))[0] == ("not_eligible", 0, 2, [])
+
+def test_no_answers_at_all(matrix):
+    results = eligibility_matrix.evaluate_rules(matrix, {})
+    assert results == {0: ("needs_answers", 0, 2, ids(LAND, AADHAAR)), 1: ("needs_answers", 0, 2, ids(LAND, TAX, SMALL))}
+
+def test_schemes_without_rules_are_judged_by_the_llm(prompts):
+    report = eligibility_matrix.assess(answered(land="Yes", aadhaar="Yes", tax="No", small="No"))
+    assert names(prompts) == ["eligibility_group"]
+    assert [(s["scheme_id"], s["method"]) for s in report["eligible"]] == [(2, "rules"), (1, "rules")]
+    assert [(s["scheme_id"], s["method"]) for s in report["not_eligible"]] == [(4, "llm"), (3, "llm")]
+
+def test_unknown_answers_to_the_llm_need_answers(prompts):
+    report = eligibility_matrix.assess(answered(land="Yes", aadhaar="Yes", small="Yes"))
+    assert [(s["scheme_id"], s["missing_questions"]) for s in report["needs_answers"]] == [(3, ids(TAX))]
+    assert {s["scheme_id"] for s in report["eligible"]} == {1, 2, 4}
+    assert report["questions"] == [{"id": question_id(TAX), "question": TAX}]
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_unanswered_schemes_skip_the_llm(prompts, asynchronous):
+    answers = answered(land="Yes", aadhaar="Yes")
+    report = asyncio.run(eligibility_matrix.aassess(answers)) if asynchronous else eligibility_matrix.assess(answers)
+    # Scheme 3 has an answer for the LLM to judge with, scheme 4 has none
+    assert names(prompts) == ["eligibility_group"]
+    assert "Farmer support 3" in prompts[0][1]["schemes"]
+    assert "Farmer support 4" not in prompts[0][1]["schemes"]
+    needs_answers = {s["scheme_id"]: s["missing_questions"] for s in report["needs_answers"]}
+    assert needs_answers[4] == ids(SMALL)
+    assert needs_answers[3] == ids(TAX)
+
+def test_no_llm_call_when_no_scheme_without_rules_has_answers(prompts):
+    report = eligibility_matrix.assess(answered(land="No"))
+    assert prompts == []
+    assert {s["scheme_id"] for s in report["not_eligible"]} == {1, 2}
+    assert {s["scheme_id"]: s["method"] for s in report["needs_answers"]} == {3: "llm", 4: "llm"}
+
+def test_profile_answers_the_remaining_questions(prompts):
+    report = eligibility_matrix.assess(profile={"land": "3 acres"})
+    assert names(prompts) == ["eligibility_profile", "eligibility_group"]
+    assert set(report["answers"]) == set(ids(LAND, AADHAAR, TAX, SMALL))
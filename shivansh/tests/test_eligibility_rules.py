@@ -0,0 +1,115 @@
+import asyncio
+import json
+import uuid
+import pytest
+import db_utils
+import eligibility_rules
+import scheme_pipeline
+
+QUESTIONS = ["Do you own agricultural land?", "Are you a small or marginal farmer?", "Do you pay income tax?", "Do you grow rice or wheat?"]
+
+# Q1 must be Yes, Q3 must be No, and Q2 or Q4 must be Yes
+COMPILED = json.dumps({"clauses": [
+    [{"question": 1, "answer": "Yes"}],
+    [{"question": 3, "answer": "no"}],
+    [{"question": 2, "answer": "Yes"}, {"question": 4, "answer": "Yes"}]
+]})
+
+@pytest.fixture
+def rules():
+    return eligibility_rules.parse(COMPILED, QUESTIONS)
+
+def test_parse_reads_fenced_output_into_zero_based_clauses(rules):
+    assert eligibility_rules.parse(f"Here are the rules:\n```json\n{COMPILED}\n```", QUESTIONS) == rules
+    assert rules == {"questions": QUESTIONS, "clauses": [[[0, "Yes"]], [[2, "No"]], [[1, "Yes"], [3, "Yes"]]]}
+
+@pytest.mark.parametrize("output", [
+    "no rules here",
+    '{"clauses": []}',
+    '{"clauses": [[{"question": 5, "answer": "Yes"}]]}',
+    '{"clauses": [[{"question": 1, "answer": "Maybe"}]]}',
+    '{"clauses": [[{"answer": "Yes"}]]}',
+    '["not", "an", "object"]'
+])
+def test_parse_rejects_invalid_rules(output):
+    with pytest.raises(ValueError):
+        eligibility_rules.parse(output, QUESTIONS)
+
+@pytest.mark.parametrize("responses, eligible, unmet", [
+    (["Yes", "Yes", "No", "No"], True, []),
+    (["Yes", "No", "No", "Yes"], True, []),
+    (["No", "Yes", "No", "Yes"], False, [[[0, "Yes"]]]),
+    (["Yes", "No", "Yes", "No"], False, [[[2, "No"]], [[1, "Yes"], [3, "Yes"]]])
+])
+def test_evaluate(rules, responses, eligible, unmet):
+    assert eligibility_rules.evaluate(rules, responses) == (eligible, unmet)
+
+def test_describe_lists_the_unmet_criteria(rules):
+    is_eligible, unmet = eligibility_rules.evaluate(rules, ["Yes", "No", "Yes", "No"])
+    assert eligibility_rules.describe(rules, is_eligible, unmet).splitlines() == [
+        "NOT ELIGIBLE: Your answers don't meet these eligibility criteria of this scheme:",
+        '- "Do you pay income tax?" must be No',
+        '- "Are you a small or marginal farmer?" must be Yes or "Do you grow rice or wheat?" must be Yes'
+    ]
+
+def test_stored_rules_round_trip(rules):
+    assert eligibility_rules.loads(eligibility_rules.dumps(rules)) == rules
+    assert eligibility_rules.loads(None) is None
+    assert eligibility_rules.loads("not json") is None
+
+def test_rule_verdict_without_the_llm(rules):
+    assert scheme_pipeline.rule_verdict(rules, ["Yes", "Yes", "No", "No"]) == (True, "ELIGIBLE: Your answers meet all the eligibility criteria of this scheme.")
+    is_eligible, text = scheme_pipeline.rule_verdict(rules, ["No", "Yes", "No", "No"])
+    assert not is_eligible
+    assert text.startswith("NOT ELIGIBLE: ")
+
+def test_rule_verdict_explained_keeps_the_rules_verdict(rules):
+    is_eligible, text = scheme_pipeline.rule_verdict(rules, ["No", "Yes", "No", "No"], explain=True)
+    assert not is_eligible
+    assert text.startswith("NOT ELIGIBLE: ")
+    assert "must be" not in text
+
+def test_applicable_rules_needs_an_answer_per_question(rules):
+    assert scheme_pipeline.applicable_rules(rules, QUESTIONS, ["Yes"] * 4) is rules
+    assert scheme_pipeline.applicable_rules(rules, QUESTIONS[:3], ["Yes"] * 3) is None
+    assert scheme_pipeline.applicable_rules(None, QUESTIONS, ["Yes"] * 4) is None
+
+def test_applicable_rules_need_the_questions_they_were_compiled_from(rules):
+    reformatted = [f"{i + 1}. {q.lower()}" for i, q in enumerate(QUESTIONS)]
+    assert scheme_pipeline.applicable_rules(rules, reformatted, ["Yes"] * 4) is rules
+    edited = QUESTIONS[:3] + ["Do you grow sugarcane?"]
+    assert scheme_pipeline.applicable_rules(rules, edited, ["Yes"] * 4) is None
+    assert scheme_pipeline.applicable_rules(rules, list(reversed(QUESTIONS)), ["Yes"] * 4) is None
+
+def test_edited_questions_are_judged_by_the_llm(monkeypatch):
+    scheme_id = db_utils.save_scheme(f"Scheme {uuid.uuid4().hex}", "Support for farmers", "\n".join(QUESTIONS), "Summary", "Scheme document")
+    assert scheme_pipeline.scheme_rules(scheme_id) is not None
+    checks = []
+    monkeypatch.setattr(scheme_pipeline, "check_eligibility", lambda *args: checks.append(args) or "NOT ELIGIBLE: Judged by the LLM.")
+    edited = QUESTIONS[:3] + [f"Do you grow crop {uuid.uuid4().hex}?"]
+    assert scheme_pipeline.judge_eligibility(edited, ["Yes"] * 4, "en", scheme_id) == (False, "NOT ELIGIBLE: Judged by the LLM.")
+    assert len(checks) == 1
+    assert scheme_pipeline.judge_eligibility(QUESTIONS, ["Yes"] * 4, "en", scheme_id)[1].startswith("ELIGIBLE: ")
+    assert len(checks) == 1
+
+def test_scheme_rules_are_compiled_once_and_stored(monkeypatch):
+    scheme_id = db_utils.save_scheme(f"Scheme {uuid.uuid4().hex}", "Support for farmers", "\n".join(QUESTIONS), "Summary", "Scheme document")
+    compiled = []
+    compile_eligibility_rules = scheme_pipeline.compile_eligibility_rules
+    monkeypatch.setattr(scheme_pipeline, "compile_eligibility_rules", lambda *args: compiled.append(args) or compile_eligibility_rules(*args))
+
+    rules = scheme_pipeline.scheme_rules(scheme_id)
+    assert rules == {"questions": QUESTIONS, "clauses": [[[i, "Yes"]] for i in range(len(QUESTIONS))]}
+    assert eligibility_rules.loads(db_utils.get_scheme_by_id(scheme_id)["eligibility_rules"]) == rules
+    assert scheme_pipeline.scheme_rules(scheme_id) == rules
+    assert len(compiled) == 1
+
+def test_async_scheme_rules_are_compiled_once_and_stored():
+    scheme_id = db_utils.save_scheme(f"Scheme {uuid.uuid4().hex}", "Support for farmers", "\n".join(QUESTIONS), "Summary", "Scheme document")
+    rules = asyncio.run(scheme_pipeline.ascheme_rules(scheme_id))
+    assert rules["questions"] == QUESTIONS
+    assert eligibility_rules.loads(db_utils.get_scheme_by_id(scheme_id)["eligibility_rules"]) == rules
+
+def test_scheme_rules_of_unknown_scheme():
+    assert scheme_pipeline.scheme_rules(-1) is None
+    assert asyncio.run(scheme_pipeline.ascheme_rules(-1)) is None
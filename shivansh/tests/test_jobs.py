@@ -0,0 +1,108 @@
+import time
+import pytest
+import db_utils
+import jobs
+import prewarm
+import scheme_pipeline
+
+DOCUMENT = "PM Kisan Samman Nidhi\nIncome support of Rs 6000 a year to small and marginal farmer families owning cultivable land."
+
+@pytest.fixture(autouse=True)
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheme_pipeline, "TEMP_AUDIO_DIR", str(tmp_path / "temp_audio"))
+    monkeypatch.setattr(scheme_pipeline, "extract_pdf_text", lambda file: file.read().decode("utf-8"))
+
+@pytest.fixture
+def updates(monkeypatch):
+    """Record every update of an upload job's progress"""
+    recorded = []
+    update_upload_job = db_utils.update_upload_job
+
+    def record(job_id, **fields):
+        recorded.append(fields)
+        update_upload_job(job_id, **fields)
+
+    monkeypatch.setattr(db_utils, "update_upload_job", record)
+    return recorded
+
+def run(pdf_bytes, language_code="hi"):
+    """Submit an upload and wait for its job to finish"""
+    job_id = jobs.submit_upload(pdf_bytes, language_code)
+    deadline = time.time() + 10
+    while jobs.get_job(job_id)["status"] in ("queued", "running") and time.time() < deadline:
+        time.sleep(0.02)
+    return jobs.get_job(job_id)
+
+def test_job_moves_through_every_stage_to_completed(updates):
+    job = run(DOCUMENT.encode("utf-8"))
+    assert [u["status"] for u in updates if "status" in u] == ["running", "completed"]
+    assert [u["stage"] for u in updates if "stage" in u] == scheme_pipeline.STAGES
+    assert updates[-2]["stages"] == scheme_pipeline.STAGES
+
+    assert job["status"] == "completed"
+    assert job["stage"] == "audio_ready"
+    assert job["stages"] == scheme_pipeline.STAGES
+    assert job["result"]["summary_title"] == "PM Kisan Samman Nidhi"
+    assert job["result"]["audio_file"].endswith(".mp3")
+    assert job["error"] is None
+
+def test_partial_results_leave_out_the_document_text(updates):
+    run(DOCUMENT.encode("utf-8"))
+    title_ready = next(u for u in updates if u.get("stage") == "title_ready")
+    assert title_ready["result"]["summary_title"] == "PM Kisan Samman Nidhi"
+    assert "raw" not in title_ready["result"]
+
+def test_pipeline_error_fails_the_job_with_its_message(monkeypatch):
+    def no_text(file):
+        raise scheme_pipeline.PipelineError("Could not extract any text from the uploaded PDF", 400)
+
+    monkeypatch.setattr(scheme_pipeline, "extract_pdf_text", no_text)
+    job = run(b"")
+    assert job["status"] == "failed"
+    assert job["error"] == "Could not extract any text from the uploaded PDF"
+    assert job["stages"] == []
+
+def test_unexpected_error_fails_the_job_after_the_stages_it_finished(monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("translator unavailable")
+
+    monkeypatch.setattr(scheme_pipeline.translation_utils, "translate", broken)
+    job = run(DOCUMENT.encode("utf-8"))
+    assert job["status"] == "failed"
+    assert job["error"] == "Error processing PDF: translator unavailable"
+    assert job["stages"] == ["text_extracted", "title_ready", "summary_ready", "questions_ready"]
+
+def test_prewarm_failure_leaves_the_job_completed(monkeypatch):
+    def broken(*args):
+        raise RuntimeError("prewarm queue closed")
+
+    monkeypatch.setattr(prewarm, "enqueue_texts", broken)
+    assert run(DOCUMENT.encode("utf-8"))["status"] == "completed"
+
+def test_failed_job_is_not_prewarmed(monkeypatch):
+    warmed = []
+    monkeypatch.setattr(prewarm, "enqueue_upload", warmed.append)
+    monkeypatch.setattr(scheme_pipeline, "extract_pdf_text", lambda file: (_ for _ in ()).throw(scheme_pipeline.PipelineError("bad PDF", 400)))
+    assert run(b"")["status"] == "failed"
+    assert warmed == []
+
+def test_finished_job_gives_its_queue_slot_back(monkeypatch):
+    monkeypatch.setattr(jobs, "UPLOAD_JOB_QUEUE_LIMIT", 1)
+    assert run(DOCUMENT.encode("utf-8"))["status"] == "completed"
+    # The slot is given back just after the job's final update
+    deadline = time.time() + 10
+    while True:
+        try:
+            job_id = jobs.submit_upload(DOCUMENT.encode("utf-8"), "en")
+            break
+        except jobs.JobQueueFull:
+            assert time.time() < deadline
+            time.sleep(0.02)
+    while jobs.get_job(job_id)["status"] in ("queued", "running") and time.time() < deadline:
+        time.sleep(0.02)
+    assert jobs.get_job(job_id)["status"] == "completed"
+
+def test_submit_refuses_uploads_past_the_queue_limit(monkeypatch):
+    monkeypatch.setattr(jobs, "UPLOAD_JOB_QUEUE_LIMIT", 0)
+    with pytest.raises(jobs.JobQueueFull):
+        jobs.submit_upload(DOCUMENT.encode("utf-8"), "en")
@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+import scheme_digest
+
+@pytest.fixture
+def notes(monkeypatch):
+    """Condense sections with the fake LLM (a quarter of the section, at least 200 characters), recording each section"""
+    sections = []
+    invoke_prompt, ainvoke_prompt = scheme_digest.invoke_prompt, scheme_digest.ainvoke_prompt
+
+    def invoke(prompt, inputs, name=None):
+        sections.append(inputs["text"])
+        return invoke_prompt(prompt, inputs, name=name)
+
+    async def ainvoke(prompt, inputs, name=None):
+        sections.append(inputs["text"])
+        return await ainvoke_prompt(prompt, inputs, name=name)
+
+    monkeypatch.setattr(scheme_digest, "invoke_prompt", invoke)
+    monkeypatch.setattr(scheme_digest, "ainvoke_prompt", ainvoke)
+    return sections
+
+def digest(text, asynchronous):
+    return asyncio.run(scheme_digest.adigest(text)) if asynchronous else scheme_digest.digest(text)
+
+def test_sections_break_on_line_boundaries():
+    text = "".join(f"Line {i:02d} of the scheme\n" for i in range(10))  # 22 characters a line
+    sections = scheme_digest.split_sections(text, max_tokens=12)  # 48 characters
+    assert sections == ["".join(f"Line {i:02d} of the scheme\n" for i in range(j, j + 2)).strip() for j in range(0, 10, 2)]
+    assert "\n".join(sections) == text.strip()
+
+def test_long_lines_are_broken_at_spaces():
+    line = " ".join(["eligibility"] * 20)
+    sections = scheme_digest.split_sections(line, max_tokens=10)  # 40 characters
+    assert all(len(section) <= 40 for section in sections)
+    assert " ".join(sections).split() == line.split()
+
+def test_long_words_are_cut_at_the_limit():
+    word = "x" * 100
+    sections = scheme_digest.split_sections(word, max_tokens=10)
+    assert sections == ["x" * 40, "x" * 40, "x" * 20]
+
+def test_empty_documents_have_no_sections():
+    assert scheme_digest.split_sections("") == []
+    assert scheme_digest.split_sections(None) == []
+    assert scheme_digest.split_sections("\n  \n\n") == []
+    assert scheme_digest.opening("") == ""
+
+def test_opening_is_the_first_section(monkeypatch):
+    monkeypatch.setattr(scheme_digest, "SCHEME_SECTION_TOKENS", 10)
+    assert scheme_digest.opening("PM Kisan Samman Nidhi\n" + "Income support for farmers. " * 10) == "PM Kisan Samman Nidhi"
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_short_documents_pass_through(notes, asynchronous):
+    text = "PM Kisan Samman Nidhi\nIncome support of Rs 6000 a year."
+    assert digest(text, asynchronous) == text
+    assert digest("", asynchronous) == ""
+    assert notes == []
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_long_documents_are_condensed_section_by_section(notes, monkeypatch, asynchronous):
+    monkeypatch.setattr(scheme_digest, "SCHEME_PROMPT_TOKENS", 400)
+    monkeypatch.setattr(scheme_digest, "SCHEME_SECTION_TOKENS", 250)
+    text = "".join(f"Clause {i}: farmers owning up to {i} hectares qualify for the subsidy.\n" for i in range(60))
+    digested = digest(text, asynchronous)
+    assert notes == scheme_digest.split_sections(text)
+    assert len(notes) > 1
+    assert digested.startswith("Notes on section 1 of the scheme document:\nClause 0:")
+    assert scheme_digest.fits(digested)
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_notes_are_truncated_after_the_last_level(notes, monkeypatch, asynchronous):
+    monkeypatch.setattr(scheme_digest, "SCHEME_PROMPT_TOKENS", 50)  # Less than one section's notes
+    monkeypatch.setattr(scheme_digest, "SCHEME_SECTION_TOKENS", 250)
+    monkeypatch.setattr(scheme_digest, "SCHEME_DIGEST_MAX_LEVELS", 2)
+    text = "Farmers owning up to two hectares qualify for the subsidy.\n" * 100
+    digested = digest(text, asynchronous)
+    first_level = scheme_digest.split_sections(text)
+    assert notes[:len(first_level)] == first_level
+    assert len(notes) > len(first_level)  # Condensed a second time, then no more
+    assert len(digested) == 50 * 4
+    assert digested.startswith("Notes on section 1 of the scheme document:")
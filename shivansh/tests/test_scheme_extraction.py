@@ -0,0 +1,121 @@
+import asyncio
+import json
+import uuid
+import pytest
+import db_utils
+import fakes
+import scheme_pipeline
+
+DOCUMENT = "PM Kisan Samman Nidhi\nIncome support of Rs 6000 a year to small and marginal farmer families owning cultivable land."
+QUESTIONS = fakes.QUESTIONS.splitlines()
+CRITERIA = [q.rstrip("?") for q in QUESTIONS]
+
+class Prompts:
+    """Answers prompts from fakes.py, recording the calls and damaging structured extractions as told"""
+
+    def __init__(self):
+        self.calls = []
+        self.damage = []  # Per extraction call, the fields to replace (a value of None drops the field)
+
+    def record(self, inputs, name):
+        asked = [key for key in scheme_pipeline.EXTRACTION_FIELDS if f'"{key}"' in inputs.get("fields", "")]
+        self.calls.append((name, asked) if asked else name)
+
+    def reply(self, name, output):
+        if name != "scheme_extraction" or not self.damage:
+            return output
+        fields = json.loads(output)
+        for key, value in self.damage.pop(0).items():
+            if value is None:
+                fields.pop(key, None)
+            else:
+                fields[key] = value
+        return json.dumps(fields)
+
+@pytest.fixture
+def prompts(monkeypatch):
+    prompts = Prompts()
+    invoke_prompt, ainvoke_prompt = scheme_pipeline.invoke_prompt, scheme_pipeline.ainvoke_prompt
+
+    def invoke(prompt, inputs, name=None):
+        prompts.record(inputs, name)
+        return prompts.reply(name, invoke_prompt(prompt, inputs, name=name))
+
+    async def ainvoke(prompt, inputs, name=None):
+        prompts.record(inputs, name)
+        return prompts.reply(name, await ainvoke_prompt(prompt, inputs, name=name))
+
+    monkeypatch.setattr(scheme_pipeline, "invoke_prompt", invoke)
+    monkeypatch.setattr(scheme_pipeline, "ainvoke_prompt", ainvoke)
+    return prompts
+
+def extract(document, asynchronous, text=DOCUMENT):
+    if asynchronous:
+        return asyncio.run(scheme_pipeline.aextract_scheme(document, text))
+    return scheme_pipeline.extract_scheme(document, text)
+
+def test_parse_extraction_keeps_only_well_formed_fields():
+    output = "```json\n" + json.dumps({"title": "Two\nlines", "summary": "  Support  ", "questions": ["Own land?", " "]}) + "\n```"
+    assert scheme_pipeline.parse_extraction(output) == {"summary": "Support"}
+    assert scheme_pipeline.parse_extraction(json.dumps({"questions": [" Own land? ", "Aadhaar?"]})) == {"questions": ["Own land?", "Aadhaar?"]}
+    assert scheme_pipeline.parse_extraction("not JSON") == {}
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_complete_extraction_is_one_call(prompts, asynchronous):
+    result = extract(DOCUMENT, asynchronous)
+    assert prompts.calls == [("scheme_extraction", ["title", "summary", "eligibility_criteria", "questions"])]
+    assert result == {
+        "summary_title": "PM Kisan Samman Nidhi",
+        "summary_original": fakes.SUMMARY,
+        "eligibility_questions_original": fakes.QUESTIONS,
+        "eligibility_criteria": CRITERIA
+    }
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_missing_fields_are_asked_for_again(prompts, asynchronous):
+    prompts.damage = [{"title": "PM Kisan\nSamman Nidhi", "eligibility_criteria": [1, 2], "questions": None}]
+    result = extract(DOCUMENT, asynchronous)
+    assert prompts.calls == [
+        ("scheme_extraction", ["title", "summary", "eligibility_criteria", "questions"]),
+        ("scheme_extraction", ["title", "eligibility_criteria", "questions"])
+    ]
+    assert result["summary_title"] == "PM Kisan Samman Nidhi"
+    assert result["eligibility_questions_original"].splitlines() == QUESTIONS
+    assert result["eligibility_criteria"] == CRITERIA
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_fields_still_missing_come_from_their_own_prompts(prompts, asynchronous):
+    prompts.damage = [{"summary": None, "eligibility_criteria": None, "questions": []}, {"summary": "", "eligibility_criteria": None, "questions": None}]
+    result = extract(DOCUMENT, asynchronous)
+    assert prompts.calls[:2] == [
+        ("scheme_extraction", ["title", "summary", "eligibility_criteria", "questions"]),
+        ("scheme_extraction", ["summary", "eligibility_criteria", "questions"])
+    ]
+    assert sorted(prompts.calls[2:]) == ["eligibility_questions", "summary"]
+    assert result["summary_original"] == fakes.SUMMARY
+    assert result["eligibility_questions_original"].splitlines() == QUESTIONS
+    assert result["eligibility_criteria"] == []
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_title_fallback_reads_the_document_not_its_notes(prompts, asynchronous):
+    prompts.damage = [{"title": None}, {"title": None}]
+    notes = "Notes on section 1 of the scheme document:\nIncome support for small farmers."
+    result = extract(notes, asynchronous)
+    assert prompts.calls[2:] == ["title"]
+    assert result["summary_title"] == "PM Kisan Samman Nidhi"
+
+def test_single_mode_uploads_with_one_extraction(prompts, tmp_path, monkeypatch):
+    monkeypatch.setattr(scheme_pipeline, "SCHEME_EXTRACTION_MODE", "single")
+    monkeypatch.setattr(scheme_pipeline, "TEMP_AUDIO_DIR", str(tmp_path))
+    stages = []
+    result = scheme_pipeline.process_scheme(DOCUMENT, "en", on_stage=lambda stage, result: stages.append(stage))
+    assert stages == scheme_pipeline.STAGES[1:]
+    assert prompts.calls == [("scheme_extraction", ["title", "summary", "eligibility_criteria", "questions"])]
+    assert result["summary_title"] == "PM Kisan Samman Nidhi"
+    assert result["eligibility_questions_original"] == fakes.QUESTIONS
+
+def test_extracted_criteria_are_stored_with_the_scheme():
+    scheme_id = db_utils.save_scheme(f"Scheme {uuid.uuid4().hex}", "Uploaded scheme", fakes.QUESTIONS, fakes.SUMMARY, DOCUMENT, criteria=CRITERIA)
+    assert db_utils.get_scheme_by_id(scheme_id)["criteria"] == CRITERIA
+    scheme_id = db_utils.save_scheme(f"Scheme {uuid.uuid4().hex}", "Uploaded scheme", fakes.QUESTIONS, fakes.SUMMARY, DOCUMENT)
+    assert db_utils.get_scheme_by_id(scheme_id)["criteria"] == []
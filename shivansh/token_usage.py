@@ -0,0 +1,38 @@
+"""
+Token and cost accounting for the API's LLM calls, with daily budgets
+
+Every call made through llm_utils is recorded in the llm_usage table of farmwise.db with the
+route and session user it was made for (or usage_context() for background work) and its
+prompt type. Costs default to gemini-2.0-flash prices, overridden by LLM_INPUT_COST_PER_MTOK
+and LLM_OUTPUT_COST_PER_MTOK. Budgets are daily token limits (0 = unlimited):
+
+    LLM_DAILY_TOKEN_BUDGET=2000000
+    LLM_USER_DAILY_TOKEN_BUDGET=100000
+    LLM_ROUTE_TOKEN_BUDGETS=/translate_scheme_summary=300000,prewarm=500000
+
+Optional work degrades when a budget is used up: translations fall back to the cached
+or English text and pre-warming stops. Calls that can't be skipped raise BudgetExceeded.
+
+Report of the last week's usage:
+
+    python token_usage.py --days 7 --by route prompt
+
+The accounting is farmwise_common.token_usage; this module points it at farmwise.db.
+"""
+from farmwise_common import token_usage as _token_usage
+from farmwise_common.token_usage import (
+    CHARS_PER_TOKEN, BudgetExceeded, add_usage, current_context, estimate_tokens, init_app, main, record_call,
+    require_budget, usage_context, within_budget
+)
+import db_utils
+
+_token_usage.configure(
+    db_utils.get_connection,
+    input_cost_per_mtok=0.10,  # gemini-2.0-flash
+    output_cost_per_mtok=0.40,
+    request_user=lambda request, session: session.get('user_id')
+)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Request-scoped tracing of the API, exported as OpenTelemetry (OTLP/JSON) spans
+
+Every span() opened while handling a request (LLM calls, gTTS, SQLite statements, PDF
+extraction) becomes a child of the request's span, following it into asyncio tasks and
+asyncio.to_thread(). Background work (upload jobs, pre-warming) starts its own trace with
+span(..., root=True). Finished traces go to traces/traces.jsonl (TRACE_EXPORT_PATH); the
+slowest can be shown as text waterfalls:
+
+    python tracing.py --top 5
+    python tracing.py traces/traces.jsonl --name "POST /upload_scheme"
+
+The implementation is farmwise_common.tracing; this module names the service and where its
+traces go.
+"""
+import os
+from farmwise_common import tracing as _tracing
+from farmwise_common.tracing import SPAN_KIND_CLIENT, SPAN_KIND_INTERNAL, SPAN_KIND_SERVER, current_span, init_app, main, span
+
+_tracing.configure("farmwise-api", os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces", "traces.jsonl"))
+
+
+if __name__ == "__main__":
+    main()
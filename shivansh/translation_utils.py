@@ -0,0 +1,176 @@
+import asyncio
+from langchain_core.prompts import ChatPromptTemplate
+import db_utils
+import metrics
+import singleflight
+import token_usage
+from llm_utils import invoke_prompt, stream_prompt, ainvoke_prompt, astream_prompt
+
+# Languages offered to users (filtered against gTTS support by the callers)
+LANGUAGES = {
+    "English": "en",
+    "Hindi": "hi",
+    "Tamil": "ta",
+    "Telugu": "te",
+    "Bengali": "bn",
+    "Marathi": "mr",
+    "Gujarati": "gu",
+    "Kannada": "kn",
+    "Malayalam": "ml"
+}
+
+# System prompts per kind of text being translated
+TRANSLATION_PROMPTS = {
+    "text": "You are a translator. Translate the following text from English to {language} maintaining the meaning and simplicity. Return ONLY the translated text without any additional explanations or notes.",
+    "questions": "You are a translator. Translate the following questions from English to {language} maintaining the meaning and simplicity. Keep the same format with one question per line, no numbering or extra text."
+}
+
+def get_language_name(language_code):
+    """Return the display name for a language code"""
+    for name, code in LANGUAGES.items():
+        if code == language_code:
+            return name
+    return None
+
+def _translation_prompt(language_code, kind):
+    """Build the translation prompt for a target language and kind of text"""
+    return ChatPromptTemplate.from_messages([
+        ("system", TRANSLATION_PROMPTS[kind].format(language=get_language_name(language_code))),
+        ("human", "{text}")
+    ])
+
+def _flight_key(text, language_code, kind):
+    """Key concurrent translations of the same text are coalesced under (see singleflight.py)"""
+    return f"{language_code}:{kind}:{db_utils.hash_text(text)}"
+
+def _cached_lookup(text, language_code, kind, use_cache):
+    """Read the translation another worker process may be storing, for singleflight"""
+    return (lambda: db_utils.get_translation(text, language_code, kind)) if use_cache else None
+
+def get_cached_translation(text, language_code, kind="text"):
+    """Return a cached translation of the text, or None if it has not been translated yet"""
+    if language_code == "en" or not text:
+        return text
+    return db_utils.get_translation(text, language_code, kind)
+
+def translate(text, language_code, kind="text", use_cache=True):
+    """
+    Translate English text into the given language using the LLM
+
+    Args:
+        text (str): English text to translate
+        language_code (str): Target language code
+        kind (str): "text" for prose, "questions" for one-question-per-line lists
+        use_cache (bool): Whether to reuse and store translations in the database (default: True)
+
+    Returns:
+        str: The translated text (the input itself for English)
+    """
+    if language_code == "en" or not text:
+        return text
+
+    if use_cache:
+        cached = db_utils.get_translation(text, language_code, kind)
+        metrics.record_cache_lookup("translation", cached is not None)
+        if cached is not None:
+            return cached
+
+    if not token_usage.within_budget():
+        print(f"LLM budget used up, serving untranslated text instead of {language_code}")
+        return text
+
+    def compute():
+        translated_text = invoke_prompt(_translation_prompt(language_code, kind), {"text": text}, name="translation")
+        if use_cache:
+            db_utils.save_translation(text, language_code, translated_text, kind)
+        return translated_text
+
+    # Concurrent requests for the same translation wait for one LLM call
+    translated_text, _ = singleflight.do("translation", _flight_key(text, language_code, kind), compute,
+                                         _cached_lookup(text, language_code, kind, use_cache))
+    return translated_text
+
+def stream_translate(text, language_code, kind="text", use_cache=True):
+    """
+    Translate English text like translate(), yielding the translation as it is generated
+
+    Yields:
+        str: Chunks of the translated text (a single chunk for English or cached translations)
+    """
+    if language_code == "en" or not text:
+        if text:
+            yield text
+        return
+
+    if use_cache:
+        cached = db_utils.get_translation(text, language_code, kind)
+        metrics.record_cache_lookup("translation", cached is not None)
+        if cached is not None:
+            yield cached
+            return
+
+    if not token_usage.within_budget():
+        print(f"LLM budget used up, serving untranslated text instead of {language_code}")
+        yield text
+        return
+
+    chunks = []
+    for chunk in stream_prompt(_translation_prompt(language_code, kind), {"text": text}, name="translation"):
+        chunks.append(chunk)
+        yield chunk
+
+    if use_cache:
+        db_utils.save_translation(text, language_code, "".join(chunks), kind)
+
+async def atranslate(text, language_code, kind="text", use_cache=True):
+    """Async variant of translate()"""
+    if language_code == "en" or not text:
+        return text
+
+    if use_cache:
+        # SQLite has no async driver, so the cache is read and written in a worker thread
+        cached = await asyncio.to_thread(db_utils.get_translation, text, language_code, kind)
+        metrics.record_cache_lookup("translation", cached is not None)
+        if cached is not None:
+            return cached
+
+    if not token_usage.within_budget():
+        print(f"LLM budget used up, serving untranslated text instead of {language_code}")
+        return text
+
+    async def compute():
+        translated_text = await ainvoke_prompt(_translation_prompt(language_code, kind), {"text": text}, name="translation")
+        if use_cache:
+            await asyncio.to_thread(db_utils.save_translation, text, language_code, translated_text, kind)
+        return translated_text
+
+    translated_text, _ = await singleflight.ado("translation", _flight_key(text, language_code, kind), compute,
+                                                _cached_lookup(text, language_code, kind, use_cache))
+    return translated_text
+
+async def astream_translate(text, language_code, kind="text", use_cache=True):
+    """Async variant of stream_translate()"""
+    if language_code == "en" or not text:
+        if text:
+            yield text
+        return
+
+    if use_cache:
+        cached = await asyncio.to_thread(db_utils.get_translation, text, language_code, kind)
+        metrics.record_cache_lookup("translation", cached is not None)
+        if cached is not None:
+            yield cached
+            return
+
+    if not token_usage.within_budget():
+        print(f"LLM budget used up, serving untranslated text instead of {language_code}")
+        yield text
+        return
+
+    chunks = []
+    async for chunk in astream_prompt(_translation_prompt(language_code, kind), {"text": text}, name="translation"):
+        chunks.append(chunk)
+        yield chunk
+
+    if use_cache:
+        await asyncio.to_thread(db_utils.save_translation, text, language_code, "".join(chunks), kind)
@@ -1,13 +1,26 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from workflow import run_workflow, FarmerState
+from workflow import FarmerState
 from dotenv import load_dotenv
+import json
 import logging
+import llm_gateway
+import metrics
+import profiling
+import recommendation_cache
+import timing
+import token_usage
+import tracing
+import workflow_variants
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:5173","http://localhost:5174"])
+metrics.init_app(app)  # Request metrics and the Prometheus /metrics endpoint
+tracing.init_app(app)  # Request traces, exported to TRACE_EXPORT_PATH
+token_usage.init_app(app)  # Attribute LLM usage to the route and user
+profiling.init_app(app)  # Profile requests sent with X-Profile when PROFILING_ENABLED is set
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -34,78 +47,47 @@ def get_recommendations():
         },
         "feedback": null  # Optional for refinement
     }
+    Send the X-Debug-Timings: 1 header to get per-node and per-call timings under metadata.timings
     """
     try:
         # Validate and parse input
         data = request.get_json()
-        if not data or 'profile' not in data:
-            return jsonify({
-                "error": "Invalid request format",
-                "message": "Profile data is required"
-            }), 400
-
-        # Required fields validation
-        required_fields = ['district', 'state', 'land_size', 'crop_type']
-        for field in required_fields:
-            if field not in data['profile'] or not data['profile'][field]:
-                return jsonify({
-                    "error": "Missing required field",
-                    "message": f"{field} is required in profile"
-                }), 400
-
-        # Prepare initial state
-        initial_state: FarmerState = {
-            "profile": {
-                "village": data['profile'].get('village', ''),
-                "district": data['profile']['district'],
-                "state": data['profile']['state'],
-                "land_size": data['profile']['land_size'],
-                "land_ownership": data['profile'].get('ownership', 'owned').lower(),
-                "crop_type": data['profile']['crop_type'],
-                "irrigation": data['profile'].get('irrigation', 'rain-fed').lower(),
-                "income": data['profile'].get('income', '0'),
-                "caste_category": data['profile'].get('caste_category', 'general').lower(),
-                "bank_account": data['profile'].get('bank_account', 'yes').lower(),
-                "existing_schemes": data['profile'].get('existing_schemes', 'none').lower()
-            },
-            "schemes": [],
-            "recommendations": None,
-            "refinement_needed": False,
-            "feedback": data.get('feedback'),
-            "visuals": []
-        }
+        initial_state, error = parse_recommendation_request(data)
+        if error:
+            return jsonify(error), 400
 
         logger.info(f"Processing request for farmer in {initial_state['profile']['district']}, {initial_state['profile']['state']}")
 
-        # Run the workflow
-        result = run_workflow(initial_state)
-
-        # Format the response
-        response = {
-            "status": "success",
-            "data": {
-                "profile": result["profile"],
-                "recommendations": result["recommendations"],
-                "schemes": [
-                    {
-                        "title": doc.metadata.get('title', 'Untitled'),
-                        "summary": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
-                        "url": doc.metadata.get('url', ''),
-                        "source": doc.metadata.get('source', 'unknown')
-                    }
-                    for doc in result["schemes"]
-                ],
-                "visuals": result.get("visuals", []),
-                "needs_refinement": result.get("refinement_needed", False)
-            },
-            "metadata": {
-                "farmer_type": result["profile"].get("farmer_type", "unknown"),
-                "needs_insurance": result["profile"].get("needs_insurance", "unknown")
-            }
-        }
+        with timing.record_run("recommendations") as run:
+            # Identical profiles get the cached response (shared by all worker processes)
+            key = recommendation_cache.cache_key(initial_state, workflow_variants.RECOMMENDATION_WORKFLOW)
+            with timing.timed_call("recommendation_cache.get"):
+                cached = recommendation_cache.get(key)
+            if cached:
+                logger.info("Serving cached recommendations")
+                return jsonify(with_timings(cached, run, timing.wants_timings(request.headers)))
+
+            # Run the workflow
+            result = workflow_variants.run(initial_state)
 
-        return jsonify(response)
+            response = format_response(result)
+            recommendation_cache.put(key, response)
+        return jsonify(with_timings(response, run, timing.wants_timings(request.headers)))
 
+    except token_usage.BudgetExceeded as e:
+        logger.warning(str(e))
+        return jsonify({
+            "status": "error",
+            "error": str(e),
+            "message": "LLM budget used up"
+        }), 429
+    except llm_gateway.GatewayUnavailable as e:
+        logger.warning(str(e))
+        return jsonify({
+            "status": "error",
+            "error": str(e),
+            "message": "Too many requests for the LLM, try again shortly"
+        }), 503, {"Retry-After": str(round(e.retry_after))}
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}", exc_info=True)
         return jsonify({
@@ -114,5 +96,135 @@ def get_recommendations():
             "message": "Failed to process request"
         }), 500
 
+@app.route('/api/recommendations/stream', methods=['POST'])
+def stream_recommendations():
+    """
+    Streaming variant of /api/recommendations, sent as server-sent events:
+    - "stage": {"node": ...} when a workflow node finishes
+    - "token": {"node": ..., "text": ...} for LLM output as it is generated
+    - "result": the same body as /api/recommendations once the workflow is done
+    - "error": {"status": "error", ...} if the workflow fails
+    """
+    data = request.get_json()
+    initial_state, error = parse_recommendation_request(data)
+    if error:
+        return jsonify(error), 400
+
+    logger.info(f"Streaming request for farmer in {initial_state['profile']['district']}, {initial_state['profile']['state']}")
+
+    key = recommendation_cache.cache_key(initial_state, workflow_variants.RECOMMENDATION_WORKFLOW)
+    debug_timings = timing.wants_timings(request.headers)
+
+    def generate():
+        final_state = None
+        try:
+            with timing.record_run("recommendations_stream") as run:
+                with timing.timed_call("recommendation_cache.get"):
+                    cached = recommendation_cache.get(key)
+                if cached:
+                    yield sse_event("result", with_timings(cached, run, debug_timings))
+                    return
+                for mode, chunk in workflow_variants.stream(initial_state):
+                    if mode == "messages":
+                        message, metadata = chunk
+                        if message.content:
+                            yield sse_event("token", {"node": metadata.get("langgraph_node"), "text": message.content})
+                    elif mode == "updates":
+                        for node in chunk:
+                            yield sse_event("stage", {"node": node})
+                    else:
+                        final_state = chunk
+                response = format_response(final_state)
+                recommendation_cache.put(key, response)
+                yield sse_event("result", with_timings(response, run, debug_timings))
+        except Exception as e:
+            logger.error(f"Error streaming request: {str(e)}", exc_info=True)
+            yield sse_event("error", {
+                "status": "error",
+                "error": str(e),
+                "message": "Failed to process request"
+            })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def parse_recommendation_request(data):
+    """Validate a recommendation request, returning (initial_state, None) or (None, error)"""
+    if not data or 'profile' not in data:
+        return None, {
+            "error": "Invalid request format",
+            "message": "Profile data is required"
+        }
+
+    # Required fields validation
+    required_fields = ['district', 'state', 'land_size', 'crop_type']
+    for field in required_fields:
+        if field not in data['profile'] or not data['profile'][field]:
+            return None, {
+                "error": "Missing required field",
+                "message": f"{field} is required in profile"
+            }
+
+    # Prepare initial state
+    initial_state: FarmerState = {
+        "profile": {
+            "village": data['profile'].get('village', ''),
+            "district": data['profile']['district'],
+            "state": data['profile']['state'],
+            "land_size": data['profile']['land_size'],
+            "land_ownership": data['profile'].get('ownership', 'owned').lower(),
+            "crop_type": data['profile']['crop_type'],
+            "irrigation": data['profile'].get('irrigation', 'rain-fed').lower(),
+            "income": data['profile'].get('income', '0'),
+            "caste_category": data['profile'].get('caste_category', 'general').lower(),
+            "bank_account": data['profile'].get('bank_account', 'yes').lower(),
+            "existing_schemes": data['profile'].get('existing_schemes', 'none').lower()
+        },
+        "schemes": [],
+        "recommendations": None,
+        "refinement_needed": False,
+        "feedback": data.get('feedback'),
+        "visuals": []
+    }
+    return initial_state, None
+
+def format_response(result):
+    """Format the final workflow state as the API response body"""
+    return {
+        "status": "success",
+        "data": {
+            "profile": result["profile"],
+            "recommendations": result["recommendations"],
+            "schemes": [
+                {
+                    "title": doc.metadata.get('title', 'Untitled'),
+                    "summary": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
+                    "url": doc.metadata.get('url', ''),
+                    "source": doc.metadata.get('source', 'unknown')
+                }
+                for doc in result["schemes"]
+            ],
+            "visuals": result.get("visuals", []),
+            "needs_refinement": result.get("refinement_needed", False)
+        },
+        "metadata": {
+            "farmer_type": result["profile"].get("farmer_type", "unknown"),
+            "needs_insurance": result["profile"].get("needs_insurance", "unknown")
+        }
+    }
+
+def with_timings(response, run, debug_timings):
+    """Add the run's timings under metadata.timings when the request sent the debug header"""
+    if not debug_timings:
+        return response
+    return {**response, "metadata": {**response.get("metadata", {}), "timings": run.to_dict()}}
+
+def sse_event(event, data):
+    """Format a server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""
+ASGI entry point for the recommendations API, for serving many concurrent requests
+from one process:
+
+    uvicorn asgi:app --port 5000
+
+Same routes and payloads as api.py, but the workflow runs with app.ainvoke()/app.astream(),
+so Gemini, Tavily and the site scrapes are awaited instead of each holding a thread.
+"""
+from quart import Quart, request, jsonify, Response
+from quart_cors import cors
+from api import parse_recommendation_request, format_response, sse_event, with_timings
+import logging
+import llm_gateway
+import metrics
+import profiling
+import recommendation_cache
+import timing
+import token_usage
+import tracing
+import workflow_variants
+
+app = Quart(__name__)
+app = cors(app, allow_origin=["http://localhost:5173", "http://localhost:5174"])
+metrics.init_app(app)
+tracing.init_app(app)
+token_usage.init_app(app)
+profiling.init_app(app)
+
+logger = logging.getLogger(__name__)
+
+@app.route('/api/recommendations', methods=['POST'])
+async def get_recommendations():
+    """Async variant of /api/recommendations in api.py"""
+    try:
+        data = await request.get_json()
+        initial_state, error = parse_recommendation_request(data)
+        if error:
+            return jsonify(error), 400
+
+        logger.info(f"Processing request for farmer in {initial_state['profile']['district']}, {initial_state['profile']['state']}")
+
+        with timing.record_run("recommendations") as run:
+            # Identical profiles get the cached response (shared by all worker processes)
+            key = recommendation_cache.cache_key(initial_state, workflow_variants.RECOMMENDATION_WORKFLOW)
+            with timing.timed_call("recommendation_cache.get"):
+                cached = recommendation_cache.get(key)
+            if cached:
+                logger.info("Serving cached recommendations")
+                return jsonify(with_timings(cached, run, timing.wants_timings(request.headers)))
+
+            # Run the workflow
+            result = await workflow_variants.arun(initial_state)
+
+            response = format_response(result)
+            recommendation_cache.put(key, response)
+        return jsonify(with_timings(response, run, timing.wants_timings(request.headers)))
+
+    except token_usage.BudgetExceeded as e:
+        logger.warning(str(e))
+        return jsonify({
+            "status": "error",
+            "error": str(e),
+            "message": "LLM budget used up"
+        }), 429
+    except llm_gateway.GatewayUnavailable as e:
+        logger.warning(str(e))
+        return jsonify({
+            "status": "error",
+            "error": str(e),
+            "message": "Too many requests for the LLM, try again shortly"
+        }), 503, {"Retry-After": str(round(e.retry_after))}
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}", exc_info=True)
+        return jsonify({
+            "status": "error",
+            "error": str(e),
+            "message": "Failed to process request"
+        }), 500
+
+@app.route('/api/recommendations/stream', methods=['POST'])
+async def stream_recommendations():
+    """Async variant of /api/recommendations/stream in api.py, emitting the same events"""
+    data = await request.get_json()
+    initial_state, error = parse_recommendation_request(data)
+    if error:
+        return jsonify(error), 400
+
+    logger.info(f"Streaming request for farmer in {initial_state['profile']['district']}, {initial_state['profile']['state']}")
+
+    key = recommendation_cache.cache_key(initial_state, workflow_variants.RECOMMENDATION_WORKFLOW)
+    debug_timings = timing.wants_timings(request.headers)
+
+    async def generate():
+        final_state = None
+        try:
+            with timing.record_run("recommendations_stream") as run:
+                with timing.timed_call("recommendation_cache.get"):
+                    cached = recommendation_cache.get(key)
+                if cached:
+                    yield sse_event("result", with_timings(cached, run, debug_timings))
+                    return
+                async for mode, chunk in workflow_variants.astream(initial_state):
+                    if mode == "messages":
+                        message, metadata = chunk
+                        if message.content:
+                            yield sse_event("token", {"node": metadata.get("langgraph_node"), "text": message.content})
+                    elif mode == "updates":
+                        for node in chunk:
+                            yield sse_event("stage", {"node": node})
+                    else:
+                        final_state = chunk
+                response = format_response(final_state)
+                recommendation_cache.put(key, response)
+                yield sse_event("result", with_timings(response, run, debug_timings))
+        except Exception as e:
+            logger.error(f"Error streaming request: {str(e)}", exc_info=True)
+            yield sse_event("error", {
+                "status": "error",
+                "error": str(e),
+                "message": "Failed to process request"
+            })
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,259 @@
+"""
+End-to-end benchmarks for the recommendations API, driven through the Flask test client.
+
+    python benchmark.py                                    # every scenario
+    python benchmark.py recommendations --clients 8 --requests 40
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json --tolerance 0.15
+
+Runs against the offline stand-ins in fakes.py (FAKE_PROVIDERS=all) unless --live, with the
+recommendation cache, usage database, timings log and exported traces in a temporary
+directory. For each scenario it reports p50/p95/p99 latency and throughput with --clients
+concurrent clients, the process's peak RSS so far, and (from a separate single-client pass
+under tracemalloc) the peak bytes allocated and the memory blocks retained per request.
+
+Profiles repeat by default, so the recommendation cache answers after the first request;
+--unique gives every request a different profile so each one runs the whole workflow.
+With --baseline the exit status is 1 if p95 latency, throughput, peak RSS or allocations
+regress by more than --tolerance, so it can run in CI.
+"""
+import os
+import gc
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = ["recommendations", "recommendations_stream"]
+
+BENCHMARK_PROFILE = {
+    "village": "Shirur",
+    "district": "Pune",
+    "state": "Maharashtra",
+    "land_size": "2 hectares",
+    "ownership": "owned",
+    "crop_type": "wheat",
+    "irrigation": "rain-fed",
+    "income": "80000",
+    "caste_category": "general",
+    "bank_account": "yes",
+    "existing_schemes": "none"
+}
+
+# Metric -> True if a higher value is a regression
+COMPARED_METRICS = {"p95_ms": True, "throughput_rps": False, "peak_rss_mib": True, "alloc_peak_kib": True}
+
+def run_scenario(name: str, client: Any, i: int, unique: bool) -> Any:
+    """Make one request of a scenario (i varies the profile when unique), reading the whole body."""
+    profile = dict(BENCHMARK_PROFILE, village=f"{BENCHMARK_PROFILE['village']} {i}" if unique else BENCHMARK_PROFILE["village"])
+    if name == "recommendations":
+        response = client.post("/api/recommendations", json={"profile": profile})
+    elif name == "recommendations_stream":
+        response = client.post("/api/recommendations/stream", json={"profile": profile})
+    else:
+        raise ValueError(f"Unknown scenario: {name}")
+    body = response.get_data(as_text=True)
+    response.close()
+    if name == "recommendations_stream" and "event: error" in body:
+        response.status_code = 500  # Streams report failures as an event after a 200
+    return response
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(1, math.ceil(p / 100 * len(ordered))) - 1]
+
+def peak_rss_mib() -> Optional[float]:
+    """Peak resident set size of this process so far, in MiB (None where unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def measure_load(app: Any, name: str, clients: int, requests_per_client: int, unique: bool, offset: int) -> Dict[str, Any]:
+    """Run a scenario from concurrent clients; return request/error counts, latency percentiles (ms) and throughput."""
+    latencies: List[float] = []
+    errors: List[Any] = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+
+    def worker(n: int) -> None:
+        client = app.test_client()
+        barrier.wait()
+        for j in range(requests_per_client):
+            i = offset + n * requests_per_client + j
+            start = time.perf_counter()
+            try:
+                status = run_scenario(name, client, i, unique).status_code
+            except Exception as e:
+                status = f"{type(e).__name__}: {e}"
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if status != 200:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    if errors:
+        logging.warning(f"{name}: {len(errors)} failed requests, e.g. {errors[0]}")
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None
+    }
+
+def measure_allocations(app: Any, name: str, count: int, unique: bool, offset: int) -> Dict[str, float]:
+    """Trace a scenario's requests one at a time: median peak KiB allocated and blocks retained per request."""
+    client = app.test_client()
+    peaks = []
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        for n in range(count):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            run_scenario(name, client, offset + n, unique)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    gc.collect()
+    return {
+        "alloc_peak_kib": round(percentile(peaks, 50) / 1024, 1),
+        "retained_blocks_per_request": round((sys.getallocatedblocks() - blocks_before) / count, 1)
+    }
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Tuple[str, str, float, float, float, bool]]:
+    """(scenario, metric, baseline value, current value, change, regressed) for each metric in both runs."""
+    rows = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for metric, higher_is_worse in COMPARED_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change > tolerance if higher_is_worse else change < -tolerance
+            rows.append((name, metric, old, new, change, regressed))
+    return rows
+
+def print_results(results: Dict[str, Any]) -> None:
+    header = ["scenario", "requests", "errors", "p50_ms", "p95_ms", "p99_ms", "throughput_rps", "peak_rss_mib", "alloc_peak_kib", "retained_blocks_per_request"]
+    table = [[name, *(str(stats.get(column, "")) for column in header[1:])] for name, stats in results["scenarios"].items()]
+    widths = [max(len(header[i]), *(len(row[i]) for row in table)) for i in range(len(header))]
+    print("  ".join(h.ljust(w) for h, w in zip(header, widths)).rstrip())
+    for row in table:
+        print("  ".join(c.ljust(w) for c, w in zip(row, widths)).rstrip())
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the recommendations API through the Flask test client")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=10, help="Requests per client")
+    parser.add_argument("--warmup", type=int, default=1, help="Requests per scenario before measuring")
+    parser.add_argument("--alloc-requests", type=int, default=3, help="Requests per scenario traced for allocations (0 to skip)")
+    parser.add_argument("--unique", action="store_true", help="Give every request a different profile, so the cache misses")
+    parser.add_argument("--live", action="store_true", help="Call the real Gemini, Tavily and sites instead of fakes.py")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file as the new baseline")
+    parser.add_argument("--baseline", help="Compare with this baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression against the baseline")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+    scenarios = args.scenarios or SCENARIOS
+
+    # Configure the app before importing it: fakes, and throwaway databases and logs
+    workdir = tempfile.mkdtemp(prefix="farmwise-benchmark-")
+    if not args.live:
+        os.environ.setdefault("FAKE_PROVIDERS", "all")
+    os.environ["RECOMMENDATION_CACHE_DB"] = os.path.join(workdir, "recommendations.db")
+    os.environ["LLM_USAGE_DB"] = os.path.join(workdir, "recommendations.db")
+    os.environ["TIMINGS_LOG_PATH"] = os.path.join(workdir, "logs", "timings.jsonl")
+    os.environ["TRACE_EXPORT_PATH"] = os.path.join(workdir, "traces", "traces.jsonl")
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from api import app
+    logging.getLogger().setLevel(logging.WARNING)  # The workflow logs every step at INFO
+
+    print(f"Benchmarking {', '.join(scenarios)} with {args.clients} clients x {args.requests} requests "
+          f"({'live providers' if args.live else 'FAKE_PROVIDERS=' + os.environ['FAKE_PROVIDERS']}, working directory {workdir})")
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "service": "recommendations",
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "clients": args.clients,
+            "requests_per_client": args.requests,
+            "unique": args.unique,
+            "fake_providers": os.getenv("FAKE_PROVIDERS", "")
+        },
+        "scenarios": {}
+    }
+    offset = 0
+    for name in scenarios:
+        warmup_client = app.test_client()
+        for i in range(args.warmup):
+            run_scenario(name, warmup_client, offset + i, args.unique)
+        offset += args.warmup
+        stats = measure_load(app, name, args.clients, args.requests, args.unique, offset)
+        offset += args.clients * args.requests
+        stats["peak_rss_mib"] = peak_rss_mib()
+        if args.alloc_requests:
+            stats.update(measure_allocations(app, name, args.alloc_requests, args.unique, offset))
+            offset += args.alloc_requests
+        results["scenarios"][name] = stats
+
+    print()
+    print_results(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            print(f"\nResults written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.tolerance)
+        print(f"\nCompared with {args.baseline} ({baseline.get('meta', {}).get('date', 'unknown date')}), tolerance {args.tolerance:.0%}:")
+        for name, metric, old, new, change, regressed in rows:
+            print(f"  {name:<24} {metric:<15} {old:>10} -> {new:<10} {change:+.1%}{'  REGRESSION' if regressed else ''}")
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Record the workflows' external calls into cassette files and replay them offline with their
+original latencies.
+
+    CASSETTE_MODE=record python api.py          # serve real traffic, recording every call
+    CASSETTE_MODE=replay python benchmark.py    # the same calls, no network, same latencies
+    CASSETTE_MODE=replay CASSETTE_LATENCY_SCALE=0.5 CASSETTE_MATCH=sequence python benchmark.py --unique
+    python cassettes.py                         # what's recorded, with latency percentiles
+
+CASSETTE_PROVIDERS selects llm, tavily, embeddings, vectorstore and sites (default all), and
+recordings go to fixtures/cassettes (CASSETTE_DIR). clients.py and tools.py wrap their clients
+when CASSETTE_MODE is set; FAKE_PROVIDERS can be recorded too.
+
+The implementation is farmwise_common.cassettes; this module sets where the service's cassettes are.
+"""
+import os
+from farmwise_common import cassettes as _cassettes
+from farmwise_common.cassettes import (
+    CassetteError, CassetteMiss, async_http_transport, http_adapter, main, mode, summary,
+    wrap_async_tavily, wrap_embeddings, wrap_llm, wrap_retriever, wrap_tavily, wrap_vector_store,
+)
+
+_cassettes.configure(os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "cassettes"))
+
+if __name__ == "__main__":
+    main()
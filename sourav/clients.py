@@ -0,0 +1,161 @@
+"""
+Lazily created, shared clients for the workflows.
+
+Nothing here connects to anything (or imports the heavy client libraries) until it is
+first used, so importing a workflow is fast and works offline. Each getter returns the
+same instance on every call. Providers named in FAKE_PROVIDERS are replaced by the offline
+stand-ins in fakes.py, and CASSETTE_MODE records or replays their calls (see cassettes.py).
+The chat model's calls go through the LLM gateway (see llm_gateway.py).
+"""
+import os
+import logging
+import threading
+from functools import wraps
+from typing import Any, Callable, Optional
+
+def singleton(factory: Callable[[], Any]) -> Callable[[], Any]:
+    """Memoise a zero-argument factory; concurrent first calls create the instance once."""
+    lock = threading.Lock()
+    instance = []
+
+    @wraps(factory)
+    def get():
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+    return get
+
+def _fake(provider: str) -> bool:
+    """Whether FAKE_PROVIDERS selects the offline stand-in for a provider."""
+    if not os.getenv("FAKE_PROVIDERS"):
+        return False  # Don't import fakes.py (and langchain_core) just to find out
+    import fakes
+    return fakes.enabled(provider)
+
+def _cassette(provider: str) -> Optional[str]:
+    """CASSETTE_MODE ("record" or "replay") if it applies to a provider, else None."""
+    if not os.getenv("CASSETTE_MODE"):
+        return None
+    import cassettes
+    return cassettes.mode(provider)
+
+def recorded(provider: str, wrapper: str) -> Callable[[Callable[[], Any]], Callable[[], Any]]:
+    """Wrap a client factory's result with cassettes.<wrapper> when CASSETTE_MODE applies to the
+    provider. Replaying doesn't call the factory, so it needs no API keys."""
+    def decorator(factory: Callable[[], Any]) -> Callable[[], Any]:
+        @wraps(factory)
+        def create():
+            mode = _cassette(provider)
+            if mode is None:
+                return factory()
+            import cassettes
+            logging.info(f"Cassettes: {mode}ing {provider} calls")
+            return getattr(cassettes, wrapper)(factory() if mode == "record" else None)
+        return create
+    return decorator
+
+def gated(factory: Callable[[], Any]) -> Callable[[], Any]:
+    """Send a chat model factory's model through the LLM gateway, unless LLM_GATEWAY=0."""
+    @wraps(factory)
+    def create():
+        import llm_gateway
+        model = factory()
+        return llm_gateway.wrap_llm(model) if llm_gateway.LLM_GATEWAY else model
+    return create
+
+@singleton
+@gated
+@recorded("llm", "wrap_llm")
+def get_llm():
+    if _fake("llm"):
+        from fakes import FakeChatModel
+        logging.info("Using the fake chat model (FAKE_PROVIDERS)")
+        return FakeChatModel()
+    import llm_gateway
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    logging.info("Creating Gemini chat client")
+    # The gateway retries failed calls itself, so the client only makes one attempt
+    max_retries = 1 if llm_gateway.LLM_GATEWAY else 6
+    return ChatGoogleGenerativeAI(model="gemini-1.5-flash", api_key=os.getenv("GOOGLE_API_KEY"), max_retries=max_retries)
+
+@singleton
+@recorded("tavily", "wrap_tavily")
+def get_tavily():
+    if _fake("tavily"):
+        from fakes import FakeTavilyClient
+        return FakeTavilyClient()
+    from tavily import TavilyClient
+    return TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+
+@singleton
+@recorded("tavily", "wrap_async_tavily")
+def get_async_tavily():
+    if _fake("tavily"):
+        from fakes import FakeAsyncTavilyClient
+        return FakeAsyncTavilyClient()
+    from tavily import AsyncTavilyClient
+    return AsyncTavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+
+@singleton
+@recorded("embeddings", "wrap_embeddings")
+def get_cohere_embeddings():
+    if _fake("embeddings"):
+        from fakes import HashEmbeddings
+        return HashEmbeddings()
+    from langchain_cohere import CohereEmbeddings
+    return CohereEmbeddings(cohere_api_key=os.getenv("COHERE_API_KEY"), model="embed-english-v3.0")
+
+@singleton
+@recorded("vectorstore", "wrap_vector_store")
+def get_scheme_store():
+    """LangChain vector store over the farmwise-ai Pinecone index (Cohere embeddings)."""
+    if _fake("vectorstore"):
+        from fakes import scheme_store
+        return scheme_store()
+    from langchain_pinecone import PineconeVectorStore
+    logging.info("Connecting to Pinecone index farmwise-ai")
+    return PineconeVectorStore.from_existing_index(
+        index_name="farmwise-ai",
+        embedding=get_cohere_embeddings()
+    )
+
+@singleton
+def get_http_session():
+    """requests session for the site scrapes, reusing connections across requests."""
+    import requests
+    session = requests.Session()
+    if _fake("sites"):
+        from fakes import http_adapter
+        session.mount("http://", http_adapter())
+        session.mount("https://", http_adapter())
+    mode = _cassette("sites")
+    if mode:
+        import cassettes
+        for prefix in ("http://", "https://"):
+            session.mount(prefix, cassettes.http_adapter(session.get_adapter(prefix) if mode == "record" else None))
+    return session
+
+def async_http_transport():
+    """Transport for the async scrapes' httpx client: the default, the site fixtures, or a cassette."""
+    transport = None
+    if _fake("sites"):
+        from fakes import async_http_transport
+        transport = async_http_transport()
+    mode = _cassette("sites")
+    if mode == "record":
+        import httpx
+        import cassettes
+        transport = cassettes.async_http_transport(transport or httpx.AsyncHTTPTransport())
+    elif mode == "replay":
+        import cassettes
+        transport = cassettes.async_http_transport()
+    return transport
+
+@singleton
+def get_react_prompt():
+    """The ReAct agent prompt, vendored in react_prompt.py instead of pulled from the hub."""
+    from langchain_core.prompts import PromptTemplate
+    from react_prompt import REACT_PROMPT_TEMPLATE
+    return PromptTemplate.from_template(REACT_PROMPT_TEMPLATE)
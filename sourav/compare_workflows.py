@@ -0,0 +1,284 @@
+"""
+Compare the recommendation workflow variants (see workflow_variants.py) on the same farmer profiles.
+
+    python compare_workflows.py                                  # every variant, fixture profiles
+    python compare_workflows.py --variants workflow workflow2 --repeat 3
+    python compare_workflows.py --live --output comparison.json
+
+Runs against the offline stand-ins in fakes.py (FAKE_PROVIDERS=all) unless --live; workflow4
+is LlamaIndex-based and has no fakes, so it is skipped without --live. Each variant runs on
+every profile in fixtures/profiles.json (or --profiles), with the timings log, traces and usage
+database in a temporary directory.
+
+For each variant it reports the mean per run of:
+- LLM calls and input/output tokens (usage metadata, or a chars/4 estimate without it)
+- wall time, split into LLM, retrieval (Tavily, scrapes, Pinecone), agent overhead and charts
+- retrieval calls
+- answer structure: "##" scheme sections, distinct URLs, and the share of answers with 4-6
+  sections and at least one URL, which is what the prompts ask for
+"""
+import os
+import re
+import sys
+import copy
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+DEFAULT_PROFILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "profiles.json")
+LIVE_ONLY_VARIANTS = ("workflow4",)
+CHARS_PER_TOKEN = 4  # Rough estimate, used when the LLM doesn't report usage
+SECTION_RANGE = (4, 6)  # The prompts ask for 4-6 recommendations
+
+SECTION_PATTERN = re.compile(r"^#{2,3}\s+\S", re.MULTILINE)
+URL_PATTERN = re.compile(r"https?://[^\s)\]>\"'`]+")
+
+# Span name prefix -> wall time category
+SPAN_CATEGORIES = {
+    "llm.": "llm_ms",
+    "tavily.": "retrieval_ms",
+    "scrape": "retrieval_ms",
+    "pinecone.": "retrieval_ms",
+    "agent.": "agent_ms",
+    "chart.": "chart_ms",
+}
+
+class LLMCallCounter(BaseCallbackHandler):
+    """Count LLM calls and tokens made by LangChain (and, see _watch_llama_index, LlamaIndex)."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._estimates: Dict[Any, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, input_tokens: int, output_tokens: int) -> None:
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+
+    def on_chat_model_start(self, serialized: Any, messages: List[List[Any]], *, run_id: Any, **kwargs: Any) -> None:
+        self._estimates[run_id] = sum(len(str(m.content)) for batch in messages for m in batch) // CHARS_PER_TOKEN
+
+    def on_llm_start(self, serialized: Any, prompts: List[str], *, run_id: Any, **kwargs: Any) -> None:
+        self._estimates[run_id] = sum(len(p) for p in prompts) // CHARS_PER_TOKEN
+
+    def on_llm_end(self, response: Any, *, run_id: Any, **kwargs: Any) -> None:
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        message = getattr(generation, "message", None)
+        usage = getattr(message, "usage_metadata", None)
+        estimate = self._estimates.pop(run_id, 0)
+        if usage:
+            self.add(usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+        else:
+            self.add(estimate, len(generation.text if generation else "") // CHARS_PER_TOKEN)
+
+    def on_llm_error(self, error: BaseException, *, run_id: Any, **kwargs: Any) -> None:
+        self._estimates.pop(run_id, None)
+
+# LangChain adds the active counter to every run's callbacks, including those in graph worker threads
+_counter: ContextVar[Optional[LLMCallCounter]] = ContextVar("compare_workflows_counter", default=None)
+register_configure_hook(_counter, inheritable=True)
+
+_llama_index_watched = False
+
+def _watch_llama_index() -> None:
+    """Count LlamaIndex chat calls (workflow4) into the active counter."""
+    global _llama_index_watched
+    if _llama_index_watched:
+        return
+    from llama_index.core.instrumentation import get_dispatcher
+    from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+    from llama_index.core.instrumentation.events.llm import LLMChatEndEvent
+
+    class ChatEndHandler(BaseEventHandler):
+        @classmethod
+        def class_name(cls) -> str:
+            return "CompareWorkflowsChatEndHandler"
+
+        def handle(self, event: Any, **kwargs: Any) -> None:
+            counter = _counter.get()
+            if counter is None or not isinstance(event, LLMChatEndEvent):
+                return
+            prompt_chars = sum(len(str(m.content or "")) for m in event.messages or [])
+            reply_chars = len(str(event.response.message.content or "")) if event.response else 0
+            counter.add(prompt_chars // CHARS_PER_TOKEN, reply_chars // CHARS_PER_TOKEN)
+
+    get_dispatcher().add_event_handler(ChatEndHandler())
+    _llama_index_watched = True
+
+def answer_structure(text: Optional[str]) -> Dict[str, Any]:
+    """Check an answer for the shape the prompts ask for: "##" scheme sections with links."""
+    text = text or ""
+    sections = len(SECTION_PATTERN.findall(text))
+    urls = {url.rstrip(".,;:") for url in URL_PATTERN.findall(text)}
+    return {
+        "sections": sections,
+        "urls": len(urls),
+        "chars": len(text),
+        "sections_ok": SECTION_RANGE[0] <= sections <= SECTION_RANGE[1],
+        "has_urls": bool(urls),
+    }
+
+def span_breakdown(spans: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Wall time (ms) per category of external call, and the number of retrieval calls."""
+    breakdown = {category: 0.0 for category in SPAN_CATEGORIES.values()}
+    breakdown["retrieval_calls"] = 0
+    for span in spans:
+        if span["kind"] != "call":
+            continue
+        for prefix, category in SPAN_CATEGORIES.items():
+            if span["name"].startswith(prefix):
+                breakdown[category] += span["duration_ms"]
+                if category == "retrieval_ms":
+                    breakdown["retrieval_calls"] += 1
+                break
+    return {key: round(value, 1) for key, value in breakdown.items()}
+
+def run_once(variant: str, initial_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one variant on one initial state and measure it."""
+    import timing
+    import workflow_variants
+
+    counter = LLMCallCounter()
+    token = _counter.set(counter)
+    error = None
+    state: Dict[str, Any] = {}
+    start = time.perf_counter()
+    try:
+        with timing.record_run(f"compare.{variant}") as run:
+            state = workflow_variants.run(copy.deepcopy(initial_state), variant)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        logging.warning(f"{variant} failed: {error}")
+    finally:
+        _counter.reset(token)
+    wall_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    return {
+        "ok": error is None,
+        "error": error,
+        "wall_ms": wall_ms,
+        "llm_calls": counter.calls,
+        "input_tokens": counter.input_tokens,
+        "output_tokens": counter.output_tokens,
+        **span_breakdown(run.spans),
+        "structure": answer_structure(state.get("recommendations")),
+    }
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Mean per run of the numeric measurements, plus pass rates of the structure checks."""
+    ok = [run for run in runs if run["ok"]]
+    summary: Dict[str, Any] = {"runs": len(runs), "errors": len(runs) - len(ok)}
+    if not ok:
+        return summary
+
+    def mean(values: List[float]) -> float:
+        return round(sum(values) / len(values), 1)
+
+    for key in ("llm_calls", "input_tokens", "output_tokens", "wall_ms", "llm_ms", "retrieval_ms", "agent_ms", "chart_ms", "retrieval_calls"):
+        summary[key] = mean([run[key] for run in ok])
+    for key in ("sections", "urls", "chars"):
+        summary[key] = mean([run["structure"][key] for run in ok])
+    for key in ("sections_ok", "has_urls"):
+        summary[key] = round(sum(run["structure"][key] for run in ok) / len(ok), 2)
+    return summary
+
+def print_results(results: Dict[str, Any]) -> None:
+    header = ["variant", "runs", "errors", "llm_calls", "input_tokens", "output_tokens", "wall_ms", "llm_ms",
+              "retrieval_ms", "agent_ms", "chart_ms", "retrieval_calls", "sections", "urls", "sections_ok", "has_urls"]
+    table = [[name, *(str(summary.get(column, "")) for column in header[1:])] for name, summary in results["variants"].items()]
+    widths = [max([len(header[i])] + [len(row[i]) for row in table]) for i in range(len(header))]
+    print("  ".join(h.ljust(w) for h, w in zip(header, widths)).rstrip())
+    for row in table:
+        print("  ".join(c.ljust(w) for c, w in zip(row, widths)).rstrip())
+    for name, reason in results["skipped"].items():
+        print(f"{name}: skipped ({reason})")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the recommendation workflow variants on the same profiles")
+    parser.add_argument("--variants", nargs="+", help="Variants to compare (default: all of workflow, workflow2, workflow3, workflow4)")
+    parser.add_argument("--profiles", default=DEFAULT_PROFILES, help="JSON list of farmer profiles, as sent to /api/recommendations")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per variant and profile")
+    parser.add_argument("--live", action="store_true", help="Call the real Gemini, Tavily, Pinecone and sites instead of fakes.py")
+    parser.add_argument("--output", help="Write the summaries and every run to this JSON file")
+    args = parser.parse_args()
+
+    # Configure the providers and throwaway logs before importing the workflows
+    workdir = tempfile.mkdtemp(prefix="farmwise-compare-")
+    if not args.live:
+        os.environ.setdefault("FAKE_PROVIDERS", "all")
+    os.environ.setdefault("LLM_USAGE_DB", os.path.join(workdir, "usage.db"))
+    os.environ["TIMINGS_LOG_PATH"] = os.path.join(workdir, "logs", "timings.jsonl")
+    os.environ["TRACE_EXPORT_PATH"] = os.path.join(workdir, "traces", "traces.jsonl")
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import workflow_variants
+    from api import parse_recommendation_request
+    logging.getLogger().setLevel(logging.WARNING)  # The workflows log every step at INFO
+
+    variants = args.variants or list(workflow_variants.VARIANTS)
+    unknown = [name for name in variants if name not in workflow_variants.VARIANTS]
+    if unknown:
+        parser.error(f"unknown variants: {', '.join(unknown)} (choose from {', '.join(workflow_variants.VARIANTS)})")
+
+    with open(args.profiles, encoding="utf-8") as f:
+        profiles = json.load(f)
+    initial_states = []
+    for profile in profiles:
+        initial_state, error = parse_recommendation_request({"profile": profile})
+        if error:
+            parser.error(f"invalid profile in {args.profiles}: {error['message']}")
+        initial_states.append(initial_state)
+
+    print(f"Comparing {', '.join(variants)} on {len(initial_states)} profiles x {args.repeat} "
+          f"({'live providers' if args.live else 'FAKE_PROVIDERS=' + os.environ['FAKE_PROVIDERS']}, working directory {workdir})")
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "profiles": args.profiles,
+            "repeat": args.repeat,
+            "fake_providers": os.getenv("FAKE_PROVIDERS", "")
+        },
+        "variants": {},
+        "skipped": {},
+        "runs": {}
+    }
+    for variant in variants:
+        if variant in LIVE_ONLY_VARIANTS and not args.live:
+            results["skipped"][variant] = "needs live providers, run with --live"
+            continue
+        try:
+            if variant == "workflow4":
+                _watch_llama_index()
+            workflow_variants.load(variant)
+        except Exception as e:
+            results["skipped"][variant] = f"could not import: {type(e).__name__}: {e}"
+            continue
+        runs = [run_once(variant, state) for state in initial_states for _ in range(args.repeat)]
+        results["runs"][variant] = runs
+        results["variants"][variant] = summarize(runs)
+
+    print()
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
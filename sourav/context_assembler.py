@@ -0,0 +1,111 @@
+"""
+Assembly of the scheme context for the recommendation prompt.
+
+The search nodes return Tavily results, scraped pages and Pinecone chunks that often repeat
+each other, and joining them all in full made the prompt (and the LLM's latency) swing with
+whatever the search returned. assemble() instead:
+
+- drops near-duplicates: documents whose 64-bit SimHash over word 3-shingles is within
+  CONTEXT_SIMHASH_DISTANCE bits of a more relevant document's,
+- ranks the rest by how many of the farmer's profile terms (state, crop, irrigation, ...) they
+  mention, keeping the search order between equals,
+- packs them, most relevant first, into CONTEXT_TOKEN_BUDGET tokens, cutting each document to
+  at most CONTEXT_DOC_TOKENS.
+
+- CONTEXT_TOKEN_BUDGET: tokens of scheme context in the prompt (default 3000)
+- CONTEXT_DOC_TOKENS: tokens of any one document (default 600)
+- CONTEXT_SIMHASH_DISTANCE: bits two fingerprints may differ by and still be duplicates (default 10;
+  search snippets are short, so a few changed words move several bits, while unrelated texts
+  differ by about 32)
+
+Used by recommendation_node in workflow.py and workflow2.py, which log the prompt's token count.
+"""
+import os
+import re
+import hashlib
+import logging
+from typing import Dict, List, Set, Tuple
+from langchain_core.documents import Document
+import token_usage
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_DOC_TOKENS = int(os.getenv("CONTEXT_DOC_TOKENS", "600"))
+CONTEXT_SIMHASH_DISTANCE = int(os.getenv("CONTEXT_SIMHASH_DISTANCE", "10"))
+
+MIN_DOC_TOKENS = 50  # A document cut shorter than this isn't worth including
+SHINGLE_WORDS = 3
+
+_WORD = re.compile(r"\w+")
+# Profile values that say nothing about which scheme fits
+_UNINFORMATIVE = {"yes", "no", "none", "unknown", "the", "and", "for", "with"}
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of a text's word shingles; near-identical texts differ in few bits."""
+    words = _words(text)
+    shingles = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))]
+    weights = [0] * 64
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+def _distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def profile_terms(profile: Dict[str, str]) -> Set[str]:
+    """Words of the profile's values, plus the field name of yes/no fields answered yes (e.g. needs_insurance)."""
+    terms = set()
+    for key, value in profile.items():
+        value = str(value).lower()
+        terms.update(word for word in _words(value) if len(word) > 2 and not word.isdigit())
+        if value == "yes":
+            terms.update(word for word in _words(key.replace("_", " ")) if len(word) > 2)
+    return terms - _UNINFORMATIVE
+
+def _render(doc: Document) -> str:
+    return f"{doc.metadata.get('title', 'Untitled')}: {doc.page_content}"
+
+def _truncate(text: str, tokens: int) -> str:
+    max_chars = tokens * token_usage.CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars - 3)
+    return text[:cut if cut > 0 else max_chars - 3].rstrip() + "..."
+
+def rank(documents: List[Document], profile: Dict[str, str]) -> List[Tuple[int, Document]]:
+    """(score, document) by descending profile-term matches; sorting is stable, so equals keep the search order."""
+    terms = profile_terms(profile)
+    scored = [(len(terms.intersection(_words(_render(doc)))), doc) for doc in documents]
+    return sorted(scored, key=lambda item: -item[0])
+
+def assemble(documents: List[Document], profile: Dict[str, str]) -> str:
+    """Return the deduplicated, ranked and budgeted scheme context, one document per line."""
+    kept: List[Tuple[int, str]] = []
+    duplicates = 0
+    for _, doc in rank([doc for doc in documents if doc.page_content.strip()], profile):
+        text = _render(doc)
+        fingerprint = simhash(text)
+        if any(_distance(fingerprint, other) <= CONTEXT_SIMHASH_DISTANCE for other, _ in kept):
+            duplicates += 1
+            continue
+        kept.append((fingerprint, text))
+
+    parts = []
+    remaining = CONTEXT_TOKEN_BUDGET
+    for _, text in kept:
+        tokens = min(CONTEXT_DOC_TOKENS, remaining)
+        if tokens < MIN_DOC_TOKENS:
+            break
+        part = _truncate(text, tokens)
+        parts.append(part)
+        remaining -= token_usage.estimate_tokens(part)
+    context = "\n".join(parts)
+    logging.info(
+        f"Scheme context: {len(parts)} of {len(documents)} documents ({duplicates} near-duplicates dropped, "
+        f"{len(kept) - len(parts)} over budget), {token_usage.estimate_tokens(context)} tokens"
+    )
+    return context
@@ -1,49 +1,59 @@
 import os
 import logging
 from dotenv import load_dotenv
-from pinecone import Pinecone, NotFoundException
-from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
-from llama_index.vector_stores.pinecone import PineconeVectorStore
-from llama_index.core import StorageContext, VectorStoreIndex, SimpleDirectoryReader
+from clients import singleton
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger()
 
 load_dotenv()
 
-if not os.getenv("COHERE_API_KEY") or not os.getenv("PINECONE_API_KEY"):
-    logger.error("Missing COHERE_API_KEY or PINECONE_API_KEY in environment variables")
-    raise ValueError("Missing COHERE_API_KEY or PINECONE_API_KEY in environment variables")
-else:
+index_name = "farmwise-ai"
+
+def _check_env():
+    if not os.getenv("COHERE_API_KEY") or not os.getenv("PINECONE_API_KEY"):
+        logger.error("Missing COHERE_API_KEY or PINECONE_API_KEY in environment variables")
+        raise ValueError("Missing COHERE_API_KEY or PINECONE_API_KEY in environment variables")
     logger.info("Environment variables loaded successfully")
 
-embed_model = GoogleGenAIEmbedding(
-    model_name="models/embedding-001", 
-    api_key=os.getenv("GOOGLE_API_KEY"), 
-)
-logger.info("Embedding model initialized")
+# The clients below are created on first use rather than at import, so that importing
+# this module (e.g. via tools.py) doesn't need the network.
 
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-logger.info("Pinecone client initialized")
+@singleton
+def get_embed_model():
+    from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+    embed_model = GoogleGenAIEmbedding(
+        model_name="models/embedding-001", 
+        api_key=os.getenv("GOOGLE_API_KEY"), 
+    )
+    logger.info("Embedding model initialized")
+    return embed_model
+
+@singleton
+def get_pinecone_index():
+    from pinecone import Pinecone, NotFoundException
+    _check_env()
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    logger.info("Pinecone client initialized")
 
-index_name = "farmwise-ai"
-try:
-    pinecone_index = pc.Index(index_name)
-    logger.info(f"Index '{index_name}' found.")
-except NotFoundException:
-    logger.warning(f"Index '{index_name}' not found, creating a new one.")
     try:
-        pc.create_index(
-            name=index_name,
-            dimension=768,
-            metric="cosine",
-            spec={"serverless": {"cloud": "aws", "region": "us-east-1"}}, 
-        )
         pinecone_index = pc.Index(index_name)
-        logger.info(f"Index '{index_name}' created successfully.")
-    except Exception as e:
-        logger.error(f"Failed to create Pinecone index: {str(e)}")
-        raise
+        logger.info(f"Index '{index_name}' found.")
+    except NotFoundException:
+        logger.warning(f"Index '{index_name}' not found, creating a new one.")
+        try:
+            pc.create_index(
+                name=index_name,
+                dimension=768,
+                metric="cosine",
+                spec={"serverless": {"cloud": "aws", "region": "us-east-1"}}, 
+            )
+            pinecone_index = pc.Index(index_name)
+            logger.info(f"Index '{index_name}' created successfully.")
+        except Exception as e:
+            logger.error(f"Failed to create Pinecone index: {str(e)}")
+            raise
+    return pinecone_index
 
 # try:
 #     documents = SimpleDirectoryReader("./docs").load_data()
@@ -52,9 +62,31 @@ except NotFoundException:
 #     logger.error(f"Failed to load documents: {str(e)}")
 #     raise
 
-vector_store = PineconeVectorStore(pinecone_index=pinecone_index)
-storage_context = StorageContext.from_defaults(vector_store=vector_store)
-logger.info("Storage context and vector store set up successfully")
+@singleton
+def get_vector_store():
+    from llama_index.vector_stores.pinecone import PineconeVectorStore
+    vector_store = PineconeVectorStore(pinecone_index=get_pinecone_index())
+    logger.info("Vector store set up successfully")
+    return vector_store
+
+@singleton
+def get_storage_context():
+    from llama_index.core import StorageContext
+    storage_context = StorageContext.from_defaults(vector_store=get_vector_store())
+    logger.info("Storage context set up successfully")
+    return storage_context
+
+def __getattr__(name):
+    # Keep "from data_feed import vector_store" (and friends) working, lazily
+    lazy = {
+        "embed_model": get_embed_model,
+        "pinecone_index": get_pinecone_index,
+        "vector_store": get_vector_store,
+        "storage_context": get_storage_context,
+    }
+    if name in lazy:
+        return lazy[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # def safe_embed_request(embed_model, documents_batch):
 #     try:
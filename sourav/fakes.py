@@ -0,0 +1,297 @@
+"""
+Offline, deterministic stand-ins for Gemini, Cohere, Tavily, the scraped sites and Pinecone.
+
+Selected with FAKE_PROVIDERS, a comma separated list of providers (or "all"):
+
+    FAKE_PROVIDERS=all python api.py
+    FAKE_PROVIDERS=llm,tavily,sites FAKE_LLM_LATENCY_MS=800 FAKE_LLM_JITTER_MS=200 python api.py
+
+- llm: a chat model returning canned, shape-correct replies (markdown recommendations,
+  ReAct steps for the agents) after FAKE_LLM_LATENCY_MS +/- FAKE_LLM_JITTER_MS, streamed in
+  chunks every FAKE_LLM_CHUNK_MS, with usage metadata so token accounting still works
+- embeddings: hashed bag-of-words vectors, so similar texts get similar embeddings
+- tavily: search results from fixtures/tavily_search.json
+- sites: the scraped pages, from fixtures/sites/<host>.html (after FAKE_HTTP_LATENCY_MS)
+- vectorstore: in-memory LangChain and LlamaIndex stores over fixtures/schemes.json
+
+clients.py and tools.py return these from their getters, so the workflows and the API run
+unchanged against them. Latency jitter comes from FAKE_SEED, so runs are reproducible.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Iterator, AsyncIterator, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+FAKE_PROVIDERS = {p.strip().lower() for p in os.getenv("FAKE_PROVIDERS", "").split(",") if p.strip()}
+FAKE_FIXTURES_DIR = os.getenv("FAKE_FIXTURES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))  # Time to the first token
+FAKE_LLM_JITTER_MS = float(os.getenv("FAKE_LLM_JITTER_MS", "100"))
+FAKE_LLM_CHUNK_MS = float(os.getenv("FAKE_LLM_CHUNK_MS", "20"))  # Between streamed chunks
+FAKE_HTTP_LATENCY_MS = float(os.getenv("FAKE_HTTP_LATENCY_MS", "100"))  # Tavily searches and site fetches
+FAKE_SEED = int(os.getenv("FAKE_SEED", "0"))
+EMBEDDING_DIMENSIONS = 1024  # Same as Cohere embed-english-v3.0
+
+CHARS_PER_TOKEN = 4
+WORDS_PER_CHUNK = 4
+
+_rng = random.Random(FAKE_SEED)
+_rng_lock = threading.Lock()
+
+def enabled(provider: str) -> bool:
+    """Whether FAKE_PROVIDERS selects the fake for a provider."""
+    return "all" in FAKE_PROVIDERS or provider in FAKE_PROVIDERS
+
+def _delay(base_ms: float, jitter_ms: float = 0.0) -> float:
+    """A latency in seconds, jittered reproducibly from FAKE_SEED."""
+    with _rng_lock:
+        jitter = _rng.uniform(-jitter_ms, jitter_ms) if jitter_ms else 0.0
+    return max(0.0, base_ms + jitter) / 1000
+
+@lru_cache(maxsize=None)
+def load_fixture(name: str) -> Any:
+    """Parse a JSON fixture from FAKE_FIXTURES_DIR (cached)."""
+    with open(os.path.join(FAKE_FIXTURES_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+# --- LLM ---
+
+RECOMMENDATIONS = """## PM-KISAN
+**Eligibility:** Your {land} qualifies you as a small farmer; land records in your name are required.
+**Benefits:** ₹6000 a year in three instalments of ₹2000, enough for a season's wheat seed on one hectare.
+**How to apply:** Register at https://pmkisan.gov.in with Aadhaar and land records, or visit your Common Service Centre.
+
+## PMFBY (Crop Insurance)
+**Eligibility:** Rain-fed farms face weather risk, so insurance is recommended for your crops.
+**Benefits:** Premium of 2% (kharif) or 1.5% (rabi) of the sum insured; the government pays the rest.
+**How to apply:** Enrol through your bank or at https://pmfby.gov.in before the seasonal cut-off date.
+
+## SMAM (Machinery Subsidy)
+**Eligibility:** Small and marginal farmers get the highest subsidy rate.
+**Benefits:** 40-50% of the cost of tractors, tillers and sprayers.
+**How to apply:** Apply at https://agrimachinery.nic.in and keep the dealer quotation ready.
+
+## State Subsidies
+**Eligibility:** Farmers registered in {state}.
+**Benefits:** Top-ups for drip irrigation, seeds and equipment on the state DBT portal.
+**How to apply:** Visit your district agriculture office or https://mahadbt.maharashtra.gov.in (Maharashtra)."""
+
+def _field(text: str, name: str, default: str) -> str:
+    """Pull "name: value" out of a formatted profile, for a reply that mentions it."""
+    for line in text.splitlines():
+        key, _, value = line.partition(":")
+        if key.strip().lower().strip("-* ") == name and value.strip():
+            return value.strip()
+    return default
+
+def _react_reply(prompt: str) -> str:
+    """One ReAct step: call the first tool once, then give the final answer."""
+    scratchpad = prompt.rsplit("Question:", 1)[-1]
+    if "Observation:" not in scratchpad and "should be one of [" in prompt:
+        tool = prompt.split("should be one of [", 1)[1].split("]", 1)[0].split(",")[0].strip()
+        if tool:
+            return f"I should look up schemes that match this farmer.\nAction: {tool}\nAction Input: agricultural schemes for small farmers"
+    return "I now know the final answer\nFinal Answer: " + RECOMMENDATIONS.format(land="2 hectares", state="your state")
+
+def canned_reply(messages: List[BaseMessage]) -> str:
+    """A deterministic reply in the shape the calling prompt asks for."""
+    prompt = "\n".join(str(m.content) for m in messages)
+    if "Final Answer:" in prompt and "Action Input:" in prompt:
+        return _react_reply(prompt)
+    return RECOMMENDATIONS.format(land=_field(prompt, "land_size", "land holding"), state=_field(prompt, "state", "your state"))
+
+def _usage(messages: List[BaseMessage], reply: str) -> Dict[str, int]:
+    input_tokens = max(1, sum(len(str(m.content)) for m in messages) // CHARS_PER_TOKEN)
+    output_tokens = max(1, len(reply) // CHARS_PER_TOKEN)
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+def _chunks(text: str) -> List[str]:
+    words = text.split(" ")
+    return [" ".join(words[i:i + WORDS_PER_CHUNK]) + (" " if i + WORDS_PER_CHUNK < len(words) else "")
+            for i in range(0, len(words), WORDS_PER_CHUNK)]
+
+def _apply_stop(text: str, stop: Optional[List[str]]) -> str:
+    for token in stop or []:
+        text = text.split(token, 1)[0]
+    return text
+
+class FakeChatModel(BaseChatModel):
+    """Chat model with Gemini's interface that answers from canned replies after a simulated delay."""
+
+    latency_ms: float = FAKE_LLM_LATENCY_MS
+    jitter_ms: float = FAKE_LLM_JITTER_MS
+    chunk_ms: float = FAKE_LLM_CHUNK_MS
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def _reply(self, messages: List[BaseMessage], stop: Optional[List[str]]) -> Tuple[str, List[str]]:
+        reply = _apply_stop(canned_reply(messages), stop)
+        return reply, _chunks(reply)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        reply, chunks = self._reply(messages, stop)
+        time.sleep(_delay(self.latency_ms, self.jitter_ms) + len(chunks) * self.chunk_ms / 1000)
+        message = AIMessage(content=reply, usage_metadata=_usage(messages, reply))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        reply, chunks = self._reply(messages, stop)
+        await asyncio.sleep(_delay(self.latency_ms, self.jitter_ms) + len(chunks) * self.chunk_ms / 1000)
+        message = AIMessage(content=reply, usage_metadata=_usage(messages, reply))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        reply, chunks = self._reply(messages, stop)
+        time.sleep(_delay(self.latency_ms, self.jitter_ms))
+        for i, text in enumerate(chunks):
+            if i:
+                time.sleep(self.chunk_ms / 1000)
+            # Like Gemini, usage is reported on the last chunk
+            usage = _usage(messages, reply) if i == len(chunks) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text, usage_metadata=usage))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        reply, chunks = self._reply(messages, stop)
+        await asyncio.sleep(_delay(self.latency_ms, self.jitter_ms))
+        for i, text in enumerate(chunks):
+            if i:
+                await asyncio.sleep(self.chunk_ms / 1000)
+            usage = _usage(messages, reply) if i == len(chunks) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text, usage_metadata=usage))
+
+# --- Embeddings ---
+
+def hash_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> List[float]:
+    """Feature-hash the words of a text into a unit vector; texts sharing words score higher."""
+    vector = [0.0] * dimensions
+    for word in text.lower().split():
+        digest = hashlib.blake2b(word.strip(".,;:!?()[]\"'").encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimensions
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector] if norm else vector
+
+class HashEmbeddings(Embeddings):
+    """Embeddings with Cohere's interface and dimensions, computed locally from hashed words."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [hash_embedding(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return hash_embedding(text)
+
+# --- Tavily ---
+
+def _tavily_results(max_results: int) -> List[Dict[str, Any]]:
+    return load_fixture("tavily_search.json")["results"][:max_results]
+
+class FakeTavilyClient:
+    """TavilyClient answering every query from fixtures/tavily_search.json."""
+
+    def search(self, query: str, max_results: int = 5, **kwargs: Any) -> Dict[str, Any]:
+        delay = _delay(FAKE_HTTP_LATENCY_MS)
+        time.sleep(delay)
+        return {"query": query, "follow_up_questions": None, "answer": None, "images": [],
+                "results": _tavily_results(max_results), "response_time": round(delay, 2)}
+
+    def get_search_context(self, query: str, max_results: int = 5, **kwargs: Any) -> str:
+        time.sleep(_delay(FAKE_HTTP_LATENCY_MS))
+        # Like the real client, a JSON string of url/content pairs
+        return json.dumps([{"url": r["url"], "content": r["content"]} for r in _tavily_results(max_results)])
+
+class FakeAsyncTavilyClient:
+    """AsyncTavilyClient answering every query from fixtures/tavily_search.json."""
+
+    async def search(self, query: str, max_results: int = 5, **kwargs: Any) -> Dict[str, Any]:
+        delay = _delay(FAKE_HTTP_LATENCY_MS)
+        await asyncio.sleep(delay)
+        return {"query": query, "follow_up_questions": None, "answer": None, "images": [],
+                "results": _tavily_results(max_results), "response_time": round(delay, 2)}
+
+# --- Scraped sites ---
+
+def site_page(url: str) -> Tuple[int, bytes]:
+    """Status and body for a scraped URL, from fixtures/sites/<host>.html (404 if there is none)."""
+    host = url.split("://", 1)[-1].split("/", 1)[0].split(":", 1)[0]
+    path = os.path.join(FAKE_FIXTURES_DIR, "sites", f"{host}.html")
+    if not os.path.exists(path):
+        return 404, b"<html><body><h1>Not Found</h1></body></html>"
+    with open(path, "rb") as f:
+        return 200, f.read()
+
+def http_adapter() -> Any:
+    """A requests transport adapter serving site_page() for every request."""
+    from requests.adapters import BaseAdapter
+    from requests.models import Response
+    from requests.structures import CaseInsensitiveDict
+
+    class FixtureAdapter(BaseAdapter):
+        def send(self, request, **kwargs):
+            time.sleep(_delay(FAKE_HTTP_LATENCY_MS))
+            status, body = site_page(request.url)
+            response = Response()
+            response.status_code = status
+            response._content = body
+            response.headers = CaseInsensitiveDict({"Content-Type": "text/html; charset=utf-8"})
+            response.encoding = "utf-8"
+            response.url = request.url
+            response.request = request
+            return response
+
+        def close(self):
+            pass
+
+    return FixtureAdapter()
+
+def async_http_transport() -> Any:
+    """An httpx transport for AsyncClient serving site_page() for every request."""
+    import httpx
+
+    async def handle(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(_delay(FAKE_HTTP_LATENCY_MS))
+        status, body = site_page(str(request.url))
+        return httpx.Response(status, content=body, headers={"Content-Type": "text/html; charset=utf-8"})
+
+    return httpx.MockTransport(handle)
+
+# --- Vector stores ---
+
+def scheme_store() -> Any:
+    """In-memory LangChain vector store over fixtures/schemes.json, in place of the Pinecone index."""
+    from langchain_core.documents import Document
+    from langchain_core.vectorstores import InMemoryVectorStore
+    store = InMemoryVectorStore(embedding=HashEmbeddings())
+    store.add_documents([Document(page_content=s["text"], metadata=s["metadata"]) for s in load_fixture("schemes.json")])
+    logging.info("Using the in-memory scheme store (FAKE_PROVIDERS)")
+    return store
+
+def llama_scheme_index() -> Any:
+    """In-memory LlamaIndex index over fixtures/schemes.json with hashed embeddings."""
+    from llama_index.core import VectorStoreIndex
+    from llama_index.core.embeddings import BaseEmbedding
+    from llama_index.core.schema import TextNode
+
+    class HashEmbedding(BaseEmbedding):
+        def _get_query_embedding(self, query: str) -> List[float]:
+            return hash_embedding(query)
+
+        async def _aget_query_embedding(self, query: str) -> List[float]:
+            return hash_embedding(query)
+
+        def _get_text_embedding(self, text: str) -> List[float]:
+            return hash_embedding(text)
+
+    nodes = [TextNode(text=s["text"], metadata=s["metadata"]) for s in load_fixture("schemes.json")]
+    logging.info("Using the in-memory LlamaIndex scheme index (FAKE_PROVIDERS)")
+    return VectorStoreIndex(nodes, embed_model=HashEmbedding(model_name="hash"))
@@ -0,0 +1,50 @@
+"""
+Production server configuration
+
+    gunicorn -c gunicorn.conf.py api:app
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+
+Workers share recommendations through the SQLite cache (recommendation_cache.py). With
+preload on, the app (the compiled LangGraph workflow) is loaded once in the master
+process, and on_starting creates the lazy LLM and Tavily clients, before the workers
+are forked.
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+
+# The Gemini client uses gRPC, which needs fork support enabled to be loaded before forking
+os.environ.setdefault("GRPC_ENABLE_FORK_SUPPORT", "1")
+os.environ.setdefault("GRPC_POLL_STRATEGY", "poll")
+
+# Workers write their metrics here so /metrics can add up every process. The previous run's
+# metric files (counter_<pid>.db and so on) are cleared on each start; nothing else in the
+# directory is touched, as an operator may point it at a directory holding other data
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "farmwise-recommendations-metrics"))
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+for metric_type in ("counter", "gauge", "histogram", "summary"):
+    for metrics_file in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], f"{metric_type}_*.db")):
+        os.remove(metrics_file)
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))  # Per worker, for the gthread worker class
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))  # The workflow runs several searches and LLM calls
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+
+def on_starting(server):
+    """Create the lazy clients once in the master when preloading, so workers inherit them"""
+    if preload_app:
+        import clients
+        clients.get_llm()
+        clients.get_tavily()
+
+
+def child_exit(server, worker):
+    """Drop a finished worker's live gauges (in-flight requests) from /metrics"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
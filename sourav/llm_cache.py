@@ -0,0 +1,19 @@
+"""
+Exact-match cache of LLM responses for prompt types whose output only depends on their input,
+stored in SQLite so every worker process shares it.
+
+Refinement calls are cached for a day unless LLM_CACHE_TTLS ("prompt=seconds,...") says
+otherwise, in LLM_CACHE_DB (default recommendations.db, next to the recommendation cache), and
+LLM_CACHE_BYPASS lists prompt types (or "all") whose calls skip the cache.
+
+The implementation is farmwise_common.llm_cache; this module passes it the service's database
+and TTLs.
+"""
+import os
+from farmwise_common import db
+from farmwise_common import llm_cache as _llm_cache
+from farmwise_common.llm_cache import cache_key, enabled, get, peek, put
+
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "recommendations.db"))
+
+_llm_cache.configure(db.connector(LLM_CACHE_DB), {"refine": 86400})
@@ -0,0 +1,40 @@
+"""
+The workflows' LLM calls.
+
+Every prompt goes through invoke() (or ainvoke()), which checks the daily token budget, times
+the call and its payload sizes, counts it in the metrics and records its token usage, so no
+workflow can call the model without the budget and usage tracking.
+"""
+from typing import Any, Dict
+from langchain.prompts import ChatPromptTemplate
+from clients import get_llm
+from llm_gateway import call_config
+import metrics
+import timing
+import profiling
+import token_usage
+
+def assemble(name: str, prompt: ChatPromptTemplate, inputs: Dict[str, Any]) -> Any:
+    """Fill in a prompt (its allocations are recorded when the request is profiled)."""
+    with profiling.allocations(f"prompt {name}"):
+        return prompt.format_prompt(**inputs)
+
+def invoke(name: str, prompt: ChatPromptTemplate, inputs: Dict[str, Any]) -> str:
+    """Call the LLM with a prompt and return its stripped reply."""
+    token_usage.require_budget()
+    with timing.timed_call(f"llm.{name}", request_bytes=timing.payload_size(inputs)) as span, metrics.track_llm_call(name):
+        message = get_llm().invoke(assemble(name, prompt, inputs), config=call_config(name))
+        span["response_bytes"] = timing.payload_size(message)
+    metrics.record_llm_tokens(name, message)
+    token_usage.record_call(name, token_usage.add_usage(None, message), prompt, inputs, message.content)
+    return message.content.strip()
+
+async def ainvoke(name: str, prompt: ChatPromptTemplate, inputs: Dict[str, Any]) -> str:
+    """Async invoke()."""
+    token_usage.require_budget()
+    with timing.timed_call(f"llm.{name}", request_bytes=timing.payload_size(inputs)) as span, metrics.track_llm_call(name):
+        message = await get_llm().ainvoke(assemble(name, prompt, inputs), config=call_config(name))
+        span["response_bytes"] = timing.payload_size(message)
+    metrics.record_llm_tokens(name, message)
+    token_usage.record_call(name, token_usage.add_usage(None, message), prompt, inputs, message.content)
+    return message.content.strip()
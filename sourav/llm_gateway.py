@@ -0,0 +1,16 @@
+"""
+Gateway for the workflows' Gemini chat calls: concurrency limits, rate limiting, retries and
+circuit breaking in one place, so bursts of requests queue (or are refused) here instead of
+failing at Gemini's rate limits.
+
+clients.get_llm() routes the chat model through wrap_llm() unless LLM_GATEWAY=0; the LlamaIndex
+client in workflow4.py is not covered. Calls run with call_config(prompt type) are answered from
+llm_cache.py where that prompt type is cached and coalesced through singleflight.py. The API
+answers GatewayUnavailable (GatewayBusy, CircuitOpen) with a 503 and a Retry-After header.
+
+The implementation, and its LLM_* settings, are in farmwise_common.llm_gateway; importing this
+module sets up the service's response cache and single-flight leases, which the gateway uses.
+"""
+import llm_cache
+import singleflight
+from farmwise_common.llm_gateway import CircuitOpen, GatewayBusy, GatewayUnavailable, LLM_GATEWAY, call_config, wrap_llm
@@ -0,0 +1,17 @@
+"""
+Prometheus metrics for the recommendations API, served in text format at /metrics
+
+- Request counts, latency and in-flight requests per route, from the hooks installed by init_app()
+- LLM calls, latency and token usage per prompt type (recommendation, refine), from workflow.py
+- LLM gateway queue wait, queued and in-flight calls, retries, refusals and circuit state per model, from farmwise_common.llm_gateway
+- Recommendation cache lookups, from the API routes
+- Calls coalesced by farmwise_common.singleflight, per kind (llm, search)
+- SQLite statement timings, from the connection factory used by recommendation_cache
+
+Cache hit ratio, for example:
+
+    sum(rate(cache_lookups_total{cache="recommendation",result="hit"}[5m])) / sum(rate(cache_lookups_total{cache="recommendation"}[5m]))
+
+The metrics are defined in farmwise_common.metrics, shared with the scheme API.
+"""
+from farmwise_common.metrics import TimedConnection, init_app, record_cache_lookup, record_llm_tokens, track_llm_call
@@ -0,0 +1,20 @@
+"""
+On-demand profiling of single requests.
+
+Off unless PROFILING_ENABLED is set. Then a request sent with an X-Profile header (cprofile or
+sampling) runs under a profiler and its profile is written to profiles/ (PROFILE_DIR):
+
+    curl -H "X-Profile: sampling" -H "Content-Type: application/json" -d @request.json localhost:5000/api/recommendations
+
+LangGraph runs sync nodes on worker threads, so use sampling to see inside them. allocations()
+records the top allocation sites of prompt assembly, and JSON responses get a summary of the
+profile under metadata.profile.
+
+The implementation is farmwise_common.profiling; this module sets where the service's profiles go
+and the key they are returned under.
+"""
+import os
+from farmwise_common import profiling as _profiling
+from farmwise_common.profiling import allocations, init_app
+
+_profiling.configure(os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"), response_key="metadata")
@@ -0,0 +1,62 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import metrics
+from typing import Any, Dict, Optional
+from farmwise_common.db import Schema, connector
+
+# Recommendation responses are cached in SQLite so every worker process shares them
+CACHE_DB_PATH = os.getenv("RECOMMENDATION_CACHE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "recommendations.db"))
+CACHE_TTL = int(os.getenv("RECOMMENDATION_CACHE_TTL", "21600"))  # Seconds, 0 disables the cache
+
+_schema = Schema(
+    "recommendation_cache",
+    """
+    CREATE TABLE IF NOT EXISTS recommendation_cache (
+        key TEXT PRIMARY KEY,
+        response TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    """
+)
+_schema.configure(connector(CACHE_DB_PATH))
+
+def cache_key(state: Dict[str, Any], variant: str = "workflow") -> str:
+    """Key a request by its farmer profile, feedback and workflow variant (take it before the workflow runs, as it adds derived fields)"""
+    payload = json.dumps({"profile": state["profile"], "feedback": state.get("feedback"), "variant": variant}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    """Return the cached response for a key, or None if missing or older than CACHE_TTL"""
+    if CACHE_TTL <= 0:
+        return None
+    try:
+        conn = _schema.connect()
+        row = conn.execute(
+            "SELECT response FROM recommendation_cache WHERE key = ? AND created_at >= ?",
+            (key, time.time() - CACHE_TTL)
+        ).fetchone()
+        conn.close()
+    except sqlite3.Error as e:
+        logging.warning(f"Recommendation cache read failed: {e}")
+        return None
+    metrics.record_cache_lookup("recommendation", row is not None)
+    return json.loads(row[0]) if row else None
+
+def put(key: str, response: Dict[str, Any]) -> None:
+    """Cache a formatted recommendations response"""
+    if CACHE_TTL <= 0:
+        return
+    try:
+        conn = _schema.connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO recommendation_cache (key, response, created_at) VALUES (?, ?, ?)",
+            (key, json.dumps(response), time.time())
+        )
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        logging.warning(f"Recommendation cache write failed: {e}")
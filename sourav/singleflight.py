@@ -0,0 +1,24 @@
+"""
+Single-flight coalescing of identical concurrent calls.
+
+When many farmers with the same profile ask at once, the first call for a key (an LLM prompt,
+a Tavily query) runs and the others wait for it and share its result, or its error, instead
+of each spending tokens and search credits on the same answer.
+
+    response, coalesced = singleflight.do("search", key, compute)
+
+Used by llm_gateway.py (identical LLM calls) and the workflows' Tavily searches. With
+SINGLEFLIGHT_LEASES=true, calls passing a lookup are also coalesced across worker processes
+through leases in SINGLEFLIGHT_DB (default recommendations.db).
+
+The implementation is farmwise_common.singleflight; this module points its leases at
+SINGLEFLIGHT_DB.
+"""
+import os
+from farmwise_common import db
+from farmwise_common import singleflight as _singleflight
+from farmwise_common.singleflight import ado, do
+
+SINGLEFLIGHT_DB = os.getenv("SINGLEFLIGHT_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "recommendations.db"))
+
+_singleflight.configure(db.connector(SINGLEFLIGHT_DB))
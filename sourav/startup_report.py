@@ -0,0 +1,54 @@
+"""
+Report where startup time goes: import time per module (python -X importtime) and,
+optionally, the one-off cost of creating each lazy client on first use.
+
+    python startup_report.py                      # import api
+    python startup_report.py workflow workflow3 --top 15
+    python startup_report.py --clients            # also time clients.get_*() (needs network)
+"""
+import os
+import time
+import logging
+import argparse
+from typing import List, Tuple
+from farmwise_common import import_timing
+
+def measure_imports(module: str) -> Tuple[float, List[Tuple[float, str]]]:
+    """Import a module of this service in a fresh interpreter; return total ms and (cumulative ms, package) per top-level import."""
+    return import_timing.measure_imports(module, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+def time_clients() -> List[Tuple[float, str]]:
+    """Create each lazy client in clients.py and time its first call."""
+    import clients
+    timings = []
+    for name in ("get_llm", "get_tavily", "get_async_tavily", "get_cohere_embeddings", "get_scheme_store", "get_react_prompt"):
+        start = time.perf_counter()
+        try:
+            getattr(clients, name)()
+            status = ""
+        except Exception as e:
+            status = f"  (failed: {e})"
+        timings.append(((time.perf_counter() - start) * 1000, f"clients.{name}(){status}"))
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Report module import times and lazy client creation times")
+    parser.add_argument("modules", nargs="*", default=["api"], help="Modules to import (default: api)")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list per module")
+    parser.add_argument("--clients", action="store_true", help="Also time the first creation of each lazy client")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        total_ms, top_level = measure_imports(module)
+        print(f"import {module}: {total_ms:.0f} ms")
+        for ms, package in sorted(top_level, reverse=True)[:args.top]:
+            print(f"  {ms:8.1f} ms  {package}")
+
+    if args.clients:
+        logging.disable(logging.INFO)
+        print("First use of lazy clients:")
+        for ms, name in time_clients():
+            print(f"  {ms:8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
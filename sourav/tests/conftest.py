@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# The service's modules import each other by name, as when it runs from its own directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the tests' caches, leases and token usage out of recommendations.db, and off the network
+_db = os.path.join(tempfile.mkdtemp(prefix="farmwise-tests-"), "recommendations.db")
+for name in ("LLM_USAGE_DB", "LLM_CACHE_DB", "SINGLEFLIGHT_DB", "RECOMMENDATION_CACHE_DB"):
+    os.environ.setdefault(name, _db)
+os.environ.setdefault("FAKE_PROVIDERS", "all")
@@ -0,0 +1,66 @@
+import pytest
+from langchain_core.documents import Document
+import context_assembler
+import token_usage
+
+PROFILE = {"state": "Punjab", "crop": "wheat", "irrigation": "canal", "needs_insurance": "yes", "has_loan": "no"}
+
+def doc(title, text):
+    return Document(page_content=text, metadata={"title": title})
+
+def words(n, prefix="word"):
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+def test_simhash_is_close_for_near_duplicates_and_far_for_unrelated_text():
+    base = "PM-KISAN gives small and marginal farmers 6000 rupees a year in three equal instalments paid into their bank accounts"
+    edited = base + " directly"
+    unrelated = "Soil health cards tell farmers which nutrients their fields lack and how much fertiliser to apply per hectare"
+    assert context_assembler._distance(context_assembler.simhash(base), context_assembler.simhash(base)) == 0
+    assert context_assembler._distance(context_assembler.simhash(base), context_assembler.simhash(edited)) <= context_assembler.CONTEXT_SIMHASH_DISTANCE
+    assert context_assembler._distance(context_assembler.simhash(base), context_assembler.simhash(unrelated)) > context_assembler.CONTEXT_SIMHASH_DISTANCE
+
+def test_profile_terms():
+    terms = context_assembler.profile_terms(PROFILE)
+    assert {"punjab", "wheat", "canal", "needs", "insurance"} <= terms
+    assert not terms & {"yes", "no", "has", "loan"}
+
+def test_rank_by_profile_matches_keeping_search_order_between_equals():
+    documents = [doc("A", "A scheme for rice"), doc("B", "Wheat growers in Punjab"), doc("C", "Another scheme for rice")]
+    assert [d.metadata["title"] for _, d in context_assembler.rank(documents, PROFILE)] == ["B", "A", "C"]
+
+def test_assemble_drops_near_duplicates_keeping_the_more_relevant():
+    text = "Crop insurance for wheat farmers in Punjab covers losses from hail, floods and pests at a two percent premium"
+    documents = [
+        doc("Copy", text.replace(" in Punjab", "")),
+        doc("Original", text),
+        doc("Other", "Canal irrigation subsidy pays half the cost of lining field channels"),
+    ]
+    context = context_assembler.assemble(documents, PROFILE)
+    lines = context.split("\n")
+    assert len(lines) == 2
+    assert lines[0].startswith("Original:")
+    assert lines[1].startswith("Other:")
+
+def test_assemble_skips_empty_documents():
+    assert context_assembler.assemble([doc("Empty", "   "), doc("Wheat", "Wheat scheme")], PROFILE) == "Wheat: Wheat scheme"
+
+def test_assemble_packs_documents_into_the_token_budget(monkeypatch):
+    monkeypatch.setattr(context_assembler, "CONTEXT_TOKEN_BUDGET", 300)
+    monkeypatch.setattr(context_assembler, "CONTEXT_DOC_TOKENS", 120)
+    documents = [doc(f"Doc {i}", words(200, prefix=f"d{i}w")) for i in range(5)]
+    lines = context_assembler.assemble(documents, PROFILE).split("\n")
+    assert len(lines) == 3  # 120 + 120 tokens, then 60 left for the third, then under MIN_DOC_TOKENS
+    assert all(line.endswith("...") for line in lines)
+    assert all(token_usage.estimate_tokens(line) <= 120 for line in lines)
+    assert sum(token_usage.estimate_tokens(line) for line in lines) <= 300
+
+def test_short_documents_are_kept_whole():
+    documents = [doc("Wheat", "Wheat scheme in Punjab"), doc("Canal", "Canal lining grant")]
+    assert context_assembler.assemble(documents, PROFILE) == "Wheat: Wheat scheme in Punjab\nCanal: Canal lining grant"
+
+@pytest.mark.parametrize("text, tokens, expected", [
+    ("short text", 10, "short text"),
+    ("one two three four five six", 4, "one two..."),
+])
+def test_truncate_cuts_at_a_word(text, tokens, expected):
+    assert context_assembler._truncate(text, tokens) == expected
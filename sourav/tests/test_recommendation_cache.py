@@ -0,0 +1,24 @@
+import uuid
+import recommendation_cache
+
+def state(**profile):
+    return {"profile": {"crop": "wheat", "farm_id": uuid.uuid4().hex, **profile}, "feedback": None}
+
+def test_responses_round_trip():
+    key = recommendation_cache.cache_key(state())
+    assert recommendation_cache.get(key) is None
+    recommendation_cache.put(key, {"recommendations": ["Sow after the first rain"]})
+    assert recommendation_cache.get(key) == {"recommendations": ["Sow after the first rain"]}
+
+def test_key_covers_profile_feedback_and_variant():
+    request = state()
+    key = recommendation_cache.cache_key(request)
+    assert key == recommendation_cache.cache_key({**request, "profile": dict(request["profile"])})
+    assert key != recommendation_cache.cache_key({**request, "feedback": "too expensive"})
+    assert key != recommendation_cache.cache_key(request, variant="workflow2")
+
+def test_expired_or_disabled_cache_misses(monkeypatch):
+    key = recommendation_cache.cache_key(state())
+    recommendation_cache.put(key, {"recommendations": []})
+    monkeypatch.setattr(recommendation_cache, "CACHE_TTL", 0)
+    assert recommendation_cache.get(key) is None
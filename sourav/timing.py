@@ -0,0 +1,212 @@
+"""
+Per-run latency records for the LangGraph workflows.
+
+A run record collects one span per graph node execution and per external call
+(Tavily, scrapes, Pinecone, LLM calls, chart rendering) with wall time, retries and
+payload sizes. Finished runs are appended to a rotating JSONL file, and the API can
+return them under metadata.timings (see DEBUG_HEADER).
+
+    with timing.record_run("recommendations") as run:
+        ...                                   # nodes decorated with @timed_node
+        with timing.timed_call("tavily.search") as span:
+            response = ...
+            span["response_bytes"] = timing.payload_size(response)
+        run.to_dict()
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import contextvars
+from functools import wraps
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import tracing
+
+TIMINGS_LOG_PATH = os.getenv("TIMINGS_LOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "timings.jsonl"))
+TIMINGS_LOG_MAX_BYTES = int(os.getenv("TIMINGS_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+TIMINGS_LOG_BACKUP_COUNT = int(os.getenv("TIMINGS_LOG_BACKUP_COUNT", "5"))
+DEBUG_HEADER = os.getenv("TIMINGS_DEBUG_HEADER", "X-Debug-Timings")
+
+_current_run: contextvars.ContextVar[Optional["RunRecord"]] = contextvars.ContextVar("timing_run", default=None)
+
+_log_lock = threading.Lock()
+_run_logger: Optional[logging.Logger] = None
+
+class RunRecord:
+    """Spans recorded during one workflow run (shared by every node and call in it)."""
+
+    def __init__(self, name: str):
+        self.run_id = uuid.uuid4().hex
+        self.name = name
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.total_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self.spans: List[Dict[str, Any]] = []
+        self._node_runs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def offset_ms(self) -> float:
+        return round((time.perf_counter() - self._start) * 1000, 2)
+
+    def add_span(self, span: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def next_attempt(self, node: str) -> int:
+        """Count executions of a node, so refine-loop re-runs show up as attempts > 1."""
+        with self._lock:
+            self._node_runs[node] = self._node_runs.get(node, 0) + 1
+            return self._node_runs[node]
+
+    def to_dict(self) -> Dict[str, Any]:
+        by_name: Dict[str, Dict[str, float]] = {}
+        for span in self.spans:
+            entry = by_name.setdefault(f"{span['kind']}:{span['name']}", {"count": 0, "total_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] = round(entry["total_ms"] + span["duration_ms"], 2)
+        return {
+            "run_id": self.run_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "total_ms": self.total_ms if self.total_ms is not None else self.offset_ms(),
+            "error": self.error,
+            "summary": by_name,
+            "spans": sorted(self.spans, key=lambda span: span["start_ms"]),
+        }
+
+def current_run() -> Optional[RunRecord]:
+    return _current_run.get()
+
+def payload_size(payload: Any) -> int:
+    """Approximate size in bytes of a request/response payload."""
+    if payload is None:
+        return 0
+    if isinstance(payload, bytes):
+        return len(payload)
+    if isinstance(payload, str):
+        return len(payload.encode("utf-8"))
+    if hasattr(payload, "content") and isinstance(payload.content, str):
+        return len(payload.content.encode("utf-8"))
+    try:
+        return len(json.dumps(payload, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(str(payload).encode("utf-8"))
+
+def _get_run_logger() -> logging.Logger:
+    """Rotating JSONL writer, set up on first use."""
+    global _run_logger
+    with _log_lock:
+        if _run_logger is None:
+            os.makedirs(os.path.dirname(TIMINGS_LOG_PATH), exist_ok=True)
+            handler = RotatingFileHandler(TIMINGS_LOG_PATH, maxBytes=TIMINGS_LOG_MAX_BYTES, backupCount=TIMINGS_LOG_BACKUP_COUNT, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            run_logger = logging.getLogger("workflow_timings")
+            run_logger.setLevel(logging.INFO)
+            run_logger.propagate = False
+            run_logger.addHandler(handler)
+            _run_logger = run_logger
+        return _run_logger
+
+def write_run(run: RunRecord) -> None:
+    try:
+        _get_run_logger().info(json.dumps(run.to_dict(), default=str))
+    except Exception as e:
+        logging.warning(f"Could not write timings for run {run.run_id}: {e}")
+
+@contextmanager
+def record_run(name: str) -> Iterator[RunRecord]:
+    """Start a run record, or join the one already active (e.g. the API's around run_workflow)."""
+    existing = _current_run.get()
+    if existing is not None:
+        yield existing
+        return
+
+    run = RunRecord(name)
+    token = _current_run.set(run)
+    try:
+        # Also a span of the request's trace (or its own trace outside a request)
+        with tracing.span(f"run {name}", root=True, **{"run.id": run.run_id}):
+            yield run
+    except Exception as e:
+        run.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        try:
+            _current_run.reset(token)
+        except ValueError:
+            _current_run.set(None)  # A streaming generator finished in a different context
+        run.total_ms = run.offset_ms()
+        logging.info(f"Run {run.name} ({run.run_id}) took {run.total_ms:.0f} ms")
+        write_run(run)
+
+@contextmanager
+def timed_call(name: str, kind: str = "call", **fields: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Time an external call (or any block) into the current run.
+
+    Yields the span dict so callers can add fields such as request_bytes,
+    response_bytes or retries. Does nothing beyond timing if no run is active.
+    The block is also traced, with the span's fields as attributes.
+    """
+    run = _current_run.get()
+    span: Dict[str, Any] = {"name": name, "kind": kind, "retries": 0}
+    span.update(fields)
+    start = time.perf_counter()
+    span["start_ms"] = run.offset_ms() if run else 0.0
+    with tracing.span(name, kind=tracing.SPAN_KIND_INTERNAL if kind == "node" else tracing.SPAN_KIND_CLIENT) as trace_span:
+        try:
+            yield span
+            span["ok"] = True
+        except BaseException as e:
+            span["ok"] = False
+            span["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            if run:
+                run.add_span(span)
+            if trace_span:
+                for key in ("attempt", "retries", "request_bytes", "response_bytes", "url", "steps"):
+                    if key in span:
+                        trace_span.set_attribute(key, span[key])
+
+def timed_node(name: str) -> Callable:
+    """Decorate a graph node (sync or async) so each execution is recorded as a span."""
+    def decorator(func: Callable) -> Callable:
+        def start_span() -> Dict[str, Any]:
+            run = _current_run.get()
+            attempt = run.next_attempt(name) if run else 1
+            return {"attempt": attempt, "retries": attempt - 1}
+
+        def finish_span(span: Dict[str, Any], update: Any) -> None:
+            if isinstance(update, dict):
+                span["updated_keys"] = sorted(update)
+                span["response_bytes"] = payload_size({k: v for k, v in update.items() if k != "visuals"})
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(state, *args, **kwargs):
+                with timed_call(name, kind="node", **start_span()) as span:
+                    update = await func(state, *args, **kwargs)
+                    finish_span(span, update)
+                    return update
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(state, *args, **kwargs):
+            with timed_call(name, kind="node", **start_span()) as span:
+                update = func(state, *args, **kwargs)
+                finish_span(span, update)
+                return update
+        return wrapper
+    return decorator
+
+def wants_timings(headers: Any) -> bool:
+    """Whether a request asked for metadata.timings via the debug header."""
+    return headers.get(DEBUG_HEADER, "").lower() in ("1", "true", "yes")
@@ -0,0 +1,41 @@
+"""
+Token and cost accounting for the workflow's LLM calls, with daily budgets
+
+Every recommendation and refine call is recorded in SQLite (LLM_USAGE_DB, default
+recommendations.db) with the route and user it was made for (the X-User-Id header, or the
+client address) and its prompt type. Costs default to gemini-1.5-flash prices, overridden by
+LLM_INPUT_COST_PER_MTOK and LLM_OUTPUT_COST_PER_MTOK. Budgets are daily token limits
+(0 = unlimited):
+
+    LLM_DAILY_TOKEN_BUDGET=2000000
+    LLM_USER_DAILY_TOKEN_BUDGET=50000
+    LLM_ROUTE_TOKEN_BUDGETS=/api/recommendations/stream=1000000
+
+When a budget is used up the refine step is skipped and the unrefined recommendations
+are returned; the recommendation call itself raises BudgetExceeded (a 429 from the API).
+
+Report of the last week's usage:
+
+    python token_usage.py --days 7 --by route prompt
+
+The accounting is farmwise_common.token_usage; this module points it at LLM_USAGE_DB.
+"""
+import os
+from farmwise_common import db
+from farmwise_common import token_usage as _token_usage
+from farmwise_common.token_usage import (
+    CHARS_PER_TOKEN, BudgetExceeded, add_usage, estimate_tokens, init_app, main, record_call, require_budget,
+    usage_context, within_budget
+)
+
+LLM_USAGE_DB = os.getenv("LLM_USAGE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "recommendations.db"))
+
+_token_usage.configure(
+    db.connector(LLM_USAGE_DB),
+    input_cost_per_mtok=0.075,  # gemini-1.5-flash
+    output_cost_per_mtok=0.30,
+    request_user=lambda request, session: request.headers.get("X-User-Id") or request.remote_addr
+)
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,9 @@ import os
 import logging
 from dotenv import load_dotenv
 from langchain.tools import tool
-from data_feed import vector_store
-from llama_index.core.workflow import Context
-from llama_index.core import VectorStoreIndex, Settings
-from llama_index.core.retrievers import VectorIndexRetriever
-from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
-from langchain.tools import tool
+from clients import singleton, recorded
+import timing
+from data_feed import get_vector_store
 from llama_index.core.workflow import Context
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,28 +12,42 @@ logger = logging.getLogger()
 
 load_dotenv()
 
-if not os.getenv("GOOGLE_API_KEY"):
-    logger.error("GOOGLE_API_KEY is not set in environment variables")
-    raise ValueError("GOOGLE_API_KEY is not set in environment variables")
+@singleton
+@recorded("vectorstore", "wrap_retriever")
+def get_retriever():
+    """Build the Pinecone-backed retriever on first use (this talks to Pinecone)."""
+    from llama_index.core import VectorStoreIndex, Settings
+    from llama_index.core.retrievers import VectorIndexRetriever
+
+    if os.getenv("FAKE_PROVIDERS"):
+        import fakes
+        if fakes.enabled("vectorstore"):
+            return VectorIndexRetriever(index=fakes.llama_scheme_index(), similarity_top_k=10)
+    from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
 
-logger.info("GOOGLE_API_KEY environment variable loaded successfully")
+    if not os.getenv("GOOGLE_API_KEY"):
+        logger.error("GOOGLE_API_KEY is not set in environment variables")
+        raise ValueError("GOOGLE_API_KEY is not set in environment variables")
 
-Settings.embed_model = GoogleGenAIEmbedding(
-    model_name="models/embedding-001",
-    api_key=os.getenv("GOOGLE_API_KEY"),
-)
+    logger.info("GOOGLE_API_KEY environment variable loaded successfully")
 
-logger.info("GoogleGenAIEmbedding model configured successfully")
+    Settings.embed_model = GoogleGenAIEmbedding(
+        model_name="models/embedding-001",
+        api_key=os.getenv("GOOGLE_API_KEY"),
+    )
 
-try:
-    vector_index = VectorStoreIndex.from_vector_store(vector_store=vector_store)
-    logger.info("Vector index created successfully")
-except Exception as e:
-    logger.error(f"Failed to create vector index: {str(e)}")
-    raise
+    logger.info("GoogleGenAIEmbedding model configured successfully")
+
+    try:
+        vector_index = VectorStoreIndex.from_vector_store(vector_store=get_vector_store())
+        logger.info("Vector index created successfully")
+    except Exception as e:
+        logger.error(f"Failed to create vector index: {str(e)}")
+        raise
 
-retriever = VectorIndexRetriever(index=vector_index, similarity_top_k=10)
-logger.info("Retriever configured successfully")
+    retriever = VectorIndexRetriever(index=vector_index, similarity_top_k=10)
+    logger.info("Retriever configured successfully")
+    return retriever
 
 @tool
 def pinecone_content(query: str) -> list[dict]:
@@ -47,7 +58,9 @@ def pinecone_content(query: str) -> list[dict]:
             logger.error("Query must be a non-empty string")
             return []
 
-        nodes = retriever.retrieve(query)
+        with timing.timed_call("pinecone.retrieve", request_bytes=timing.payload_size(query)) as span:
+            nodes = get_retriever().retrieve(query)
+            span["response_bytes"] = sum(timing.payload_size(node.get_content()) for node in nodes)
         results = []
         for i, node in enumerate(nodes, 1):
             results.append({
@@ -72,7 +85,9 @@ async def get_pinecone_content(ctx:Context, query: str):
             logger.error("Query must be a non-empty string")
             return []
 
-        nodes = retriever.retrieve(query)
+        with timing.timed_call("pinecone.retrieve", request_bytes=timing.payload_size(query)) as span:
+            nodes = get_retriever().retrieve(query)
+            span["response_bytes"] = sum(timing.payload_size(node.get_content()) for node in nodes)
         results = []
         for i, node in enumerate(nodes, 1):
             results.append({
@@ -0,0 +1,24 @@
+"""
+Request-scoped tracing of the recommendation API, exported as OpenTelemetry (OTLP/JSON) spans
+
+Every span() opened while handling a request becomes a child of the request's span: the
+workflow run, its LangGraph nodes and their Tavily, scrape, Pinecone, LLM and chart calls (all
+through timing.timed_call), and SQLite statements, following it into asyncio tasks and the
+threads LangGraph runs nodes on. A workflow run outside a request (e.g. python workflow2.py)
+starts its own trace. Finished traces go to traces/traces.jsonl (TRACE_EXPORT_PATH); the
+slowest can be shown as text waterfalls:
+
+    python tracing.py --top 5
+    python tracing.py traces/traces.jsonl --name "POST /api/recommendations"
+
+The implementation is farmwise_common.tracing; this module names the service and where its
+traces go.
+"""
+import os
+from farmwise_common import tracing as _tracing
+from farmwise_common.tracing import SPAN_KIND_CLIENT, SPAN_KIND_INTERNAL, SPAN_KIND_SERVER, current_span, init_app, main, span
+
+_tracing.configure("farmwise-recommendations", os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces", "traces.jsonl"))
+
+if __name__ == "__main__":
+    main()
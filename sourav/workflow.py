@@ -1,29 +1,28 @@
 import os
 import io
 import base64
-import requests
+import asyncio
+import httpx
 import logging
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from tavily import TavilyClient
-import matplotlib.pyplot as plt
 from langgraph.graph import StateGraph, END
 from langchain_core.documents import Document
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
 from typing import TypedDict, List, Optional, Dict, Any
-from langchain_google_genai import ChatGoogleGenerativeAI
+from clients import get_tavily, get_async_tavily, get_http_session, async_http_transport
+import llm_calls
+import singleflight
+import timing
+import profiling
+import token_usage
+import context_assembler
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-1.5-flash",
-    api_key=os.getenv("GOOGLE_API_KEY")
-)
-
-tavily = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
-
 class FarmerState(TypedDict):
     profile: Dict[str, str]
     schemes: List[Document]
@@ -32,6 +31,7 @@ class FarmerState(TypedDict):
     feedback: Optional[str]  # For user feedback
     visuals: Optional[List[str]]  # Base64-encoded images
 
+@timing.timed_node("profile_analysis")
 def profile_analysis_node(state: FarmerState) -> Dict[str, Any]:
     logging.info("Starting profile_analysis_node")
     profile = state["profile"]
@@ -50,106 +50,186 @@ def profile_analysis_node(state: FarmerState) -> Dict[str, Any]:
     logging.info(f"Enhanced profile: {profile}")
     return {"profile": profile, "schemes": [], "refinement_needed": False, "visuals": []}
 
+SCRAPE_SITES = [
+    {"url": "https://pmkisan.gov.in", "title": "PM-KISAN", "desc": "₹6000/year for small farmers (land ≤ 2 hectares)"},
+    {"url": "https://pmfby.gov.in", "title": "PMFBY (Crop Insurance)", "desc": "Insurance against crop loss"},
+    {"url": "https://agrimachinery.nic.in", "title": "SMAM (Machinery Subsidy)", "desc": "Subsidies for farm equipment"},
+    {"url": "https://mahadbt.maharashtra.gov.in", "title": "Maha DBT", "desc": "Subsidies for farm equipment in Maharashtra"}
+]
+SCRAPE_HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+def _search_query(profile: Dict[str, str]) -> str:
+    return f"latest agricultural schemes for farmers in {profile['state']} 2025 site:*.gov.in OR site:*.org.in -inurl:(signup login)"
+
+def _tavily_documents(response: Dict[str, Any]) -> List[Document]:
+    logging.info(f"Tavily raw response: {response}")
+    tavily_results = response.get("results", [])
+    logging.info(f"Fetched {len(tavily_results)} schemes from Tavily")
+    return [
+        Document(page_content=r["content"], metadata={"url": r.get("url", "unknown"), "source": "tavily", "title": r.get("title", "Untitled")})
+        for r in tavily_results if isinstance(r, dict) and "content" in r
+    ]
+
+def _scraped_document(site: Dict[str, str], html: str) -> Document:
+    soup = BeautifulSoup(html, "html.parser")
+    content = soup.find("div", {"class": "content"}) or soup.find("div", {"id": "content"}) or soup.body
+    logging.info(f"Scraped {site['title']}")
+    return Document(
+        page_content=f"{site['title']}: {site['desc']}. {content.get_text()[:500]}",
+        metadata={"url": site["url"], "source": "scraped", "title": site["title"]}
+    )
+
+def _search_update(schemes: List[Document]) -> Dict[str, List[Document]]:
+    if not schemes:
+        schemes.append(Document(
+            page_content="No schemes fetched. Suggest PM-KISAN, PMFBY, SMAM, Maha DBT based on profile.",
+            metadata={"source": "placeholder"}
+        ))
+    logging.info(f"Total schemes fetched: {len(schemes)}")
+    return {"schemes": schemes}
+
+@timing.timed_node("web_search")
 def web_search_node(state: FarmerState) -> Dict[str, List[Document]]:
     logging.info("Starting web_search_node")
     schemes = []
     profile = state["profile"]
 
     try:
-        query = f"latest agricultural schemes for farmers in {profile['state']} 2025 site:*.gov.in OR site:*.org.in -inurl:(signup login)"
-        response = tavily.search(query=query, max_results=5)
-        logging.info(f"Tavily raw response: {response}")
-        tavily_results = response.get("results", [])
-        schemes.extend([
-            Document(page_content=r["content"], metadata={"url": r.get("url", "unknown"), "source": "tavily", "title": r.get("title", "Untitled")})
-            for r in tavily_results if isinstance(r, dict) and "content" in r
-        ])
-        logging.info(f"Fetched {len(tavily_results)} schemes from Tavily")
+        query = _search_query(profile)
+        with timing.timed_call("tavily.search", request_bytes=timing.payload_size(query)) as span:
+            # Farmers with the same profile search at the same time; they share one search
+            response, _ = singleflight.do("search", f"search:{query}:5", lambda: get_tavily().search(query=query, max_results=5))
+            span["response_bytes"] = timing.payload_size(response)
+        schemes.extend(_tavily_documents(response))
     except Exception as e:
         logging.error(f"Tavily error: {str(e)}")
 
-    sites = [
-        {"url": "https://pmkisan.gov.in", "title": "PM-KISAN", "desc": "₹6000/year for small farmers (land ≤ 2 hectares)"},
-        {"url": "https://pmfby.gov.in", "title": "PMFBY (Crop Insurance)", "desc": "Insurance against crop loss"},
-        {"url": "https://agrimachinery.nic.in", "title": "SMAM (Machinery Subsidy)", "desc": "Subsidies for farm equipment"},
-        {"url": "https://mahadbt.maharashtra.gov.in", "title": "Maha DBT", "desc": "Subsidies for farm equipment in Maharashtra"}
-    ]
-    headers = {"User-Agent": "Mozilla/5.0"}
-    for site in sites:
+    for site in SCRAPE_SITES:
         try:
-            response = requests.get(site["url"], headers=headers, timeout=5)
-            soup = BeautifulSoup(response.text, "html.parser")
-            content = soup.find("div", {"class": "content"}) or soup.find("div", {"id": "content"}) or soup.body
-            schemes.append(Document(
-                page_content=f"{site['title']}: {site['desc']}. {content.get_text()[:500]}",
-                metadata={"url": site["url"], "source": "scraped", "title": site["title"]}
-            ))
-            logging.info(f"Scraped {site['title']}")
+            with timing.timed_call("scrape", url=site["url"]) as span:
+                response = get_http_session().get(site["url"], headers=SCRAPE_HEADERS, timeout=5)
+                span["response_bytes"] = len(response.content)
+            schemes.append(_scraped_document(site, response.text))
         except Exception as e:
             logging.error(f"Scraping error for {site['url']}: {str(e)}")
 
-    if not schemes:
-        schemes.append(Document(
-            page_content="No schemes fetched. Suggest PM-KISAN, PMFBY, SMAM, Maha DBT based on profile.",
-            metadata={"source": "placeholder"}
-        ))
-    logging.info(f"Total schemes fetched: {len(schemes)}")
-    return {"schemes": schemes}
+    return _search_update(schemes)
 
-def recommendation_node(state: FarmerState) -> Dict[str, Any]:
-    logging.info("Starting recommendation_node")
+@timing.timed_node("web_search")
+async def aweb_search_node(state: FarmerState) -> Dict[str, List[Document]]:
+    """Async web_search_node: the Tavily search and all site scrapes run concurrently."""
+    logging.info("Starting web_search_node (async)")
     profile = state["profile"]
-    profile_str = "\n".join(f"{k}: {v}" for k, v in profile.items())
-    schemes_str = "\n".join(f"{doc.metadata.get('title', 'Untitled')}: {doc.page_content}" for doc in state["schemes"])
-    
-    seed_cost_estimate = profile.get("seed_cost_estimate", "unknown")
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You're an expert on Indian agricultural schemes. Given a farmer's profile and scheme data, provide 4-6 detailed recommendations. For each:
+
+    async def search() -> List[Document]:
+        try:
+            query = _search_query(profile)
+            with timing.timed_call("tavily.search", request_bytes=timing.payload_size(query)) as span:
+                response, _ = await singleflight.ado("search", f"search:{query}:5", lambda: get_async_tavily().search(query=query, max_results=5))
+                span["response_bytes"] = timing.payload_size(response)
+            return _tavily_documents(response)
+        except Exception as e:
+            logging.error(f"Tavily error: {str(e)}")
+            return []
+
+    async def scrape(client: httpx.AsyncClient, site: Dict[str, str]) -> List[Document]:
+        try:
+            with timing.timed_call("scrape", url=site["url"]) as span:
+                response = await client.get(site["url"])
+                span["response_bytes"] = len(response.content)
+            return [_scraped_document(site, response.text)]
+        except Exception as e:
+            logging.error(f"Scraping error for {site['url']}: {str(e)}")
+            return []
+
+    async with httpx.AsyncClient(headers=SCRAPE_HEADERS, timeout=5, follow_redirects=True, transport=async_http_transport()) as client:
+        results = await asyncio.gather(search(), *(scrape(client, site) for site in SCRAPE_SITES))
+
+    return _search_update([doc for docs in results for doc in docs])
+
+RECOMMENDATION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You're an expert on Indian agricultural schemes. Given a farmer's profile and scheme data, provide 4-6 detailed recommendations. For each:
         - Confirm eligibility with profile specifics (e.g., '2 hectares = small farmer', 'rain-fed needs insurance').
         - Quantify benefits (e.g., '₹6000 covers 25% of wheat seed costs at ₹{seed_cost_estimate}/hectare').
         - Provide steps with URLs (e.g., https://pmkisan.gov.in) or local instructions (e.g., 'Visit your district office').
         Include national schemes (PM-KISAN, PMFBY, SMAM) and state-specific ones (e.g., Maha DBT for Maharashtra). Use markdown with headers (## Scheme Name)."""),
-        ("human", "Profile:\n{profile_str}\nSchemes:\n{schemes_str}")
-    ])
-    
-    response = (prompt | llm).invoke({
-        "profile_str": profile_str,
-        "schemes_str": schemes_str,
-        "seed_cost_estimate": seed_cost_estimate
-    }).content.strip()
+    ("human", "Profile:\n{profile_str}\nSchemes:\n{schemes_str}")
+])
+
+REFINE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """Refine this text for farmers. Ensure:
+        - 4-6 schemes with headers (## Scheme Name).
+        - Eligibility is clear (e.g., 'Your 2 hectares qualify').
+        - Benefits are practical (e.g., '₹6000 buys wheat seeds').
+        - Steps have URLs (e.g., https://pmkisan.gov.in) or clear instructions.
+        Use markdown with headers and bullet points."""),
+    ("human", "{recommendations}")
+])
+
+def _recommendation_inputs(state: FarmerState) -> Dict[str, str]:
+    profile = state["profile"]
+    with profiling.allocations("recommendation inputs"):
+        inputs = {
+            "profile_str": "\n".join(f"{k}: {v}" for k, v in profile.items()),
+            "schemes_str": context_assembler.assemble(state["schemes"], profile),
+            "seed_cost_estimate": profile.get("seed_cost_estimate", "unknown")
+        }
+    logging.info(f"Recommendation prompt: {token_usage.estimate_tokens(RECOMMENDATION_PROMPT.format(**inputs))} tokens")
+    return inputs
+
+def _recommendation_update(response: str) -> Dict[str, Any]:
     refinement_needed = "http" not in response or len(response.split("##")) < 4
     
     visuals = []
     if not refinement_needed:
-        fig, ax = plt.subplots(figsize=(6, 4))
-        ax.pie([40, 25, 20, 15], labels=["PM-KISAN", "PMFBY", "Maha DBT", "SMAM"], autopct="%1.1f%%")
-        ax.set_title("Estimated Subsidy Contribution")
-        buf = io.BytesIO()
-        fig.savefig(buf, format="png")
-        buf.seek(0)
-        visuals.append(base64.b64encode(buf.getvalue()).decode("utf-8"))
-        plt.close(fig)
+        with timing.timed_call("chart.render") as span:
+            import matplotlib.pyplot as plt  # Slow to import, only needed for the chart
+            fig, ax = plt.subplots(figsize=(6, 4))
+            ax.pie([40, 25, 20, 15], labels=["PM-KISAN", "PMFBY", "Maha DBT", "SMAM"], autopct="%1.1f%%")
+            ax.set_title("Estimated Subsidy Contribution")
+            buf = io.BytesIO()
+            fig.savefig(buf, format="png")
+            buf.seek(0)
+            visuals.append(base64.b64encode(buf.getvalue()).decode("utf-8"))
+            plt.close(fig)
+            span["response_bytes"] = len(visuals[-1])
     
     logging.info(f"Generated recommendations: {response[:100]}... Refinement needed: {refinement_needed}")
     return {"recommendations": response, "refinement_needed": refinement_needed, "visuals": visuals}
 
+@timing.timed_node("recommendation")
+def recommendation_node(state: FarmerState) -> Dict[str, Any]:
+    logging.info("Starting recommendation_node")
+    response = llm_calls.invoke("recommendation", RECOMMENDATION_PROMPT, _recommendation_inputs(state))
+    return _recommendation_update(response)
+
+@timing.timed_node("recommendation")
+async def arecommendation_node(state: FarmerState) -> Dict[str, Any]:
+    logging.info("Starting recommendation_node (async)")
+    response = await llm_calls.ainvoke("recommendation", RECOMMENDATION_PROMPT, _recommendation_inputs(state))
+    return _recommendation_update(response)
+
+@timing.timed_node("refine")
 def refine_node(state: FarmerState) -> Dict[str, Any]:
     logging.info("Starting refine_node")
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """Refine this text for farmers. Ensure:
-        - 4-6 schemes with headers (## Scheme Name).
-        - Eligibility is clear (e.g., 'Your 2 hectares qualify').
-        - Benefits are practical (e.g., '₹6000 buys wheat seeds').
-        - Steps have URLs (e.g., https://pmkisan.gov.in) or clear instructions.
-        Use markdown with headers and bullet points."""),
-        ("human", "{recommendations}")
-    ])
-    
-    response = (prompt | llm).invoke({"recommendations": state["recommendations"]}).content.strip()
+    if not token_usage.within_budget():
+        logging.warning("LLM budget used up, returning the unrefined recommendations")
+        return {"refinement_needed": False}
+    response = llm_calls.invoke("refine", REFINE_PROMPT, {"recommendations": state["recommendations"]})
     logging.info(f"Refined recommendations: {response[:100]}...")
     return {"recommendations": response, "refinement_needed": False, "visuals": state["visuals"]}
 
+@timing.timed_node("refine")
+async def arefine_node(state: FarmerState) -> Dict[str, Any]:
+    logging.info("Starting refine_node (async)")
+    if not token_usage.within_budget():
+        logging.warning("LLM budget used up, returning the unrefined recommendations")
+        return {"refinement_needed": False}
+    response = await llm_calls.ainvoke("refine", REFINE_PROMPT, {"recommendations": state["recommendations"]})
+    logging.info(f"Refined recommendations: {response[:100]}...")
+    return {"recommendations": response, "refinement_needed": False, "visuals": state["visuals"]}
+
+@timing.timed_node("handle_feedback")
 def handle_feedback_node(state: FarmerState) -> Dict[str, Any]:
     logging.info("Starting handle_feedback_node")
     feedback = state.get("feedback")
@@ -165,9 +245,10 @@ def route_recommendations(state: FarmerState) -> str:
 workflow = StateGraph(FarmerState)
 
 workflow.add_node("profile_analysis", profile_analysis_node)
-workflow.add_node("web_search", web_search_node)
-workflow.add_node("recommendation", recommendation_node)
-workflow.add_node("refine", refine_node)
+# Nodes that wait on the network get an async variant, used by app.ainvoke()/app.astream()
+workflow.add_node("web_search", RunnableLambda(web_search_node, afunc=aweb_search_node))
+workflow.add_node("recommendation", RunnableLambda(recommendation_node, afunc=arecommendation_node))
+workflow.add_node("refine", RunnableLambda(refine_node, afunc=arefine_node))
 workflow.add_node("handle_feedback", handle_feedback_node)  
 
 workflow.set_entry_point("profile_analysis")
@@ -192,9 +273,51 @@ def run_workflow(initial_state: Optional[FarmerState] = None) -> FarmerState:
     state = initial_state or default_state
     
     try:
-        final_state = app.invoke(state)
+        with timing.record_run("workflow"):
+            final_state = app.invoke(state)
         logging.info("Workflow completed")
         return final_state
     except Exception as e:
         logging.error(f"Workflow execution failed: {str(e)}")
         raise
+
+def stream_workflow(initial_state: FarmerState):
+    """Run the workflow, yielding (mode, chunk) pairs from LangGraph's streaming API.
+
+    "updates" chunks map the node that just finished to its state update, "messages"
+    chunks are (message_chunk, metadata) pairs carrying LLM tokens as they are generated
+    and "values" chunks are the full state after each step (the last one is the final state).
+    """
+    logging.info("Starting streaming workflow")
+    try:
+        with timing.record_run("workflow"):
+            for mode, chunk in app.stream(initial_state, stream_mode=["updates", "messages", "values"]):
+                yield mode, chunk
+        logging.info("Streaming workflow completed")
+    except Exception as e:
+        logging.error(f"Streaming workflow execution failed: {str(e)}")
+        raise
+
+async def arun_workflow(initial_state: FarmerState) -> FarmerState:
+    """Async variant of run_workflow(), used by the ASGI app."""
+    logging.info("Starting workflow (async)")
+    try:
+        with timing.record_run("workflow"):
+            final_state = await app.ainvoke(initial_state)
+        logging.info("Workflow completed")
+        return final_state
+    except Exception as e:
+        logging.error(f"Workflow execution failed: {str(e)}")
+        raise
+
+async def astream_workflow(initial_state: FarmerState):
+    """Async variant of stream_workflow(), yielding the same (mode, chunk) pairs."""
+    logging.info("Starting streaming workflow (async)")
+    try:
+        with timing.record_run("workflow"):
+            async for mode, chunk in app.astream(initial_state, stream_mode=["updates", "messages", "values"]):
+                yield mode, chunk
+        logging.info("Streaming workflow completed")
+    except Exception as e:
+        logging.error(f"Streaming workflow execution failed: {str(e)}")
+        raise
@@ -1,19 +1,19 @@
 import os
 import io
 import base64
-import requests
 import logging
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from langchain_cohere import CohereEmbeddings
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_pinecone import PineconeVectorStore
-import matplotlib.pyplot as plt
 from langgraph.graph import StateGraph, END
 from langchain_core.documents import Document
 from langchain.prompts import ChatPromptTemplate
 from typing import TypedDict, List, Optional, Dict, Any
-from tavily import TavilyClient
+from clients import get_tavily, get_scheme_store, get_http_session
+import llm_calls
+import singleflight
+import token_usage
+import context_assembler
+import timing
 
 load_dotenv()
 
@@ -30,14 +30,7 @@ google_api_key = os.getenv("GOOGLE_API_KEY")
 tavily_api_key = os.getenv("TAVILY_API_KEY")
 pinecone_environment = os.getenv("PINECONE_ENVIRONMENT", "us-east-1")
 
-embeddings = CohereEmbeddings(cohere_api_key=cohere_api_key, model="embed-english-v3.0")
-pc = PineconeVectorStore.from_existing_index(
-    index_name="farmwise-ai",
-    embedding=embeddings
-)
-
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", api_key=google_api_key)
-tavily = TavilyClient(api_key=tavily_api_key)
+# Pinecone, Cohere, Gemini and Tavily clients are created on first use (see clients.py)
 
 class FarmerState(TypedDict):
     profile: Dict[str, str]
@@ -47,6 +40,7 @@ class FarmerState(TypedDict):
     feedback: Optional[str]
     visuals: Optional[List[str]]
 
+@timing.timed_node("profile_analysis")
 def profile_analysis_node(state: FarmerState) -> Dict[str, Any]:
     logger.info("[Profile Analysis] Starting analysis of farmer profile.")
     profile = state["profile"]
@@ -66,6 +60,7 @@ def profile_analysis_node(state: FarmerState) -> Dict[str, Any]:
     logger.info("[Profile Analysis] Enhanced profile: %s", profile)
     return {"profile": profile, "schemes": [], "refinement_needed": False, "visuals": []}
 
+@timing.timed_node("web_search")
 def web_search_node(state: FarmerState) -> Dict[str, List[Document]]:
     logger.info("[Web Search] Starting search for agricultural schemes.")
     schemes = []
@@ -74,7 +69,9 @@ def web_search_node(state: FarmerState) -> Dict[str, List[Document]]:
     try:
         query_text = f"Available agricultural schemes for farmer with profile: {profile}"
         logger.debug("[Web Search] Embedding query: %s", query_text)
-        results = pc.similarity_search_with_score(query=query_text, k=5)
+        with timing.timed_call("pinecone.search", request_bytes=timing.payload_size(query_text)) as span:
+            results = get_scheme_store().similarity_search_with_score(query=query_text, k=5)
+            span["response_bytes"] = sum(timing.payload_size(doc.page_content) for doc, _ in results)
         logger.info(results);
         logger.info("[Web Search] Pinecone query returned %d matches", len(results))
 
@@ -96,7 +93,9 @@ def web_search_node(state: FarmerState) -> Dict[str, List[Document]]:
 
         tavily_query = f"agricultural schemes in India for a farmer with {profile['land_size']} land and {profile['irrigation']} irrigation"
         logger.debug("[Web Search] Tavily query: %s", tavily_query)
-        tavily_response = tavily.get_search_context(query=tavily_query, max_results=3)
+        with timing.timed_call("tavily.search", request_bytes=timing.payload_size(tavily_query)) as span:
+            tavily_response, _ = singleflight.do("search", f"get_search_context:{tavily_query}:3", lambda: get_tavily().get_search_context(query=tavily_query, max_results=3))
+            span["response_bytes"] = timing.payload_size(tavily_response)
         logger.debug("[Web Search] Raw Tavily response: %s", tavily_response)
 
         if isinstance(tavily_response, str):
@@ -136,7 +135,9 @@ def web_search_node(state: FarmerState) -> Dict[str, List[Document]]:
     headers = {"User-Agent": "Mozilla/5.0"}
     for site in sites:
         try:
-            response = requests.get(site["url"], headers=headers, timeout=5)
+            with timing.timed_call("scrape", url=site["url"]) as span:
+                response = get_http_session().get(site["url"], headers=headers, timeout=5)
+                span["response_bytes"] = len(response.content)
             soup = BeautifulSoup(response.text, "html.parser")
             content = soup.find("div", {"class": "content"}) or soup.find("div", {"id": "content"}) or soup.body
             schemes.append(Document(
@@ -155,11 +156,12 @@ def web_search_node(state: FarmerState) -> Dict[str, List[Document]]:
     logger.info("[Web Search] Total schemes fetched: %d", len(schemes))
     return {"schemes": schemes}
 
+@timing.timed_node("recommendation")
 def recommendation_node(state: FarmerState) -> Dict[str, Any]:
     logger.info("[Recommendation] Generating recommendations for farmer profile.")
     profile = state["profile"]
     profile_str = "\n".join(f"{k}: {v}" for k, v in profile.items())
-    schemes_str = "\n".join(f"{doc.metadata.get('title', 'Untitled')}: {doc.page_content}" for doc in state["schemes"])
+    schemes_str = context_assembler.assemble(state["schemes"], profile)
 
     seed_cost_estimate = profile.get("seed_cost_estimate", "unknown")
 
@@ -172,29 +174,38 @@ def recommendation_node(state: FarmerState) -> Dict[str, Any]:
         ("human", "Profile:\n{profile_str}\nSchemes:\n{schemes_str}")
     ])
 
-    response = (prompt | llm).invoke({
+    inputs = {
         "profile_str": profile_str,
         "schemes_str": schemes_str,
         "seed_cost_estimate": seed_cost_estimate
-    }).content.strip()
+    }
+    logger.info("[Recommendation] Prompt: %d tokens", token_usage.estimate_tokens(prompt.format(**inputs)))
+    response = llm_calls.invoke("recommendation", prompt, inputs)
     refinement_needed = "http" not in response or len(response.split("##")) < 4
 
     visuals = []
     if not refinement_needed:
-        fig, ax = plt.subplots(figsize=(6, 4))
-        ax.pie([40, 25, 20, 15], labels=["PM-KISAN", "PMFBY", "Maha DBT", "SMAM"], autopct="%1.1f%%")
-        ax.set_title("Estimated Subsidy Contribution")
-        buf = io.BytesIO()
-        fig.savefig(buf, format="png")
-        buf.seek(0)
-        visuals.append(base64.b64encode(buf.getvalue()).decode("utf-8"))
-        plt.close(fig)
+        with timing.timed_call("chart.render") as span:
+            import matplotlib.pyplot as plt  # Slow to import, only needed for the chart
+            fig, ax = plt.subplots(figsize=(6, 4))
+            ax.pie([40, 25, 20, 15], labels=["PM-KISAN", "PMFBY", "Maha DBT", "SMAM"], autopct="%1.1f%%")
+            ax.set_title("Estimated Subsidy Contribution")
+            buf = io.BytesIO()
+            fig.savefig(buf, format="png")
+            buf.seek(0)
+            visuals.append(base64.b64encode(buf.getvalue()).decode("utf-8"))
+            plt.close(fig)
+            span["response_bytes"] = len(visuals[-1])
 
     logger.info("[Recommendation] Generated recommendations (first 100 chars): %s... Refinement needed: %s", response[:100], refinement_needed)
     return {"recommendations": response, "refinement_needed": refinement_needed, "visuals": visuals}
 
+@timing.timed_node("refine")
 def refine_node(state: FarmerState) -> Dict[str, Any]:
     logger.info("[Refine] Starting refinement of recommendations.")
+    if not token_usage.within_budget():
+        logger.warning("[Refine] LLM budget used up, returning the unrefined recommendations.")
+        return {"refinement_needed": False}
     prompt = ChatPromptTemplate.from_messages([
         ("system", """Refine this text for farmers. Ensure:
         - 4-6 schemes with headers (## Scheme Name).
@@ -205,10 +216,11 @@ def refine_node(state: FarmerState) -> Dict[str, Any]:
         ("human", "{recommendations}")
     ])
 
-    response = (prompt | llm).invoke({"recommendations": state["recommendations"]}).content.strip()
+    response = llm_calls.invoke("refine", prompt, {"recommendations": state["recommendations"]})
     logger.info("[Refine] Refined recommendations (first 100 chars): %s...", response[:100])
     return {"recommendations": response, "refinement_needed": False, "visuals": state["visuals"]}
 
+@timing.timed_node("handle_feedback")
 def handle_feedback_node(state: FarmerState) -> Dict[str, Any]:
     logger.info("[Feedback] Processing user feedback.")
     feedback = state.get("feedback")
@@ -253,7 +265,8 @@ def run_workflow(initial_state: Optional[FarmerState] = None) -> FarmerState:
     state = initial_state or default_state
 
     try:
-        final_state = app.invoke(state)
+        with timing.record_run("workflow2"):
+            final_state = app.invoke(state)
         logger.info("[Workflow] Execution completed successfully.")
         return final_state
     except Exception as e:
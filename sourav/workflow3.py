@@ -1,17 +1,15 @@
 import os
 import logging
 from dotenv import load_dotenv
-from langchain_cohere import CohereEmbeddings
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_pinecone import PineconeVectorStore
 from langgraph.graph import StateGraph, END
 from langchain_core.documents import Document
 from typing import TypedDict, Optional, Dict, Any, List
-from langchain import hub
 from langchain.agents import create_react_agent, AgentExecutor
 from tools import pinecone_content
-from tavily import TavilyClient
+from clients import singleton, get_llm, get_tavily, get_react_prompt
 from langchain.tools import tool
+import singleflight
+import timing
 
 load_dotenv()
 
@@ -27,20 +25,15 @@ cohere_api_key = os.getenv("COHERE_API_KEY")
 google_api_key = os.getenv("GOOGLE_API_KEY")
 pinecone_environment = os.getenv("PINECONE_ENVIRONMENT", "us-east-1")
 
-embeddings = CohereEmbeddings(cohere_api_key=cohere_api_key, model="embed-english-v3.0")
-pc = PineconeVectorStore.from_existing_index(
-    index_name="farmwise-ai",
-    embedding=embeddings
-)
-
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", api_key=google_api_key)
-tavily = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+# Gemini and Tavily clients are created on first use (see clients.py)
 
 @tool
 def tavily_search(query: str):
     """Searches online for the given query and summarizes them."""
     try:
-        search_results = tavily.search(query=query)
+        with timing.timed_call("tavily.search", request_bytes=timing.payload_size(query)) as span:
+            search_results, _ = singleflight.do("search", f"search:{query}", lambda: get_tavily().search(query=query))
+            span["response_bytes"] = timing.payload_size(search_results)
         return search_results
     except Exception as e:
         logging.error("Exception caused in tavily search", e);
@@ -55,10 +48,12 @@ class FarmerState(TypedDict):
 tools = [pinecone_content]
 tools2 = [tavily_search]
 
-prompt_template = hub.pull("hwchase17/react")
-agent = create_react_agent(llm, tools, prompt_template)
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True)
+@singleton
+def get_agent_executor():
+    agent = create_react_agent(get_llm(), tools, get_react_prompt())
+    return AgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True)
 
+@timing.timed_node("profile_analysis")
 def profile_analysis_node(state: FarmerState) -> Dict[str, Any]:
     logger.info("[Profile Analysis] Starting analysis of farmer profile.")
     profile = state["profile"]
@@ -78,6 +73,7 @@ def profile_analysis_node(state: FarmerState) -> Dict[str, Any]:
     logger.info("[Profile Analysis] Enhanced profile: %s", profile)
     return {"profile": profile, "schemes": [], "recommendations": None, "visuals": []}
 
+@timing.timed_node("react_agent")
 def react_agent_node(state: FarmerState) -> Dict[str, Any]:
     logger.info("[ReAct Agent] Starting agent to suggest schemes from Pinecone.")
     profile = state["profile"]
@@ -97,7 +93,10 @@ def react_agent_node(state: FarmerState) -> Dict[str, Any]:
     # Farmer-profile: {profile}
 
     try:
-        response = agent_executor.invoke({"input": combined_input})
+        with timing.timed_call("agent.recommend", request_bytes=timing.payload_size(combined_input)) as span:
+            response = get_agent_executor().invoke({"input": combined_input})
+            span["steps"] = len(response.get("intermediate_steps", []))
+            span["response_bytes"] = timing.payload_size(response.get("output"))
         logger.info("[ReAct Agent] Agent response: %s", response["output"][:100] if "output" in response else "No output")
 
         schemes = []
@@ -123,9 +122,10 @@ def react_agent_node(state: FarmerState) -> Dict[str, Any]:
         logger.error("[ReAct Agent] Execution failed: %s", str(e))
         return {"schemes": [], "recommendations": "Error generating recommendations.", "visuals": []}
 
+@timing.timed_node("refine_agent")
 def refine_agent_node(state: FarmerState) -> Dict[str, Any]:
     logger.info("[Refine Agent] Starting refinement of recommendations.")
-    agent2 = create_react_agent(llm, tools2, prompt_template)
+    agent2 = create_react_agent(get_llm(), tools2, get_react_prompt())
     agent_executor2 = AgentExecutor(agent=agent2, tools=tools2, verbose=True, handle_parsing_errors=True)
 
     schemes = state["recommendations"]
@@ -143,7 +143,10 @@ def refine_agent_node(state: FarmerState) -> Dict[str, Any]:
     """
 
     try:
-        response = agent_executor2.invoke({"input": combined_input})
+        with timing.timed_call("agent.refine", request_bytes=timing.payload_size(combined_input)) as span:
+            response = agent_executor2.invoke({"input": combined_input})
+            span["steps"] = len(response.get("intermediate_steps", []))
+            span["response_bytes"] = timing.payload_size(response.get("output"))
         refined_output = response.get("output", "No detailed information found.")
         logger.info("[Refine Agent] Refined recommendations: %s", refined_output[:100])
         return {
@@ -185,7 +188,8 @@ def run_workflow(initial_state: Optional[FarmerState] = None) -> FarmerState:
     state = initial_state or default_state
 
     try:
-        final_state = app.invoke(state)
+        with timing.record_run("workflow3"):
+            final_state = app.invoke(state)
         logger.info("[Workflow] Execution completed successfully.")
         return final_state
     except Exception as e:
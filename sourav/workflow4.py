@@ -1,4 +1,5 @@
 import os
+import json
 import asyncio
 import logging
 from dotenv import load_dotenv
@@ -100,10 +101,7 @@ agent_workflow = AgentWorkflow(
 
 logger.info("Agent workflow initialized successfully")
 
-async def run_workflow():
-    try:
-        result = await agent_workflow.run(
-            user_msg=""" 
+DEFAULT_USER_MSG = """ 
                 Suggest me the schemes for the given farmer:
                 "basic_information": {
                     "state": "Haryana",
@@ -125,7 +123,15 @@ async def run_workflow():
                     "current_schemes": "none"
                 }
             """
-        )
+
+async def run_workflow(profile=None):
+    """Run the agents for a farmer profile (the sample farmer above if none is given)."""
+    if profile is None:
+        user_msg = DEFAULT_USER_MSG
+    else:
+        user_msg = "Suggest me the schemes for the given farmer:\n" + json.dumps(profile, indent=2)
+    try:
+        result = await agent_workflow.run(user_msg=user_msg)
         logger.info("Workflow executed successfully")
         return result
     except Exception as e:
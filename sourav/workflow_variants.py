@@ -0,0 +1,90 @@
+"""
+The four recommendation pipelines behind one interface, so the API and compare_workflows.py
+can switch between them.
+
+- workflow: linear LangGraph (web search, recommendation, refine); the only one that streams
+- workflow2: the same graph with Pinecone retrieval added to the web search
+- workflow3: ReAct agents (AgentExecutor) over the Pinecone and Tavily tools
+- workflow4: LlamaIndex multi-agent AgentWorkflow (needs live Gemini and Tavily)
+
+The API uses RECOMMENDATION_WORKFLOW (default: workflow). Variant modules are imported on
+first use; every runner returns the final state in workflow.py's FarmerState shape.
+"""
+import os
+import asyncio
+import logging
+import importlib
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+VARIANTS = ("workflow", "workflow2", "workflow3", "workflow4")
+STREAMING_VARIANTS = ("workflow",)
+
+RECOMMENDATION_WORKFLOW = os.getenv("RECOMMENDATION_WORKFLOW", "workflow")
+if RECOMMENDATION_WORKFLOW not in VARIANTS:
+    raise ValueError(f"RECOMMENDATION_WORKFLOW must be one of {', '.join(VARIANTS)}, not {RECOMMENDATION_WORKFLOW!r}")
+
+# State keys each LangGraph variant's FarmerState declares
+_STATE_KEYS = {
+    "workflow": ("profile", "schemes", "recommendations", "refinement_needed", "feedback", "visuals"),
+    "workflow2": ("profile", "schemes", "recommendations", "refinement_needed", "feedback", "visuals"),
+    "workflow3": ("profile", "schemes", "recommendations", "visuals"),
+}
+
+def load(variant: str) -> Any:
+    """Import a variant's module (building its graph or agents on first use)."""
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown workflow variant {variant!r}, expected one of {', '.join(VARIANTS)}")
+    return importlib.import_module(variant)
+
+def _input_state(variant: str, initial_state: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: initial_state[key] for key in _STATE_KEYS[variant] if key in initial_state}
+
+def _final_state(initial_state: Dict[str, Any], final: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "profile": final.get("profile", initial_state["profile"]),
+        "schemes": final.get("schemes") or [],
+        "recommendations": final.get("recommendations"),
+        "refinement_needed": final.get("refinement_needed", False),
+        "feedback": final.get("feedback", initial_state.get("feedback")),
+        "visuals": final.get("visuals") or []
+    }
+
+def _agent_state(initial_state: Dict[str, Any], output: Any) -> Dict[str, Any]:
+    return _final_state(initial_state, {"recommendations": str(output)})
+
+def run(initial_state: Dict[str, Any], variant: Optional[str] = None) -> Dict[str, Any]:
+    """Run a variant (default RECOMMENDATION_WORKFLOW) on an initial state and return its final state."""
+    variant = variant or RECOMMENDATION_WORKFLOW
+    module = load(variant)
+    if variant == "workflow4":
+        return _agent_state(initial_state, asyncio.run(module.run_workflow(initial_state["profile"])))
+    return _final_state(initial_state, module.run_workflow(_input_state(variant, initial_state)))
+
+async def arun(initial_state: Dict[str, Any], variant: Optional[str] = None) -> Dict[str, Any]:
+    """Async variant of run(); synchronous variants run in a worker thread."""
+    variant = variant or RECOMMENDATION_WORKFLOW
+    module = load(variant)
+    if variant == "workflow":
+        return _final_state(initial_state, await module.arun_workflow(initial_state))
+    if variant == "workflow4":
+        return _agent_state(initial_state, await module.run_workflow(initial_state["profile"]))
+    return await asyncio.to_thread(run, initial_state, variant)
+
+def stream(initial_state: Dict[str, Any], variant: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+    """Yield workflow.stream_workflow()'s (mode, chunk) pairs; other variants only yield ("values", final state)."""
+    variant = variant or RECOMMENDATION_WORKFLOW
+    if variant in STREAMING_VARIANTS:
+        yield from load(variant).stream_workflow(initial_state)
+    else:
+        logging.info(f"{variant} doesn't stream, sending its result when it finishes")
+        yield "values", run(initial_state, variant)
+
+async def astream(initial_state: Dict[str, Any], variant: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """Async variant of stream()."""
+    variant = variant or RECOMMENDATION_WORKFLOW
+    if variant in STREAMING_VARIANTS:
+        async for mode, chunk in load(variant).astream_workflow(initial_state):
+            yield mode, chunk
+    else:
+        logging.info(f"{variant} doesn't stream, sending its result when it finishes")
+        yield "values", await arun(initial_state, variant)